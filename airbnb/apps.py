@@ -5,3 +5,6 @@ class AirbnbConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'airbnb'
     verbose_name = "Airbnb"
+
+    def ready(self):
+        from . import calendario, fechas_ocupadas, feed_ical  # noqa: F401
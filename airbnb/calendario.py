@@ -0,0 +1,300 @@
+"""
+Eventos del Calendario Unificado
+================================
+FullCalendar pide los eventos del rango visible cada vez que el usuario
+navega. En vez de consultar y formatear todo en cada petición, los eventos se
+arman por rebanadas de (mes, fuente) y cada rebanada se guarda en el cache de
+Django. Ir y volver entre meses reutiliza las rebanadas ya armadas.
+
+Fuentes: cotizaciones, reservas de Airbnb, asignaciones de espacio y de
+personal. Cada fuente lleva un token de generación; guardar o borrar uno de
+sus modelos lo cambia, y con él todas las claves de sus rebanadas. Es más
+grueso que invalidar solo los meses tocados, pero el modelo no conserva las
+fechas anteriores y mover un evento de junio a julio tiene que refrescar los
+dos meses.
+
+Como la clave de una rebanada cambia con la generación, su valor nunca
+cambia: las rebanadas van también en la memoria de cada worker (L1 de
+CACHES, ver core_erp/cache_niveles.py); los tokens de generación no.
+
+Cada rebanada lleva además una `version` (hash de su contenido). Si el cliente
+manda las versiones que ya tiene, el endpoint devuelve solo las rebanadas que
+cambiaron: una reconstruida sin cambios conserva su versión.
+"""
+import hashlib
+import json
+import uuid
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+from django.db.models.signals import post_delete, post_save
+
+from .models import AnuncioAirbnb, ConflictoCalendario, ReservaAirbnb
+
+PREFIJO = 'airbnb:calendario'
+
+# Respaldo para lo que no invalida por signal (renombrar un espacio o un
+# empleado): una rebanada nunca vive más que esto.
+SEGUNDOS_REBANADA = 600
+
+# Rango más largo que se atiende: la vista de año de FullCalendar con sus
+# días de relleno. Más que eso serían cientos de rebanadas por petición.
+DIAS_MAXIMOS = 400
+
+
+def _dia(valor):
+    return valor.strftime('%Y-%m-%d')
+
+
+# ─────────────────────────────── Fuentes ───────────────────────────────────
+# Cada fuente devuelve tuplas (desde, hasta, evento): [desde, hasta) es el
+# rango con el que el evento se traslapa con la ventana pedida, con el mismo
+# criterio que el filtro de su consulta.
+
+def _cotizaciones(inicio, fin):
+    from comercial.models import Cotizacion
+
+    # Traslape de rango, no solo las que empiezan dentro de la ventana: un
+    # Hospedaje de varias noches puede haber comenzado antes de `inicio`.
+    cotizaciones = Cotizacion.objects.exclude(estado='CANCELADA').filter(
+        fecha_evento__lt=fin,
+    ).filter(
+        Q(fecha_salida__gt=inicio)
+        | Q(fecha_salida__isnull=True, fecha_evento__gte=inicio)
+    ).select_related('cliente')
+
+    for c in cotizaciones:
+        evento = {
+            'id': f'cot-{c.id}',
+            'title': f" {c.cliente.nombre} - {c.nombre_evento}",
+            'start': _dia(c.fecha_evento),
+            'color': '#27ae60' if c.estado == 'CONFIRMADA' else '#95a5a6',
+            'url': f'/admin/comercial/cotizacion/{c.id}/change/',
+            'extendedProps': {'tipo': 'evento'}
+        }
+        if c.tipo_servicio == 'HOSPEDAJE' and c.fecha_salida:
+            # Rango real (FullCalendar: 'end' es exclusivo), en vez del punto
+            # de un solo día que sigue usando el resto de los servicios.
+            evento['end'] = _dia(c.fecha_salida)
+        yield c.fecha_evento, c.fecha_salida or c.fecha_evento + timedelta(days=1), evento
+
+
+def _reservas(inicio, fin):
+    reservas = ReservaAirbnb.objects.filter(
+        estado__in=['CONFIRMADA', 'BLOQUEADA', 'PENDIENTE'],
+        anuncio__activo=True,
+        fecha_inicio__lt=fin, fecha_fin__gte=inicio,
+    ).select_related('anuncio').annotate(
+        tiene_conflicto=Exists(ConflictoCalendario.objects.filter(
+            reserva_airbnb=OuterRef('pk'), estado='PENDIENTE',
+        )),
+    )
+
+    for r in reservas:
+        if r.tiene_conflicto:
+            color = '#e74c3c'
+        elif r.estado == 'PENDIENTE':
+            color = '#f39c12'
+        elif r.estado == 'BLOQUEADA':
+            color = '#6c757d'
+        elif r.anuncio.tipo == 'CASA':
+            color = '#3498db'
+        else:
+            color = '#e67e22'
+
+        # `fecha_fin__gte`: el día de salida también cuenta como traslape.
+        yield r.fecha_inicio, r.fecha_fin + timedelta(days=1), {
+            'id': f'airbnb-{r.id}',
+            'title': f" {r.anuncio.nombre}: {r.titulo or 'Reserva'}",
+            'start': _dia(r.fecha_inicio),
+            'end': _dia(r.fecha_fin),
+            'color': color,
+            'url': f'/admin/airbnb/reservaairbnb/{r.id}/change/',
+            'extendedProps': {'tipo': 'airbnb'}
+        }
+
+
+def _espacios(inicio, fin):
+    from comercial.models import AsignacionEspacio
+
+    asignaciones = AsignacionEspacio.objects.filter(
+        fecha__gte=inicio, fecha__lt=fin,
+    ).select_related('espacio')
+    for a in asignaciones:
+        yield a.fecha, a.fecha + timedelta(days=1), {
+            'id': f'espacio-{a.id}',
+            'title': f"📍 {a.espacio.nombre}: COT-{a.cotizacion_id:03d}",
+            'start': f"{_dia(a.fecha)}T{a.hora_inicio.strftime('%H:%M:%S')}",
+            'end': f"{_dia(a.fecha)}T{a.hora_fin.strftime('%H:%M:%S')}" if a.hora_fin > a.hora_inicio else None,
+            'color': '#9b59b6',
+            'url': f'/admin/comercial/asignacionespacio/{a.id}/change/',
+            'extendedProps': {'tipo': 'espacio'}
+        }
+
+
+def _personal(inicio, fin):
+    from comercial.models import AsignacionPersonal
+
+    asignaciones = AsignacionPersonal.objects.filter(
+        fecha__gte=inicio, fecha__lt=fin,
+    ).select_related('empleado')
+    for a in asignaciones:
+        yield a.fecha, a.fecha + timedelta(days=1), {
+            'id': f'personal-{a.id}',
+            'title': f"👤 {a.empleado.nombre} ({a.get_rol_display()})",
+            'start': f"{_dia(a.fecha)}T{a.hora_inicio.strftime('%H:%M:%S')}",
+            'color': '#16a085',
+            'url': f'/admin/comercial/asignacionpersonal/{a.id}/change/',
+            'extendedProps': {'tipo': 'personal'}
+        }
+
+
+FUENTES = {
+    'cotizaciones': _cotizaciones,
+    'airbnb': _reservas,
+    'espacios': _espacios,
+    'personal': _personal,
+}
+
+
+# ─────────────────────────────── Rebanadas ─────────────────────────────────
+
+def _meses(inicio, fin):
+    """Primer día de cada mes que toca [inicio, fin)."""
+    mes = inicio.replace(day=1)
+    while mes < fin:
+        yield mes
+        mes = (mes + timedelta(days=32)).replace(day=1)
+
+
+def _clave_generacion(fuente):
+    return f'{PREFIJO}:{fuente}:gen'
+
+
+def _generaciones():
+    claves = {fuente: _clave_generacion(fuente) for fuente in FUENTES}
+    guardadas = cache.get_many(claves.values())
+    generaciones = {}
+    for fuente, clave in claves.items():
+        generacion = guardadas.get(clave)
+        if generacion is None:
+            cache.add(clave, uuid.uuid4().hex[:8], None)
+            generacion = cache.get(clave)
+        generaciones[fuente] = generacion
+    return generaciones
+
+
+def _armar(fuente, mes):
+    siguiente = (mes + timedelta(days=32)).replace(day=1)
+    filas = [
+        (desde.isoformat(), hasta.isoformat(), evento)
+        for desde, hasta, evento in FUENTES[fuente](mes, siguiente)
+    ]
+    eventos = [evento for _, _, evento in filas]
+    version = hashlib.sha256(
+        json.dumps(eventos, sort_keys=True, ensure_ascii=False).encode()
+    ).hexdigest()[:12]
+    return {'version': version, 'filas': filas}
+
+
+def rebanadas(inicio, fin):
+    """
+    Rebanadas que cubren [inicio, fin), en orden: dict `clave → rebanada`,
+    con `clave` = 'fuente:AAAA-MM' y rebanada = {'version', 'filas'}.
+    Las que faltan en el cache se arman y se guardan en una sola escritura.
+    """
+    generaciones = _generaciones()
+    claves = {
+        f'{fuente}:{mes:%Y-%m}': (
+            fuente, mes, f'{PREFIJO}:rebanada:{fuente}:{generaciones[fuente]}:{mes:%Y-%m}',
+        )
+        for mes in _meses(inicio, fin)
+        for fuente in FUENTES
+    }
+    guardadas = cache.get_many([clave_cache for _, _, clave_cache in claves.values()])
+
+    resultado, nuevas = {}, {}
+    for clave, (fuente, mes, clave_cache) in claves.items():
+        rebanada = guardadas.get(clave_cache)
+        if rebanada is None:
+            rebanada = nuevas[clave_cache] = _armar(fuente, mes)
+        resultado[clave] = rebanada
+    if nuevas:
+        cache.set_many(nuevas, SEGUNDOS_REBANADA)
+    return resultado
+
+
+def eventos_de(rebanadas_, inicio=None, fin=None):
+    """Eventos de las rebanadas sin repetir (un Hospedaje de julio a agosto
+    vive en las dos), opcionalmente solo los que se traslapan con [inicio, fin)."""
+    desde_max = fin.isoformat() if fin else None
+    hasta_min = inicio.isoformat() if inicio else None
+    vistos, eventos = set(), []
+    for rebanada in rebanadas_:
+        for desde, hasta, evento in rebanada['filas']:
+            if evento['id'] in vistos:
+                continue
+            if desde_max and not (desde < desde_max and hasta > hasta_min):
+                continue
+            vistos.add(evento['id'])
+            eventos.append(evento)
+    return eventos
+
+
+def eventos_calendario(inicio, fin):
+    """Lista plana de eventos que se traslapan con [inicio, fin)."""
+    return eventos_de(rebanadas(inicio, fin).values(), inicio, fin)
+
+
+def leer_version(token):
+    """'fuente:AAAA-MM=version,...' → dict clave → version. Ignora basura."""
+    versiones = {}
+    for parte in (token or '').split(','):
+        clave, _, version = parte.partition('=')
+        if clave and version:
+            versiones[clave.strip()] = version.strip()
+    return versiones
+
+
+def escribir_version(rebanadas_):
+    return ','.join(f'{clave}={r["version"]}' for clave, r in rebanadas_.items())
+
+
+# ─────────────────────────────── Invalidación ──────────────────────────────
+
+def invalidar_fuente(*fuentes):
+    """Cambia la generación de `fuentes` ahora y otra vez al confirmar: una
+    petición entre el cambio y el commit habría armado la rebanada nueva con
+    los datos de antes."""
+    def _nueva_generacion():
+        cache.set_many({_clave_generacion(f): uuid.uuid4().hex[:8] for f in fuentes}, None)
+    _nueva_generacion()
+    transaction.on_commit(_nueva_generacion)
+
+
+_FUENTES_POR_MODELO = {
+    'comercial.Cotizacion': ('cotizaciones',),
+    'comercial.Cliente': ('cotizaciones',),
+    'comercial.AsignacionEspacio': ('espacios',),
+    'comercial.AsignacionPersonal': ('personal',),
+    ReservaAirbnb: ('airbnb',),
+    ConflictoCalendario: ('airbnb',),
+    AnuncioAirbnb: ('airbnb',),
+}
+
+
+def _receptor(fuentes):
+    def _invalidar(sender, **kwargs):
+        invalidar_fuente(*fuentes)
+    return _invalidar
+
+
+for _modelo, _fuentes in _FUENTES_POR_MODELO.items():
+    _nombre = _modelo if isinstance(_modelo, str) else _modelo.__name__
+    for _signal, _sufijo in ((post_save, 'save'), (post_delete, 'delete')):
+        _signal.connect(
+            _receptor(_fuentes), sender=_modelo, weak=False,
+            dispatch_uid=f'calendario_{_nombre}_{_sufijo}',
+        )
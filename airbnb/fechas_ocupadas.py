@@ -0,0 +1,134 @@
+"""
+Días ocupados del cotizador público
+===================================
+El cotizador pide `/api/fechas-ocupadas/?dias=730` en cada carga para
+deshabilitar en el calendario los días ya apartados. En vez de leer los
+bloqueos y expandirlos día por día en cada petición, el conjunto de días
+ocupados se guarda en el cache de Django como un mapa de bits: el bit `i`
+es el día `EPOCA + inicio + i`, con `inicio` = días de EPOCA a la fecha en
+que se armó. Cubre `DIAS_MAPA` días desde ese día.
+
+Igual que el feed iCal (ver feed_ical.py), el artefacto se marca como viejo
+al guardar o borrar una reserva, un anuncio o una cotización tocando su
+estado, sus fechas o su tipo de servicio, y al cambiar de día. Se
+reconstruye en la siguiente consulta.
+
+Un bloqueo ocupa [fecha_inicio, fecha_fin): el día de salida no cuenta,
+mismo criterio que `verificar_disponibilidad_rango`.
+"""
+import hashlib
+from datetime import date, timedelta
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+
+from .feed_ical import CAMPOS_FEED
+from .models import AnuncioAirbnb, ReservaAirbnb
+
+CLAVE_MAPA = 'airbnb:fechas_ocupadas'
+CLAVE_VIEJO = 'airbnb:fechas_ocupadas:viejo'
+
+EPOCA = date(2000, 1, 1)
+
+# Lo más que pide el endpoint (730) más el día de hoy.
+DIAS_MAPA = 731
+
+# Se reconstruye a diario de todos modos; el timeout solo evita huérfanos.
+SEGUNDOS_MAPA = 2 * 24 * 3600
+
+
+def armar_mapa(hoy):
+    """(bits, etag) de los días ocupados en [hoy, hoy + DIAS_MAPA)."""
+    from . import validacion_fechas
+
+    fin = hoy + timedelta(days=DIAS_MAPA)
+    bits = 0
+    for bloqueo in validacion_fechas.obtener_fechas_bloqueadas(hoy, fin):
+        desde = max((bloqueo['fecha_inicio'] - hoy).days, 0)
+        hasta = min((bloqueo['fecha_fin'] - hoy).days, DIAS_MAPA)
+        if hasta > desde:
+            bits |= ((1 << (hasta - desde)) - 1) << desde
+    datos = bits.to_bytes((DIAS_MAPA + 7) // 8, 'little')
+    return datos, hashlib.sha256(datos).hexdigest()[:16]
+
+
+def mapa_ocupado(hoy):
+    """
+    Artefacto vigente para `hoy`: dict con `fecha` (ISO del día en que se
+    armó), `inicio` (días desde EPOCA), `bits` y `etag`. Sin cambios
+    pendientes cuesta una lectura del cache.
+    """
+    guardado = cache.get_many([CLAVE_MAPA, CLAVE_VIEJO])
+    artefacto = guardado.get(CLAVE_MAPA)
+    if artefacto and artefacto['fecha'] == hoy.isoformat() and not guardado.get(CLAVE_VIEJO):
+        return artefacto
+
+    # Se limpia la marca antes de leer: un cambio que entre mientras se
+    # reconstruye la vuelve a poner y la siguiente consulta lo recoge.
+    cache.delete(CLAVE_VIEJO)
+    bits, etag = armar_mapa(hoy)
+    artefacto = {
+        'fecha': hoy.isoformat(),
+        'inicio': (hoy - EPOCA).days,
+        'bits': bits,
+        'etag': etag,
+    }
+    cache.set(CLAVE_MAPA, artefacto, SEGUNDOS_MAPA)
+    return artefacto
+
+
+def rebanar(artefacto, desde, hasta):
+    """Bits de los días [desde, hasta] como int (bit 0 = `desde`)."""
+    base = EPOCA + timedelta(days=artefacto['inicio'])
+    corrimiento = (desde - base).days
+    dias = (hasta - desde).days + 1
+    return (int.from_bytes(artefacto['bits'], 'little') >> corrimiento) & ((1 << dias) - 1)
+
+
+def fechas(bits, desde):
+    """Lista ISO de los días con su bit encendido."""
+    resultado = []
+    while bits:
+        bajo = bits & -bits
+        resultado.append((desde + timedelta(days=bajo.bit_length() - 1)).isoformat())
+        bits ^= bajo
+    return resultado
+
+
+def rangos(bits, desde):
+    """[[ISO del primer día, días seguidos], ...] de los tramos ocupados."""
+    resultado, dia = [], 0
+    while bits:
+        libres = (bits & -bits).bit_length() - 1
+        bits >>= libres
+        dia += libres
+        seguidos = (~bits & (bits + 1)).bit_length() - 1
+        resultado.append([(desde + timedelta(days=dia)).isoformat(), seguidos])
+        bits >>= seguidos
+        dia += seguidos
+    return resultado
+
+
+def invalidar_fechas_ocupadas():
+    """Marca el mapa como viejo ahora y otra vez al confirmar: una consulta
+    entre el cambio y el commit lo habría reconstruido con los datos de antes."""
+    cache.set(CLAVE_VIEJO, True, SEGUNDOS_MAPA)
+    transaction.on_commit(lambda: cache.set(CLAVE_VIEJO, True, SEGUNDOS_MAPA))
+
+
+def _cotizacion_cambiada(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and not CAMPOS_FEED.intersection(update_fields):
+        return
+    invalidar_fechas_ocupadas()
+
+
+def _bloqueo_cambiado(sender, **kwargs):
+    invalidar_fechas_ocupadas()
+
+
+post_save.connect(_cotizacion_cambiada, sender='comercial.Cotizacion', dispatch_uid='fechas_ocupadas_cot_save')
+post_delete.connect(_cotizacion_cambiada, sender='comercial.Cotizacion', dispatch_uid='fechas_ocupadas_cot_delete')
+for _modelo in (ReservaAirbnb, AnuncioAirbnb):
+    post_save.connect(_bloqueo_cambiado, sender=_modelo, dispatch_uid=f'fechas_ocupadas_{_modelo.__name__}_save')
+    post_delete.connect(_bloqueo_cambiado, sender=_modelo, dispatch_uid=f'fechas_ocupadas_{_modelo.__name__}_delete')
@@ -0,0 +1,147 @@
+"""
+Feed iCal de eventos para Airbnb
+================================
+Airbnb consulta `/airbnb/ical/eventos/` cada vez que quiere, no cuando algo
+cambia. El feed se sirve de un artefacto ya renderizado que vive en el cache
+de Django: el VCALENDAR completo, su ETag (hash del contenido), un número de
+versión y la fecha de la última vez que el contenido cambió de verdad.
+
+El artefacto se marca como viejo cuando se guarda o se borra una cotización
+tocando su estado, sus fechas o su tipo de servicio, y también al cambiar de
+día (el feed solo lleva los últimos 30 días). Se reconstruye en la siguiente
+consulta. Como el contenido es determinista —DTSTAMP sale de `created_at` de
+cada cotización, no de la hora actual—, reconstruir sin cambios reales
+produce el mismo ETag y Airbnb sigue recibiendo 304.
+"""
+import hashlib
+from datetime import datetime, time, timedelta
+from datetime import timezone as dt_timezone
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.utils import timezone
+
+CLAVE_FEED = 'airbnb:ical_eventos'
+CLAVE_VIEJO = 'airbnb:ical_eventos:viejo'
+
+# El artefacto se reconstruye a diario de todos modos; el timeout solo evita
+# que uno huérfano se quede en la tabla del cache para siempre.
+SEGUNDOS_FEED = 2 * 24 * 3600
+
+# Campos de Cotizacion que cambian lo que publica el feed.
+CAMPOS_FEED = frozenset({'estado', 'fecha_evento', 'fecha_salida', 'tipo_servicio'})
+
+FORMATO_UTC = '%Y%m%dT%H%M%SZ'
+
+
+def _marca_utc(cot):
+    """Marca de tiempo estable del evento: su alta, o el día del evento."""
+    if cot.created_at:
+        return cot.created_at.astimezone(dt_timezone.utc).strftime(FORMATO_UTC)
+    return datetime.combine(cot.fecha_evento, time.min).strftime(FORMATO_UTC)
+
+
+def renderizar_feed(hoy):
+    """VCALENDAR con las cotizaciones CONFIRMADA de los últimos 30 días y futuras."""
+    from comercial.models import Cotizacion
+
+    cotizaciones = (
+        Cotizacion.objects
+        .filter(estado='CONFIRMADA', fecha_evento__gte=hoy - timedelta(days=30))
+        .only('id', 'fecha_evento', 'fecha_salida', 'tipo_servicio', 'created_at')
+        .order_by('fecha_evento', 'id')
+    )
+
+    lineas = [
+        'BEGIN:VCALENDAR',
+        'VERSION:2.0',
+        'PRODID:-//Quinta Koox Tanil//ERP//ES',
+        'CALSCALE:GREGORIAN',
+        'METHOD:PUBLISH',
+        'X-WR-CALNAME:Eventos Quinta Koox Tanil',
+        'X-WR-TIMEZONE:America/Merida',
+    ]
+
+    for cot in cotizaciones:
+        # Fecha de inicio y fin: rango real de noches para Hospedaje, un solo
+        # día (evento de día completo) para el resto de los servicios.
+        fecha_fin = (
+            cot.fecha_salida if cot.tipo_servicio == 'HOSPEDAJE' and cot.fecha_salida
+            else cot.fecha_evento + timedelta(days=1)
+        )
+        marca = _marca_utc(cot)
+
+        # Ni el nombre del cliente ni el del evento salen del ERP: el feed solo
+        # existe para que Airbnb bloquee la fecha, y para eso basta el folio.
+        # Publicar "Cliente: NOMBRE" regalaba la cartera a quien tuviera la URL.
+        # Como el folio es numérico, tampoco hay nada que escapar (RFC 5545).
+        lineas.extend([
+            'BEGIN:VEVENT',
+            f'UID:evento-{cot.id}@qkt-erp',
+            f'DTSTAMP:{marca}',
+            f'CREATED:{marca}',
+            f"DTSTART;VALUE=DATE:{cot.fecha_evento.strftime('%Y%m%d')}",
+            f"DTEND;VALUE=DATE:{fecha_fin.strftime('%Y%m%d')}",
+            f'SUMMARY:EVENTO QKT: COT-{cot.id:03d}',
+            'DESCRIPTION:Fecha no disponible.',
+            'STATUS:CONFIRMED',
+            'TRANSP:OPAQUE',
+            'END:VEVENT',
+        ])
+
+    lineas.append('END:VCALENDAR')
+    return '\r\n'.join(lineas)
+
+
+def feed_eventos():
+    """
+    Artefacto vigente del feed: dict con `contenido`, `etag`, `version` y
+    `ultima_modificacion` (epoch). Sin cambios pendientes cuesta una lectura
+    del cache; si hay que reconstruir, una consulta de cotizaciones más.
+    """
+    hoy = timezone.localdate()
+    guardado = cache.get_many([CLAVE_FEED, CLAVE_VIEJO])
+    artefacto = guardado.get(CLAVE_FEED)
+    if artefacto and artefacto['fecha'] == hoy.isoformat() and not guardado.get(CLAVE_VIEJO):
+        return artefacto
+
+    # Se limpia la marca antes de leer: un cambio que entre mientras se
+    # reconstruye la vuelve a poner y la siguiente consulta lo recoge.
+    cache.delete(CLAVE_VIEJO)
+    contenido = renderizar_feed(hoy)
+    etag = '"%s"' % hashlib.sha256(contenido.encode()).hexdigest()[:32]
+    if artefacto and artefacto['etag'] == etag:
+        version, ultima_modificacion = artefacto['version'], artefacto['ultima_modificacion']
+    else:
+        version = (artefacto['version'] + 1) if artefacto else 1
+        ultima_modificacion = int(timezone.now().timestamp())
+
+    artefacto = {
+        'fecha': hoy.isoformat(),
+        'version': version,
+        'etag': etag,
+        'ultima_modificacion': ultima_modificacion,
+        'contenido': contenido,
+    }
+    cache.set(CLAVE_FEED, artefacto, SEGUNDOS_FEED)
+    return artefacto
+
+
+def invalidar_feed_eventos():
+    """Marca el feed como viejo ahora y otra vez al confirmar: una consulta
+    entre el cambio y el commit lo habría reconstruido con los datos de antes."""
+    cache.set(CLAVE_VIEJO, True, SEGUNDOS_FEED)
+    transaction.on_commit(lambda: cache.set(CLAVE_VIEJO, True, SEGUNDOS_FEED))
+
+
+def _cotizacion_cambiada(sender, instance, update_fields=None, **kwargs):
+    # El modelo no guarda el estado anterior, así que un save() completo
+    # invalida siempre; si no cambió nada visible, el ETag sale igual.
+    if update_fields is not None and not CAMPOS_FEED.intersection(update_fields):
+        return
+    invalidar_feed_eventos()
+
+
+post_save.connect(_cotizacion_cambiada, sender='comercial.Cotizacion', dispatch_uid='feed_ical_save')
+post_delete.connect(_cotizacion_cambiada, sender='comercial.Cotizacion', dispatch_uid='feed_ical_delete')
@@ -137,6 +137,24 @@ class CalendarioEventosRangoTest(TestCase):
         respuesta = self.client.get(reverse('calendario_unificado_eventos'))
         self.assertEqual(respuesta.status_code, 400)
 
+    def test_un_rango_de_siglos_responde_400_sin_armar_rebanadas(self):
+        with patch('airbnb.views.rebanadas') as rebanadas, patch('airbnb.views.eventos_calendario') as eventos:
+            for params in (
+                {'start': '1900-01-01', 'end': '2100-01-01'},
+                {'start': '1900-01-01', 'end': '2100-01-01', 'version': ''},
+                {'start': '2027-07-01', 'end': '2027-06-01'},
+            ):
+                respuesta = self.client.get(reverse('calendario_unificado_eventos'), params)
+                self.assertEqual(respuesta.status_code, 400, params)
+        rebanadas.assert_not_called()
+        eventos.assert_not_called()
+
+    def test_la_vista_de_anio_cabe_en_el_rango(self):
+        respuesta = self.client.get(
+            reverse('calendario_unificado_eventos'), {'start': '2026-12-28', 'end': '2028-01-03'},
+        )
+        self.assertEqual(respuesta.status_code, 200)
+
     def test_staff_sin_permiso_recibe_403(self):
         staff_sin_permiso = get_user_model().objects.create_user(
             username='staff_sin_permiso_calendario', password='Segura-190!', is_staff=True,
@@ -187,7 +205,7 @@ class FeedIcalTest(TestCase):
     def test_el_feed_no_publica_datos_del_cliente(self):
         cuerpo = self.client.get(self.url, {'token': TOKEN}).content.decode()
 
-        # DTSTAMP y CREATED llevan la hora actual, y buscar el número de
+        # DTSTAMP y CREATED llevan la hora de alta de la cotización, y buscar el número de
         # invitados (137) sobre el cuerpo completo choca con ella cada vez que
         # esos dígitos caen seguidos en la marca de tiempo — p. ej.
         # `20260814T22`0137`Z`. Se comprueba sobre el resto del feed, que es
@@ -4,10 +4,17 @@ Tests del módulo Airbnb
 """
 from datetime import date, time, timedelta
 from decimal import Decimal
+from io import StringIO
 
-from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
 
-from airbnb.models import AnuncioAirbnb, PagoAirbnb, ReservaAirbnb
+from airbnb.calendario import eventos_calendario
+from airbnb.models import AnuncioAirbnb, ConflictoCalendario, PagoAirbnb, ReservaAirbnb
 from airbnb.services import DetectorConflictosService
 from comercial.models import Cliente, Cotizacion
 from core_erp.test_utils import login_superuser_con_totp
@@ -713,3 +720,255 @@ class ConciliacionDepositosTest(TestCase):
 
         self.assertEqual(respuesta.status_code, 302)
         self.assertIn('/admin/login/', respuesta['Location'])
+
+
+@override_settings(ICAL_PUBLIC_TOKEN='token-feed')
+class FeedIcalCacheTest(TestCase):
+    """El feed se sirve de un artefacto versionado con ETag/Last-Modified."""
+
+    def setUp(self):
+        self.url = reverse('airbnb:ical_eventos')
+        self.cot = Cotizacion.objects.create(
+            cliente=Cliente.objects.create(nombre='C'),
+            nombre_evento='E',
+            fecha_evento=date.today() + timedelta(days=10),
+            estado='CONFIRMADA',
+        )
+
+    def _get(self, **headers):
+        return self.client.get(self.url, {'token': 'token-feed'}, headers=headers)
+
+    def _lee_cotizaciones(self, **headers):
+        with CaptureQueriesContext(connection) as ctx:
+            respuesta = self._get(**headers)
+        return respuesta, any('comercial_cotizacion' in q['sql'] for q in ctx.captured_queries)
+
+    def test_dos_consultas_seguidas_dan_el_mismo_cuerpo_y_etag(self):
+        primera, segunda = self._get(), self._get()
+        self.assertEqual(primera.content, segunda.content)
+        self.assertEqual(primera['ETag'], segunda['ETag'])
+        self.assertFalse(primera['ETag'].startswith('W/'))
+        self.assertIn('Last-Modified', primera)
+
+    def test_consulta_condicional_recibe_304_sin_leer_cotizaciones(self):
+        etag = self._get()['ETag']
+        respuesta, leyo = self._lee_cotizaciones(if_none_match=etag)
+        self.assertEqual(respuesta.status_code, 304)
+        self.assertEqual(respuesta['ETag'], etag)
+        self.assertFalse(leyo)
+
+    def test_if_modified_since_tambien_da_304(self):
+        ultima = self._get()['Last-Modified']
+        self.assertEqual(self._get(if_modified_since=ultima).status_code, 304)
+
+    def test_cambiar_el_estado_publica_una_version_nueva(self):
+        etag = self._get()['ETag']
+        self.cot.estado = 'CANCELADA'
+        self.cot.save(update_fields=['estado'])
+        respuesta = self._get(if_none_match=etag)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertNotEqual(respuesta['ETag'], etag)
+        self.assertNotIn('BEGIN:VEVENT', respuesta.content.decode())
+
+    def test_un_campo_ajeno_al_feed_no_lo_invalida(self):
+        self._get()
+        self.cot.num_personas = 80
+        self.cot.save(update_fields=['num_personas'])
+        _, leyo = self._lee_cotizaciones()
+        self.assertFalse(leyo)
+
+    def test_reconstruir_sin_cambios_conserva_el_etag(self):
+        primera = self._get()
+        self.cot.save()  # save() completo: invalida, pero nada visible cambió
+        respuesta, leyo = self._lee_cotizaciones(if_none_match=primera['ETag'])
+        self.assertTrue(leyo)
+        self.assertEqual(respuesta.status_code, 304)
+        self.assertEqual(respuesta['Last-Modified'], primera['Last-Modified'])
+
+    def test_cerrar_cotizaciones_invalida_el_feed(self):
+        self.cot.fecha_evento = date.today() - timedelta(days=2)
+        self.cot.save(update_fields=['fecha_evento'])
+        self.assertIn('BEGIN:VEVENT', self._get().content.decode())
+        call_command('cerrar_cotizaciones', stdout=StringIO())
+        self.assertNotIn('BEGIN:VEVENT', self._get().content.decode())
+
+
+class CalendarioRebanadasTest(TestCase):
+    """Eventos del calendario por rebanadas (mes, fuente) en el cache."""
+
+    JUNIO = (date(2027, 6, 1), date(2027, 7, 1))
+
+    def setUp(self):
+        self.cliente = Cliente.objects.create(nombre='Cliente Cal')
+        self.anuncio = AnuncioAirbnb.objects.create(
+            nombre='Casa Cal', url_ical='https://airbnb.mx/calendar/ical/9.ics',
+        )
+
+    def _reserva(self, dia, conflicto=False):
+        reserva = ReservaAirbnb.objects.create(
+            anuncio=self.anuncio, uid_ical=f'uid-cal-{dia}',
+            fecha_inicio=date(2027, 6, dia), fecha_fin=date(2027, 6, dia + 2),
+        )
+        if conflicto:
+            cot = Cotizacion.objects.create(
+                cliente=self.cliente, nombre_evento='Choque', fecha_evento=date(2027, 6, dia),
+            )
+            ConflictoCalendario.objects.create(
+                reserva_airbnb=reserva, cotizacion=cot, fecha_conflicto=date(2027, 6, dia),
+            )
+        return reserva
+
+    def _consultas(self, inicio, fin):
+        with CaptureQueriesContext(connection) as ctx:
+            eventos = eventos_calendario(inicio, fin)
+        return eventos, [q['sql'] for q in ctx.captured_queries]
+
+    def test_el_conflicto_se_anota_sin_una_consulta_por_reserva(self):
+        for dia in (3, 10, 14, 18):
+            self._reserva(dia, conflicto=True)
+        eventos, consultas = self._consultas(*self.JUNIO)
+
+        # Una sola consulta de reservas, con el conflicto como subconsulta.
+        self.assertEqual(sum('airbnb_conflictocalendario' in sql for sql in consultas), 1)
+        self.assertEqual(sum('airbnb_reservaairbnb' in sql for sql in consultas), 1)
+        rojas = [e for e in eventos if e['extendedProps']['tipo'] == 'airbnb' and e['color'] == '#e74c3c']
+        self.assertEqual(len(rojas), 4)
+
+    def test_volver_a_un_mes_ya_armado_no_consulta_modelos(self):
+        self._reserva(3)
+        self._consultas(*self.JUNIO)
+        _, consultas = self._consultas(*self.JUNIO)
+        self.assertFalse([sql for sql in consultas if 'airbnb_reservaairbnb' in sql or 'comercial_' in sql])
+
+    def test_guardar_una_cotizacion_refresca_el_mes(self):
+        self._consultas(*self.JUNIO)
+        Cotizacion.objects.create(cliente=self.cliente, nombre_evento='Nueva', fecha_evento=date(2027, 6, 20))
+        eventos, _ = self._consultas(*self.JUNIO)
+        self.assertTrue(any('Nueva' in e['title'] for e in eventos))
+
+    def test_un_hospedaje_entre_dos_meses_sale_una_sola_vez(self):
+        Cotizacion.objects.create(
+            cliente=self.cliente, nombre_evento='Largo', tipo_servicio='HOSPEDAJE',
+            fecha_evento=date(2027, 6, 28), fecha_salida=date(2027, 7, 3),
+        )
+        eventos = eventos_calendario(date(2027, 6, 20), date(2027, 7, 10))
+        self.assertEqual(sum('Largo' in e['title'] for e in eventos), 1)
+
+    def test_el_endpoint_con_version_solo_devuelve_rebanadas_cambiadas(self):
+        login_superuser_con_totp(self.client, get_user_model().objects.create_user(
+            username='staff_cal', password='Segura-190!', is_staff=True, is_superuser=True,
+        ))
+        url = reverse('calendario_unificado_eventos')
+        rango = {'start': '2027-06-01', 'end': '2027-07-01'}
+
+        primera = self.client.get(url, {**rango, 'version': ''}).json()
+        self.assertEqual(set(primera['rebanadas']), set(primera['claves']))
+
+        sin_cambios = self.client.get(url, {**rango, 'version': primera['version']}).json()
+        self.assertEqual(sin_cambios['rebanadas'], {})
+
+        Cotizacion.objects.create(cliente=self.cliente, nombre_evento='Otra', fecha_evento=date(2027, 6, 9))
+        cambio = self.client.get(url, {**rango, 'version': primera['version']}).json()
+        self.assertEqual(list(cambio['rebanadas']), ['cotizaciones:2027-06'])
+        self.assertTrue(any('Otra' in e['title'] for e in cambio['rebanadas']['cotizaciones:2027-06']['eventos']))
+
+
+class FechasOcupadasTest(TestCase):
+    """`/api/fechas-ocupadas/` sale del mapa de bits del cache."""
+
+    def setUp(self):
+        from django.utils import timezone
+
+        self.hoy = timezone.now().date()
+        self.url = reverse('api_fechas_ocupadas')
+        self.anuncio = AnuncioAirbnb.objects.create(
+            nombre='Casa Test', url_ical='https://www.airbnb.mx/calendar/ical/9.ics',
+            afecta_eventos_quinta=True,
+        )
+        self.cliente = Cliente.objects.create(nombre='C')
+
+    def _dia(self, n):
+        return self.hoy + timedelta(days=n)
+
+    def _reserva(self, ini, fin, estado='CONFIRMADA'):
+        return ReservaAirbnb.objects.create(
+            anuncio=self.anuncio, uid_ical=f'uid-{ini}-{fin}', fecha_inicio=ini, fecha_fin=fin,
+            estado=estado,
+        )
+
+    def _cotizacion(self, fecha, salida=None, estado='CONFIRMADA'):
+        return Cotizacion.objects.create(
+            cliente=self.cliente, nombre_evento='E', fecha_evento=fecha, fecha_salida=salida,
+            tipo_servicio='HOSPEDAJE' if salida else 'EVENTO', estado=estado,
+        )
+
+    def _esperadas(self, dias):
+        """Referencia: expandir cada bloqueo día por día, [inicio, fin)."""
+        from airbnb.validacion_fechas import obtener_fechas_bloqueadas
+
+        fin = self._dia(dias)
+        fechas = set()
+        for b in obtener_fechas_bloqueadas(self.hoy, fin):
+            d = b['fecha_inicio']
+            while d < b['fecha_fin']:
+                if self.hoy <= d <= fin:
+                    fechas.add(d.isoformat())
+                d += timedelta(days=1)
+        return sorted(fechas)
+
+    def _get(self, **params):
+        return self.client.get(self.url, params)
+
+    def test_mismas_fechas_que_expandir_los_bloqueos(self):
+        self._reserva(self._dia(-3), self._dia(2))
+        self._reserva(self._dia(10), self._dia(13))
+        self._reserva(self._dia(12), self._dia(15))
+        self._reserva(self._dia(20), self._dia(22), estado='CANCELADA')
+        self._reserva(self._dia(725), self._dia(740))
+        self._cotizacion(self._dia(5))
+        self._cotizacion(self._dia(-1), salida=self._dia(1))
+        self._cotizacion(self._dia(30), salida=self._dia(33))
+        self._cotizacion(self._dia(40), estado='COTIZADA')
+
+        for dias in (1, 14, 365, 730):
+            with self.subTest(dias=dias):
+                datos = self._get(dias=dias).json()
+                self.assertEqual(datos['fechas_ocupadas'], self._esperadas(dias))
+                self.assertEqual(datos['hasta'], self._dia(dias).isoformat())
+
+        # El día de salida queda libre: un evento de un día no bloquea el siguiente.
+        fechas = self._get(dias=30).json()['fechas_ocupadas']
+        self.assertIn(self._dia(5).isoformat(), fechas)
+        self.assertNotIn(self._dia(6).isoformat(), fechas)
+
+    def test_formato_por_rangos(self):
+        self._reserva(self._dia(10), self._dia(13))
+        self._reserva(self._dia(12), self._dia(15))
+        self._cotizacion(self._dia(20))
+
+        datos = self._get(dias=60, formato='rangos').json()
+        self.assertEqual(datos['rangos'], [
+            [self._dia(10).isoformat(), 5],
+            [self._dia(20).isoformat(), 1],
+        ])
+
+    def test_consulta_condicional_da_304_sin_leer_bloqueos(self):
+        self._reserva(self._dia(3), self._dia(5))
+        primera = self._get(dias=30)
+        with CaptureQueriesContext(connection) as ctx:
+            segunda = self.client.get(self.url, {'dias': 30}, headers={'if_none_match': primera['ETag']})
+        self.assertEqual(segunda.status_code, 304)
+        self.assertFalse(any('airbnb_reservaairbnb' in q['sql'] for q in ctx.captured_queries))
+
+    def test_una_reserva_o_cotizacion_nueva_invalida_el_mapa(self):
+        etag = self._get(dias=30)['ETag']
+        self._cotizacion(self._dia(7))
+        respuesta = self.client.get(self.url, {'dias': 30}, headers={'if_none_match': etag})
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.json()['fechas_ocupadas'], [self._dia(7).isoformat()])
+
+        self._reserva(self._dia(9), self._dia(10))
+        self.assertEqual(
+            self._get(dias=30).json()['fechas_ocupadas'],
+            [self._dia(7).isoformat(), self._dia(9).isoformat()],
+        )
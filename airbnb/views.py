@@ -18,10 +18,14 @@ from django.http import HttpResponse, JsonResponse
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse
 from django.utils import timezone
+from django.utils.cache import get_conditional_response
 from django.utils.dateparse import parse_date
+from django.utils.http import http_date
 
 from core_erp.ratelimit import rate_limit
 
+from .calendario import DIAS_MAXIMOS, escribir_version, eventos_calendario, eventos_de, leer_version, rebanadas
+from .feed_ical import feed_eventos
 from .models import AnuncioAirbnb, ConflictoCalendario, PagoAirbnb, ReservaAirbnb
 
 logger = logging.getLogger(__name__)
@@ -35,115 +39,6 @@ MESES = {
 }
 
 
-def _construir_eventos_calendario(fecha_inicio, fecha_fin):
-    """Arma la lista de eventos del calendario unificado, acotada al rango
-    [fecha_inicio, fecha_fin) — nunca el histórico completo. La vista
-    original consultaba todas las cotizaciones/reservas/asignaciones que
-    hayan existido jamás en cada carga de página (SEC-DOS-001): con el
-    histórico creciendo sin límite, eso degrada progresivamente."""
-    from django.db.models import Q
-
-    from comercial.models import AsignacionEspacio, AsignacionPersonal, Cotizacion
-
-    eventos_lista = []
-
-    # EVENTOS DE LA QUINTA (Cotizaciones) — traslape de rango, no solo las que
-    # empiezan dentro de la ventana: un Hospedaje de varias noches puede haber
-    # comenzado antes de fecha_inicio y seguir vigente dentro de la ventana.
-    cotizaciones = Cotizacion.objects.exclude(estado='CANCELADA').filter(
-        fecha_evento__lt=fecha_fin,
-    ).filter(
-        Q(fecha_salida__gt=fecha_inicio)
-        | Q(fecha_salida__isnull=True, fecha_evento__gte=fecha_inicio)
-    ).select_related('cliente')
-
-    for c in cotizaciones:
-        if c.estado == 'CONFIRMADA':
-            color = '#27ae60'
-            icon = ''
-        else:
-            color = '#95a5a6'
-            icon = ''
-
-        evento = {
-            'title': f"{icon} {c.cliente.nombre} - {c.nombre_evento}",
-            'start': c.fecha_evento.strftime("%Y-%m-%d"),
-            'color': color,
-            'url': f'/admin/comercial/cotizacion/{c.id}/change/',
-            'extendedProps': {'tipo': 'evento'}
-        }
-        if c.tipo_servicio == 'HOSPEDAJE' and c.fecha_salida:
-            # Rango real (FullCalendar: 'end' es exclusivo), en vez del punto
-            # de un solo día que sigue usando el resto de los servicios.
-            evento['end'] = c.fecha_salida.strftime("%Y-%m-%d")
-        eventos_lista.append(evento)
-
-    # RESERVAS DE AIRBNB — se incluye cualquier reserva cuyo rango se
-    # traslape con [fecha_inicio, fecha_fin), no solo las que empiezan ahí.
-    reservas = ReservaAirbnb.objects.filter(
-        estado__in=['CONFIRMADA', 'BLOQUEADA', 'PENDIENTE'],
-        anuncio__activo=True,
-        fecha_inicio__lt=fecha_fin, fecha_fin__gte=fecha_inicio,
-    ).select_related('anuncio')
-
-    for r in reservas:
-        tiene_conflicto = r.conflictos.filter(estado='PENDIENTE').exists()
-
-        if tiene_conflicto:
-            color = '#e74c3c'
-            icon = ''
-        elif r.estado == 'PENDIENTE':
-            color = '#f39c12'
-            icon = ''
-        elif r.estado == 'BLOQUEADA':
-            color = '#6c757d'
-            icon = ''
-        elif r.anuncio.tipo == 'CASA':
-            color = '#3498db'
-            icon = ''
-        else:
-            color = '#e67e22'
-            icon = ''
-
-        eventos_lista.append({
-            'title': f"{icon} {r.anuncio.nombre}: {r.titulo or 'Reserva'}",
-            'start': r.fecha_inicio.strftime("%Y-%m-%d"),
-            'end': r.fecha_fin.strftime("%Y-%m-%d"),
-            'color': color,
-            'url': f'/admin/airbnb/reservaairbnb/{r.id}/change/',
-            'extendedProps': {'tipo': 'airbnb'}
-        })
-
-    # ASIGNACIONES DE ESPACIO
-    asignaciones_esp = AsignacionEspacio.objects.filter(
-        fecha__gte=fecha_inicio, fecha__lt=fecha_fin,
-    ).select_related('espacio', 'cotizacion__cliente')
-    for a in asignaciones_esp:
-        eventos_lista.append({
-            'title': f"📍 {a.espacio.nombre}: COT-{a.cotizacion_id:03d}",
-            'start': f"{a.fecha.strftime('%Y-%m-%d')}T{a.hora_inicio.strftime('%H:%M:%S')}",
-            'end': f"{a.fecha.strftime('%Y-%m-%d')}T{a.hora_fin.strftime('%H:%M:%S')}" if a.hora_fin > a.hora_inicio else None,
-            'color': '#9b59b6',
-            'url': f'/admin/comercial/asignacionespacio/{a.id}/change/',
-            'extendedProps': {'tipo': 'espacio'}
-        })
-
-    # ASIGNACIONES DE PERSONAL
-    asignaciones_per = AsignacionPersonal.objects.filter(
-        fecha__gte=fecha_inicio, fecha__lt=fecha_fin,
-    ).select_related('empleado')
-    for a in asignaciones_per:
-        eventos_lista.append({
-            'title': f"👤 {a.empleado.nombre} ({a.get_rol_display()})",
-            'start': f"{a.fecha.strftime('%Y-%m-%d')}T{a.hora_inicio.strftime('%H:%M:%S')}",
-            'color': '#16a085',
-            'url': f'/admin/comercial/asignacionpersonal/{a.id}/change/',
-            'extendedProps': {'tipo': 'personal'}
-        })
-
-    return eventos_lista
-
-
 @staff_member_required
 @permission_required('airbnb.view_reservaairbnb', raise_exception=True)
 def calendario_unificado(request):
@@ -175,15 +70,39 @@ def calendario_unificado(request):
 def calendario_unificado_eventos(request):
     """JSON de eventos del calendario, acotado a `start`/`end` (YYYY-MM-DD,
     fin exclusivo) — el rango que FullCalendar tenga visible en cada momento.
-    Devuelve un array plano de eventos, no un objeto envolvente: es el
-    formato que FullCalendar espera cuando `events` recibe una función que
-    llama a `successCallback(eventos)`."""
+
+    Sin `version` devuelve un array plano de eventos, no un objeto
+    envolvente: es el formato que FullCalendar espera cuando `events` recibe
+    una función que llama a `successCallback(eventos)`.
+
+    Con `version` (las versiones de rebanada que el cliente ya tiene, en el
+    formato del campo `version` de una respuesta anterior; vacío la primera
+    vez) devuelve `{version, claves, rebanadas}`: `claves` son las rebanadas
+    (fuente:AAAA-MM) que cubren el rango y `rebanadas` trae solo las que
+    cambiaron. Ver airbnb.calendario."""
     fecha_inicio = parse_date(request.GET.get('start', ''))
     fecha_fin = parse_date(request.GET.get('end', ''))
     if not fecha_inicio or not fecha_fin:
         return JsonResponse({'error': "Parámetros 'start' y 'end' requeridos (YYYY-MM-DD)."}, status=400)
+    if not 0 < (fecha_fin - fecha_inicio).days <= DIAS_MAXIMOS:
+        return JsonResponse(
+            {'error': f"'end' debe ser posterior a 'start' y el rango de máximo {DIAS_MAXIMOS} días."}, status=400,
+        )
+
+    if 'version' not in request.GET:
+        return JsonResponse(eventos_calendario(fecha_inicio, fecha_fin), safe=False)
 
-    return JsonResponse(_construir_eventos_calendario(fecha_inicio, fecha_fin), safe=False)
+    actuales = rebanadas(fecha_inicio, fecha_fin)
+    conocidas = leer_version(request.GET['version'])
+    return JsonResponse({
+        'version': escribir_version(actuales),
+        'claves': list(actuales),
+        'rebanadas': {
+            clave: {'version': rebanada['version'], 'eventos': eventos_de([rebanada])}
+            for clave, rebanada in actuales.items()
+            if conocidas.get(clave) != rebanada['version']
+        },
+    })
 
 
 @staff_member_required
@@ -366,8 +285,6 @@ def generar_ical_eventos(request):
     from django.conf import settings
     from django.http import HttpResponseForbidden
 
-    from comercial.models import Cotizacion
-
     token_esperado = getattr(settings, 'ICAL_PUBLIC_TOKEN', '')
     if not token_esperado:
         logger.error(
@@ -378,65 +295,18 @@ def generar_ical_eventos(request):
     if not hmac.compare_digest(request.GET.get('token', ''), token_esperado):
         return HttpResponseForbidden('Token inválido')
 
-    # Solo eventos confirmados (últimos 30 días + futuros)
-    cotizaciones = Cotizacion.objects.filter(
-        estado='CONFIRMADA',
-        fecha_evento__gte=timezone.now().date() - timedelta(days=30)
-    ).select_related('cliente')
-
-    # Generar contenido iCal
-    lineas = [
-        'BEGIN:VCALENDAR',
-        'VERSION:2.0',
-        'PRODID:-//Quinta Koox Tanil//ERP//ES',
-        'CALSCALE:GREGORIAN',
-        'METHOD:PUBLISH',
-        'X-WR-CALNAME:Eventos Quinta Koox Tanil',
-        'X-WR-TIMEZONE:America/Merida',
-    ]
-
-    for cot in cotizaciones:
-        uid = f"evento-{cot.id}@qkt-erp"
-
-        # Fecha de inicio y fin: rango real de noches para Hospedaje, un solo
-        # día (evento de día completo) para el resto de los servicios.
-        fecha_inicio = cot.fecha_evento.strftime('%Y%m%d')
-        fecha_fin_date = cot.fecha_salida if cot.tipo_servicio == 'HOSPEDAJE' and cot.fecha_salida else cot.fecha_evento + timedelta(days=1)
-        fecha_fin = fecha_fin_date.strftime('%Y%m%d')
-
-        # Timestamp de creación
-        dtstamp = timezone.now().strftime('%Y%m%dT%H%M%SZ')
-        created = cot.created_at.strftime('%Y%m%dT%H%M%SZ') if hasattr(cot, 'created_at') and cot.created_at else dtstamp
-
-        # Ni el nombre del cliente ni el del evento salen del ERP: el feed solo
-        # existe para que Airbnb bloquee la fecha, y para eso basta el folio.
-        # Publicar "Cliente: NOMBRE" regalaba la cartera a quien tuviera la URL.
-        # Como el folio es numérico, tampoco hay nada que escapar (RFC 5545).
-        titulo = f"EVENTO QKT: COT-{cot.id:03d}"
-        descripcion = "Fecha no disponible."
-
-        lineas.extend([
-            'BEGIN:VEVENT',
-            f'UID:{uid}',
-            f'DTSTAMP:{dtstamp}',
-            f'CREATED:{created}',
-            f'DTSTART;VALUE=DATE:{fecha_inicio}',
-            f'DTEND;VALUE=DATE:{fecha_fin}',
-            f'SUMMARY:{titulo}',
-            f'DESCRIPTION:{descripcion}',
-            'STATUS:CONFIRMED',
-            'TRANSP:OPAQUE',
-            'END:VEVENT',
-        ])
-
-    lineas.append('END:VCALENDAR')
-
-    contenido = '\r\n'.join(lineas)
-
-    response = HttpResponse(contenido, content_type='text/calendar; charset=utf-8')
+    # El VCALENDAR ya viene renderizado (ver airbnb.feed_ical): una consulta
+    # condicional con el ETag o la fecha vigentes recibe 304 sin leer
+    # cotizaciones.
+    feed = feed_eventos()
+    response = HttpResponse(feed['contenido'], content_type='text/calendar; charset=utf-8')
     response['Content-Disposition'] = 'inline; filename="eventos_qkt.ics"'
-
-    return response
+    response['ETag'] = feed['etag']
+    response['Last-Modified'] = http_date(feed['ultima_modificacion'])
+    response['Cache-Control'] = 'no-cache'
+    return get_conditional_response(
+        request, etag=feed['etag'], last_modified=feed['ultima_modificacion'], response=response,
+    )
 
 
 # ==========================================
@@ -5,6 +5,8 @@ from datetime import timedelta
 from django import forms
 from django.contrib import admin, messages
 from django.db import models as db_models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from django.shortcuts import get_object_or_404, redirect, render
 from django.template.loader import render_to_string
 from django.urls import NoReverseMatch, path, reverse
@@ -18,6 +20,7 @@ from .choices import PosicionLanding
 from .models import (
     AsignacionEspacio,
     AsignacionPersonal,
+    CambioEstadoCotizacion,
     Cliente,
     ComponenteProducto,
     Compra,
@@ -68,6 +71,16 @@ BTN_SM = '<a href="{url}" {target} class="btn btn-sm qkt-accion-btn" style="back
 # Rojo (peligro/cancelar):               bg='#e74c3c', fg='white'
 # Gris (neutral/inactivo):               bg='#95a5a6', fg='white'
 
+def _conteo_parcialidades(**filtros):
+    """Subconsulta con el número de parcialidades que cumplen `filtros`, para
+    anotar changelists sin un COUNT por fila (ver PlanPagoAdmin/CotizacionAdmin)."""
+    conteo = (
+        ParcialidadPago.objects.filter(**filtros)
+        .order_by().values('plan').annotate(n=Count('pk')).values('n')
+    )
+    return Coalesce(Subquery(conteo, output_field=db_models.IntegerField()), 0)
+
+
 MEDIA_CONFIG = {
     'css': { 'all': ('css/admin_fix.css', 'css/mobile_fix.css') },
     'js': ('js/tabs_fix.js',)
@@ -446,13 +459,26 @@ class PlanPagoAdmin(admin.ModelAdmin):
     def monto_total(self, obj): return f"${obj.cotizacion.precio_final:,.2f}"
     monto_total.short_description = "Total"
 
+    def get_queryset(self, request):
+        """Progreso y próxima parcialidad vienen anotados: el changelist cuesta
+        lo mismo con 10 que con 100 planes (antes eran 4 consultas por fila)."""
+        siguiente = ParcialidadPago.objects.filter(
+            plan=OuterRef('pk'), pagada=False,
+        ).order_by('fecha_limite', 'numero')
+        return super().get_queryset(request).select_related('cotizacion__cliente').annotate(
+            _num_parcialidades=_conteo_parcialidades(plan=OuterRef('pk')),
+            _num_pagadas=_conteo_parcialidades(plan=OuterRef('pk'), pagada=True),
+            _siguiente_monto=Subquery(siguiente.values('monto')[:1]),
+            _siguiente_fecha=Subquery(siguiente.values('fecha_limite')[:1]),
+        )
+
     def num_parcialidades(self, obj):
-        return f"{obj.parcialidades_pagadas()}/{obj.parcialidades.count()}"
+        return f"{obj._num_pagadas}/{obj._num_parcialidades}"
     num_parcialidades.short_description = "Pagadas"
 
     def progreso_badge(self, obj):
-        pagadas = obj.parcialidades_pagadas()
-        total = obj.parcialidades.count()
+        pagadas = obj._num_pagadas
+        total = obj._num_parcialidades
         if total == 0:
             return '-'
         pct = int((pagadas / total) * 100)
@@ -464,15 +490,15 @@ class PlanPagoAdmin(admin.ModelAdmin):
     progreso_badge.short_description = "Progreso"
 
     def siguiente_pago_info(self, obj):
-        sig = obj.siguiente_pago()
-        if not sig:
+        if obj._siguiente_fecha is None:
             return mark_safe('<span style="color:#27ae60; font-weight:bold;">Liquidado</span>')
-        dias = sig.dias_restantes
+        monto = obj._siguiente_monto
+        dias = (obj._siguiente_fecha - timezone.now().date()).days
         if dias < 0:
-            return format_html('<span style="color:#e74c3c; font-weight:bold;">${} vencido hace {} días</span>', f"{sig.monto:,.2f}", abs(dias))
+            return format_html('<span style="color:#e74c3c; font-weight:bold;">${} vencido hace {} días</span>', f"{monto:,.2f}", abs(dias))
         elif dias <= 7:
-            return format_html('<span style="color:#f39c12; font-weight:bold;">${} en {} días</span>', f"{sig.monto:,.2f}", dias)
-        return format_html('<span style="color:#3498db;">${} el {}</span>', f"{sig.monto:,.2f}", sig.fecha_limite.strftime('%d/%m/%Y'))
+            return format_html('<span style="color:#f39c12; font-weight:bold;">${} en {} días</span>', f"{monto:,.2f}", dias)
+        return format_html('<span style="color:#3498db;">${} el {}</span>', f"{monto:,.2f}", obj._siguiente_fecha.strftime('%d/%m/%Y'))
     siguiente_pago_info.short_description = "Próximo Pago"
 
     class Media:
@@ -567,10 +593,19 @@ class PagoInline(admin.TabularInline):
     fields = ('fecha_pago', 'monto', 'concepto', 'metodo', 'referencia', 'notas', 'usuario', 'created_at')
     readonly_fields = ('usuario', 'created_at')
 
+class CambioEstadoInline(admin.TabularInline):
+    model = CambioEstadoCotizacion
+    extra = 0
+    fields = ('fecha', 'estado_anterior', 'estado_nuevo', 'usuario', 'motivo')
+    readonly_fields = fields
+    can_delete = False
+    classes = ('collapse',)
+    def has_add_permission(self, request, obj=None): return False
+
 @admin.register(Cotizacion)
 class CotizacionAdmin(admin.ModelAdmin):
     change_form_template = 'admin/comercial/cotizacion/change_form.html'
-    inlines = [ItemCotizacionInline, PagoInline, PlanPagoResumenInline]
+    inlines = [ItemCotizacionInline, PagoInline, PlanPagoResumenInline, CambioEstadoInline]
     list_display = ('folio_cotizacion', 'nombre_evento', 'cliente', 'fecha_evento', 'get_nivel_paquete', 'estado_badge', 'pago_badge', 'precio_final', 'acciones_display')
     list_filter = ('estado', 'fecha_evento', 'clima', 'incluye_licor_nacional', 'incluye_licor_premium')
     search_fields = ('id', 'cliente__nombre', 'cliente__rfc', 'nombre_evento')
@@ -627,8 +662,20 @@ class CotizacionAdmin(admin.ModelAdmin):
     estado_badge.short_description = "Estado"
     estado_badge.admin_order_field = 'estado'
 
+    def get_queryset(self, request):
+        """Anota lo que piden las columnas del changelist (pagado, progreso del
+        plan, portal) para que ninguna consulte la BD por fila: con 100
+        cotizaciones por página eran cientos de consultas."""
+        return super().get_queryset(request).select_related(
+            'cliente', 'plan_pago', 'portal',
+        ).annotate(
+            _total_pagado=Cotizacion.expresion_total_pagado(),
+            _plan_num_parcialidades=_conteo_parcialidades(plan__cotizacion=OuterRef('pk')),
+            _plan_num_pagadas=_conteo_parcialidades(plan__cotizacion=OuterRef('pk'), pagada=True),
+        )
+
     def pago_badge(self, obj):
-        pct = obj.porcentaje_pagado
+        pct = Cotizacion.porcentaje_de(obj._total_pagado, obj.precio_final)
         if pct >= 100:
             color = '#27ae60'
         elif pct >= 50:
@@ -660,8 +707,8 @@ class CotizacionAdmin(admin.ModelAdmin):
             plan = obj.plan_pago
             if plan and plan.activo:
                 url_pdf = reverse('plan_pagos_pdf', args=[obj.id])
-                pagadas = plan.parcialidades_pagadas()
-                total = plan.parcialidades.count()
+                pagadas = obj._plan_num_pagadas
+                total = obj._plan_num_parcialidades
                 return format_html(btn_tpl, url=url_pdf, target='target="_blank"', bg='#2E7D32', fg='white', label=f'{pagadas}/{total}', extra='')
         except PlanPago.DoesNotExist:
             pass
@@ -904,7 +951,7 @@ class CotizacionAdmin(admin.ModelAdmin):
         }
         return render(request, 'admin/comercial/cotizacion/descuentos.html', context)
 
-    actions = ['evaluar_descuentos_aplicables']
+    actions = ['evaluar_descuentos_aplicables', 'aplicar_descuentos_automaticos']
 
     @admin.action(description="Evaluar descuentos aplicables")
     def evaluar_descuentos_aplicables(self, request, queryset):
@@ -919,6 +966,25 @@ class CotizacionAdmin(admin.ModelAdmin):
         from django.urls import reverse as _reverse
         return redirect(_reverse('admin:cotizacion_descuentos', args=[cot.id]))
 
+    @admin.action(description="Aplicar descuentos automáticos", permissions=['change'])
+    @confirmar_accion_destructiva(
+        "¿Aplicar los descuentos automáticos vigentes a las cotizaciones "
+        "seleccionadas en BORRADOR o COTIZADA? Cambia su precio final."
+    )
+    def aplicar_descuentos_automaticos(self, request, queryset):
+        from .services_descuentos import DescuentoService
+
+        aplicados = DescuentoService.aplicar_automaticos_en_bloque(
+            queryset.filter(estado__in=('BORRADOR', 'COTIZADA'))
+        )
+        total = sum(len(lista) for lista in aplicados.values())
+        if total:
+            self.message_user(
+                request, f"{total} descuento(s) aplicado(s) en {len(aplicados)} cotización(es)."
+            )
+        else:
+            self.message_user(request, "No hay descuentos automáticos aplicables.", messages.INFO)
+
     def contrato_form_view(self, request, cotizacion_id):
         """Formulario intermedio para seleccionar tipo y depósito antes de generar."""
         from .models import ContratoServicio
@@ -979,6 +1045,7 @@ class CotizacionAdmin(admin.ModelAdmin):
 @admin.register(Pago)
 class PagoAdmin(admin.ModelAdmin):
     list_display = ('cotizacion', 'tipo_badge', 'concepto', 'fecha_pago', 'monto', 'metodo', 'comision_tpv', 'referencia', 'usuario', 'created_at')
+    list_select_related = ('cotizacion__cliente', 'usuario')
     list_filter = ('tipo', 'concepto', 'metodo', 'fecha_pago')
     search_fields = ('cotizacion__cliente__nombre', 'referencia', 'cotizacion__nombre_evento')
     readonly_fields = ('usuario', 'created_at', 'updated_at')
@@ -1707,14 +1774,29 @@ class DescuentoAplicadoAdmin(admin.ModelAdmin):
 @admin.register(OpenpayTransaccion)
 class OpenpayTransaccionAdmin(admin.ModelAdmin):
     list_display = ('openpay_id', 'metodo', 'event_type', 'estado_openpay', 'monto', 'cotizacion', 'autorizacion', 'pago', 'procesado', 'created_at')
-    list_filter = ('procesado', 'metodo', 'event_type', 'created_at')
+    list_filter = ('procesado', 'webhook_pendiente', 'metodo', 'event_type', 'created_at')
     search_fields = ('openpay_id', 'referencia_pago', 'autorizacion', 'cotizacion__nombre_evento')
-    readonly_fields = ('openpay_id', 'event_type', 'metodo', 'estado_openpay', 'monto', 'cotizacion', 'autorizacion', 'pago', 'referencia_pago', 'payload_crudo', 'procesado', 'error_detalle', 'created_at')
-    actions = ['borrar_transacciones_de_prueba']
+    readonly_fields = (
+        'openpay_id', 'event_type', 'metodo', 'estado_openpay', 'monto', 'cotizacion', 'autorizacion', 'pago',
+        'referencia_pago', 'payload_crudo', 'procesado', 'error_detalle', 'created_at',
+        'webhook_payload', 'webhook_pendiente', 'webhook_recibido_en', 'webhook_procesado_en',
+        'webhook_intentos', 'webhook_reintentar_en',
+        'latencia_cola_ms', 'latencia_contabilidad_ms', 'latencia_notificaciones_ms',
+    )
+    actions = ['reencolar_webhook', 'borrar_transacciones_de_prueba']
 
     def has_add_permission(self, request):
         return False  # solo se crean desde el webhook, nunca manual
 
+    @admin.action(description="Reencolar webhook (reintentar crear el Pago)")
+    def reencolar_webhook(self, request, queryset):
+        """Devuelve a la cola las notificaciones sin procesar que agotaron
+        sus intentos, para que el worker las vuelva a intentar ya."""
+        n = queryset.filter(procesado=False, webhook_payload__isnull=False).update(
+            webhook_pendiente=True, webhook_intentos=0, webhook_reintentar_en=None,
+        )
+        self.message_user(request, f"{n} notificación(es) de vuelta en la cola.", messages.SUCCESS)
+
     @confirmar_accion_destructiva(
         "¿Borrar las transacciones de prueba seleccionadas junto con su Pago "
         "y sus pólizas contables? La cotización queda intacta, pero esto no "
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class ComercialConfig(AppConfig):
     name = 'comercial'
     verbose_name = "Eventos"
+
+    def ready(self):
+        from . import reservas  # noqa: F401
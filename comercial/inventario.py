@@ -0,0 +1,202 @@
+"""
+Libro de inventario
+===================
+`Insumo.cantidad_stock` es la existencia de ahora; cada MovimientoInventario
+la mueve. Para saber cuánto había en una fecha pasada, o cuánto se consumió
+por evento o por mes, aquí se consulta el libro sin recorrer toda la
+historia:
+
+- `CorteInventario` guarda la existencia de cada insumo al cierre de cada
+  día (cron diario `cortar_inventario`). Un corte se calcula como la
+  existencia actual menos lo que se movió después de ese día, así que
+  también recoge el stock capturado a mano en el Insumo.
+- `stock_al(fecha)` parte del último corte de cada insumo y le suma los
+  movimientos posteriores hasta `fecha`; si un insumo no tiene corte, resta
+  a la existencia actual lo movido después de `fecha`. Tres consultas sin
+  importar cuántos insumos ni cuánta historia haya.
+- `registrar_movimientos()` asienta muchos movimientos en una transacción,
+  con un solo bloqueo por insumo.
+
+Los días son los de TIME_ZONE (America/Merida), igual que el resto del ERP.
+"""
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Case, DecimalField, F, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce, TruncDate, TruncMonth
+from django.utils import timezone
+
+from .models import CorteInventario, Insumo, MovimientoInventario
+
+CERO = Decimal('0.00')
+_DECIMAL = DecimalField(max_digits=12, decimal_places=2)
+
+
+def _con_signo():
+    """Cantidad del movimiento con el signo con el que mueve el stock."""
+    return Case(
+        When(tipo__in=MovimientoInventario.TIPOS_ENTRADA, then=F('cantidad')),
+        default=-F('cantidad'),
+        output_field=_DECIMAL,
+    )
+
+
+def _inicio(dia):
+    return timezone.make_aware(datetime.combine(dia, time.min))
+
+
+def _existencia_descontando(insumos, desde_dia):
+    """{insumo_id: cantidad_stock − lo movido a partir de `desde_dia`}, en una consulta."""
+    posteriores = (
+        MovimientoInventario.objects
+        .filter(insumo=OuterRef('pk'), created_at__gte=_inicio(desde_dia))
+        .order_by().values('insumo').annotate(t=Sum(_con_signo())).values('t')
+    )
+    filas = insumos.annotate(
+        posterior=Coalesce(Subquery(posteriores, output_field=_DECIMAL), Value(CERO), output_field=_DECIMAL),
+    ).values_list('pk', 'cantidad_stock', 'posterior')
+    return {pk: stock - posterior for pk, stock, posterior in filas}
+
+
+def cortar(fecha):
+    """Escribe (o reescribe) el corte de todos los insumos al cierre de `fecha`."""
+    existencias = _existencia_descontando(Insumo.objects.all(), fecha + timedelta(days=1))
+    CorteInventario.objects.bulk_create(
+        [CorteInventario(insumo_id=pk, fecha=fecha, cantidad=cantidad) for pk, cantidad in existencias.items()],
+        update_conflicts=True, unique_fields=['insumo', 'fecha'], update_fields=['cantidad', 'created_at'],
+    )
+    return len(existencias)
+
+
+def stock_al(fecha, insumos=None):
+    """{insumo_id: existencia al cierre de `fecha`} de `insumos` (todos por defecto)."""
+    insumos = Insumo.objects.all() if insumos is None else insumos
+    corte = CorteInventario.objects.filter(insumo=OuterRef('pk'), fecha__lte=fecha).order_by('-fecha')
+    cortes = {
+        pk: (corte_fecha, cantidad)
+        for pk, corte_fecha, cantidad in insumos.annotate(
+            corte_fecha=Subquery(corte.values('fecha')[:1]),
+            corte_cantidad=Subquery(corte.values('cantidad')[:1]),
+        ).values_list('pk', 'corte_fecha', 'corte_cantidad')
+    }
+
+    con_corte = {pk: c for pk, c in cortes.items() if c[0] is not None}
+    resultado = {pk: cantidad for pk, (_, cantidad) in con_corte.items()}
+    if con_corte:
+        # Una ventana para todos, desde el corte más viejo; cada insumo solo
+        # suma los días posteriores al suyo. Con el cron diario es un día.
+        desde = min(f for f, _ in con_corte.values()) + timedelta(days=1)
+        por_dia = (
+            MovimientoInventario.objects
+            .filter(insumo__in=list(con_corte), created_at__gte=_inicio(desde),
+                    created_at__lt=_inicio(fecha + timedelta(days=1)))
+            .annotate(dia=TruncDate('created_at'))
+            .order_by().values('insumo', 'dia').annotate(delta=Sum(_con_signo()))
+        )
+        for fila in por_dia:
+            if fila['dia'] > con_corte[fila['insumo']][0]:
+                resultado[fila['insumo']] += fila['delta']
+
+    sin_corte = [pk for pk in cortes if pk not in con_corte]
+    if sin_corte:
+        resultado.update(_existencia_descontando(
+            Insumo.objects.filter(pk__in=sin_corte), fecha + timedelta(days=1),
+        ))
+    return resultado
+
+
+def stock_bajo_minimo(fecha=None):
+    """
+    [(insumo, existencia)] de los insumos con mínimo configurado que al
+    cierre de `fecha` (hoy por defecto) estaban por debajo de él, del más
+    corto al más holgado.
+    """
+    fecha = fecha or timezone.localdate()
+    insumos = Insumo.objects.filter(stock_minimo__gt=0)
+    existencias = stock_al(fecha, insumos)
+    bajos = [(i, existencias[i.pk]) for i in insumos.select_related('proveedor') if existencias[i.pk] < i.stock_minimo]
+    return sorted(bajos, key=lambda par: par[1] - par[0].stock_minimo)
+
+
+def _consumo():
+    # `costo` va primero: después de anotar `cantidad`, F('cantidad') ya sería la suma.
+    return {
+        'costo': Sum(F('cantidad') * F('insumo__costo_unitario'), output_field=_DECIMAL),
+        'cantidad': Sum('cantidad'),
+    }
+
+
+def consumo_por_cotizacion(cotizaciones):
+    """{cotizacion_id: [{'insumo', 'cantidad', 'costo'}]} de las salidas
+    ligadas a esas cotizaciones (ids o queryset), valuadas al costo actual."""
+    filas = (
+        MovimientoInventario.objects
+        .filter(cotizacion__in=cotizaciones, tipo='SALIDA')
+        .order_by().values('cotizacion', 'insumo')
+        .annotate(**_consumo())
+        .order_by('cotizacion', 'insumo')
+    )
+    resultado = defaultdict(list)
+    for fila in filas:
+        resultado[fila.pop('cotizacion')].append(fila)
+    return dict(resultado)
+
+
+def consumo_por_mes(desde, hasta):
+    """[{'mes', 'insumo', 'cantidad', 'costo'}] de las salidas entre `desde` y `hasta` (inclusive)."""
+    return list(
+        MovimientoInventario.objects
+        .filter(tipo='SALIDA', created_at__gte=_inicio(desde), created_at__lt=_inicio(hasta + timedelta(days=1)))
+        .annotate(mes=TruncMonth('created_at'))
+        .order_by().values('mes', 'insumo')
+        .annotate(**_consumo())
+        .order_by('mes', 'insumo')
+    )
+
+
+def registrar_movimientos(movimientos, usuario=None):
+    """
+    Asienta `movimientos` (MovimientoInventario sin guardar) en una sola
+    transacción: bloquea cada insumo una vez, valida y calcula
+    stock_anterior/stock_posterior en orden sobre la existencia acumulada,
+    inserta todo con un bulk_create y mueve cada insumo con un UPDATE.
+
+    Todo o nada: si uno no pasa `clean()` (cantidad o stock insuficiente),
+    lanza ValidationError indicando cuál y no se guarda ninguno.
+    """
+    movimientos = list(movimientos)
+    if not movimientos:
+        return []
+
+    with transaction.atomic():
+        insumos = {
+            i.pk: i for i in
+            Insumo.objects.select_for_update().filter(pk__in={m.insumo_id for m in movimientos}).order_by('pk')
+        }
+        deltas = defaultdict(lambda: CERO)
+        for n, mov in enumerate(movimientos, start=1):
+            if mov.insumo_id not in insumos:
+                raise ValidationError(f"Movimiento {n}: el insumo {mov.insumo_id} no existe.")
+            if mov.tipo not in MovimientoInventario.TIPOS_ENTRADA + MovimientoInventario.TIPOS_SALIDA:
+                raise ValidationError(f"Movimiento {n}: tipo '{mov.tipo}' inválido.")
+            insumo = insumos[mov.insumo_id]
+            mov.insumo = insumo
+            mov.stock_anterior = insumo.cantidad_stock
+            try:
+                mov.clean()
+            except ValidationError as e:
+                raise ValidationError(f"Movimiento {n} ({insumo.nombre}): {'; '.join(e.messages)}")
+            delta = mov.cantidad if mov.tipo in MovimientoInventario.TIPOS_ENTRADA else -mov.cantidad
+            insumo.cantidad_stock += delta
+            deltas[insumo.pk] += delta
+            mov.stock_posterior = insumo.cantidad_stock
+            if usuario is not None and mov.created_by_id is None:
+                mov.created_by = usuario
+
+        MovimientoInventario.objects.bulk_create(movimientos)
+        for pk, delta in deltas.items():
+            Insumo.objects.filter(pk=pk).update(cantidad_stock=F('cantidad_stock') + delta)
+    return movimientos
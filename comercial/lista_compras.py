@@ -0,0 +1,353 @@
+"""
+Listas de compras
+=================
+Lista de la barra de una cotización (`generar_lista_compras_barra`, la del
+PDF "Checklist de Barra") y lista consolidada de todos los eventos de un
+rango (`lista_consolidada`).
+
+Los artículos de la barra se resuelven por concepto: primero la Plantilla
+de Barra, y si el concepto no está configurado, el primer insumo
+CONSUMIBLE cuyo nombre tenga una de sus palabras clave. `CatalogoBarra`
+lee la plantilla y el catálogo una vez y resuelve en memoria, así que
+una lista de cincuenta eventos cuesta lo mismo en consultas que una de uno.
+"""
+import math
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db.models import Sum
+
+from .models import ConstanteSistema, Cotizacion, Insumo, PlantillaBarra, ReservaInventario
+from .reservas import ESTADOS_QUE_RESERVAN, disponibilidad
+from .services import CalculadoraBarraService
+
+BUSQUEDA_KEYWORDS = {
+    'CERVEZA': ['cerveza', 'caguama', 'tecate', 'corona'],
+    'TEQUILA_NAC': ['tequila cuervo', 'tequila tradicional', 'tequila'],
+    'WHISKY_NAC': ['whisky', 'whiskey'],
+    'RON_NAC': ['ron bacardi', 'ron castillo', 'ron havana', 'ron '],
+    'VODKA_NAC': ['vodka'],
+    'TEQUILA_PREM': ['don julio', 'herradura', 'tequila 1800'],
+    'WHISKY_PREM': ['buchanan', 'jack daniel', 'johnnie walker black', 'etiqueta negra'],
+    'GIN_PREM': ['ginebra', 'hendrick', 'tanqueray', 'bombay'],
+    'REFRESCO_COLA': ['coca cola', 'coca-cola'],
+    'REFRESCO_TORONJA': ['toronja', 'squirt', 'fresca'],
+    'AGUA_MINERAL': ['agua mineral', 'topochico', 'topo chico', 'peñafiel mineral'],
+    'AGUA_NATURAL': ['garrafon', 'garrafón', 'agua natural', 'agua purificada'],
+    'HIELO': ['hielo'],
+    'LIMON': ['limon', 'limón'],
+    'HIERBABUENA': ['hierbabuena', 'menta'],
+    'JARABE': ['jarabe'],
+    'FRUTOS_ROJOS': ['frutos rojos', 'berries', 'zarzamora', 'frambuesa'],
+    'CAFE': ['café', 'cafe', 'espresso'],
+    'SERVILLETAS': ['servilleta', 'popote'],
+}
+
+SIN_PROVEEDOR = 'Sin proveedor'
+
+
+class CatalogoBarra:
+    """
+    Plantilla de Barra activa y catálogo de insumos en memoria. Dos
+    consultas al crearse; `item()` ya no consulta.
+    """
+
+    def __init__(self):
+        self.plantilla = {}
+        for renglon in (
+            PlantillaBarra.objects.filter(activo=True)
+            .select_related('insumo__proveedor')
+            .order_by('grupo', 'orden', 'categoria', 'pk')
+        ):
+            self.plantilla.setdefault(renglon.categoria, renglon)
+        self.insumos = {i.pk: i for i in Insumo.objects.select_related('proveedor').order_by('pk')}
+        self.consumibles = [
+            (i.nombre.lower(), i) for i in self.insumos.values() if i.categoria == 'CONSUMIBLE'
+        ]
+        self._resueltos = {}
+
+    def _buscar(self, coincide):
+        return next((insumo for nombre, insumo in self.consumibles if coincide(nombre)), None)
+
+    def _buscar_palabra_completa(self, keyword):
+        """
+        Insumo donde el keyword sea una PALABRA COMPLETA, no parte de otra
+        palabra. Evita que 'ron' matchee 'Toronja' o 'gin' matchee 'Original'.
+        """
+        return (
+            self._buscar(lambda nombre: nombre.startswith(keyword))
+            or self._buscar(lambda nombre: f' {keyword}' in nombre)
+        )
+
+    def item(self, categoria):
+        """Artículo de la barra para `categoria` o None si no hay ni plantilla ni coincidencia."""
+        if categoria not in self._resueltos:
+            self._resueltos[categoria] = self._resolver(categoria)
+        return self._resueltos[categoria]
+
+    def _resolver(self, categoria):
+        plantilla = self.plantilla.get(categoria)
+        if plantilla and plantilla.insumo:
+            insumo = plantilla.insumo
+            nombre = insumo.nombre
+            if insumo.presentacion:
+                nombre = f"{insumo.nombre} ({insumo.presentacion})"
+            return {
+                'nombre': nombre,
+                'proveedor': insumo.proveedor.nombre if insumo.proveedor else '',
+                'costo_unitario': float(insumo.costo_unitario),
+                'proporcion': float(plantilla.proporcion),
+                'insumo_id': insumo.id,
+            }
+
+        for keyword in BUSQUEDA_KEYWORDS.get(categoria, []):
+            if ' ' in keyword or len(keyword) > 4:
+                insumo = self._buscar(lambda nombre: keyword in nombre)
+            else:
+                insumo = self._buscar_palabra_completa(keyword)
+
+            if insumo:
+                nombre = insumo.nombre
+                if insumo.presentacion:
+                    nombre = f"{insumo.nombre} ({insumo.presentacion})"
+                return {
+                    'nombre': nombre,
+                    'proveedor': insumo.proveedor.nombre if insumo.proveedor else ' Sin proveedor',
+                    'costo_unitario': float(insumo.costo_unitario),
+                    'proporcion': 1.0,
+                    'insumo_id': insumo.id,
+                    '_via_fallback': True,
+                }
+
+        return None
+
+
+def _fallback_item(nombre_generico):
+    """Devuelve un item con datos genéricos cuando no hay plantilla configurada."""
+    return {
+        'nombre': nombre_generico,
+        'proveedor': ' Sin asignar',
+        'costo_unitario': 0,
+        'proporcion': 1.0,
+        'insumo_id': None,
+    }
+
+
+def _agregar_a_lista(lista, seccion, item_nombre, cantidad, unidad, nota='', proveedor='', costo_unitario=0,
+                     insumo_id=None):
+    """Helper para agregar un ítem a la lista de compras con formato consistente."""
+    if seccion not in lista:
+        lista[seccion] = []
+
+    entry = {
+        'item': item_nombre,
+        'cantidad': cantidad,
+        'unidad': unidad,
+    }
+    if nota:
+        entry['nota'] = nota
+    if proveedor:
+        entry['proveedor'] = proveedor
+    if costo_unitario > 0:
+        entry['costo_unitario'] = costo_unitario
+        entry['costo_total'] = round(costo_unitario * cantidad, 2)
+    if insumo_id:
+        entry['insumo_id'] = insumo_id
+
+    lista[seccion].append(entry)
+
+
+def generar_lista_compras_barra(cotizacion, catalogo=None, constantes=None):
+    """
+    Lista de compras de la barra de `cotizacion`: {sección: [renglón]}.
+    Para varias cotizaciones, pasar el mismo `catalogo` (y `constantes`)
+    evita releer la plantilla y el catálogo en cada una.
+    """
+    catalogo = catalogo or CatalogoBarra()
+    calc = CalculadoraBarraService(cotizacion, constantes)
+    datos = calc.calcular()
+    if not datos:
+        return {}
+
+    lista_compras = {}
+
+    if datos['cervezas_unidades'] > 0:
+        p = catalogo.item('CERVEZA') or _fallback_item('Cerveza Nacional (Caguama)')
+        cajas = math.ceil(datos['cervezas_unidades'] / 12.0)
+        _agregar_a_lista(lista_compras, 'Licores y Alcohol', p['nombre'], cajas, 'Cajas (12u)', proveedor=p['proveedor'], costo_unitario=p['costo_unitario'], insumo_id=p['insumo_id'])
+
+    if datos['botellas_nacional'] > 0:
+        b = datos['botellas_nacional']
+        mapeo_nacional = [
+            ('TEQUILA_NAC', 'Tequila Nacional', 0.40),
+            ('WHISKY_NAC', 'Whisky Nacional', 0.30),
+            ('RON_NAC', 'Ron Nacional', 0.20),
+            ('VODKA_NAC', 'Vodka Nacional', 0.10),
+        ]
+        for cat, fallback_nombre, default_prop in mapeo_nacional:
+            p = catalogo.item(cat)
+            if p:
+                prop = p['proporcion']
+                cant = math.ceil(b * prop)
+                if cant > 0:
+                    _agregar_a_lista(lista_compras, 'Licores y Alcohol', p['nombre'], cant, 'Botellas', proveedor=p['proveedor'], costo_unitario=p['costo_unitario'], insumo_id=p['insumo_id'])
+            else:
+                cant = math.ceil(b * default_prop)
+                if cant > 0:
+                    _agregar_a_lista(lista_compras, 'Licores y Alcohol', fallback_nombre, cant, 'Botellas', proveedor=' Configurar en Plantilla de Barra')
+
+    if datos['botellas_premium'] > 0:
+        b = datos['botellas_premium']
+        mapeo_premium = [
+            ('TEQUILA_PREM', 'Tequila Premium', 0.40),
+            ('WHISKY_PREM', 'Whisky Premium', 0.30),
+            ('GIN_PREM', 'Ginebra / Ron Premium', 0.30),
+        ]
+        for cat, fallback_nombre, default_prop in mapeo_premium:
+            p = catalogo.item(cat)
+            if p:
+                prop = p['proporcion']
+                cant = math.ceil(b * prop)
+                if cant > 0:
+                    _agregar_a_lista(lista_compras, 'Licores y Alcohol', p['nombre'], cant, 'Botellas', proveedor=p['proveedor'], costo_unitario=p['costo_unitario'], insumo_id=p['insumo_id'])
+            else:
+                cant = math.ceil(b * default_prop)
+                if cant > 0:
+                    _agregar_a_lista(lista_compras, 'Licores y Alcohol', fallback_nombre, cant, 'Botellas', proveedor=' Configurar en Plantilla de Barra')
+
+    if l := datos['litros_mezcladores']:
+        mapeo_mezcladores = [
+            ('REFRESCO_COLA', 'Coca-Cola (2.5L)', 0.60, 2.5),
+            ('REFRESCO_TORONJA', 'Refresco Toronja (2L)', 0.20, 2.0),
+            ('AGUA_MINERAL', 'Agua Mineral (2L)', 0.20, 2.0),
+        ]
+        for cat, fallback_nombre, share, litros_envase in mapeo_mezcladores:
+            p = catalogo.item(cat)
+            litros_necesarios = l * share
+            cant = math.ceil(litros_necesarios / litros_envase)
+            if cant > 0:
+                if p:
+                    _agregar_a_lista(lista_compras, 'Bebidas y Mezcladores', p['nombre'], cant, 'Botellas', proveedor=p['proveedor'], costo_unitario=p['costo_unitario'], insumo_id=p['insumo_id'])
+                else:
+                    _agregar_a_lista(lista_compras, 'Bebidas y Mezcladores', fallback_nombre, cant, 'Botellas', proveedor=' Configurar en Plantilla de Barra')
+
+    if datos['litros_agua'] > 0:
+        p = catalogo.item('AGUA_NATURAL') or _fallback_item('Agua Natural (Garrafón 20L)')
+        cant = math.ceil(datos['litros_agua'] / 20)
+        _agregar_a_lista(lista_compras, 'Bebidas y Mezcladores', p['nombre'], cant, 'Garrafones', proveedor=p['proveedor'], costo_unitario=p['costo_unitario'], insumo_id=p['insumo_id'])
+
+    p = catalogo.item('HIELO') or _fallback_item('Hielo (Bolsa 20kg)')
+    _agregar_a_lista(lista_compras, 'Abarrotes y Consumibles', p['nombre'], datos['bolsas_hielo_20kg'], 'Bolsas', nota=datos['hielo_info'], proveedor=p['proveedor'], costo_unitario=p['costo_unitario'], insumo_id=p['insumo_id'])
+
+    if cotizacion.incluye_cocteleria_basica:
+        for cat, fallback, cant_calc, unidad in [
+            ('LIMON', 'Limón Persa', math.ceil(cotizacion.num_personas / 8), 'Kg'),
+            ('HIERBABUENA', 'Hierbabuena', math.ceil(cotizacion.num_personas / 15), 'Manojos'),
+            ('JARABE', 'Jarabe Natural', math.ceil(cotizacion.num_personas / 40), 'Litros'),
+        ]:
+            p = catalogo.item(cat) or _fallback_item(fallback)
+            seccion = 'Frutas y Verduras' if cat in ('LIMON', 'HIERBABUENA') else 'Abarrotes y Consumibles'
+            _agregar_a_lista(lista_compras, seccion, p['nombre'], cant_calc, unidad, proveedor=p['proveedor'], costo_unitario=p['costo_unitario'], insumo_id=p['insumo_id'])
+
+    if cotizacion.incluye_cocteleria_premium:
+        for cat, fallback, cant_calc, unidad in [
+            ('FRUTOS_ROJOS', 'Frutos Rojos', math.ceil(cotizacion.num_personas / 20), 'Bolsas'),
+            ('CAFE', 'Café Espresso', 1, 'Kg'),
+        ]:
+            p = catalogo.item(cat) or _fallback_item(fallback)
+            seccion = 'Frutas y Verduras' if cat == 'FRUTOS_ROJOS' else 'Abarrotes y Consumibles'
+            _agregar_a_lista(lista_compras, seccion, p['nombre'], cant_calc, unidad, proveedor=p['proveedor'], costo_unitario=p['costo_unitario'], insumo_id=p['insumo_id'])
+
+    p = catalogo.item('SERVILLETAS') or _fallback_item('Servilletas / Popotes')
+    _agregar_a_lista(lista_compras, 'Abarrotes y Consumibles', p['nombre'], 1, 'Kit', proveedor=p['proveedor'], costo_unitario=p['costo_unitario'], insumo_id=p['insumo_id'])
+
+    for seccion, items in lista_compras.items():
+        for item in items:
+            if 'costo_total' not in item and item.get('costo_unitario', 0) > 0:
+                item['costo_total'] = round(item['costo_unitario'] * item['cantidad'], 2)
+
+    return lista_compras
+
+
+def lista_consolidada(fecha_inicio, fecha_fin):
+    """
+    Compras para los eventos confirmados entre `fecha_inicio` y `fecha_fin`
+    (inclusive): barra de cada evento más los insumos que reservan sus
+    productos (ReservaInventario), sumados por insumo, menos lo disponible
+    antes del rango (existencia menos lo ya comprometido por eventos
+    anteriores), agrupados por proveedor.
+
+    Los artículos de barra sin insumo vinculado se suman por nombre y
+    unidad, y se compran completos.
+
+    Regresa {'eventos', 'proveedores': [{'proveedor', 'renglones', 'total'}], 'total'}.
+    """
+    catalogo = CatalogoBarra()
+    constantes = dict(ConstanteSistema.objects.values_list('clave', 'valor'))
+    eventos = list(
+        Cotizacion.objects
+        .filter(estado__in=ESTADOS_QUE_RESERVAN, fecha_evento__range=(fecha_inicio, fecha_fin))
+        .select_related(
+            'cliente', 'insumo_hielo', 'insumo_refresco', 'insumo_agua',
+            'insumo_alcohol_basico', 'insumo_alcohol_premium',
+        )
+        .order_by('fecha_evento', 'pk')
+    )
+
+    requerido = defaultdict(Decimal)
+    sueltos = {}
+    for cotizacion in eventos:
+        for renglones in generar_lista_compras_barra(cotizacion, catalogo, constantes).values():
+            for renglon in renglones:
+                if renglon.get('insumo_id'):
+                    requerido[renglon['insumo_id']] += Decimal(str(renglon['cantidad']))
+                    continue
+                clave = (renglon['item'], renglon['unidad'])
+                if clave not in sueltos:
+                    sueltos[clave] = {
+                        'nombre': renglon['item'], 'unidad': renglon['unidad'],
+                        'proveedor': renglon.get('proveedor', '').strip() or SIN_PROVEEDOR,
+                        'requerido': Decimal('0'), 'disponible': Decimal('0'), 'costo_unitario': Decimal('0'),
+                    }
+                sueltos[clave]['requerido'] += Decimal(str(renglon['cantidad']))
+
+    reservado = (
+        ReservaInventario.objects.filter(cotizacion__in=[c.pk for c in eventos])
+        .order_by().values('insumo').annotate(total=Sum('cantidad')).values_list('insumo', 'total')
+    )
+    for insumo_id, cantidad in reservado:
+        requerido[insumo_id] += cantidad
+
+    libre = disponibilidad(fecha_inicio - timedelta(days=1), Insumo.objects.filter(pk__in=list(requerido)))
+    renglones = list(sueltos.values())
+    for insumo_id, cantidad in requerido.items():
+        insumo = catalogo.insumos[insumo_id]
+        renglones.append({
+            'nombre': f"{insumo.nombre} ({insumo.presentacion})" if insumo.presentacion else insumo.nombre,
+            'unidad': insumo.unidad_medida,
+            'proveedor': insumo.proveedor.nombre if insumo.proveedor else SIN_PROVEEDOR,
+            'requerido': cantidad,
+            'disponible': max(libre[insumo_id]['disponible'], Decimal('0')),
+            'costo_unitario': insumo.costo_unitario,
+        })
+
+    por_proveedor = defaultdict(list)
+    for renglon in renglones:
+        renglon['comprar'] = max(renglon['requerido'] - renglon['disponible'], Decimal('0'))
+        renglon['costo_total'] = (renglon['comprar'] * renglon['costo_unitario']).quantize(Decimal('0.01'))
+        por_proveedor[renglon['proveedor']].append(renglon)
+
+    proveedores = [
+        {
+            'proveedor': proveedor,
+            'renglones': sorted(filas, key=lambda r: r['nombre']),
+            'total': sum((r['costo_total'] for r in filas), Decimal('0.00')),
+        }
+        for proveedor, filas in sorted(por_proveedor.items(), key=lambda par: (par[0] == SIN_PROVEEDOR, par[0]))
+    ]
+    return {
+        'eventos': eventos,
+        'proveedores': proveedores,
+        'total': sum((p['total'] for p in proveedores), Decimal('0.00')),
+    }
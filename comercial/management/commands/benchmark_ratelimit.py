@@ -0,0 +1,55 @@
+"""
+Compara golpes por segundo de los backends del rate limiting.
+
+Golpea la base configurada (la misma que usará producción si se corre allá)
+con `--golpes` peticiones repartidas entre `--clientes` IPs, primero con el
+backend 'cache' (add/get/set sobre qkt_cache) y luego con 'tabla' en ventana
+fija y en GCRA. Al terminar borra los contadores que creó.
+
+Uso:
+    python manage.py benchmark_ratelimit
+    python manage.py benchmark_ratelimit --golpes 5000 --clientes 50
+"""
+import time as reloj
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+
+from core_erp.ratelimit import BACKENDS, _bucket
+
+CLAVE = 'benchmark_ratelimit'
+VENTANA = 60
+
+
+class Command(BaseCommand):
+    help = "Mide golpes por segundo del rate limiting con cada backend."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--golpes', type=int, default=2000)
+        parser.add_argument('--clientes', type=int, default=20)
+
+    def handle(self, *args, **opciones):
+        golpes, clientes = max(1, opciones['golpes']), max(1, opciones['clientes'])
+        ips = [f'198.51.100.{i % 250}-{i}' for i in range(clientes)]
+        buckets = [_bucket(CLAVE, ip, VENTANA) for ip in ips]
+        claves_gcra = [f'rl:{CLAVE}:{ip}' for ip in ips]
+
+        pruebas = [
+            ('cache (ventana fija)', lambda i: BACKENDS['cache'].contar(buckets[i % clientes], VENTANA)),
+            ('tabla (ventana fija)', lambda i: BACKENDS['tabla'].contar(buckets[i % clientes], VENTANA)),
+            ('tabla (GCRA)', lambda i: BACKENDS['tabla'].gcra(claves_gcra[i % clientes], golpes, VENTANA)),
+        ]
+        try:
+            for nombre, golpe in pruebas:
+                inicio = reloj.perf_counter()
+                for i in range(golpes):
+                    golpe(i)
+                duracion = reloj.perf_counter() - inicio
+                self.stdout.write(
+                    f"  {nombre:<22} {golpes / duracion:>10,.0f} golpes/s "
+                    f"({duracion / golpes * 1e6:,.0f} µs por golpe)"
+                )
+        finally:
+            cache.delete_many(buckets)
+            for clave in buckets + claves_gcra:
+                BACKENDS['tabla'].borrar(clave)
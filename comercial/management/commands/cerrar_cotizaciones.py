@@ -5,46 +5,112 @@ Lógica:
   1. CONFIRMADA / COTIZADA con fecha_evento < hoy → EJECUTADA (evento realizado)
   2. EJECUTADA con fecha_evento < hoy y saldo ≤ $0.50  → CERRADA (pagada y lista)
 
-Uso:  python manage.py cerrar_cotizaciones
+Cada paso es un UPDATE sobre el conjunto; el saldo del paso 2 sale de
+`Cotizacion.expresion_total_pagado()` anotado en la misma consulta, así que
+las EJECUTADA que siguen debiendo (y se acumulan día con día) no cuestan
+una consulta por cotización. Cada cambio queda en CambioEstadoCotizacion,
+insertado en bloque, y las ejecutadas liberan su ReservaInventario.
+
+Uso:  python manage.py cerrar_cotizaciones [--dry-run]
 Cron: configurar en Railway como cron job diario.
 """
 from decimal import Decimal
 
 from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F
 from django.utils import timezone
 
-from comercial.models import Cotizacion
+from comercial.models import CambioEstadoCotizacion, Cotizacion
+from comercial.reservas import ESTADOS_QUE_RESERVAN, liberar
+
+TOLERANCIA_SALDO = Decimal('0.50')
+MOTIVO = 'Cierre automático (cerrar_cotizaciones)'
+
+
+def pendientes_ejecutar(hoy):
+    """Eventos realizados que siguen como CONFIRMADA o COTIZADA."""
+    return Cotizacion.objects.filter(
+        fecha_evento__lt=hoy,
+        estado__in=['CONFIRMADA', 'COTIZADA'],
+    )
+
+
+def pendientes_cerrar(hoy, estados=('EJECUTADA',)):
+    """Eventos ejecutados con saldo cubierto (con la misma tolerancia que cambiar_estado).
+
+    `estados` permite contar también los que el paso 1 va a ejecutar en la
+    misma corrida (ver --dry-run)."""
+    return Cotizacion.objects.filter(
+        fecha_evento__lt=hoy,
+        estado__in=estados,
+    ).alias(
+        pagado=Cotizacion.expresion_total_pagado(),
+    ).filter(
+        precio_final__lte=F('pagado') + TOLERANCIA_SALDO,
+    )
 
 
 class Command(BaseCommand):
     help = 'Avanza automáticamente el estado de cotizaciones con eventos pasados'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Solo cuenta cuántas cotizaciones cambiarían, sin escribir.',
+        )
+
     def handle(self, *args, **options):
         hoy = timezone.now().date()
-        ejecutadas = 0
-        cerradas = 0
 
-        # Paso 1: eventos realizados que siguen como CONFIRMADA o COTIZADA
-        pendientes_ejecutar = Cotizacion.objects.filter(
-            fecha_evento__lt=hoy,
-            estado__in=['CONFIRMADA', 'COTIZADA'],
-        )
-        for cot in pendientes_ejecutar:
-            Cotizacion.objects.filter(pk=cot.pk).update(estado='EJECUTADA')
-            ejecutadas += 1
-            self.stdout.write(f'  EJECUTADA  COT-{cot.pk:03d} ({cot.nombre_evento[:50]})')
-
-        # Paso 2: eventos ejecutados con saldo cubierto → CERRADA
-        pendientes_cerrar = Cotizacion.objects.filter(
-            fecha_evento__lt=hoy,
-            estado='EJECUTADA',
-        )
-        for cot in pendientes_cerrar:
-            if cot.saldo_pendiente() <= Decimal('0.50'):
-                Cotizacion.objects.filter(pk=cot.pk).update(estado='CERRADA')
-                cerradas += 1
-                self.stdout.write(f'  CERRADA    COT-{cot.pk:03d} ({cot.nombre_evento[:50]})')
+        if options['dry_run']:
+            # Una corrida real cierra en el paso 2 también lo que el paso 1
+            # acaba de ejecutar; se cuentan igual.
+            cerrarian = pendientes_cerrar(hoy, estados=['EJECUTADA', 'CONFIRMADA', 'COTIZADA']).count()
+            self.stdout.write(self.style.WARNING(
+                f'SIMULACIÓN: {pendientes_ejecutar(hoy).count()} → EJECUTADA, {cerrarian} → CERRADA'
+            ))
+            return
+
+        with transaction.atomic():
+            ejecutadas = self._avanzar(pendientes_ejecutar(hoy), 'EJECUTADA')
+            # Después del paso 1: igual que antes, una cotización vencida y
+            # pagada pasa a CERRADA en la misma corrida.
+            cerradas = self._avanzar(pendientes_cerrar(hoy), 'CERRADA')
+
+        if ejecutadas or cerradas:
+            # update() no dispara post_save: el feed iCal de Airbnb, los días
+            # ocupados del cotizador (un Hospedaje en curso) y el calendario
+            # unificado (color por estado) no se enteran solos.
+            from airbnb.calendario import invalidar_fuente
+            from airbnb.fechas_ocupadas import invalidar_fechas_ocupadas
+            from airbnb.feed_ical import invalidar_feed_eventos
+            invalidar_feed_eventos()
+            invalidar_fechas_ocupadas()
+            invalidar_fuente('cotizaciones')
 
         self.stdout.write(self.style.SUCCESS(
             f'\nResultado: {ejecutadas} → EJECUTADA, {cerradas} → CERRADA'
         ))
+
+    def _avanzar(self, cotizaciones, nuevo_estado):
+        """Pasa `cotizaciones` a `nuevo_estado` en un UPDATE y deja su bitácora."""
+        filas = list(
+            cotizaciones.select_for_update().order_by('pk').values_list('pk', 'estado', 'nombre_evento')
+        )
+        if not filas:
+            return 0
+
+        pks = [pk for pk, _, _ in filas]
+        Cotizacion.objects.filter(pk__in=pks).update(estado=nuevo_estado)
+        if nuevo_estado not in ESTADOS_QUE_RESERVAN:
+            liberar(pks)
+        CambioEstadoCotizacion.objects.bulk_create([
+            CambioEstadoCotizacion(
+                cotizacion_id=pk, estado_anterior=estado, estado_nuevo=nuevo_estado, motivo=MOTIVO,
+            )
+            for pk, estado, _ in filas
+        ])
+        for pk, _, nombre in filas:
+            self.stdout.write(f'  {nuevo_estado:<10} COT-{pk:03d} ({nombre[:50]})')
+        return len(filas)
@@ -0,0 +1,47 @@
+"""
+Escribe el corte de inventario (existencia de cada insumo al cierre del día)
+que usan `comercial.inventario.stock_al` y el reporte de stock bajo.
+
+Volver a cortar un día lo reescribe, así que se puede repetir sin cuidado.
+
+Uso:  python manage.py cortar_inventario                    (ayer)
+      python manage.py cortar_inventario --fecha 2026-09-30
+      python manage.py cortar_inventario --desde 2026-09-01 (del 1 a ayer)
+Cron: configurar en Railway como cron job diario, pasada la medianoche.
+"""
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from comercial.inventario import cortar
+
+
+class Command(BaseCommand):
+    help = 'Guarda la existencia de cada insumo al cierre del día (ayer por defecto)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fecha', help="Día a cortar, YYYY-MM-DD. Por defecto, ayer.")
+        parser.add_argument('--desde', help="Corta cada día desde esta fecha hasta --fecha, YYYY-MM-DD.")
+
+    def handle(self, *args, **opciones):
+        try:
+            fecha = date.fromisoformat(opciones['fecha']) if opciones['fecha'] else None
+            desde = date.fromisoformat(opciones['desde']) if opciones['desde'] else None
+        except ValueError as e:
+            raise CommandError(f"Fecha inválida: {e}")
+
+        hoy = timezone.localdate()
+        fecha = fecha or hoy - timedelta(days=1)
+        if fecha >= hoy:
+            raise CommandError("Solo se cortan días cerrados (anteriores a hoy).")
+        desde = desde or fecha
+        if desde > fecha:
+            raise CommandError("--desde no puede ser posterior a --fecha.")
+
+        dia = desde
+        while dia <= fecha:
+            insumos = cortar(dia)
+            self.stdout.write(f'  {dia}  {insumos} insumo(s)')
+            dia += timedelta(days=1)
+        self.stdout.write(self.style.SUCCESS(f'Corte de inventario al {fecha} listo.'))
@@ -0,0 +1,20 @@
+"""
+Borra los contadores vencidos de la tabla del rate limiting (qkt_ratelimit).
+
+Una fila vencida ya no cuenta para nada (ver core_erp.ratelimit.ContadorTabla),
+así que esto solo evita que la tabla crezca con una fila por IP y ventana.
+
+Uso:
+  python manage.py limpiar_ratelimit   # cron, p. ej. cada hora
+"""
+from django.core.management.base import BaseCommand
+
+from core_erp.ratelimit import BACKENDS
+
+
+class Command(BaseCommand):
+    help = 'Borra los contadores vencidos del rate limiting'
+
+    def handle(self, *args, **options):
+        borrados = BACKENDS['tabla'].limpiar_expirados()
+        self.stdout.write(self.style.SUCCESS(f'{borrados} contadores vencidos borrados.'))
@@ -0,0 +1,56 @@
+"""
+Worker de la cola del webhook de Openpay.
+
+La vista del webhook solo guarda la notificación (ver encolar_webhook_openpay)
+y responde 200 de inmediato. Este comando hace el trabajo pesado: crea el
+Pago, dispara la póliza y la comisión, y manda los avisos al cliente.
+Registra en cada OpenpayTransaccion cuánto esperó en cola y cuánto tardó
+cada etapa.
+
+Uso:
+  python manage.py procesar_webhooks_openpay              # drena y termina (cron)
+  python manage.py procesar_webhooks_openpay --continuo   # worker permanente
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from comercial.services_openpay import procesar_cola_webhooks_openpay
+
+
+class Command(BaseCommand):
+    help = 'Procesa las notificaciones del webhook de Openpay que quedaron en cola'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--continuo', action='store_true',
+            help='No termina al vaciar la cola: vuelve a revisarla cada --intervalo segundos.',
+        )
+        parser.add_argument(
+            '--intervalo', type=float, default=2.0,
+            help='Segundos entre revisiones de la cola en modo --continuo (default 2).',
+        )
+        parser.add_argument(
+            '--lote', type=int, default=50,
+            help='Máximo de notificaciones por pasada (default 50).',
+        )
+
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            procesadas = procesar_cola_webhooks_openpay(limite=options['lote'])
+            for r in procesadas:
+                estado = 'OK' if r.procesado else (r.error_detalle[:60] or r.estado_openpay or 'sin cambios')
+                self.stdout.write(
+                    f"  {r.openpay_id} [{estado}] cola={r.latencia_cola_ms}ms "
+                    f"contabilidad={r.latencia_contabilidad_ms}ms "
+                    f"notificaciones={r.latencia_notificaciones_ms}ms"
+                )
+            total += len(procesadas)
+            if len(procesadas) == options['lote']:
+                continue  # la cola sigue llena: no esperar
+            if not options['continuo']:
+                break
+            time.sleep(options['intervalo'])
+
+        self.stdout.write(self.style.SUCCESS(f'\nResultado: {total} notificación(es) procesada(s)'))
@@ -0,0 +1,48 @@
+"""
+Revisa las reservas de inventario (ver comercial/reservas.py) de las
+cotizaciones confirmadas, y de las que conservan reservas sin estarlo, y
+corrige las que no coinciden con sus items y recetas actuales.
+
+Las reservas se mantienen solas al confirmar y al editar items; esto es
+para la carga inicial y para después de cambiar recetas o paquetes.
+Reporta por defecto. Uso:
+    python manage.py sincronizar_reservas_inventario [--aplicar]
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+
+from comercial.models import Cotizacion
+from comercial.reservas import ESTADOS_QUE_RESERVAN, sincronizar
+
+
+class Command(BaseCommand):
+    help = "Recalcula las reservas de inventario de las cotizaciones confirmadas. Reporta salvo --aplicar."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--aplicar', action='store_true', help="Escribe. Sin esto solo reporta.")
+
+    def handle(self, *args, **opciones):
+        cotizaciones = Cotizacion.objects.filter(
+            Q(estado__in=ESTADOS_QUE_RESERVAN) | Q(reservas_inventario__isnull=False),
+        ).distinct().order_by('fecha_evento', 'pk')
+
+        distintas = 0
+        for cotizacion in cotizaciones.iterator():
+            with transaction.atomic():
+                cambios = sincronizar(cotizacion, aplicar=opciones['aplicar'])
+            if any(cambios.values()):
+                distintas += 1
+                self.stdout.write(
+                    f"  COT-{cotizacion.pk:03d} {cotizacion.fecha_evento}  "
+                    f"+{cambios['creadas']} ~{cambios['actualizadas']} -{cambios['borradas']}"
+                )
+
+        if not distintas:
+            self.stdout.write(self.style.SUCCESS("Las reservas coinciden con las cotizaciones."))
+        elif opciones['aplicar']:
+            self.stdout.write(self.style.SUCCESS(f"{distintas} cotización(es) corregida(s)."))
+        else:
+            self.stdout.write(self.style.WARNING(
+                f"SIMULACIÓN: {distintas} cotización(es) con diferencias. Vuelve a correrlo con --aplicar."
+            ))
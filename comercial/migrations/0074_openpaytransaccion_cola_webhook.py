@@ -0,0 +1,72 @@
+# Generated by Django 6.1 on 2026-10-19 10:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("comercial", "0073_hospedaje"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="openpaytransaccion",
+            name="latencia_cola_ms",
+            field=models.PositiveIntegerField(
+                blank=True, null=True, verbose_name="Espera en cola (ms)"
+            ),
+        ),
+        migrations.AddField(
+            model_name="openpaytransaccion",
+            name="latencia_contabilidad_ms",
+            field=models.PositiveIntegerField(
+                blank=True, null=True, verbose_name="Pago y pólizas (ms)"
+            ),
+        ),
+        migrations.AddField(
+            model_name="openpaytransaccion",
+            name="latencia_notificaciones_ms",
+            field=models.PositiveIntegerField(
+                blank=True, null=True, verbose_name="Notificaciones (ms)"
+            ),
+        ),
+        migrations.AddField(
+            model_name="openpaytransaccion",
+            name="webhook_payload",
+            field=models.JSONField(
+                blank=True,
+                help_text="Se guarda aparte de payload_crudo para no pisar la respuesta original del cargo.",
+                null=True,
+                verbose_name="Última notificación de webhook",
+            ),
+        ),
+        migrations.AddField(
+            model_name="openpaytransaccion",
+            name="webhook_pendiente",
+            field=models.BooleanField(
+                db_index=True, default=False, verbose_name="Webhook en cola"
+            ),
+        ),
+        migrations.AddField(
+            model_name="openpaytransaccion",
+            name="webhook_procesado_en",
+            field=models.DateTimeField(
+                blank=True, null=True, verbose_name="Webhook procesado"
+            ),
+        ),
+        migrations.AddField(
+            model_name="openpaytransaccion",
+            name="webhook_recibido_en",
+            field=models.DateTimeField(
+                blank=True, null=True, verbose_name="Webhook recibido"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="openpaytransaccion",
+            index=models.Index(
+                fields=["webhook_pendiente", "webhook_recibido_en"],
+                name="comercial_o_webhook_75bd84_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,24 @@
+from django.db import migrations
+
+TABLA = 'qkt_ratelimit'
+
+
+def crear_tabla_ratelimit(apps, schema_editor):
+    # Sin modelo, igual que qkt_cache: solo la usa core_erp.ratelimit con SQL
+    # directo. Sin índices aparte de la llave primaria, para que en PostgreSQL
+    # cada golpe sea un UPDATE HOT sobre la misma fila.
+    schema_editor.execute(
+        f'CREATE TABLE IF NOT EXISTS {TABLA} ('
+        'clave varchar(255) NOT NULL PRIMARY KEY, '
+        'contador integer NOT NULL, '
+        'expira double precision NOT NULL)'
+    )
+
+
+def borrar_tabla_ratelimit(apps, schema_editor):
+    schema_editor.execute(f'DROP TABLE IF EXISTS {TABLA}')
+
+
+class Migration(migrations.Migration):
+    dependencies = [('comercial', '0074_openpaytransaccion_cola_webhook')]
+    operations = [migrations.RunPython(crear_tabla_ratelimit, borrar_tabla_ratelimit)]
@@ -0,0 +1,82 @@
+# Generated by Django 6.1 on 2026-10-19 12:00
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("comercial", "0075_tabla_ratelimit"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CambioEstadoCotizacion",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "estado_anterior",
+                    models.CharField(
+                        choices=[
+                            ("BORRADOR", "Borrador"),
+                            ("COTIZADA", "Cotización Enviada"),
+                            ("CONFIRMADA", "Venta Confirmada"),
+                            ("EJECUTADA", "Evento Ejecutado"),
+                            ("CERRADA", "Cerrada / Completada"),
+                            ("CANCELADA", "Cancelada"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                (
+                    "estado_nuevo",
+                    models.CharField(
+                        choices=[
+                            ("BORRADOR", "Borrador"),
+                            ("COTIZADA", "Cotización Enviada"),
+                            ("CONFIRMADA", "Venta Confirmada"),
+                            ("EJECUTADA", "Evento Ejecutado"),
+                            ("CERRADA", "Cerrada / Completada"),
+                            ("CANCELADA", "Cancelada"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                ("motivo", models.CharField(blank=True, max_length=255)),
+                ("fecha", models.DateTimeField(auto_now_add=True)),
+                (
+                    "cotizacion",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="cambios_estado",
+                        to="comercial.cotizacion",
+                    ),
+                ),
+                (
+                    "usuario",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Cambio de estado",
+                "verbose_name_plural": "Cambios de estado",
+                "ordering": ["-fecha", "-id"],
+            },
+        ),
+    ]
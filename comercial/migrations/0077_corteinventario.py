@@ -0,0 +1,45 @@
+# Generated by Django 6.1 on 2026-10-19 12:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("comercial", "0076_cambioestadocotizacion"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CorteInventario",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("fecha", models.DateField()),
+                ("cantidad", models.DecimalField(decimal_places=2, max_digits=12)),
+                ("created_at", models.DateTimeField(auto_now=True)),
+                (
+                    "insumo",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="cortes",
+                        to="comercial.insumo",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Corte de inventario",
+                "verbose_name_plural": "Cortes de inventario",
+                "ordering": ["-fecha"],
+                "unique_together": {("insumo", "fecha")},
+            },
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 6.1 on 2026-10-19 14:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("comercial", "0077_corteinventario"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ReservaInventario",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("fecha", models.DateField(help_text="Fecha del evento.")),
+                ("cantidad", models.DecimalField(decimal_places=4, max_digits=14)),
+                (
+                    "cotizacion",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="reservas_inventario",
+                        to="comercial.cotizacion",
+                    ),
+                ),
+                (
+                    "insumo",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="reservas",
+                        to="comercial.insumo",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Reserva de inventario",
+                "verbose_name_plural": "Reservas de inventario",
+                "indexes": [
+                    models.Index(
+                        fields=["insumo", "fecha"],
+                        name="comercial_r_insumo__724e61_idx",
+                    )
+                ],
+                "unique_together": {("cotizacion", "insumo")},
+            },
+        ),
+    ]
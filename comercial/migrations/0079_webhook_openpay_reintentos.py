@@ -0,0 +1,30 @@
+# Generated by Django 6.1 on 2026-10-19 19:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("comercial", "0078_reservainventario"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="openpaytransaccion",
+            name="webhook_intentos",
+            field=models.PositiveSmallIntegerField(
+                default=0, verbose_name="Intentos del worker"
+            ),
+        ),
+        migrations.AddField(
+            model_name="openpaytransaccion",
+            name="webhook_reintentar_en",
+            field=models.DateTimeField(
+                blank=True,
+                help_text="El worker no la toma antes de esta hora.",
+                null=True,
+                verbose_name="Siguiente intento",
+            ),
+        ),
+    ]
@@ -6,6 +6,7 @@ from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
 from django.db import models, transaction
 from django.db.models import F, Sum
+from django.db.models.functions import Coalesce
 from django.utils.timezone import now
 
 from comercial.choices import ModoDescuento, PosicionLanding
@@ -117,6 +118,9 @@ class MovimientoInventario(models.Model):
         ('AJUSTE_NEG', 'Ajuste Negativo (Merma / Daño)'),
         ('DEVOLUCION', 'Devolución a Proveedor'),
     ]
+    # Los que suman al stock; el resto resta.
+    TIPOS_ENTRADA = ('ENTRADA', 'AJUSTE_POS')
+    TIPOS_SALIDA = ('SALIDA', 'AJUSTE_NEG', 'DEVOLUCION')
 
     insumo = models.ForeignKey(Insumo, on_delete=models.PROTECT, related_name='movimientos',
                                 verbose_name="Insumo")
@@ -155,7 +159,7 @@ class MovimientoInventario(models.Model):
         if self.cantidad <= 0:
             raise ValidationError({'cantidad': 'La cantidad debe ser mayor a cero.'})
 
-        if self.tipo in ('SALIDA', 'AJUSTE_NEG', 'DEVOLUCION'):
+        if self.tipo in self.TIPOS_SALIDA:
             if self.cantidad > self.insumo.cantidad_stock:
                 raise ValidationError({
                     'cantidad': f'Stock insuficiente. Disponible: {self.insumo.cantidad_stock} {self.insumo.unidad_medida}'
@@ -173,11 +177,11 @@ class MovimientoInventario(models.Model):
             self.clean()
 
             # Update atómico con F() expression
-            if self.tipo in ('ENTRADA', 'AJUSTE_POS'):
+            if self.tipo in self.TIPOS_ENTRADA:
                 Insumo.objects.filter(pk=self.insumo_id).update(
                     cantidad_stock=F('cantidad_stock') + self.cantidad
                 )
-            elif self.tipo in ('SALIDA', 'AJUSTE_NEG', 'DEVOLUCION'):
+            elif self.tipo in self.TIPOS_SALIDA:
                 Insumo.objects.filter(pk=self.insumo_id).update(
                     cantidad_stock=F('cantidad_stock') - self.cantidad
                 )
@@ -189,10 +193,54 @@ class MovimientoInventario(models.Model):
             super().save(*args, **kwargs)
 
     def __str__(self):
-        signo = '+' if self.tipo in ('ENTRADA', 'AJUSTE_POS') else '-'
+        signo = '+' if self.tipo in self.TIPOS_ENTRADA else '-'
         return f"{signo}{self.cantidad} {self.insumo.nombre} ({self.get_tipo_display()})"
 
 
+class CorteInventario(models.Model):
+    """
+    Existencia de un insumo al cierre de un día, escrita por el cron
+    `cortar_inventario`. Es el punto de partida de las consultas "¿cuánto
+    había el día X?" (ver comercial/inventario.py): corte más los
+    movimientos posteriores, sin recorrer toda la historia.
+    """
+    insumo = models.ForeignKey(Insumo, on_delete=models.CASCADE, related_name='cortes')
+    fecha = models.DateField()
+    cantidad = models.DecimalField(max_digits=12, decimal_places=2)
+    created_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Corte de inventario"
+        verbose_name_plural = "Cortes de inventario"
+        ordering = ['-fecha']
+        unique_together = ['insumo', 'fecha']
+
+    def __str__(self):
+        return f"{self.insumo.nombre} al {self.fecha}: {self.cantidad}"
+
+
+class ReservaInventario(models.Model):
+    """
+    Insumo comprometido por una cotización confirmada para la fecha de su
+    evento. Una fila por (cotización, insumo); la mantiene
+    comercial/reservas.py al confirmar, al tocar los items o al cambiar la
+    fecha, y se libera al ejecutar o cancelar.
+    """
+    cotizacion = models.ForeignKey('Cotizacion', on_delete=models.CASCADE, related_name='reservas_inventario')
+    insumo = models.ForeignKey(Insumo, on_delete=models.CASCADE, related_name='reservas')
+    fecha = models.DateField(help_text="Fecha del evento.")
+    cantidad = models.DecimalField(max_digits=14, decimal_places=4)
+
+    class Meta:
+        verbose_name = "Reserva de inventario"
+        verbose_name_plural = "Reservas de inventario"
+        unique_together = ['cotizacion', 'insumo']
+        indexes = [models.Index(fields=['insumo', 'fecha'])]
+
+    def __str__(self):
+        return f"{self.cantidad} {self.insumo.nombre} para COT-{self.cotizacion_id:03d} ({self.fecha})"
+
+
 # ==========================================
 # 1.5 PLANTILLA DE BARRA
 # ==========================================
@@ -636,6 +684,10 @@ class Cotizacion(models.Model):
 
         self.estado = nuevo_estado
         self.save(update_fields=['estado', 'motivo_cancelacion', 'cancelada_por', 'fecha_cancelacion', 'updated_at'])
+        CambioEstadoCotizacion.objects.create(
+            cotizacion=self, estado_anterior=estado_actual, estado_nuevo=nuevo_estado,
+            usuario=usuario, motivo=(motivo or '')[:255],
+        )
         return True, f"Estado cambiado a '{dict(self.ESTADOS).get(nuevo_estado)}'"
 
     def _get_porcentaje_anticipo_minimo(self):
@@ -649,7 +701,7 @@ class Cotizacion(models.Model):
     def porcentaje_pagado(self):
         """Retorna el porcentaje de pago como número."""
         if self.precio_final > 0:
-            return round((self.total_pagado() / self.precio_final) * 100, 1)
+            return self.porcentaje_de(self.total_pagado(), self.precio_final)
         return Decimal('0.0')
 
     @property
@@ -860,6 +912,40 @@ class Cotizacion(models.Model):
         return qs.aggregate(Sum('monto'))['monto__sum'] or Decimal('0.00')
     def saldo_pendiente(self): return self.precio_final - self.total_pagado()
 
+    @staticmethod
+    def expresion_total_pagado(cotizacion='pk'):
+        """Equivalente SQL de `total_pagado()` para anotar un queryset de
+        cotizaciones (`.annotate(pagado=Cotizacion.expresion_total_pagado())`).
+
+        `cotizacion` es la ruta a la cotización desde el modelo anotado; desde
+        una parcialidad, por ejemplo, `'plan__cotizacion'`.
+
+        Usa subconsultas correlacionadas en vez de JOIN + Sum para que anotar
+        no multiplique filas si el queryset ya trae otros JOINs, y para que el
+        costo sea una sola consulta sin importar cuántas cotizaciones traiga.
+        """
+        def _suma(**filtros):
+            suma = (
+                Pago.objects.filter(cotizacion=models.OuterRef(cotizacion), **filtros)
+                .order_by().values('cotizacion').annotate(total=Sum('monto')).values('total')
+            )
+            return Coalesce(
+                models.Subquery(suma, output_field=models.DecimalField(max_digits=12, decimal_places=2)),
+                models.Value(Decimal('0.00')),
+                output_field=models.DecimalField(max_digits=12, decimal_places=2),
+            )
+        return models.ExpressionWrapper(
+            _suma(tipo='INGRESO', concepto='VENTA') - _suma(tipo='REEMBOLSO'),
+            output_field=models.DecimalField(max_digits=12, decimal_places=2),
+        )
+
+    @staticmethod
+    def porcentaje_de(pagado, precio_final):
+        """Misma fórmula que `porcentaje_pagado`, sobre un total ya calculado."""
+        if precio_final > 0:
+            return round((pagado / precio_final) * 100, 1)
+        return Decimal('0.0')
+
     def requiere_pago_total_detalle(self):
         """
         ¿Este servicio debe liquidarse al 100% en el siguiente pago? (bool, motivo)
@@ -955,6 +1041,26 @@ class Cotizacion(models.Model):
             models.Index(fields=['fecha_evento']),
         ]
 
+
+class CambioEstadoCotizacion(models.Model):
+    """Bitácora de cambios de estado: los del usuario (`cambiar_estado`) y
+    los del cierre automático diario (`cerrar_cotizaciones`, sin usuario)."""
+    cotizacion = models.ForeignKey(Cotizacion, on_delete=models.CASCADE, related_name='cambios_estado')
+    estado_anterior = models.CharField(max_length=20, choices=Cotizacion.ESTADOS)
+    estado_nuevo = models.CharField(max_length=20, choices=Cotizacion.ESTADOS)
+    usuario = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    motivo = models.CharField(max_length=255, blank=True)
+    fecha = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Cambio de estado"
+        verbose_name_plural = "Cambios de estado"
+        ordering = ['-fecha', '-id']
+
+    def __str__(self):
+        return f"COT-{self.cotizacion_id:03d}: {self.estado_anterior} → {self.estado_nuevo}"
+
+
 class ItemCotizacion(models.Model):
     cotizacion = models.ForeignKey(Cotizacion, related_name='items', on_delete=models.CASCADE)
     producto = models.ForeignKey(Producto, on_delete=models.SET_NULL, null=True, blank=True)
@@ -1376,7 +1482,12 @@ class PlanPago(models.Model):
         return self.parcialidades.filter(pagada=False).order_by('fecha_limite').first()
 
     def __str__(self):
-        return f"Plan de pagos COT-{self.cotizacion.id:03d} ({self.parcialidades.count()} parcialidades)"
+        # PlanPagoAdmin anota `_num_parcialidades`: el checkbox de acciones del
+        # changelist usa str(obj) y sin esto volvería a ser un COUNT por fila.
+        num = getattr(self, '_num_parcialidades', None)
+        if num is None:
+            num = self.parcialidades.count()
+        return f"Plan de pagos COT-{self.cotizacion_id:03d} ({num} parcialidades)"
 
     class Meta:
         verbose_name = "Plan de Pago"
@@ -2063,10 +2174,39 @@ class OpenpayTransaccion(models.Model):
     error_detalle = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    # Cola del webhook: la vista solo guarda la notificación y responde 200;
+    # `procesar_webhooks_openpay` la drena después (Pago, póliza, avisos).
+    webhook_payload = models.JSONField(
+        null=True, blank=True, verbose_name="Última notificación de webhook",
+        help_text="Se guarda aparte de payload_crudo para no pisar la respuesta original del cargo.",
+    )
+    webhook_pendiente = models.BooleanField(default=False, db_index=True, verbose_name="Webhook en cola")
+    webhook_recibido_en = models.DateTimeField(null=True, blank=True, verbose_name="Webhook recibido")
+    webhook_procesado_en = models.DateTimeField(null=True, blank=True, verbose_name="Webhook procesado")
+    # Un intento fallido deja la notificación en cola: Openpay ya recibió su
+    # 200 y no la va a volver a mandar.
+    webhook_intentos = models.PositiveSmallIntegerField(default=0, verbose_name="Intentos del worker")
+    webhook_reintentar_en = models.DateTimeField(
+        null=True, blank=True, verbose_name="Siguiente intento",
+        help_text="El worker no la toma antes de esta hora.",
+    )
+    latencia_cola_ms = models.PositiveIntegerField(
+        null=True, blank=True, verbose_name="Espera en cola (ms)",
+    )
+    latencia_contabilidad_ms = models.PositiveIntegerField(
+        null=True, blank=True, verbose_name="Pago y pólizas (ms)",
+    )
+    latencia_notificaciones_ms = models.PositiveIntegerField(
+        null=True, blank=True, verbose_name="Notificaciones (ms)",
+    )
+
     class Meta:
         verbose_name = "Transacción Openpay"
         verbose_name_plural = "Transacciones Openpay"
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['webhook_pendiente', 'webhook_recibido_en']),
+        ]
 
     def __str__(self):
         return f"{self.openpay_id} - {self.metodo or self.event_type} [{'procesado' if self.procesado else 'pendiente'}]"
@@ -0,0 +1,133 @@
+"""
+Reservas de inventario
+======================
+Una cotización CONFIRMADA compromete los insumos de su evento. Aquí se
+mantiene `ReservaInventario` (una fila por cotización e insumo, fechada en
+`fecha_evento`) para que "¿cuánto queda libre de cada insumo para tal
+fecha?" sea una suma sobre el índice (insumo, fecha), sin recalcular los
+requerimientos de cada evento próximo.
+
+Los requerimientos salen de `Cotizacion.calcular_inventario_inteligente()`
+(subproductos de los productos, sin duplicar herencias) explotados por
+`RecetaSubProducto`, más los items que son un insumo directo. El servicio
+de barra es una estimación por palabra clave y no reserva.
+
+Se recalcula solo la cotización afectada, comparando contra sus filas:
+al guardar la cotización tocando `estado` o `fecha_evento` y al guardar o
+borrar uno de sus items. `cerrar_cotizaciones` las pasa a EJECUTADA con un
+UPDATE y libera sus reservas con `liberar()`. Un cambio de receta no se
+propaga solo: `manage.py sincronizar_reservas_inventario` lo recoge.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db.models import DecimalField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_delete, post_save
+
+from .models import Cotizacion, Insumo, ItemCotizacion, RecetaSubProducto, ReservaInventario
+
+ESTADOS_QUE_RESERVAN = ('CONFIRMADA',)
+CAMPOS_RESERVA = frozenset({'estado', 'fecha_evento'})
+
+CERO = Decimal('0')
+CUATRO_DECIMALES = Decimal('0.0001')
+
+
+def requerimientos(cotizacion):
+    """{insumo_id: cantidad} que consume el evento de `cotizacion`."""
+    subproductos = cotizacion.calcular_inventario_inteligente()
+    resultado = defaultdict(lambda: CERO)
+    recetas = RecetaSubProducto.objects.filter(subproducto_id__in=subproductos).values_list(
+        'subproducto_id', 'insumo_id', 'cantidad',
+    )
+    for sub_id, insumo_id, cantidad in recetas:
+        resultado[insumo_id] += cantidad * subproductos[sub_id]['cantidad']
+    directos = cotizacion.items.filter(producto__isnull=True, insumo__isnull=False).values_list('insumo_id', 'cantidad')
+    for insumo_id, cantidad in directos:
+        resultado[insumo_id] += cantidad
+    return {
+        pk: cantidad.quantize(CUATRO_DECIMALES)
+        for pk, cantidad in resultado.items()
+        if cantidad > 0
+    }
+
+
+def sincronizar(cotizacion, aplicar=True):
+    """
+    Deja las reservas de `cotizacion` como deben estar según su estado,
+    fecha e items; solo escribe las filas que cambian. Regresa
+    {'creadas', 'actualizadas', 'borradas'}; con aplicar=False solo cuenta.
+    """
+    actuales = {r.insumo_id: r for r in ReservaInventario.objects.filter(cotizacion=cotizacion)}
+    deseadas = requerimientos(cotizacion) if cotizacion.estado in ESTADOS_QUE_RESERVAN else {}
+
+    borrar = [r.pk for pk, r in actuales.items() if pk not in deseadas]
+    crear = [
+        ReservaInventario(cotizacion=cotizacion, insumo_id=pk, fecha=cotizacion.fecha_evento, cantidad=cantidad)
+        for pk, cantidad in deseadas.items() if pk not in actuales
+    ]
+    actualizar = []
+    for pk, cantidad in deseadas.items():
+        reserva = actuales.get(pk)
+        if reserva and (reserva.cantidad != cantidad or reserva.fecha != cotizacion.fecha_evento):
+            reserva.cantidad, reserva.fecha = cantidad, cotizacion.fecha_evento
+            actualizar.append(reserva)
+
+    if aplicar:
+        if borrar:
+            ReservaInventario.objects.filter(pk__in=borrar).delete()
+        if crear:
+            ReservaInventario.objects.bulk_create(crear)
+        if actualizar:
+            ReservaInventario.objects.bulk_update(actualizar, ['cantidad', 'fecha'])
+    return {'creadas': len(crear), 'actualizadas': len(actualizar), 'borradas': len(borrar)}
+
+
+def liberar(cotizaciones):
+    """Borra las reservas de `cotizaciones` (ids o queryset)."""
+    return ReservaInventario.objects.filter(cotizacion__in=cotizaciones).delete()[0]
+
+
+def disponibilidad(fecha, insumos=None):
+    """
+    {insumo_id: {'stock', 'reservado', 'disponible'}} para prometer en
+    `fecha`: existencia actual menos lo comprometido por eventos hasta ese
+    día. Una consulta.
+    """
+    insumos = Insumo.objects.all() if insumos is None else insumos
+    reservado = (
+        ReservaInventario.objects
+        .filter(insumo=OuterRef('pk'), fecha__lte=fecha)
+        .order_by().values('insumo').annotate(t=Sum('cantidad')).values('t')
+    )
+    decimal = DecimalField(max_digits=14, decimal_places=4)
+    filas = insumos.annotate(
+        reservado=Coalesce(Subquery(reservado, output_field=decimal), Value(CERO), output_field=decimal),
+    ).values_list('pk', 'cantidad_stock', 'reservado')
+    return {
+        pk: {'stock': stock, 'reservado': reservado, 'disponible': stock - reservado}
+        for pk, stock, reservado in filas
+    }
+
+
+def _cotizacion_guardada(sender, instance, created, update_fields=None, **kwargs):
+    if update_fields is not None and not CAMPOS_RESERVA.intersection(update_fields):
+        return
+    if created and instance.estado not in ESTADOS_QUE_RESERVAN:
+        return
+    sincronizar(instance)
+
+
+def _item_cambiado(sender, instance, origin=None, **kwargs):
+    # Al borrar la cotización sus items caen en cascada junto con las reservas.
+    if isinstance(origin, Cotizacion):
+        return
+    cotizacion = instance.cotizacion
+    if cotizacion.estado in ESTADOS_QUE_RESERVAN:
+        sincronizar(cotizacion)
+
+
+post_save.connect(_cotizacion_guardada, sender=Cotizacion, dispatch_uid='reservas_cot_save')
+post_save.connect(_item_cambiado, sender=ItemCotizacion, dispatch_uid='reservas_item_save')
+post_delete.connect(_item_cambiado, sender=ItemCotizacion, dispatch_uid='reservas_item_delete')
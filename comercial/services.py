@@ -177,13 +177,18 @@ class CalculadoraBarraService:
     separando la lógica de negocio del modelo de base de datos.
     """
 
-    def __init__(self, cotizacion):
+    def __init__(self, cotizacion, constantes=None):
         self.cot = cotizacion
+        # {clave: valor} de ConstanteSistema ya leído, para calcular muchas
+        # cotizaciones sin una consulta por constante en cada una.
+        self.constantes = constantes
 
     def _get_costo(self, insumo, clave_constante, default_val):
         if insumo:
             factor = insumo.factor_rendimiento if insumo.factor_rendimiento > 0 else 1
             return insumo.costo_unitario / Decimal(factor)
+        if self.constantes is not None:
+            return self.constantes.get(clave_constante, Decimal(default_val))
         try:
             const = ConstanteSistema.objects.get(clave=clave_constante)
             return const.valor
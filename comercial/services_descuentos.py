@@ -11,8 +11,16 @@ Regla de negocio central (NO-ACUMULABLES):
   ganador entre los no-acumulables.
 
 Todo cálculo monetario con Decimal y quantize(Decimal('0.01'), ROUND_HALF_UP).
+
+Las reglas AUTOMATICO se leen una vez en una `ReglasDescuento`, que sirve
+igual para una cotización que para muchas: `aplicar_automaticos_en_bloque`
+evalúa toda una selección contra la misma tabla y escribe en bloque.
 """
+from collections import Counter
+from dataclasses import dataclass
+from datetime import date
 from decimal import ROUND_HALF_UP, Decimal
+from typing import Optional
 
 from django.db import transaction
 from django.db.models import F
@@ -42,55 +50,108 @@ def _monto_descuento(descuento, subtotal):
     return _q(descuento.valor)
 
 
-class DescuentoService:
+def _calcular_aplicacion(cotizacion, descuento, subtotal):
+    """(monto, porcentaje equivalente) de aplicar `descuento` sobre el
+    descuento que la cotización ya trae."""
+    # El descuento no puede exceder la base disponible (evita base negativa).
+    base_disponible = subtotal - (cotizacion.descuento or Decimal('0.00'))
+    if base_disponible < 0:
+        base_disponible = Decimal('0.00')
+    monto = _q(min(_monto_descuento(descuento, subtotal), base_disponible))
 
-    # ── Evaluación ──────────────────────────────────────────────────────
-    @staticmethod
-    def evaluar_automaticos(cotizacion):
-        """Retorna los descuentos AUTOMATICO + activos cuyas condiciones
-        cumple la cotización. Usa select_related/prefetch_related (sin N+1)."""
-        subtotal = _subtotal_items(cotizacion)
-        candidatos = (
+    porcentaje_equiv = (
+        _q(monto / subtotal * Decimal('100')) if subtotal > 0 else Decimal('0.00')
+    )
+    return monto, porcentaje_equiv
+
+
+@dataclass
+class _Regla:
+    descuento: Descuento
+    tipos_servicio: frozenset
+    tipos_evento: frozenset
+    # Vigencia del descuento ya intersectada con la de su temporada.
+    desde: Optional[date]
+    hasta: Optional[date]
+
+    def vigente(self, fecha):
+        if self.desde is None and self.hasta is None:
+            return True
+        if not fecha:
+            return False
+        return (self.desde is None or fecha >= self.desde) and (self.hasta is None or fecha <= self.hasta)
+
+
+class ReglasDescuento:
+    """
+    Los descuentos AUTOMATICO activos, leídos una vez e indexados por
+    (tipo_servicio, tipo_evento). La vigencia y la temporada se reducen a un
+    solo rango por regla; una temporada inactiva descarta la regla desde aquí.
+
+    Lo que cambia de una cotización a otra (monto mínimo, fecha, usos) se
+    revisa al pedir `candidatos()`. Los usos se leen del objeto Descuento de
+    la tabla: quien aplica en bloque los va incrementando ahí mismo.
+    """
+
+    def __init__(self):
+        self.reglas = []
+        descuentos = (
             Descuento.objects
             .filter(modo='AUTOMATICO', activo=True)
             .select_related('temporada')
             .prefetch_related('tipos_evento')
         )
+        for d in descuentos:
+            desde, hasta = d.fecha_inicio, d.fecha_fin
+            if d.temporada_id:
+                temp = d.temporada
+                if not temp.activo:
+                    continue
+                desde = max(desde, temp.fecha_inicio) if desde else temp.fecha_inicio
+                hasta = min(hasta, temp.fecha_fin) if hasta else temp.fecha_fin
+            if desde and hasta and desde > hasta:
+                continue
+            self.reglas.append(_Regla(
+                descuento=d,
+                tipos_servicio=frozenset(d.tipos_servicio or ()),
+                tipos_evento=frozenset(t.id for t in d.tipos_evento.all()),
+                desde=desde,
+                hasta=hasta,
+            ))
+        self._indice = {}
+
+    def _por_tipo(self, tipo_servicio, tipo_evento_id):
+        clave = (tipo_servicio, tipo_evento_id)
+        if clave not in self._indice:
+            self._indice[clave] = [
+                r for r in self.reglas
+                if (not r.tipos_servicio or tipo_servicio in r.tipos_servicio)
+                and (not r.tipos_evento or tipo_evento_id in r.tipos_evento)
+            ]
+        return self._indice[clave]
+
+    def candidatos(self, cotizacion, subtotal):
+        """Descuentos cuyas condiciones (todas con AND) cumple la cotización,
+        en el orden de Descuento.Meta.ordering."""
+        fecha = cotizacion.fecha_evento
         return [
-            d for d in candidatos
-            if DescuentoService._cumple_condiciones(d, cotizacion, subtotal)
+            r.descuento
+            for r in self._por_tipo(cotizacion.tipo_servicio, cotizacion.tipo_evento_id)
+            if r.descuento.usos_disponibles()
+            and (r.descuento.monto_minimo is None or subtotal >= r.descuento.monto_minimo)
+            and r.vigente(fecha)
         ]
 
-    @staticmethod
-    def _cumple_condiciones(descuento, cotizacion, subtotal):
-        """Todas las condiciones presentes se evalúan con AND."""
-        if not descuento.usos_disponibles():
-            return False
-
-        if descuento.monto_minimo is not None and subtotal < descuento.monto_minimo:
-            return False
-
-        fecha = cotizacion.fecha_evento
-        if descuento.fecha_inicio and (not fecha or fecha < descuento.fecha_inicio):
-            return False
-        if descuento.fecha_fin and (not fecha or fecha > descuento.fecha_fin):
-            return False
-
-        if descuento.temporada_id:
-            temp = descuento.temporada
-            if not temp or not temp.activo or not temp.contiene(fecha):
-                return False
-
-        tipos_ev_ids = {t.id for t in descuento.tipos_evento.all()}
-        if tipos_ev_ids:
-            if not cotizacion.tipo_evento_id or cotizacion.tipo_evento_id not in tipos_ev_ids:
-                return False
 
-        if descuento.tipos_servicio:
-            if cotizacion.tipo_servicio not in descuento.tipos_servicio:
-                return False
+class DescuentoService:
 
-        return True
+    # ── Evaluación ──────────────────────────────────────────────────────
+    @staticmethod
+    def evaluar_automaticos(cotizacion, reglas=None):
+        """Retorna los descuentos AUTOMATICO + activos cuyas condiciones
+        cumple la cotización. Sin `reglas`, las lee (dos consultas)."""
+        reglas = reglas or ReglasDescuento()
+        return reglas.candidatos(cotizacion, _subtotal_items(cotizacion))
 
     @staticmethod
     def mejor_descuento(candidatos, subtotal):
@@ -103,6 +164,15 @@ class DescuentoService:
             key=lambda d: (d.prioridad, _monto_descuento(d, subtotal)),
         )
 
+    @staticmethod
+    def _a_aplicar(candidatos, subtotal):
+        """En orden de aplicación: el ganador no-acumulable y luego todos
+        los acumulables."""
+        ganador = DescuentoService.mejor_descuento(
+            [d for d in candidatos if not d.acumulable], subtotal,
+        )
+        return ([ganador] if ganador else []) + [d for d in candidatos if d.acumulable]
+
     # ── Aplicación / reversión ──────────────────────────────────────────
     @staticmethod
     @transaction.atomic
@@ -111,16 +181,7 @@ class DescuentoService:
         suma el monto a Cotizacion.descuento, recalcula totales e incrementa
         el contador de usos si el descuento tiene tope."""
         subtotal = _subtotal_items(cotizacion)
-
-        # El descuento no puede exceder la base disponible (evita base negativa).
-        base_disponible = subtotal - (cotizacion.descuento or Decimal('0.00'))
-        if base_disponible < 0:
-            base_disponible = Decimal('0.00')
-        monto = _q(min(_monto_descuento(descuento, subtotal), base_disponible))
-
-        porcentaje_equiv = (
-            _q(monto / subtotal * Decimal('100')) if subtotal > 0 else Decimal('0.00')
-        )
+        monto, porcentaje_equiv = _calcular_aplicacion(cotizacion, descuento, subtotal)
 
         aplicado = DescuentoAplicado.objects.create(
             cotizacion=cotizacion,
@@ -198,17 +259,67 @@ class DescuentoService:
             return []
 
         subtotal = _subtotal_items(cotizacion)
-        acumulables = [d for d in candidatos if d.acumulable]
-        no_acumulables = [d for d in candidatos if not d.acumulable]
-
-        aplicados = []
-        ganador = DescuentoService.mejor_descuento(no_acumulables, subtotal)
-        if ganador:
-            aplicados.append(
-                DescuentoService.aplicar(cotizacion, ganador, usuario=usuario, modo='AUTOMATICO')
-            )
-        for d in acumulables:
-            aplicados.append(
-                DescuentoService.aplicar(cotizacion, d, usuario=usuario, modo='AUTOMATICO')
-            )
-        return aplicados
+        return [
+            DescuentoService.aplicar(cotizacion, d, usuario=usuario, modo='AUTOMATICO')
+            for d in DescuentoService._a_aplicar(candidatos, subtotal)
+        ]
+
+    @staticmethod
+    @transaction.atomic
+    def aplicar_automaticos_en_bloque(cotizaciones):
+        """`aplicar_automaticos` para un queryset de cotizaciones, con las
+        mismas reglas de precedencia y el mismo cálculo que `aplicar`, pero
+        con una sola lectura de reglas, items y descuentos ya aplicados, y
+        escrituras en bloque: un bulk_create de DescuentoAplicado, un
+        bulk_update de cotizaciones y un UPDATE de usos por descuento con
+        tope. Los usos se descuentan en memoria conforme se aplican, así que
+        un descuento con tope deja de salir cuando se agota dentro del bloque.
+
+        Devuelve {cotizacion_id: [DescuentoAplicado, ...]} de las que
+        recibieron algún descuento.
+        """
+        reglas = ReglasDescuento()
+        cotizaciones = list(
+            cotizaciones.select_related('cliente').prefetch_related('items').order_by('pk')
+        )
+        ya_aplicados = {}
+        for cot_id, desc_id in DescuentoAplicado.objects.filter(
+            cotizacion__in=[c.pk for c in cotizaciones], activo=True,
+        ).values_list('cotizacion_id', 'descuento_id'):
+            ya_aplicados.setdefault(cot_id, set()).add(desc_id)
+
+        nuevos, modificadas, usos = {}, [], Counter()
+        for cot in cotizaciones:
+            subtotal = _subtotal_items(cot)
+            candidatos = [
+                d for d in reglas.candidatos(cot, subtotal)
+                if d.id not in ya_aplicados.get(cot.pk, ())
+            ]
+            for d in DescuentoService._a_aplicar(candidatos, subtotal):
+                monto, porcentaje_equiv = _calcular_aplicacion(cot, d, subtotal)
+                nuevos.setdefault(cot.pk, []).append(DescuentoAplicado(
+                    cotizacion=cot,
+                    descuento=d,
+                    monto_aplicado=monto,
+                    porcentaje_equivalente=porcentaje_equiv,
+                    modo_aplicacion='AUTOMATICO',
+                    activo=True,
+                ))
+                cot.descuento = _q((cot.descuento or Decimal('0.00')) + monto)
+                if d.max_usos is not None:
+                    d.usos = (d.usos or 0) + 1
+                    usos[d.pk] += 1
+            if cot.pk in nuevos:
+                cot.calcular_totales()
+                modificadas.append(cot)
+
+        if not modificadas:
+            return {}
+        DescuentoAplicado.objects.bulk_create([a for lista in nuevos.values() for a in lista])
+        Cotizacion.objects.bulk_update(
+            modificadas,
+            ['descuento', 'subtotal', 'iva', 'retencion_isr', 'retencion_iva', 'precio_final'],
+        )
+        for desc_id, n in usos.items():
+            Descuento.objects.filter(pk=desc_id).update(usos=F('usos') + n)
+        return nuevos
@@ -12,13 +12,16 @@ El `Pago` creado aquí dispara la póliza automática existente — este módulo
 no toca la lógica de contabilidad.
 """
 import logging
+import time
 import uuid
 from datetime import timedelta
 from decimal import Decimal, InvalidOperation
 
 import requests
 from django.conf import settings
-from django.db import transaction
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
 
 from .models import Cotizacion, OpenpayTransaccion, Pago, ParcialidadPago
 
@@ -673,6 +676,16 @@ def borrar_transacciones_openpay_prueba(registros):
 
 # --- WEBHOOK (confirma cargos asíncronos: efectivo y SPEI) ---
 
+def _datos_webhook(payload: dict):
+    """(event_type, transaction, openpay_id) de una notificación; openpay_id
+    queda en None si la notificación no trae transacción identificable."""
+    event_type = payload.get('type', '')
+    transaction_data = payload.get('transaction', payload)
+    if not isinstance(transaction_data, dict):
+        return event_type, {}, None
+    return event_type, transaction_data, transaction_data.get('id') or None
+
+
 def procesar_webhook_openpay(payload: dict):
     """
     Procesa una notificación de webhook ya autenticada (la vista valida el
@@ -686,11 +699,7 @@ def procesar_webhook_openpay(payload: dict):
     Pago. Nunca lanza excepción hacia afuera sin registrar el error — la
     vista siempre debe poder regresar 200 OK a Openpay.
     """
-    event_type = payload.get('type', '')
-    transaction_data = payload.get('transaction', payload)
-    if not isinstance(transaction_data, dict):
-        return None
-    openpay_id = transaction_data.get('id')
+    event_type, transaction_data, openpay_id = _datos_webhook(payload)
     if not openpay_id:
         return None  # notificación sin id de transacción (ej. verification_code) — se ignora aquí
 
@@ -751,6 +760,138 @@ def procesar_webhook_openpay(payload: dict):
     return registro
 
 
+def encolar_webhook_openpay(payload: dict):
+    """
+    Camino rápido de la vista del webhook: guarda la notificación en su
+    OpenpayTransaccion, la marca en cola y regresa. Openpay reintenta si la
+    respuesta tarda, así que aquí no se crea el Pago ni la póliza ni se avisa
+    al cliente — eso lo hace `procesar_cola_webhooks_openpay`.
+
+    Idempotente por openpay_id: la fila se bloquea con select_for_update para
+    que un reintento simultáneo no pise la notificación ni re-encole un cargo
+    que el worker ya procesó.
+    """
+    event_type, transaction_data, openpay_id = _datos_webhook(payload)
+    if not openpay_id:
+        return None
+
+    ahora = timezone.now()
+    with transaction.atomic():
+        registro = OpenpayTransaccion.objects.select_for_update().filter(openpay_id=openpay_id).first()
+        if registro is None:
+            try:
+                with transaction.atomic():
+                    return OpenpayTransaccion.objects.create(
+                        openpay_id=openpay_id,
+                        event_type=event_type,
+                        metodo=transaction_data.get('method', ''),
+                        estado_openpay=transaction_data.get('status', ''),
+                        monto=_decimal_o_none(transaction_data.get('amount')),
+                        payload_crudo=payload,
+                        autorizacion=transaction_data.get('authorization') or '',
+                        webhook_payload=payload,
+                        webhook_pendiente=True,
+                        webhook_recibido_en=ahora,
+                    )
+            except IntegrityError:
+                # Otro reintento la creó entre el SELECT y el INSERT.
+                registro = OpenpayTransaccion.objects.select_for_update().get(openpay_id=openpay_id)
+
+        if registro.procesado:
+            return registro
+        registro.webhook_payload = payload
+        registro.webhook_pendiente = True
+        registro.webhook_recibido_en = ahora
+        registro.webhook_intentos = 0
+        registro.webhook_reintentar_en = None
+        registro.save(update_fields=[
+            'webhook_payload', 'webhook_pendiente', 'webhook_recibido_en',
+            'webhook_intentos', 'webhook_reintentar_en',
+        ])
+    return registro
+
+
+def _ms(inicio, fin):
+    return max(0, int((fin - inicio) * 1000))
+
+
+def _webhook_fallido(payload, registro):
+    """True si la notificación confirmaba un pago y no quedó procesada
+    (procesar_webhook_openpay anota el error en vez de lanzarlo)."""
+    event_type, transaction_data, _ = _datos_webhook(payload)
+    confirma_pago = event_type == 'charge.succeeded' and transaction_data.get('status') == 'completed'
+    return confirma_pago and not (registro and registro.procesado)
+
+
+def procesar_cola_webhooks_openpay(limite=50):
+    """
+    Drena hasta `limite` notificaciones en cola, la más antigua primero, con
+    el mismo `procesar_webhook_openpay` de siempre (Pago → póliza → avisos).
+
+    Cada notificación va en su propia transacción con la fila bloqueada
+    (skip_locked): dos workers a la vez nunca toman la misma. Los avisos al
+    cliente corren en el on_commit de esa transacción, por eso la latencia de
+    notificaciones se mide hasta que termina el commit.
+
+    Si un pago confirmado no se pudo crear, la notificación se queda en cola
+    y se reintenta más tarde (ver OPENPAY_WEBHOOK_MAX_INTENTOS); Openpay ya
+    recibió su 200 y no la reenvía.
+
+    Regresa la lista de OpenpayTransaccion procesadas.
+    """
+    max_intentos = getattr(settings, 'OPENPAY_WEBHOOK_MAX_INTENTOS', 8)
+    espera_base = getattr(settings, 'OPENPAY_WEBHOOK_REINTENTO_SEGUNDOS', 30)
+    procesadas = []
+    for _ in range(limite):
+        inicio = time.monotonic()
+        with transaction.atomic():
+            registro = (
+                OpenpayTransaccion.objects.select_for_update(skip_locked=True)
+                .filter(webhook_pendiente=True)
+                .filter(Q(webhook_reintentar_en__isnull=True) | Q(webhook_reintentar_en__lte=timezone.now()))
+                .order_by('webhook_recibido_en', 'pk')
+                .first()
+            )
+            if registro is None:
+                break
+            inicio_proceso = timezone.now()
+            payload = registro.webhook_payload or {}
+            try:
+                with transaction.atomic():
+                    resultado = procesar_webhook_openpay(payload)
+                fallido = _webhook_fallido(payload, resultado)
+            except Exception as e:
+                logger.exception("Webhook Openpay: error procesando %s desde la cola.", registro.openpay_id)
+                OpenpayTransaccion.objects.filter(pk=registro.pk).update(
+                    error_detalle=f"Error al procesar el webhook en cola: {e}",
+                )
+                fallido = True
+            if fallido:
+                intentos = registro.webhook_intentos + 1
+                OpenpayTransaccion.objects.filter(pk=registro.pk).update(
+                    webhook_intentos=intentos,
+                    webhook_pendiente=intentos < max_intentos,
+                    webhook_reintentar_en=inicio_proceso + timedelta(seconds=espera_base * 2 ** (intentos - 1)),
+                )
+            else:
+                OpenpayTransaccion.objects.filter(pk=registro.pk).update(
+                    webhook_pendiente=False, webhook_reintentar_en=None,
+                )
+            fin_contabilidad = time.monotonic()
+        fin = time.monotonic()
+
+        espera = (inicio_proceso - registro.webhook_recibido_en).total_seconds() if registro.webhook_recibido_en else 0
+        OpenpayTransaccion.objects.filter(pk=registro.pk).update(
+            webhook_procesado_en=timezone.now(),
+            latencia_cola_ms=max(0, int(espera * 1000)),
+            latencia_contabilidad_ms=_ms(inicio, fin_contabilidad),
+            latencia_notificaciones_ms=_ms(fin_contabilidad, fin),
+        )
+        registro.refresh_from_db()
+        procesadas.append(registro)
+    return procesadas
+
+
 def _resolver_cotizacion_desde_order_id(order_id: str):
     if not order_id.startswith('COT-'):
         return None
@@ -0,0 +1,94 @@
+"""
+Presupuesto de consultas de los changelists de Cotizacion, Pago y PlanPago.
+
+Las columnas de badges (pagado, progreso del plan, próximo pago, portal)
+leen solo anotaciones del `get_queryset` del admin: el número de consultas
+de una página no debe crecer con el número de filas.
+
+Ejecutar: python manage.py test comercial.test_admin_changelists --verbosity=2
+"""
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from comercial.models import (
+    Cliente,
+    Cotizacion,
+    ItemCotizacion,
+    Pago,
+    PlanPago,
+    PortalCliente,
+)
+from comercial.services import PlanPagosService
+from core_erp.test_utils import login_superuser_con_totp
+
+
+class ChangelistPresupuestoConsultasTest(TestCase):
+    def setUp(self):
+        self.superusuario = User.objects.create_superuser(
+            'admin_listas', 'admin_listas@quintakooxtanil.com', 'clave-de-prueba',
+        )
+        login_superuser_con_totp(self.client, self.superusuario)
+        self.cliente = Cliente.objects.create(nombre='Cliente listas', telefono='9991234567')
+        self.num_creadas = 0
+
+    def _crear_cotizaciones(self, n):
+        for _ in range(n):
+            self.num_creadas += 1
+            cot = Cotizacion.objects.create(
+                cliente=self.cliente,
+                nombre_evento=f'Evento {self.num_creadas}',
+                fecha_evento=date.today() + timedelta(days=120 + self.num_creadas),
+            )
+            ItemCotizacion.objects.create(
+                cotizacion=cot, descripcion='Servicio', cantidad=1, precio_unitario=1000,
+            )
+            cot.refresh_from_db()
+            Pago.objects.create(
+                cotizacion=cot, monto=Decimal('300.00'), metodo='EFECTIVO',
+                usuario=self.superusuario,
+            )
+            PlanPagosService(cot).generar(usuario=self.superusuario)
+            PortalCliente.objects.get_or_create(cotizacion=cot)
+
+    def _consultas(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            respuesta = self.client.get(url)
+        self.assertEqual(respuesta.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def _assert_consultas_constantes(self, url):
+        self._crear_cotizaciones(2)
+        pocas = self._consultas(url)
+        self._crear_cotizaciones(8)
+        muchas = self._consultas(url)
+        self.assertEqual(pocas, muchas)
+
+    def test_cotizaciones_consultas_constantes(self):
+        self._assert_consultas_constantes(reverse('admin:comercial_cotizacion_changelist'))
+
+    def test_pagos_consultas_constantes(self):
+        self._assert_consultas_constantes(reverse('admin:comercial_pago_changelist'))
+
+    def test_planes_consultas_constantes(self):
+        self._assert_consultas_constantes(reverse('admin:comercial_planpago_changelist'))
+
+    def test_badges_anotados_coinciden_con_el_modelo(self):
+        self._crear_cotizaciones(1)
+        cot = Cotizacion.objects.get()
+        anotada = Cotizacion.objects.annotate(pagado=Cotizacion.expresion_total_pagado()).get()
+        self.assertEqual(anotada.pagado, cot.total_pagado())
+
+        respuesta = self.client.get(reverse('admin:comercial_cotizacion_changelist'))
+        self.assertContains(respuesta, f'{cot.porcentaje_pagado}%')
+        plan = PlanPago.objects.get()
+        self.assertContains(respuesta, f'{plan.parcialidades_pagadas()}/{plan.parcialidades.count()}')
+
+        respuesta = self.client.get(reverse('admin:comercial_planpago_changelist'))
+        siguiente = plan.siguiente_pago()
+        self.assertContains(respuesta, f'${siguiente.monto:,.2f}')
@@ -7,7 +7,9 @@ from datetime import date, timedelta
 from decimal import Decimal
 
 from django.contrib.auth.models import User
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 
 from comercial.models import (
     Cliente,
@@ -262,3 +264,112 @@ class TiposCondicionTest(DescuentoBaseTest):
         cot_evt = self._cotizacion('20000.00', tipo_servicio='EVENTO')
         self.assertEqual(DescuentoService.evaluar_automaticos(cot_arr), [d])
         self.assertEqual(DescuentoService.evaluar_automaticos(cot_evt), [])
+
+
+class AplicarEnBloqueTest(DescuentoBaseTest):
+    """Muchas cotizaciones contra una sola lectura de reglas, con la misma
+    precedencia que aplicar_automaticos."""
+
+    def _reglas(self):
+        Descuento.objects.create(
+            nombre='Temporada', tipo_valor='MONTO_FIJO', valor=Decimal('1000.00'),
+            modo='AUTOMATICO', activo=True, acumulable=False, prioridad=5,
+        )
+        Descuento.objects.create(
+            nombre='Otro no acum', tipo_valor='PORCENTAJE', valor=Decimal('10.00'),
+            modo='AUTOMATICO', activo=True, acumulable=False, prioridad=5,
+        )
+        Descuento.objects.create(
+            nombre='Referido', tipo_valor='MONTO_FIJO', valor=Decimal('500.00'),
+            modo='AUTOMATICO', activo=True, acumulable=True, prioridad=1,
+        )
+
+    def _resumen(self, cot):
+        cot.refresh_from_db()
+        return (
+            cot.descuento, cot.precio_final,
+            sorted(cot.descuentos_aplicados.values_list('descuento__nombre', 'monto_aplicado')),
+        )
+
+    def test_mismo_resultado_que_una_por_una(self):
+        self._reglas()
+        subtotales = ['5000.00', '15000.00', '1200.00']
+        en_bloque = [self._cotizacion(s) for s in subtotales]
+        una_por_una = [self._cotizacion(s) for s in subtotales]
+
+        aplicados = DescuentoService.aplicar_automaticos_en_bloque(
+            Cotizacion.objects.filter(pk__in=[c.pk for c in en_bloque])
+        )
+        for cot in una_por_una:
+            DescuentoService.aplicar_automaticos(cot)
+
+        self.assertEqual(set(aplicados), {c.pk for c in en_bloque})
+        for bloque, sola in zip(en_bloque, una_por_una):
+            self.assertEqual(self._resumen(bloque), self._resumen(sola))
+        # 15000: el 10% (1500) le gana por monto a los 1000 fijos.
+        self.assertEqual(self._resumen(en_bloque[1])[0], Decimal('2000.00'))
+
+    def test_es_idempotente(self):
+        Descuento.objects.create(
+            nombre='Temporada', tipo_valor='MONTO_FIJO', valor=Decimal('1000.00'),
+            modo='AUTOMATICO', activo=True, acumulable=False, prioridad=5,
+        )
+        Descuento.objects.create(
+            nombre='Referido', tipo_valor='MONTO_FIJO', valor=Decimal('500.00'),
+            modo='AUTOMATICO', activo=True, acumulable=True, prioridad=1,
+        )
+        cot = self._cotizacion('20000.00')
+
+        DescuentoService.aplicar_automaticos_en_bloque(Cotizacion.objects.filter(pk=cot.pk))
+        self.assertEqual(DescuentoService.aplicar_automaticos_en_bloque(Cotizacion.objects.filter(pk=cot.pk)), {})
+
+        self.assertEqual(cot.descuentos_aplicados.count(), 2)
+
+    def test_max_usos_se_agota_dentro_del_bloque(self):
+        d = Descuento.objects.create(
+            nombre='Una vez', tipo_valor='MONTO_FIJO', valor=Decimal('500.00'),
+            modo='AUTOMATICO', activo=True, max_usos=1,
+        )
+        primera = self._cotizacion('20000.00')
+        segunda = self._cotizacion('20000.00')
+
+        aplicados = DescuentoService.aplicar_automaticos_en_bloque(Cotizacion.objects.all())
+
+        self.assertEqual(list(aplicados), [primera.pk])
+        self.assertFalse(segunda.descuentos_aplicados.exists())
+        d.refresh_from_db()
+        self.assertEqual(d.usos, 1)
+
+    def test_temporada_inactiva_y_tipo_de_servicio(self):
+        temp = Temporada.objects.create(
+            nombre='Verano', fecha_inicio=date(2026, 6, 1),
+            fecha_fin=date(2026, 8, 31), anio=2026, activo=False,
+        )
+        Descuento.objects.create(
+            nombre='Verano', tipo_valor='PORCENTAJE', valor=Decimal('5.00'),
+            modo='AUTOMATICO', activo=True, temporada=temp,
+        )
+        d_arr = Descuento.objects.create(
+            nombre='Solo arrendamiento', tipo_valor='MONTO_FIJO', valor=Decimal('300.00'),
+            modo='AUTOMATICO', activo=True, tipos_servicio=['ARRENDAMIENTO'],
+        )
+        arr = self._cotizacion('20000.00', tipo_servicio='ARRENDAMIENTO', fecha=date(2026, 7, 10))
+        self._cotizacion('20000.00', fecha=date(2026, 7, 10))
+
+        aplicados = DescuentoService.aplicar_automaticos_en_bloque(Cotizacion.objects.all())
+
+        self.assertEqual({k: [a.descuento for a in v] for k, v in aplicados.items()}, {arr.pk: [d_arr]})
+
+    def test_consultas_constantes(self):
+        self._reglas()
+
+        def _consultas(cotizaciones):
+            with CaptureQueriesContext(connection) as ctx:
+                DescuentoService.aplicar_automaticos_en_bloque(
+                    Cotizacion.objects.filter(pk__in=[c.pk for c in cotizaciones])
+                )
+            return len(ctx.captured_queries)
+
+        pocas = _consultas([self._cotizacion('20000.00')])
+        muchas = _consultas([self._cotizacion('20000.00') for _ in range(8)])
+        self.assertEqual(muchas, pocas)
@@ -7,10 +7,13 @@ import base64
 import json
 from datetime import date, datetime, timedelta
 from decimal import Decimal
+from io import StringIO
 from unittest.mock import MagicMock, patch
 
+from django.core.management import call_command
 from django.test import Client, TestCase, override_settings
 from django.urls import reverse
+from django.utils import timezone
 
 from comercial.models import (
     Cliente,
@@ -22,9 +25,11 @@ from comercial.models import (
 )
 from comercial.services_openpay import (
     consultar_y_confirmar_cargo,
+    encolar_webhook_openpay,
     procesar_cargo_efectivo,
     procesar_cargo_spei,
     procesar_cargo_tarjeta,
+    procesar_cola_webhooks_openpay,
     procesar_webhook_openpay,
     reembolsar_cargo_openpay,
 )
@@ -144,6 +149,132 @@ class WebhookOpenpayAuthTest(TestCase):
         self.assertEqual(registro.pago, pago)
 
 
+@override_settings(
+    OPENPAY_WEBHOOK_USER=WEBHOOK_USER, OPENPAY_WEBHOOK_PASSWORD=WEBHOOK_PASSWORD, OPENPAY_WEBHOOK_ENCOLAR=True,
+)
+class WebhookColaTest(TestCase):
+    """La vista solo encola; el worker hace Pago, póliza y avisos."""
+
+    def _post(self, payload):
+        return self.client.post(
+            reverse('openpay_webhook'), secure=True, data=json.dumps(payload),
+            content_type='application/json',
+            HTTP_AUTHORIZATION=_basic_auth_header(WEBHOOK_USER, WEBHOOK_PASSWORD),
+        )
+
+    def test_reintento_en_cola_no_duplica_registro_ni_pago(self):
+        cotizacion = _crear_cotizacion()
+        payload = _payload_exitoso(cotizacion, openpay_id='txcola01')
+        self._post(payload)
+        self._post(payload)  # reintento de Openpay antes de que corra el worker
+
+        registro = OpenpayTransaccion.objects.get(openpay_id='txcola01')
+        self.assertTrue(registro.webhook_pendiente)
+        self.assertEqual(registro.webhook_payload, payload)
+
+        procesar_cola_webhooks_openpay()
+        procesar_cola_webhooks_openpay()
+        self.assertEqual(Pago.objects.filter(referencia='txcola01').count(), 1)
+
+    def test_worker_registra_latencias_y_vacia_la_cola(self):
+        cotizacion = _crear_cotizacion()
+        encolar_webhook_openpay(_payload_exitoso(cotizacion, openpay_id='txcola02'))
+
+        procesadas = procesar_cola_webhooks_openpay()
+
+        self.assertEqual(len(procesadas), 1)
+        registro = procesadas[0]
+        self.assertTrue(registro.procesado)
+        self.assertFalse(registro.webhook_pendiente)
+        self.assertIsNotNone(registro.webhook_procesado_en)
+        self.assertIsNotNone(registro.latencia_cola_ms)
+        self.assertIsNotNone(registro.latencia_contabilidad_ms)
+        self.assertIsNotNone(registro.latencia_notificaciones_ms)
+        self.assertEqual(procesar_cola_webhooks_openpay(), [])
+
+    def test_cargo_ya_procesado_no_se_vuelve_a_encolar(self):
+        cotizacion = _crear_cotizacion()
+        payload = _payload_exitoso(cotizacion, openpay_id='txcola03')
+        procesar_webhook_openpay(payload)
+
+        registro = encolar_webhook_openpay(payload)
+
+        self.assertFalse(registro.webhook_pendiente)
+
+    def test_encolar_conserva_payload_original_del_cargo(self):
+        cotizacion = _crear_cotizacion()
+        OpenpayTransaccion.objects.create(
+            openpay_id='txcola04', metodo='store', estado_openpay='in_progress',
+            monto=Decimal('500.00'), cotizacion=cotizacion,
+            payload_crudo={'id': 'txcola04', 'status': 'in_progress'},
+        )
+        encolar_webhook_openpay(_payload_exitoso(cotizacion, openpay_id='txcola04'))
+
+        registro = OpenpayTransaccion.objects.get(openpay_id='txcola04')
+        self.assertEqual(registro.payload_crudo, {'id': 'txcola04', 'status': 'in_progress'})
+        procesar_cola_webhooks_openpay()
+        self.assertTrue(Pago.objects.filter(referencia='txcola04').exists())
+
+    def test_pago_que_falla_en_el_worker_se_reintenta_despues(self):
+        from django.db import OperationalError
+
+        from comercial import services_openpay
+
+        cotizacion = _crear_cotizacion()
+        encolar_webhook_openpay(_payload_exitoso(cotizacion, openpay_id='txcola05'))
+
+        original, llamadas = services_openpay._crear_pago_desde_cargo, []
+
+        def falla_la_primera(*args):
+            llamadas.append(args)
+            if len(llamadas) == 1:
+                raise OperationalError('conexión perdida')
+            return original(*args)
+
+        with patch('comercial.services_openpay._crear_pago_desde_cargo', side_effect=falla_la_primera):
+            procesar_cola_webhooks_openpay()
+            registro = OpenpayTransaccion.objects.get(openpay_id='txcola05')
+            self.assertTrue(registro.webhook_pendiente)
+            self.assertEqual(registro.webhook_intentos, 1)
+            self.assertIn('conexión perdida', registro.error_detalle)
+            self.assertFalse(Pago.objects.filter(referencia='txcola05').exists())
+
+            # Antes de su hora de reintento el worker no la toma.
+            self.assertEqual(procesar_cola_webhooks_openpay(), [])
+            OpenpayTransaccion.objects.filter(pk=registro.pk).update(
+                webhook_reintentar_en=timezone.now() - timedelta(seconds=1),
+            )
+            procesar_cola_webhooks_openpay()
+
+        registro.refresh_from_db()
+        self.assertTrue(registro.procesado)
+        self.assertFalse(registro.webhook_pendiente)
+        self.assertTrue(Pago.objects.filter(referencia='txcola05').exists())
+
+    @override_settings(OPENPAY_WEBHOOK_MAX_INTENTOS=2, OPENPAY_WEBHOOK_REINTENTO_SEGUNDOS=0)
+    def test_agotados_los_intentos_sale_de_la_cola_con_su_error(self):
+        cotizacion = _crear_cotizacion()
+        encolar_webhook_openpay(_payload_exitoso(cotizacion, openpay_id='txcola06'))
+
+        with patch('comercial.services_openpay.procesar_webhook_openpay', side_effect=RuntimeError('caído')):
+            procesar_cola_webhooks_openpay()
+            procesar_cola_webhooks_openpay()
+
+        registro = OpenpayTransaccion.objects.get(openpay_id='txcola06')
+        self.assertFalse(registro.webhook_pendiente)
+        self.assertEqual(registro.webhook_intentos, 2)
+        self.assertIn('caído', registro.error_detalle)
+        # La misma notificación reenviada vuelve a la cola con intentos frescos.
+        registro = encolar_webhook_openpay(_payload_exitoso(cotizacion, openpay_id='txcola06'))
+        self.assertEqual((registro.webhook_pendiente, registro.webhook_intentos), (True, 0))
+
+    @override_settings(OPENPAY_WEBHOOK_ENCOLAR=False)
+    def test_sin_cola_procesa_dentro_de_la_peticion(self):
+        cotizacion = _crear_cotizacion()
+        self._post(_payload_exitoso(cotizacion, openpay_id='txcola05'))
+        self.assertTrue(Pago.objects.filter(referencia='txcola05').exists())
+
+
 class ProcesarWebhookIdempotenciaTest(TestCase):
     """El mismo openpay_id no debe generar dos Pagos aunque llegue repetido."""
 
@@ -5,18 +5,28 @@ Ejecutar: python manage.py test comercial --verbosity=2
 """
 from datetime import date, timedelta
 from decimal import Decimal
+from io import BytesIO, StringIO
 
+import openpyxl
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 
+from comercial import inventario, reservas
+from comercial.lista_compras import CatalogoBarra, generar_lista_compras_barra, lista_consolidada
 from comercial.models import (
     AsignacionEspacio,
     AsignacionPersonal,
+    CambioEstadoCotizacion,
     Cliente,
+    ComponenteProducto,
     Compra,
     ConstanteSistema,
+    CorteInventario,
     Cotizacion,
     Espacio,
     Insumo,
@@ -25,6 +35,12 @@ from comercial.models import (
     Pago,
     ParcialidadPago,
     PlanPago,
+    PlantillaBarra,
+    Producto,
+    Proveedor,
+    RecetaSubProducto,
+    ReservaInventario,
+    SubProducto,
 )
 from comercial.services import PlanPagosService
 from core_erp.test_utils import login_superuser_con_totp
@@ -267,6 +283,113 @@ class TransicionEstadosTest(TestCase):
         self.assertFalse(ok)
         self.assertIn('anticipo', msg.lower())
 
+    def test_el_cambio_queda_en_la_bitacora(self):
+        self.cot.cambiar_estado('COTIZADA', self.user)
+        self.cot.cambiar_estado('CONFIRMADA', self.user)  # sin anticipo mínimo configurado
+
+        self.assertEqual(
+            list(self.cot.cambios_estado.order_by('id').values_list('estado_anterior', 'estado_nuevo', 'usuario')),
+            [('BORRADOR', 'COTIZADA', self.user.pk), ('COTIZADA', 'CONFIRMADA', self.user.pk)],
+        )
+
+
+class CerrarCotizacionesTest(TestCase):
+    """El cron diario avanza eventos pasados con dos UPDATE sobre el conjunto."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('cierre', password='x')
+        self.cliente = Cliente.objects.create(nombre='Cliente Cierre')
+        self.ayer = date.today() - timedelta(days=1)
+
+    def _cotizacion(self, estado, pagado=None, fecha_evento=None):
+        cot = Cotizacion.objects.create(
+            cliente=self.cliente, nombre_evento=f'Evento {estado}',
+            fecha_evento=fecha_evento or self.ayer, estado=estado,
+        )
+        Cotizacion.objects.filter(pk=cot.pk).update(precio_final=Decimal('1000.00'))
+        cot.refresh_from_db()
+        if pagado:
+            Pago.objects.create(cotizacion=cot, monto=Decimal(pagado), metodo='EFECTIVO', usuario=self.user)
+        return cot
+
+    def _estado(self, cot):
+        return Cotizacion.objects.values_list('estado', flat=True).get(pk=cot.pk)
+
+    def test_avanza_y_deja_bitacora(self):
+        confirmada_pagada = self._cotizacion('CONFIRMADA', pagado='1000.00')
+        cotizada = self._cotizacion('COTIZADA')
+        ejecutada_pagada = self._cotizacion('EJECUTADA', pagado='999.60')
+        ejecutada_debe = self._cotizacion('EJECUTADA', pagado='500.00')
+        futura = self._cotizacion('CONFIRMADA', fecha_evento=date.today() + timedelta(days=5))
+
+        salida = StringIO()
+        call_command('cerrar_cotizaciones', stdout=salida)
+
+        self.assertIn('2 → EJECUTADA, 2 → CERRADA', salida.getvalue())
+        self.assertEqual(self._estado(confirmada_pagada), 'CERRADA')
+        self.assertEqual(self._estado(cotizada), 'EJECUTADA')
+        self.assertEqual(self._estado(ejecutada_pagada), 'CERRADA')
+        self.assertEqual(self._estado(ejecutada_debe), 'EJECUTADA')
+        self.assertEqual(self._estado(futura), 'CONFIRMADA')
+        self.assertEqual(
+            sorted(CambioEstadoCotizacion.objects.values_list('cotizacion', 'estado_anterior', 'estado_nuevo')),
+            sorted([
+                (confirmada_pagada.pk, 'CONFIRMADA', 'EJECUTADA'),
+                (confirmada_pagada.pk, 'EJECUTADA', 'CERRADA'),
+                (cotizada.pk, 'COTIZADA', 'EJECUTADA'),
+                (ejecutada_pagada.pk, 'EJECUTADA', 'CERRADA'),
+            ]),
+        )
+
+    def test_el_reembolso_cuenta_contra_lo_pagado(self):
+        cot = self._cotizacion('EJECUTADA', pagado='1000.00')
+        Pago.objects.create(
+            cotizacion=cot, monto=Decimal('200.00'), metodo='EFECTIVO', tipo='REEMBOLSO', usuario=self.user,
+        )
+
+        call_command('cerrar_cotizaciones', stdout=StringIO())
+
+        self.assertEqual(self._estado(cot), 'EJECUTADA')
+
+    def test_dry_run_solo_cuenta(self):
+        cot = self._cotizacion('CONFIRMADA')
+        self._cotizacion('EJECUTADA', pagado='1000.00')
+
+        salida = StringIO()
+        call_command('cerrar_cotizaciones', '--dry-run', stdout=salida)
+
+        self.assertIn('1 → EJECUTADA, 1 → CERRADA', salida.getvalue())
+        self.assertEqual(self._estado(cot), 'CONFIRMADA')
+        self.assertFalse(CambioEstadoCotizacion.objects.exists())
+
+    def test_dry_run_cuenta_lo_que_cierra_la_corrida_real(self):
+        self._cotizacion('CONFIRMADA', pagado='1000.00')
+        self._cotizacion('COTIZADA')
+        self._cotizacion('EJECUTADA', pagado='1000.00')
+
+        simulacion = StringIO()
+        call_command('cerrar_cotizaciones', '--dry-run', stdout=simulacion)
+        real = StringIO()
+        call_command('cerrar_cotizaciones', stdout=real)
+
+        self.assertIn('2 → EJECUTADA, 2 → CERRADA', simulacion.getvalue())
+        self.assertIn('2 → EJECUTADA, 2 → CERRADA', real.getvalue())
+
+    def test_consultas_constantes_con_el_rezago_de_ejecutadas(self):
+        def _consultas():
+            with CaptureQueriesContext(connection) as ctx:
+                call_command('cerrar_cotizaciones', stdout=StringIO())
+            return len(ctx.captured_queries)
+
+        self._cotizacion('CONFIRMADA')
+        self._cotizacion('EJECUTADA', pagado='1000.00')
+        pocas = _consultas()
+        for _ in range(5):
+            self._cotizacion('CONFIRMADA')
+            self._cotizacion('EJECUTADA', pagado='1000.00')
+            self._cotizacion('EJECUTADA', pagado='100.00')
+        self.assertEqual(_consultas(), pocas)
+
 
 class PlanPagosTest(TestCase):
     """Verifica la generación de planes de pago."""
@@ -390,6 +513,342 @@ class MovimientoInventarioTest(TestCase):
         self.assertEqual(mov.stock_anterior, Decimal('10.00'))
         self.assertEqual(mov.stock_posterior, Decimal('15.00'))
 
+
+class InventarioLedgerTest(TestCase):
+    """Libro de inventario: cortes diarios, stock a una fecha, consumo y movimientos en bloque."""
+
+    def setUp(self):
+        self.user = User.objects.create_superuser('inv', 'inv@x.com', 'x')
+        self.hielo = Insumo.objects.create(
+            nombre='Hielo 20kg', unidad_medida='Bolsa', costo_unitario=Decimal('90.00'),
+            cantidad_stock=Decimal('10.00'), stock_minimo=Decimal('5.00'),
+        )
+        self.vasos = Insumo.objects.create(
+            nombre='Vasos', unidad_medida='Paquete', costo_unitario=Decimal('20.00'),
+            cantidad_stock=Decimal('100.00'),
+        )
+        self.hoy = timezone.localdate()
+
+    def _mover(self, insumo, tipo, cantidad, dias_atras, cotizacion=None):
+        """Movimiento guardado como si se hubiera hecho hace `dias_atras` días."""
+        mov = MovimientoInventario.objects.create(
+            insumo=insumo, tipo=tipo, cantidad=Decimal(cantidad), cotizacion=cotizacion,
+        )
+        momento = timezone.now() - timedelta(days=dias_atras)
+        MovimientoInventario.objects.filter(pk=mov.pk).update(created_at=momento)
+        return mov
+
+    def test_stock_al_sin_corte_descuenta_lo_posterior(self):
+        self._mover(self.hielo, 'SALIDA', '3', 5)
+        self._mover(self.hielo, 'ENTRADA', '8', 2)
+        stock = inventario.stock_al(self.hoy - timedelta(days=3))
+        self.assertEqual(stock[self.hielo.pk], Decimal('7.00'))
+        self.assertEqual(stock[self.vasos.pk], Decimal('100.00'))
+        self.assertEqual(inventario.stock_al(self.hoy)[self.hielo.pk], Decimal('15.00'))
+
+    def test_stock_al_parte_del_corte(self):
+        self._mover(self.hielo, 'SALIDA', '3', 5)
+        call_command('cortar_inventario', fecha=(self.hoy - timedelta(days=4)).isoformat(), stdout=StringIO())
+        self.assertEqual(
+            CorteInventario.objects.get(insumo=self.hielo, fecha=self.hoy - timedelta(days=4)).cantidad,
+            Decimal('7.00'),
+        )
+        # Un ajuste a mano del stock queda fuera del libro; el corte ya no lo ve
+        # y la consulta arma el resultado desde el corte.
+        Insumo.objects.filter(pk=self.hielo.pk).update(cantidad_stock=Decimal('50.00'))
+        self._mover(self.hielo, 'ENTRADA', '4', 2)
+        self._mover(self.hielo, 'AJUSTE_NEG', '1', 1)
+        stock = inventario.stock_al(self.hoy - timedelta(days=1))
+        self.assertEqual(stock[self.hielo.pk], Decimal('10.00'))
+
+    def test_stock_al_consultas_constantes(self):
+        call_command('cortar_inventario', desde=(self.hoy - timedelta(days=3)).isoformat(), stdout=StringIO())
+        self.assertEqual(CorteInventario.objects.count(), 6)
+        for n in range(5):
+            Insumo.objects.create(nombre=f'Extra {n}', unidad_medida='Pza', costo_unitario=1, cantidad_stock=3)
+        with CaptureQueriesContext(connection) as ctx:
+            stock = inventario.stock_al(self.hoy)
+        self.assertEqual(len(stock), 7)
+        self.assertLessEqual(len(ctx.captured_queries), 3)
+
+    def test_cortar_es_repetible(self):
+        ayer = (self.hoy - timedelta(days=1)).isoformat()
+        call_command('cortar_inventario', fecha=ayer, stdout=StringIO())
+        Insumo.objects.filter(pk=self.vasos.pk).update(cantidad_stock=Decimal('80.00'))
+        call_command('cortar_inventario', fecha=ayer, stdout=StringIO())
+        self.assertEqual(CorteInventario.objects.filter(fecha=ayer).count(), 2)
+        self.assertEqual(CorteInventario.objects.get(insumo=self.vasos, fecha=ayer).cantidad, Decimal('80.00'))
+
+    def test_registrar_en_bloque(self):
+        movimientos = [
+            MovimientoInventario(insumo=self.hielo, tipo='SALIDA', cantidad=Decimal('4')),
+            MovimientoInventario(insumo=self.vasos, tipo='SALIDA', cantidad=Decimal('30')),
+            MovimientoInventario(insumo=self.hielo, tipo='SALIDA', cantidad=Decimal('5')),
+        ]
+        with CaptureQueriesContext(connection) as ctx:
+            inventario.registrar_movimientos(movimientos, self.user)
+        updates = [q for q in ctx.captured_queries if q['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 2)
+        self.assertEqual([m.stock_posterior for m in movimientos], [Decimal('6'), Decimal('70'), Decimal('1')])
+        self.assertEqual(movimientos[2].stock_anterior, Decimal('6'))
+        self.hielo.refresh_from_db()
+        self.assertEqual(self.hielo.cantidad_stock, Decimal('1.00'))
+        self.assertEqual(MovimientoInventario.objects.filter(created_by=self.user).count(), 3)
+
+    def test_registrar_en_bloque_es_todo_o_nada(self):
+        movimientos = [
+            MovimientoInventario(insumo=self.vasos, tipo='SALIDA', cantidad=Decimal('1')),
+            MovimientoInventario(insumo=self.hielo, tipo='SALIDA', cantidad=Decimal('6')),
+            MovimientoInventario(insumo=self.hielo, tipo='SALIDA', cantidad=Decimal('6')),
+        ]
+        with self.assertRaisesMessage(ValidationError, 'Movimiento 3'):
+            inventario.registrar_movimientos(movimientos)
+        self.assertFalse(MovimientoInventario.objects.exists())
+        self.vasos.refresh_from_db()
+        self.assertEqual(self.vasos.cantidad_stock, Decimal('100.00'))
+
+    def test_consumo_por_cotizacion_y_mes(self):
+        cliente = Cliente.objects.create(nombre='C')
+        cot = Cotizacion.objects.create(cliente=cliente, nombre_evento='Boda', fecha_evento=self.hoy)
+        self._mover(self.hielo, 'SALIDA', '2', 0, cotizacion=cot)
+        self._mover(self.hielo, 'SALIDA', '3', 0, cotizacion=cot)
+        self._mover(self.vasos, 'SALIDA', '10', 0, cotizacion=cot)
+        self._mover(self.hielo, 'ENTRADA', '20', 0, cotizacion=cot)
+
+        consumo = inventario.consumo_por_cotizacion([cot.pk])[cot.pk]
+        self.assertEqual(consumo, [
+            {'insumo': self.hielo.pk, 'cantidad': Decimal('5.00'), 'costo': Decimal('450.00')},
+            {'insumo': self.vasos.pk, 'cantidad': Decimal('10.00'), 'costo': Decimal('200.00')},
+        ])
+        por_mes = inventario.consumo_por_mes(self.hoy, self.hoy)
+        self.assertEqual(sum(f['cantidad'] for f in por_mes), Decimal('15.00'))
+
+    def test_stock_bajo_minimo_a_una_fecha(self):
+        self._mover(self.hielo, 'SALIDA', '7', 3)
+        self._mover(self.hielo, 'ENTRADA', '10', 1)
+        self.assertEqual(inventario.stock_bajo_minimo(), [])
+        bajos = inventario.stock_bajo_minimo(self.hoy - timedelta(days=2))
+        self.assertEqual(bajos, [(self.hielo, Decimal('3.00'))])
+
+    def test_endpoints(self):
+        login_superuser_con_totp(self.client, self.user)
+        respuesta = self.client.post(
+            '/admin/inventario/movimientos/',
+            data={'movimientos': [
+                {'insumo': self.hielo.pk, 'tipo': 'SALIDA', 'cantidad': '8'},
+                {'insumo': self.vasos.pk, 'tipo': 'ENTRADA', 'cantidad': '5', 'nota': 'Recepción'},
+            ]},
+            content_type='application/json',
+        )
+        self.assertEqual(respuesta.status_code, 201)
+        self.assertEqual([m['stock_posterior'] for m in respuesta.json()['movimientos']], ['2.00', '105.00'])
+
+        respuesta = self.client.post(
+            '/admin/inventario/movimientos/',
+            data={'movimientos': [{'insumo': self.hielo.pk, 'tipo': 'SALIDA', 'cantidad': '8'}]},
+            content_type='application/json',
+        )
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertIn('Stock insuficiente', respuesta.json()['error'])
+
+        respuesta = self.client.get('/admin/inventario/stock/', {'bajo_minimo': '1'})
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual([i['id'] for i in respuesta.json()['insumos']], [self.hielo.pk])
+        self.assertEqual(self.client.get('/admin/inventario/stock/', {'fecha': 'x'}).status_code, 400)
+
+
+
+class ReservaInventarioTest(TestCase):
+    """Las cotizaciones confirmadas reservan sus insumos; se recalcula solo la afectada."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('reservas', password='x')
+        self.cliente = Cliente.objects.create(nombre='Cliente Reservas')
+        self.hielo = Insumo.objects.create(
+            nombre='Hielo', unidad_medida='Bolsa', costo_unitario=Decimal('90'), cantidad_stock=Decimal('40'),
+        )
+        self.mantel = Insumo.objects.create(
+            nombre='Mantel', unidad_medida='Pza', costo_unitario=Decimal('50'), cantidad_stock=Decimal('20'),
+        )
+        enfriador = SubProducto.objects.create(nombre='Enfriador')
+        RecetaSubProducto.objects.create(subproducto=enfriador, insumo=self.hielo, cantidad=Decimal('0.5'))
+        self.producto = Producto.objects.create(nombre='Mesa con hielera', precio_venta_fijo=Decimal('100'))
+        ComponenteProducto.objects.create(producto=self.producto, subproducto=enfriador, cantidad=Decimal('2'))
+        self.fecha = date.today() + timedelta(days=20)
+
+    def _cotizacion(self, estado='COTIZADA', fecha=None, mesas='10', manteles='3'):
+        cot = Cotizacion.objects.create(
+            cliente=self.cliente, nombre_evento='Boda', fecha_evento=fecha or self.fecha, estado=estado,
+        )
+        ItemCotizacion.objects.create(cotizacion=cot, producto=self.producto, cantidad=Decimal(mesas))
+        ItemCotizacion.objects.create(cotizacion=cot, insumo=self.mantel, cantidad=Decimal(manteles))
+        return cot
+
+    def _reservas(self, cot):
+        return dict(ReservaInventario.objects.filter(cotizacion=cot).values_list('insumo', 'cantidad'))
+
+    def test_confirmar_reserva_y_cancelar_libera(self):
+        cot = self._cotizacion()
+        self.assertEqual(self._reservas(cot), {})
+
+        exito, _ = cot.cambiar_estado('CONFIRMADA', usuario=self.user)
+        self.assertTrue(exito)
+        self.assertEqual(self._reservas(cot), {self.hielo.pk: Decimal('10'), self.mantel.pk: Decimal('3')})
+        self.assertEqual(set(ReservaInventario.objects.values_list('fecha', flat=True)), {self.fecha})
+
+        cot.cambiar_estado('CANCELADA', usuario=self.user, motivo='Cliente desistió')
+        self.assertEqual(self._reservas(cot), {})
+
+    def test_editar_items_recalcula_solo_esa_cotizacion(self):
+        cot = self._cotizacion('CONFIRMADA')
+        otra = self._cotizacion('CONFIRMADA')
+        intacta = ReservaInventario.objects.get(cotizacion=otra, insumo=self.hielo)
+
+        item = cot.items.get(producto=self.producto)
+        item.cantidad = Decimal('4')
+        item.save()
+        self.assertEqual(self._reservas(cot)[self.hielo.pk], Decimal('4'))
+
+        cot.items.get(insumo=self.mantel).delete()
+        self.assertEqual(self._reservas(cot), {self.hielo.pk: Decimal('4')})
+        self.assertEqual(ReservaInventario.objects.get(pk=intacta.pk).cantidad, Decimal('10'))
+
+    def test_cambio_de_fecha_mueve_la_reserva(self):
+        cot = self._cotizacion('CONFIRMADA')
+        cot.fecha_evento = self.fecha + timedelta(days=7)
+        cot.save()
+        self.assertEqual(
+            set(ReservaInventario.objects.filter(cotizacion=cot).values_list('fecha', flat=True)),
+            {self.fecha + timedelta(days=7)},
+        )
+
+    def test_disponibilidad_a_una_fecha(self):
+        self._cotizacion('CONFIRMADA', mesas='10')
+        self._cotizacion('CONFIRMADA', fecha=self.fecha + timedelta(days=10), mesas='25')
+        self._cotizacion('COTIZADA', mesas='100')
+
+        with CaptureQueriesContext(connection) as ctx:
+            antes = reservas.disponibilidad(self.fecha - timedelta(days=1))
+            primera = reservas.disponibilidad(self.fecha)
+            ambas = reservas.disponibilidad(self.fecha + timedelta(days=10))
+        self.assertEqual(len(ctx.captured_queries), 3)
+        self.assertEqual(antes[self.hielo.pk]['disponible'], Decimal('40'))
+        self.assertEqual(primera[self.hielo.pk]['reservado'], Decimal('10'))
+        self.assertEqual(ambas[self.hielo.pk]['disponible'], Decimal('5'))
+        self.assertEqual(ambas[self.mantel.pk]['disponible'], Decimal('14'))
+
+    def test_cerrar_cotizaciones_libera(self):
+        pasada = self._cotizacion('CONFIRMADA', fecha=date.today() - timedelta(days=1))
+        futura = self._cotizacion('CONFIRMADA')
+        call_command('cerrar_cotizaciones', stdout=StringIO())
+        self.assertEqual(self._reservas(pasada), {})
+        self.assertNotEqual(self._reservas(futura), {})
+
+    def test_sincronizar_recoge_cambios_de_receta(self):
+        cot = self._cotizacion('CONFIRMADA')
+        RecetaSubProducto.objects.filter(insumo=self.hielo).update(cantidad=Decimal('1.5'))
+
+        salida = StringIO()
+        call_command('sincronizar_reservas_inventario', stdout=salida)
+        self.assertIn('SIMULACIÓN: 1', salida.getvalue())
+        self.assertEqual(self._reservas(cot)[self.hielo.pk], Decimal('10'))
+
+        call_command('sincronizar_reservas_inventario', aplicar=True, stdout=StringIO())
+        self.assertEqual(self._reservas(cot)[self.hielo.pk], Decimal('30'))
+
+
+
+class ListaComprasConsolidadaTest(TestCase):
+    """Lista de compras de varios eventos: barra + recetas, menos lo disponible, por proveedor."""
+
+    def setUp(self):
+        self.user = User.objects.create_superuser('compras', 'compras@x.com', 'x')
+        self.cliente = Cliente.objects.create(nombre='Cliente Compras')
+        self.hielera = Proveedor.objects.create(nombre='Hielera del Sur')
+        self.hielo = Insumo.objects.create(
+            nombre='Hielo 20kg', unidad_medida='Bolsa', costo_unitario=Decimal('90'),
+            cantidad_stock=Decimal('12'), proveedor=self.hielera,
+        )
+        PlantillaBarra.objects.create(categoria='HIELO', grupo='HIELO', insumo=self.hielo)
+        self.cerveza = Insumo.objects.create(
+            nombre='Caguama Tecate', unidad_medida='Caja', costo_unitario=Decimal('500'),
+        )
+        Insumo.objects.create(nombre='Refresco Toronja', unidad_medida='Botella', costo_unitario=Decimal('30'))
+        enfriador = SubProducto.objects.create(nombre='Enfriador')
+        RecetaSubProducto.objects.create(subproducto=enfriador, insumo=self.hielo, cantidad=Decimal('1'))
+        self.producto = Producto.objects.create(nombre='Hielera extra', precio_venta_fijo=Decimal('100'))
+        ComponenteProducto.objects.create(producto=self.producto, subproducto=enfriador, cantidad=Decimal('1'))
+        self.inicio = date.today() + timedelta(days=10)
+
+    def _evento(self, dias=0, estado='CONFIRMADA', hieleras=None):
+        cot = Cotizacion.objects.create(
+            cliente=self.cliente, nombre_evento='Evento', fecha_evento=self.inicio + timedelta(days=dias),
+            estado=estado, num_personas=100, incluye_cerveza=True, clima='normal',
+        )
+        if hieleras:
+            ItemCotizacion.objects.create(cotizacion=cot, producto=self.producto, cantidad=Decimal(hieleras))
+        return cot
+
+    def _renglon(self, lista, nombre):
+        return next(r for g in lista['proveedores'] for r in g['renglones'] if r['nombre'] == nombre)
+
+    def test_suma_eventos_y_descuenta_disponible(self):
+        uno = self._evento(0, hieleras='3')
+        dos = self._evento(2)
+        self._evento(1, estado='COTIZADA')
+        self._evento(30)
+        bolsas = sum(
+            r['cantidad'] for c in (uno, dos)
+            for r in generar_lista_compras_barra(c)['Abarrotes y Consumibles'] if r.get('insumo_id') == self.hielo.pk
+        )
+
+        lista = lista_consolidada(self.inicio, self.inicio + timedelta(days=5))
+
+        self.assertEqual(lista['eventos'], [uno, dos])
+        hielo = self._renglon(lista, 'Hielo 20kg')
+        self.assertEqual(hielo['requerido'], Decimal(bolsas) + 3)
+        self.assertEqual(hielo['disponible'], Decimal('12'))
+        self.assertEqual(hielo['comprar'], hielo['requerido'] - 12)
+        self.assertEqual(lista['proveedores'][0]['proveedor'], 'Hielera del Sur')
+        # La cerveza sale por palabra clave ('tecate') y no tiene proveedor.
+        self.assertEqual(self._renglon(lista, 'Caguama Tecate')['proveedor'], 'Sin proveedor')
+
+    def test_consultas_no_crecen_con_los_eventos(self):
+        self._evento(0)
+        with CaptureQueriesContext(connection) as uno:
+            lista_consolidada(self.inicio, self.inicio + timedelta(days=5))
+        for dias in (1, 2, 3, 4):
+            self._evento(dias, hieleras='1')
+        with CaptureQueriesContext(connection) as cinco:
+            lista = lista_consolidada(self.inicio, self.inicio + timedelta(days=5))
+        self.assertEqual(len(lista['eventos']), 5)
+        self.assertEqual(len(cinco.captured_queries), len(uno.captured_queries))
+
+    def test_catalogo_resuelve_en_memoria(self):
+        catalogo = CatalogoBarra()
+        with CaptureQueriesContext(connection) as ctx:
+            # 'ron ' no debe caer en "Refresco Toronja".
+            self.assertIsNone(catalogo.item('RON_NAC'))
+            self.assertEqual(catalogo.item('REFRESCO_TORONJA')['nombre'], 'Refresco Toronja')
+            self.assertEqual(catalogo.item('HIELO')['insumo_id'], self.hielo.pk)
+            self.assertEqual(catalogo.item('HIELO')['proveedor'], 'Hielera del Sur')
+        self.assertEqual(len(ctx.captured_queries), 0)
+
+    def test_descarga_xlsx(self):
+        self._evento(0)
+        login_superuser_con_totp(self.client, self.user)
+        respuesta = self.client.post('/admin/lista-compras/', {
+            'fecha_inicio': self.inicio.isoformat(),
+            'fecha_fin': (self.inicio + timedelta(days=5)).isoformat(),
+            'formato': 'xlsx',
+        })
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertIn('spreadsheetml', respuesta['Content-Type'])
+        libro = openpyxl.load_workbook(BytesIO(respuesta.content))
+        self.assertEqual(libro.sheetnames, ['Compras', 'Eventos'])
+        self.assertEqual(libro['Eventos'].max_row, 2)
+
+
 class AsignacionEspacioTest(TestCase):
     """Verifica detección de conflictos de asignación de espacios."""
 
@@ -19,10 +19,12 @@ from django.http import HttpResponse, JsonResponse
 from django.shortcuts import get_object_or_404, redirect, render
 from django.template.loader import render_to_string
 from django.utils import timezone
+from django.utils.dateparse import parse_date
 from django.utils.html import strip_tags
 from django.views.decorators.csrf import csrf_exempt
 from weasyprint import HTML
 
+from .lista_compras import generar_lista_compras_barra, lista_consolidada
 from .models import (
     Cliente,
     Compra,
@@ -59,243 +61,6 @@ logger = logging.getLogger(__name__)
 ESTADOS_VENTA_REAL = ['CONFIRMADA', 'EJECUTADA', 'CERRADA']
 
 
-# ==========================================
-# 0. LÓGICA DE LISTA DE COMPRAS (REFACTORIZADO)
-# ==========================================
-
-def _buscar_insumo_palabra_completa(keyword):
-    """
-    Busca un insumo donde el keyword sea una PALABRA COMPLETA,
-    no parte de otra palabra.
-    Evita que 'ron' matchee 'Toronja' o 'gin' matchee 'Original'.
-    """
-    insumo = Insumo.objects.filter(
-        nombre__istartswith=keyword,
-        categoria='CONSUMIBLE'
-    ).first()
-    if insumo:
-        return insumo
-
-    insumo = Insumo.objects.filter(
-        nombre__icontains=f' {keyword}',
-        categoria='CONSUMIBLE'
-    ).first()
-    if insumo:
-        return insumo
-
-    return None
-
-
-def _obtener_item_plantilla(categoria):
-    plantilla = PlantillaBarra.objects.filter(
-        categoria=categoria, activo=True
-    ).select_related('insumo').first()
-
-    if plantilla and plantilla.insumo:
-        insumo = plantilla.insumo
-        nombre = insumo.nombre
-        if insumo.presentacion:
-            nombre = f"{insumo.nombre} ({insumo.presentacion})"
-        return {
-            'nombre': nombre,
-            'proveedor': insumo.proveedor.nombre if insumo.proveedor else '',
-            'costo_unitario': float(insumo.costo_unitario),
-            'proporcion': float(plantilla.proporcion),
-            'insumo_id': insumo.id,
-        }
-
-    BUSQUEDA_KEYWORDS = {
-        'CERVEZA': ['cerveza', 'caguama', 'tecate', 'corona'],
-        'TEQUILA_NAC': ['tequila cuervo', 'tequila tradicional', 'tequila'],
-        'WHISKY_NAC': ['whisky', 'whiskey'],
-        'RON_NAC': ['ron bacardi', 'ron castillo', 'ron havana', 'ron '],
-        'VODKA_NAC': ['vodka'],
-        'TEQUILA_PREM': ['don julio', 'herradura', 'tequila 1800'],
-        'WHISKY_PREM': ['buchanan', 'jack daniel', 'johnnie walker black', 'etiqueta negra'],
-        'GIN_PREM': ['ginebra', 'hendrick', 'tanqueray', 'bombay'],
-        'REFRESCO_COLA': ['coca cola', 'coca-cola'],
-        'REFRESCO_TORONJA': ['toronja', 'squirt', 'fresca'],
-        'AGUA_MINERAL': ['agua mineral', 'topochico', 'topo chico', 'peñafiel mineral'],
-        'AGUA_NATURAL': ['garrafon', 'garrafón', 'agua natural', 'agua purificada'],
-        'HIELO': ['hielo'],
-        'LIMON': ['limon', 'limón'],
-        'HIERBABUENA': ['hierbabuena', 'menta'],
-        'JARABE': ['jarabe'],
-        'FRUTOS_ROJOS': ['frutos rojos', 'berries', 'zarzamora', 'frambuesa'],
-        'CAFE': ['café', 'cafe', 'espresso'],
-        'SERVILLETAS': ['servilleta', 'popote'],
-    }
-
-    keywords = BUSQUEDA_KEYWORDS.get(categoria, [])
-
-    for keyword in keywords:
-        if ' ' in keyword:
-            insumo = Insumo.objects.filter(
-                nombre__icontains=keyword,
-                categoria='CONSUMIBLE'
-            ).first()
-        elif len(keyword) <= 4:
-            insumo = _buscar_insumo_palabra_completa(keyword)
-        else:
-            insumo = Insumo.objects.filter(
-                nombre__icontains=keyword,
-                categoria='CONSUMIBLE'
-            ).first()
-
-        if insumo:
-            nombre = insumo.nombre
-            if insumo.presentacion:
-                nombre = f"{insumo.nombre} ({insumo.presentacion})"
-            return {
-                'nombre': nombre,
-                'proveedor': insumo.proveedor.nombre if insumo.proveedor else ' Sin proveedor',
-                'costo_unitario': float(insumo.costo_unitario),
-                'proporcion': 1.0,
-                'insumo_id': insumo.id,
-                '_via_fallback': True,
-            }
-
-    return None
-
-
-def _fallback_item(nombre_generico):
-    """Devuelve un item con datos genéricos cuando no hay plantilla configurada."""
-    return {
-        'nombre': nombre_generico,
-        'proveedor': ' Sin asignar',
-        'costo_unitario': 0,
-        'proporcion': 1.0,
-        'insumo_id': None,
-    }
-
-
-def _agregar_a_lista(lista, seccion, item_nombre, cantidad, unidad, nota='', proveedor='', costo_unitario=0):
-    """Helper para agregar un ítem a la lista de compras con formato consistente."""
-    if seccion not in lista:
-        lista[seccion] = []
-
-    entry = {
-        'item': item_nombre,
-        'cantidad': cantidad,
-        'unidad': unidad,
-    }
-    if nota:
-        entry['nota'] = nota
-    if proveedor:
-        entry['proveedor'] = proveedor
-    if costo_unitario > 0:
-        entry['costo_unitario'] = costo_unitario
-        entry['costo_total'] = round(costo_unitario * cantidad, 2)
-
-    lista[seccion].append(entry)
-
-
-def generar_lista_compras_barra(cotizacion):
-    calc = CalculadoraBarraService(cotizacion)
-    datos = calc.calcular()
-    if not datos:
-        return {}
-
-    lista_compras = {}
-
-    if datos['cervezas_unidades'] > 0:
-        p = _obtener_item_plantilla('CERVEZA') or _fallback_item('Cerveza Nacional (Caguama)')
-        cajas = math.ceil(datos['cervezas_unidades'] / 12.0)
-        _agregar_a_lista(lista_compras, 'Licores y Alcohol', p['nombre'], cajas, 'Cajas (12u)', proveedor=p['proveedor'], costo_unitario=p['costo_unitario'])
-
-    if datos['botellas_nacional'] > 0:
-        b = datos['botellas_nacional']
-        mapeo_nacional = [
-            ('TEQUILA_NAC', 'Tequila Nacional', 0.40),
-            ('WHISKY_NAC', 'Whisky Nacional', 0.30),
-            ('RON_NAC', 'Ron Nacional', 0.20),
-            ('VODKA_NAC', 'Vodka Nacional', 0.10),
-        ]
-        for cat, fallback_nombre, default_prop in mapeo_nacional:
-            p = _obtener_item_plantilla(cat)
-            if p:
-                prop = p['proporcion']
-                cant = math.ceil(b * prop)
-                if cant > 0:
-                    _agregar_a_lista(lista_compras, 'Licores y Alcohol', p['nombre'], cant, 'Botellas', proveedor=p['proveedor'], costo_unitario=p['costo_unitario'])
-            else:
-                cant = math.ceil(b * default_prop)
-                if cant > 0:
-                    _agregar_a_lista(lista_compras, 'Licores y Alcohol', fallback_nombre, cant, 'Botellas', proveedor=' Configurar en Plantilla de Barra')
-
-    if datos['botellas_premium'] > 0:
-        b = datos['botellas_premium']
-        mapeo_premium = [
-            ('TEQUILA_PREM', 'Tequila Premium', 0.40),
-            ('WHISKY_PREM', 'Whisky Premium', 0.30),
-            ('GIN_PREM', 'Ginebra / Ron Premium', 0.30),
-        ]
-        for cat, fallback_nombre, default_prop in mapeo_premium:
-            p = _obtener_item_plantilla(cat)
-            if p:
-                prop = p['proporcion']
-                cant = math.ceil(b * prop)
-                if cant > 0:
-                    _agregar_a_lista(lista_compras, 'Licores y Alcohol', p['nombre'], cant, 'Botellas', proveedor=p['proveedor'], costo_unitario=p['costo_unitario'])
-            else:
-                cant = math.ceil(b * default_prop)
-                if cant > 0:
-                    _agregar_a_lista(lista_compras, 'Licores y Alcohol', fallback_nombre, cant, 'Botellas', proveedor=' Configurar en Plantilla de Barra')
-
-    if l := datos['litros_mezcladores']:
-        mapeo_mezcladores = [
-            ('REFRESCO_COLA', 'Coca-Cola (2.5L)', 0.60, 2.5),
-            ('REFRESCO_TORONJA', 'Refresco Toronja (2L)', 0.20, 2.0),
-            ('AGUA_MINERAL', 'Agua Mineral (2L)', 0.20, 2.0),
-        ]
-        for cat, fallback_nombre, share, litros_envase in mapeo_mezcladores:
-            p = _obtener_item_plantilla(cat)
-            litros_necesarios = l * share
-            cant = math.ceil(litros_necesarios / litros_envase)
-            if cant > 0:
-                if p:
-                    _agregar_a_lista(lista_compras, 'Bebidas y Mezcladores', p['nombre'], cant, 'Botellas', proveedor=p['proveedor'], costo_unitario=p['costo_unitario'])
-                else:
-                    _agregar_a_lista(lista_compras, 'Bebidas y Mezcladores', fallback_nombre, cant, 'Botellas', proveedor=' Configurar en Plantilla de Barra')
-
-    if datos['litros_agua'] > 0:
-        p = _obtener_item_plantilla('AGUA_NATURAL') or _fallback_item('Agua Natural (Garrafón 20L)')
-        cant = math.ceil(datos['litros_agua'] / 20)
-        _agregar_a_lista(lista_compras, 'Bebidas y Mezcladores', p['nombre'], cant, 'Garrafones', proveedor=p['proveedor'], costo_unitario=p['costo_unitario'])
-
-    p = _obtener_item_plantilla('HIELO') or _fallback_item('Hielo (Bolsa 20kg)')
-    _agregar_a_lista(lista_compras, 'Abarrotes y Consumibles', p['nombre'], datos['bolsas_hielo_20kg'], 'Bolsas', nota=datos['hielo_info'], proveedor=p['proveedor'], costo_unitario=p['costo_unitario'])
-
-    if cotizacion.incluye_cocteleria_basica:
-        for cat, fallback, cant_calc, unidad in [
-            ('LIMON', 'Limón Persa', math.ceil(cotizacion.num_personas / 8), 'Kg'),
-            ('HIERBABUENA', 'Hierbabuena', math.ceil(cotizacion.num_personas / 15), 'Manojos'),
-            ('JARABE', 'Jarabe Natural', math.ceil(cotizacion.num_personas / 40), 'Litros'),
-        ]:
-            p = _obtener_item_plantilla(cat) or _fallback_item(fallback)
-            seccion = 'Frutas y Verduras' if cat in ('LIMON', 'HIERBABUENA') else 'Abarrotes y Consumibles'
-            _agregar_a_lista(lista_compras, seccion, p['nombre'], cant_calc, unidad, proveedor=p['proveedor'], costo_unitario=p['costo_unitario'])
-
-    if cotizacion.incluye_cocteleria_premium:
-        for cat, fallback, cant_calc, unidad in [
-            ('FRUTOS_ROJOS', 'Frutos Rojos', math.ceil(cotizacion.num_personas / 20), 'Bolsas'),
-            ('CAFE', 'Café Espresso', 1, 'Kg'),
-        ]:
-            p = _obtener_item_plantilla(cat) or _fallback_item(fallback)
-            seccion = 'Frutas y Verduras' if cat == 'FRUTOS_ROJOS' else 'Abarrotes y Consumibles'
-            _agregar_a_lista(lista_compras, seccion, p['nombre'], cant_calc, unidad, proveedor=p['proveedor'], costo_unitario=p['costo_unitario'])
-
-    p = _obtener_item_plantilla('SERVILLETAS') or _fallback_item('Servilletas / Popotes')
-    _agregar_a_lista(lista_compras, 'Abarrotes y Consumibles', p['nombre'], 1, 'Kit', proveedor=p['proveedor'], costo_unitario=p['costo_unitario'])
-
-    for seccion, items in lista_compras.items():
-        for item in items:
-            if 'costo_total' not in item and item.get('costo_unitario', 0) > 0:
-                item['costo_total'] = round(item['costo_unitario'] * item['cantidad'], 2)
-
-    return lista_compras
-
-
 # ==========================================
 # 0.5 ASISTENTE DE CONFIGURACIÓN DE PLANTILLA DE BARRA
 # ==========================================
@@ -529,9 +294,47 @@ def ver_dashboard_kpis(request):
 @staff_member_required
 @permission_required('comercial.view_cotizacion', raise_exception=True)
 def generar_lista_compras(request):
-    if request.method == 'POST':
-        return render(request, 'comercial/reporte_form.html', {'titulo': 'Reporte Masivo en Construcción'})
-    return render(request, 'comercial/reporte_form.html', {'titulo': 'Generar Lista de Compras'})
+    """Lista de compras consolidada de los eventos confirmados de un rango, en PDF o XLSX."""
+    contexto_form = {'titulo': 'Generar Lista de Compras', 'formatos': True}
+    if request.method != 'POST':
+        return render(request, 'comercial/reporte_form.html', contexto_form)
+
+    fecha_inicio = parse_date(request.POST.get('fecha_inicio', ''))
+    fecha_fin = parse_date(request.POST.get('fecha_fin', ''))
+    if not fecha_inicio or not fecha_fin or fecha_inicio > fecha_fin:
+        messages.error(request, "Indica un rango de fechas válido.")
+        return render(request, 'comercial/reporte_form.html', contexto_form)
+
+    lista = lista_consolidada(fecha_inicio, fecha_fin)
+    nombre = f"Lista_Compras_{fecha_inicio:%Y%m%d}_{fecha_fin:%Y%m%d}"
+
+    if request.POST.get('formato') == 'xlsx':
+        response = HttpResponse(content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+        response['Content-Disposition'] = f'attachment; filename="{nombre}.xlsx"'
+        wb = openpyxl.Workbook(write_only=True)
+        ws = wb.create_sheet(title="Compras")
+        ws.append(['Proveedor', 'Artículo', 'Unidad', 'Requerido', 'Disponible', 'A comprar', 'C/U', 'Subtotal'])
+        for grupo in lista['proveedores']:
+            for r in grupo['renglones']:
+                ws.append([grupo['proveedor'], r['nombre'], r['unidad'], r['requerido'], r['disponible'],
+                           r['comprar'], r['costo_unitario'], r['costo_total']])
+        ws.append(['', '', '', '', '', '', 'Total', lista['total']])
+        ws_eventos = wb.create_sheet(title="Eventos")
+        ws_eventos.append(['Folio', 'Fecha', 'Cliente', 'Evento', 'Personas'])
+        for c in lista['eventos']:
+            ws_eventos.append([f"COT-{c.id:03d}", c.fecha_evento, c.cliente.nombre, c.nombre_evento, c.num_personas])
+        wb.save(response)
+        return response
+
+    ruta_logo = os.path.join(settings.BASE_DIR, 'static', 'img', 'logo.png')
+    logo_url = f"file:///{ruta_logo.replace(os.sep, '/')}" if os.name == 'nt' else f"file://{ruta_logo}"
+    html_string = render_to_string('comercial/pdf_lista_compras.html', {
+        **lista, 'fecha_inicio': fecha_inicio, 'fecha_fin': fecha_fin, 'logo_url': logo_url,
+    })
+    response = HttpResponse(content_type='application/pdf')
+    response['Content-Disposition'] = f'inline; filename="{nombre}.pdf"'
+    HTML(string=html_string, base_url=request.build_absolute_uri()).write_pdf(response)
+    return response
 
 @staff_member_required
 @permission_required('comercial.view_cotizacion', raise_exception=True)
@@ -510,36 +510,50 @@ def api_disponibilidad_fecha(request):
 
 @rate_limit(key='api_fechas_ocupadas', limit=60, window=60)
 def api_fechas_ocupadas(request):
-    """GET /api/fechas-ocupadas/?dias=365
-    Devuelve la lista de fechas no disponibles (Airbnb + cotizaciones apartadas)
-    en el rango [hoy, hoy+dias] para pintar un calendario."""
+    """GET /api/fechas-ocupadas/?dias=365[&formato=rangos]
+    Devuelve las fechas no disponibles (Airbnb + cotizaciones apartadas) en el
+    rango [hoy, hoy+dias] para pintar un calendario: lista ISO en
+    `fechas_ocupadas`, o con `formato=rangos` tramos [primer día, días] en
+    `rangos`.
+
+    Sale de un mapa de bits ya armado en el cache (ver
+    airbnb.fechas_ocupadas), no de expandir los bloqueos en cada petición.
+    Lleva ETag: el cotizador que ya tiene la respuesta recibe 304."""
+    from django.utils.cache import get_conditional_response
+
+    from airbnb import fechas_ocupadas
+
     try:
         dias = int(request.GET.get('dias', '365'))
     except ValueError:
         dias = 365
     dias = max(1, min(dias, 730))
+    por_rangos = request.GET.get('formato') == 'rangos'
     hoy = timezone.now().date()
     fin = hoy + timedelta(days=dias)
     try:
-        from airbnb.validacion_fechas import obtener_fechas_bloqueadas
-        bloqueos = obtener_fechas_bloqueadas(hoy, fin)
+        mapa = fechas_ocupadas.mapa_ocupado(hoy)
     except Exception:
         logger.exception("Error al obtener las fechas bloqueadas (%s a %s).", hoy, fin)
         return JsonResponse({'ok': False, 'error': 'No se pudieron obtener las fechas ocupadas.'}, status=500)
 
-    fechas = set()
-    for b in bloqueos:
-        ini, f_fin = b['fecha_inicio'], b['fecha_fin']
-        d = ini
-        while d <= f_fin:
-            fechas.add(d.strftime('%Y-%m-%d'))
-            d += timedelta(days=1)
-    return JsonResponse({
-        'ok': True,
-        'desde': hoy.strftime('%Y-%m-%d'),
-        'hasta': fin.strftime('%Y-%m-%d'),
-        'fechas_ocupadas': sorted(fechas),
-    })
+    etag = f'"{mapa["etag"]}-{hoy:%Y%m%d}-{dias}{"r" if por_rangos else ""}"'
+    respuesta = get_conditional_response(request, etag=etag)
+    if respuesta is None:
+        bits = fechas_ocupadas.rebanar(mapa, hoy, fin)
+        datos = {
+            'ok': True,
+            'desde': hoy.strftime('%Y-%m-%d'),
+            'hasta': fin.strftime('%Y-%m-%d'),
+        }
+        if por_rangos:
+            datos['rangos'] = fechas_ocupadas.rangos(bits, hoy)
+        else:
+            datos['fechas_ocupadas'] = fechas_ocupadas.fechas(bits, hoy)
+        respuesta = JsonResponse(datos)
+    respuesta['ETag'] = etag
+    respuesta['Cache-Control'] = 'no-cache'
+    return respuesta
 
 
 @rate_limit(key='api_productos_cotizador', limit=60, window=60)
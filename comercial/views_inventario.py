@@ -0,0 +1,116 @@
+"""
+Vistas de inventario
+====================
+JSON del libro de inventario (ver comercial.inventario) para el admin:
+existencias a una fecha y captura de movimientos en bloque.
+"""
+import json
+from decimal import Decimal, InvalidOperation
+
+from django.contrib.admin.views.decorators import staff_member_required
+from django.contrib.auth.decorators import permission_required
+from django.core.exceptions import ValidationError
+from django.http import JsonResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from django.views.decorators.http import require_GET, require_POST
+
+from . import inventario
+from .models import Compra, Cotizacion, Insumo, MovimientoInventario
+
+CAMPOS_MOVIMIENTO = ('insumo', 'tipo', 'cantidad', 'cotizacion', 'compra', 'nota')
+
+
+@staff_member_required
+@permission_required('comercial.view_insumo', raise_exception=True)
+@require_GET
+def api_stock_inventario(request):
+    """Existencia de cada insumo al cierre de `fecha` (YYYY-MM-DD, hoy por
+    defecto). Con `bajo_minimo=1` solo los que estaban bajo su mínimo."""
+    fecha = timezone.localdate()
+    if request.GET.get('fecha'):
+        fecha = parse_date(request.GET['fecha'])
+        if not fecha:
+            return JsonResponse({'error': "Parámetro 'fecha' inválido (YYYY-MM-DD)."}, status=400)
+
+    if request.GET.get('bajo_minimo') == '1':
+        filas = inventario.stock_bajo_minimo(fecha)
+    else:
+        existencias = inventario.stock_al(fecha)
+        filas = [(i, existencias[i.pk]) for i in Insumo.objects.order_by('nombre')]
+
+    return JsonResponse({
+        'fecha': fecha.isoformat(),
+        'insumos': [
+            {
+                'id': insumo.pk,
+                'nombre': insumo.nombre,
+                'unidad': insumo.unidad_medida,
+                'stock': str(stock),
+                'stock_minimo': str(insumo.stock_minimo),
+            }
+            for insumo, stock in filas
+        ],
+    })
+
+
+@staff_member_required
+@permission_required('comercial.add_movimientoinventario', raise_exception=True)
+@require_POST
+def api_movimientos_inventario(request):
+    """
+    Registra varios movimientos en una transacción:
+    `{"movimientos": [{"insumo": 3, "tipo": "SALIDA", "cantidad": "2.5",
+    "cotizacion": 41, "nota": "..."}, ...]}`. Todos o ninguno.
+    """
+    try:
+        datos = json.loads(request.body)
+        filas = datos['movimientos']
+        if not isinstance(filas, list) or not filas:
+            raise ValueError
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'error': "Se espera JSON con una lista 'movimientos' no vacía."}, status=400)
+
+    tipos = dict(MovimientoInventario.TIPOS_MOVIMIENTO)
+    movimientos = []
+    for n, fila in enumerate(filas, start=1):
+        if not isinstance(fila, dict) or set(fila) - set(CAMPOS_MOVIMIENTO):
+            return JsonResponse({'error': f"Movimiento {n}: campos permitidos {', '.join(CAMPOS_MOVIMIENTO)}."}, status=400)
+        if fila.get('tipo') not in tipos:
+            return JsonResponse({'error': f"Movimiento {n}: tipo inválido."}, status=400)
+        try:
+            cantidad = Decimal(str(fila.get('cantidad')))
+            if not cantidad.is_finite():
+                raise InvalidOperation
+            insumo_id = int(fila['insumo'])
+            cotizacion_id, compra_id = (
+                int(fila[campo]) if fila.get(campo) is not None else None for campo in ('cotizacion', 'compra')
+            )
+        except (InvalidOperation, KeyError, TypeError, ValueError):
+            return JsonResponse({'error': f"Movimiento {n}: 'insumo' y 'cantidad' son obligatorios; "
+                                          f"'cotizacion' y 'compra', ids."}, status=400)
+        movimientos.append(MovimientoInventario(
+            insumo_id=insumo_id,
+            tipo=fila['tipo'],
+            cantidad=cantidad,
+            cotizacion_id=cotizacion_id,
+            compra_id=compra_id,
+            nota=str(fila.get('nota', ''))[:255],
+        ))
+
+    for campo, modelo in (('cotizacion_id', Cotizacion), ('compra_id', Compra)):
+        ids = {getattr(m, campo) for m in movimientos} - {None}
+        if ids and modelo.objects.filter(pk__in=ids).count() != len(ids):
+            return JsonResponse({'error': f"Hay {modelo._meta.verbose_name_plural.lower()} que no existen."}, status=400)
+
+    try:
+        inventario.registrar_movimientos(movimientos, request.user)
+    except ValidationError as e:
+        return JsonResponse({'error': '; '.join(e.messages)}, status=400)
+
+    return JsonResponse({
+        'movimientos': [
+            {'id': m.pk, 'insumo': m.insumo_id, 'stock_posterior': str(m.stock_posterior)}
+            for m in movimientos
+        ],
+    }, status=201)
@@ -19,6 +19,7 @@ from .models import OpenpayTransaccion, PortalCliente
 from .paynet import TIENDAS_PAYNET
 from .services_openpay import (
     consultar_y_confirmar_cargo,
+    encolar_webhook_openpay,
     procesar_cargo_efectivo,
     procesar_cargo_spei,
     procesar_cargo_tarjeta,
@@ -330,8 +331,15 @@ def openpay_webhook_view(request):
         logger.warning("Webhook Openpay: código de verificación recibido: %s", codigo)
         return HttpResponse(status=200)
 
+    # Con la cola activa solo se guarda la notificación y se responde ya: el
+    # Pago, la póliza y los avisos los hace `procesar_webhooks_openpay`. Si
+    # Openpay no recibe 200 a tiempo reintenta, y en una ráfaga de
+    # confirmaciones SPEI/Paynet los reintentos se apilaban.
     try:
-        procesar_webhook_openpay(payload)
+        if settings.OPENPAY_WEBHOOK_ENCOLAR:
+            encolar_webhook_openpay(payload)
+        else:
+            procesar_webhook_openpay(payload)
     except Exception:
         logger.exception("Webhook Openpay: error inesperado procesando el payload.")
         # Aun así, 200 — cualquier reintento de Openpay va a repetir el mismo error;
@@ -5,6 +5,9 @@ Uso:
     python manage.py enviar_recordatorios
     python manage.py enviar_recordatorios --dry-run
 
+El envío va en lote (ver `comunicacion.recordatorios`): al terminar imprime
+cuántos mensajes por segundo salieron y un histograma de latencias por canal.
+
 Es el único comando de recordatorios con lógica real. `comercial.enviar_recordatorios_pagos`
 quedó como shim deprecado que delega aquí, porque el Cron de Railway lo invoca
 por ese nombre y vive fuera del repositorio.
@@ -14,8 +17,7 @@ from datetime import timedelta
 from django.core.management.base import BaseCommand
 from django.utils import timezone
 
-from comercial.models import ParcialidadPago
-from comunicacion.services_notificaciones import notificar_recordatorio
+from comunicacion.recordatorios import enviar_recordatorios, histograma, parcialidades_a_recordar
 
 # Días respecto a la fecha límite en los que se avisa. Es la unión de los dos
 # calendarios que existían antes de consolidar los comandos: +3 y −1 venían de
@@ -42,36 +44,39 @@ class Command(BaseCommand):
         hoy = timezone.localdate()
         objetivos = [hoy + timedelta(days=d) for d in DIAS_AVISO]
 
-        parcialidades = ParcialidadPago.objects.filter(
-            pagada=False,
-            fecha_limite__in=objetivos,
-            plan__activo=True,
-        ).select_related('plan__cotizacion__cliente')
-
-        enviadas = 0
-        for parc in parcialidades:
-            cot = parc.plan.cotizacion
-            cliente = cot.cliente
-            if not cliente or (not cliente.email and not cliente.telefono):
-                continue
+        parcialidades = parcialidades_a_recordar(objetivos)
 
-            if dry_run:
+        if dry_run:
+            total = 0
+            for parc in parcialidades:
+                cot = parc.plan.cotizacion
+                cliente = cot.cliente
+                if not cliente or (not cliente.email and not cliente.telefono):
+                    continue
                 self.stdout.write(
                     f"[DRY RUN] COT-{cot.id:03d} parcialidad #{parc.numero} "
                     f"vence {parc.fecha_limite} → {cliente.nombre}"
                 )
-                enviadas += 1
-                continue
+                total += 1
+            self.stdout.write(self.style.SUCCESS(f"[DRY RUN] Recordatorios procesados: {total}"))
+            return
 
-            # La idempotencia es responsabilidad del servicio (clave por
-            # parcialidad + fecha + canal), así que correr el cron dos veces el
-            # mismo día no duplica.
-            notificar_recordatorio(
-                parc,
-                fecha=hoy,
-                dias_restantes=(parc.fecha_limite - hoy).days,
-            )
-            enviadas += 1
+        # La idempotencia es por parcialidad + fecha + canal, así que correr el
+        # cron dos veces el mismo día no duplica: lo ya reservado se omite.
+        resumen = enviar_recordatorios(parcialidades, fecha=hoy)
+
+        self.stdout.write(
+            f"Throughput: {resumen.por_segundo:.1f} mensajes/s en {resumen.segundos:.2f} s"
+        )
+        for canal in ('EMAIL', 'WHATSAPP'):
+            latencias = resumen.latencias(canal)
+            if not latencias:
+                continue
+            self.stdout.write(f"Latencia {canal} ({len(latencias)} envíos):")
+            for etiqueta, cuenta in histograma(latencias):
+                self.stdout.write(f"  {etiqueta:>11} {cuenta:5d} {'█' * min(cuenta, 50)}")
 
-        etiqueta = '[DRY RUN] ' if dry_run else ''
-        self.stdout.write(self.style.SUCCESS(f"{etiqueta}Recordatorios procesados: {enviadas}"))
+        self.stdout.write(self.style.SUCCESS(
+            f"Recordatorios procesados: {resumen.contar('ENVIADO')} enviado(s), "
+            f"{resumen.contar('FALLIDO')} fallido(s), {resumen.omitidos} ya enviado(s) antes"
+        ))
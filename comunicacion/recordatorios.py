@@ -0,0 +1,391 @@
+"""
+Envío masivo de recordatorios de pago
+=====================================
+Lo que usa el cron diario (`enviar_recordatorios`). Manda lo mismo que
+`notificar_recordatorio`, pero en lote y en tres fases:
+
+1. **Preparar** — una sola consulta trae las parcialidades con su plan,
+   cotización, cliente, portal y lo pagado (subconsulta anotada). Los correos
+   se renderizan y los payloads de WhatsApp se arman aquí, en el hilo
+   principal.
+2. **Reservar** — todas las claves de idempotencia se insertan con un solo
+   `bulk_create(ignore_conflicts=True)`. Las filas que insertó *esta* corrida
+   se reconocen porque llevan su marca de tiempo en `fecha_envio`; las claves
+   que ya existían (otra corrida del mismo día) se omiten sin enviar.
+3. **Despachar** — un pool acotado de hilos llama a los proveedores. Cada
+   proveedor (Brevo, Meta) tiene su propio límite de envíos por segundo y los
+   errores transitorios (429, 5xx, red) se reintentan con espera exponencial.
+   Los hilos no tocan la base: al terminar, el hilo principal guarda todos los
+   resultados con un `bulk_update`.
+
+Igual que en el envío suelto, una fila que se queda en PENDIENTE después de
+una caída significa "no se sabe si salió" y no se reintenta sola.
+
+Los proveedores se pueden sustituir (`proveedores={'EMAIL': ..., 'WHATSAPP': ...}`),
+que es como los tests corren el pipeline contra uno falso.
+"""
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Optional
+
+import requests
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives
+from django.template.loader import render_to_string
+from django.utils import timezone
+from django.utils.html import strip_tags
+
+from comercial.models import Cotizacion, ParcialidadPago
+
+from . import services
+from .models import ComunicacionCliente
+from .services_notificaciones import _telefono, contenido_recordatorio, url_portal
+
+logger = logging.getLogger(__name__)
+
+# Filas por INSERT/UPDATE y claves por IN(...) al reservar y guardar.
+LOTE = 500
+
+# Cortes (en milisegundos) del histograma de latencias que imprime el comando.
+CORTES_MS = (100, 250, 500, 1000, 2500, 5000)
+
+CAMPOS_RESULTADO = ['estado', 'error', 'fecha_envio', 'proveedor_id']
+
+
+class ErrorTransitorio(Exception):
+    """El proveedor pidió esperar (límite de tasa, 5xx, red): se reintenta."""
+
+
+class ErrorEnvio(Exception):
+    """El proveedor rechazó el mensaje; reintentar daría lo mismo."""
+
+
+@dataclass
+class Envio:
+    """Un mensaje de un canal ya preparado, con su fila de auditoría."""
+
+    comm: ComunicacionCliente
+    destino: str
+    asunto: str = ''
+    html: str = ''
+    payload: Optional[dict] = None
+    intentos: int = 0
+    latencia: float = 0.0  # segundos dentro del proveedor, sumando reintentos
+
+    @property
+    def canal(self):
+        return self.comm.canal
+
+
+# ─────────────────────────────── Proveedores ───────────────────────────────
+
+def _es_error_de_red(exc) -> bool:
+    causa = exc.__cause__ or exc.__context__
+    return any(
+        isinstance(e, (ConnectionError, TimeoutError, requests.ConnectionError, requests.Timeout))
+        for e in (exc, causa)
+    )
+
+
+class ProveedorEmail:
+    """Brevo vía el backend de correo de Django (anymail)."""
+
+    def enviar(self, envio: Envio) -> str:
+        msg = EmailMultiAlternatives(
+            subject=envio.asunto,
+            body=strip_tags(envio.html),
+            from_email=services.remitente_por_tipo(envio.comm.tipo),
+            to=[envio.destino],
+        )
+        msg.attach_alternative(envio.html, 'text/html')
+        try:
+            msg.send(fail_silently=False)
+        except Exception as exc:
+            # anymail expone el HTTP de Brevo en `status_code`.
+            status = getattr(exc, 'status_code', None)
+            if (status is not None and (status == 429 or status >= 500)) or _es_error_de_red(exc):
+                raise ErrorTransitorio(str(exc)) from exc
+            raise
+        estado = getattr(msg, 'anymail_status', None)
+        return getattr(estado, 'message_id', None) or ''
+
+
+# Códigos de Meta que son límites de tasa de la cuenta o de la app, no del
+# mensaje: se resuelven esperando. El 131056 (límite por destinatario) no está
+# aquí a propósito, porque reintentarlo en segundos vuelve a fallar.
+WA_CODIGOS_TRANSITORIOS = {4, 80007, 130429}
+
+
+class ProveedorWhatsApp:
+    """WhatsApp Cloud API, por el mismo POST que el envío suelto."""
+
+    def enviar(self, envio: Envio) -> str:
+        try:
+            resp = services.post_mensaje_wa(envio.destino, envio.payload)
+        except (requests.ConnectionError, requests.Timeout) as exc:
+            raise ErrorTransitorio(str(exc)) from exc
+        if resp.status_code == 200:
+            return ((resp.json() or {}).get('messages') or [{}])[0].get('id', '')
+        detalle = services._describir_error_meta(resp)
+        try:
+            codigo = ((resp.json() or {}).get('error') or {}).get('code')
+        except ValueError:
+            codigo = None
+        if resp.status_code == 429 or resp.status_code >= 500 or codigo in WA_CODIGOS_TRANSITORIOS:
+            raise ErrorTransitorio(detalle)
+        raise ErrorEnvio(detalle)
+
+
+def proveedores_por_defecto() -> dict:
+    return {'EMAIL': ProveedorEmail(), 'WHATSAPP': ProveedorWhatsApp()}
+
+
+class LimiteTasa:
+    """
+    Espacia las llamadas a un proveedor para no pasar de `por_segundo`.
+
+    Lo comparten todos los hilos del pool: cada llamada toma el siguiente
+    turno libre bajo el lock y duerme fuera de él hasta que le toca.
+    """
+
+    def __init__(self, por_segundo, *, reloj=time.monotonic, dormir=time.sleep):
+        self.intervalo = 1 / por_segundo if por_segundo else 0
+        self.reloj = reloj
+        self.dormir = dormir
+        self._siguiente = 0.0
+        self._lock = threading.Lock()
+
+    def esperar(self):
+        if not self.intervalo:
+            return
+        with self._lock:
+            ahora = self.reloj()
+            turno = max(ahora, self._siguiente)
+            self._siguiente = turno + self.intervalo
+        if turno > ahora:
+            self.dormir(turno - ahora)
+
+
+# ─────────────────────────────── Preparación ───────────────────────────────
+
+def parcialidades_a_recordar(fechas):
+    """Parcialidades pendientes que vencen en `fechas`, con todo lo que el
+    recordatorio necesita resuelto en la misma consulta."""
+    return (
+        ParcialidadPago.objects
+        .filter(pagada=False, fecha_limite__in=fechas, plan__activo=True)
+        .select_related('plan__cotizacion__cliente', 'plan__cotizacion__portal')
+        .annotate(pagado=Cotizacion.expresion_total_pagado('plan__cotizacion'))
+        .order_by('fecha_limite', 'pk')
+    )
+
+
+def preparar_envios(parcialidades, *, fecha, marca) -> list:
+    """
+    Un `Envio` por parcialidad y canal, con la fila de auditoría sin guardar.
+
+    Las parcialidades deben venir de `parcialidades_a_recordar` (usa la
+    anotación `pagado`). Lo que no puede salir —plantilla sin configurar,
+    teléfono inválido, correo que no renderiza— queda FALLIDO desde aquí, igual
+    que en el envío suelto, y no llega a los proveedores.
+    """
+    emisor = None
+    envios = []
+    for parc in parcialidades:
+        cotizacion = parc.plan.cotizacion
+        cliente = cotizacion.cliente
+        if cliente is None:
+            continue
+        telefono = _telefono(cliente)
+        if not cliente.email and not telefono:
+            continue
+
+        contenido = contenido_recordatorio(
+            parc, fecha=fecha,
+            saldo=cotizacion.precio_final - parc.pagado,
+            portal=url_portal(cotizacion),
+        )
+        comun = dict(
+            cotizacion=cotizacion, tipo='RECORDATORIO_PAGO', trigger='CRON',
+            estado='PENDIENTE', fecha_envio=marca,
+        )
+
+        if cliente.email:
+            comm = ComunicacionCliente(
+                canal='EMAIL', destinatario=cliente.email, asunto=contenido['asunto'],
+                clave_idempotencia=contenido['clave_email'], **comun,
+            )
+            html = ''
+            try:
+                html = render_to_string(contenido['template'], contenido['context'])
+                comm.cuerpo = html[:5000]
+            except Exception as e:
+                logger.exception("No se pudo renderizar el recordatorio de la parcialidad %s", parc.pk)
+                comm.estado = 'FALLIDO'
+                comm.error = str(e)[:1000]
+            envios.append(Envio(comm, destino=cliente.email, asunto=contenido['asunto'], html=html))
+
+        if telefono:
+            plantilla = contenido['plantilla_wa']
+            payload, auditado = services.payload_plantilla_wa(plantilla, contenido['parametros_wa'])
+            comm = ComunicacionCliente(
+                canal='WHATSAPP', destinatario=telefono, asunto=plantilla,
+                cuerpo=auditado[:5000], clave_idempotencia=contenido['clave_whatsapp'], **comun,
+            )
+            if not plantilla:
+                comm.error = 'Plantilla de WhatsApp no configurada'
+            else:
+                if emisor is None:
+                    emisor = services.numero_emisor_wa()
+                comm.error = services.validar_envio_wa(telefono, emisor)
+            if comm.error:
+                comm.estado = 'FALLIDO'
+            envios.append(Envio(comm, destino=telefono, payload=payload))
+    return envios
+
+
+def reservar_en_lote(envios, marca) -> list:
+    """
+    Inserta las filas de `envios` de una vez y devuelve solo los que esta
+    corrida reservó; los demás ya tenían su clave tomada.
+    """
+    if not envios:
+        return []
+    ComunicacionCliente.objects.bulk_create(
+        [e.comm for e in envios], ignore_conflicts=True, batch_size=LOTE,
+    )
+    claves = [e.comm.clave_idempotencia for e in envios]
+    propias = {}
+    for i in range(0, len(claves), LOTE):
+        propias.update(
+            ComunicacionCliente.objects
+            .filter(clave_idempotencia__in=claves[i:i + LOTE], fecha_envio=marca)
+            .values_list('clave_idempotencia', 'pk')
+        )
+
+    reservados = []
+    for envio in envios:
+        pk = propias.get(envio.comm.clave_idempotencia)
+        if pk is None:
+            logger.info("Comunicación duplicada omitida (clave=%s)", envio.comm.clave_idempotencia)
+            continue
+        envio.comm.pk = pk
+        envio.comm._state.adding = False
+        envio.comm._state.db = ComunicacionCliente.objects.db
+        reservados.append(envio)
+    return reservados
+
+
+# ─────────────────────────────── Despacho ──────────────────────────────────
+
+def _enviar_con_reintentos(envio, proveedor, limite, *, reintentos, espera_base, dormir):
+    comm = envio.comm
+    for intento in range(reintentos + 1):
+        limite.esperar()
+        envio.intentos += 1
+        inicio = time.monotonic()
+        try:
+            proveedor_id = proveedor.enviar(envio)
+        except ErrorTransitorio as e:
+            envio.latencia += time.monotonic() - inicio
+            if intento == reintentos:
+                comm.estado = 'FALLIDO'
+                comm.error = f"{e} (tras {envio.intentos} intentos)"[:1000]
+                return
+            dormir(espera_base * 2 ** intento + random.uniform(0, espera_base))  # noqa: S311 — jitter, no cripto
+            continue
+        except Exception as e:
+            envio.latencia += time.monotonic() - inicio
+            if not isinstance(e, ErrorEnvio):
+                logger.exception("Error enviando el recordatorio %s", comm.clave_idempotencia)
+            comm.estado = 'FALLIDO'
+            comm.error = str(e)[:1000]
+            return
+        envio.latencia += time.monotonic() - inicio
+        comm.estado = 'ENVIADO'
+        comm.fecha_envio = timezone.now()
+        comm.proveedor_id = (proveedor_id or '')[:100]
+        return
+
+
+def despachar(envios, proveedores, *, hilos, envios_por_segundo, reintentos, espera_base,
+              dormir=time.sleep):
+    """Manda `envios` por un pool de `hilos` respetando el límite de cada canal.
+    Solo modifica los objetos en memoria; guardar es cosa de quien llama."""
+    limites = {
+        canal: LimiteTasa(envios_por_segundo.get(canal), dormir=dormir)
+        for canal in proveedores
+    }
+
+    def _uno(envio):
+        _enviar_con_reintentos(
+            envio, proveedores[envio.canal], limites[envio.canal],
+            reintentos=reintentos, espera_base=espera_base, dormir=dormir,
+        )
+
+    with ThreadPoolExecutor(max_workers=max(1, hilos), thread_name_prefix='recordatorios') as pool:
+        list(pool.map(_uno, envios))
+
+
+# ─────────────────────────────── Resultado ─────────────────────────────────
+
+@dataclass
+class Resumen:
+    envios: list = field(default_factory=list)
+    omitidos: int = 0
+    segundos: float = 0.0
+
+    def contar(self, estado):
+        return sum(1 for e in self.envios if e.comm.estado == estado)
+
+    @property
+    def por_segundo(self):
+        despachados = sum(1 for e in self.envios if e.intentos)
+        return despachados / self.segundos if self.segundos else 0.0
+
+    def latencias(self, canal):
+        return [e.latencia for e in self.envios if e.canal == canal and e.intentos]
+
+
+def histograma(latencias, cortes=CORTES_MS):
+    """Cuenta las latencias (segundos) en los intervalos de `cortes` (ms)."""
+    filas = [[f"< {c} ms", 0] for c in cortes] + [[f"≥ {cortes[-1]} ms", 0]]
+    for segundos in latencias:
+        ms = segundos * 1000
+        indice = next((i for i, c in enumerate(cortes) if ms < c), len(cortes))
+        filas[indice][1] += 1
+    return [tuple(f) for f in filas]
+
+
+def enviar_recordatorios(parcialidades, *, fecha, proveedores=None, dormir=time.sleep) -> Resumen:
+    """
+    Prepara, reserva y despacha los recordatorios de `parcialidades` (un
+    queryset de `parcialidades_a_recordar`). La concurrencia, las tasas y los
+    reintentos salen de los settings `RECORDATORIOS_*`.
+    """
+    inicio = time.monotonic()
+    marca = timezone.now()
+    preparados = preparar_envios(parcialidades, fecha=fecha, marca=marca)
+    envios = reservar_en_lote(preparados, marca)
+
+    pendientes = [e for e in envios if e.comm.estado == 'PENDIENTE']
+    despachar(
+        pendientes, proveedores or proveedores_por_defecto(),
+        hilos=getattr(settings, 'RECORDATORIOS_HILOS', 8),
+        envios_por_segundo=getattr(settings, 'RECORDATORIOS_ENVIOS_POR_SEGUNDO', {}),
+        reintentos=getattr(settings, 'RECORDATORIOS_REINTENTOS', 3),
+        espera_base=getattr(settings, 'RECORDATORIOS_ESPERA_BASE', 1.0),
+        dormir=dormir,
+    )
+    ComunicacionCliente.objects.bulk_update(
+        [e.comm for e in pendientes], CAMPOS_RESULTADO, batch_size=LOTE,
+    )
+    return Resumen(
+        envios=envios,
+        omitidos=len(preparados) - len(envios),
+        segundos=time.monotonic() - inicio,
+    )
@@ -339,42 +339,47 @@ def alertar_equipo_email(cotizacion, *, asunto: str, cuerpo: str,
 
 # ──────────────────────────────── WhatsApp ─────────────────────────────────
 
-def _enviar_wa(comm: ComunicacionCliente, payload: dict, destino: str) -> ComunicacionCliente:
+def post_mensaje_wa(destino: str, payload: dict):
     """
-    Ejecuta el POST a la Graph API y deja el resultado auditado en `comm`.
-    Único punto del proyecto que habla con `/messages`.
+    POST a `/messages` de la Graph API. Único punto del proyecto que habla con
+    ese endpoint; no valida ni audita nada, eso queda a quien lo llama.
     """
     phone_id, token = _wa_credenciales()
+    return requests.post(
+        f'https://graph.facebook.com/{wa_graph_version()}/{phone_id}/messages',
+        headers={'Authorization': f'Bearer {token}', 'Content-Type': 'application/json'},
+        json={'messaging_product': 'whatsapp', 'to': destino, **payload},
+        timeout=WA_TIMEOUT,
+    )
+
+
+def validar_envio_wa(destino: str, emisor: str) -> str:
+    """Motivo por el que un WhatsApp a `destino` no debe intentarse, o ''."""
+    phone_id, token = _wa_credenciales()
     if not phone_id or not token:
-        comm.estado = 'FALLIDO'
-        comm.error = 'WhatsApp no configurado (falta WA_PHONE_NUMBER_ID o WA_CLOUD_API_TOKEN)'
-        comm.save(update_fields=['estado', 'error'])
-        return comm
+        return 'WhatsApp no configurado (falta WA_PHONE_NUMBER_ID o WA_CLOUD_API_TOKEN)'
     if not destino:
-        comm.estado = 'FALLIDO'
-        comm.error = 'Teléfono vacío o con formato no reconocido'
-        comm.save(update_fields=['estado', 'error'])
-        return comm
-
-    emisor = numero_emisor_wa()
+        return 'Teléfono vacío o con formato no reconocido'
     if emisor and emisor == destino:
+        return 'El destinatario coincide con el número emisor (Meta 131021)'
+    return ''
+
+
+def _enviar_wa(comm: ComunicacionCliente, payload: dict, destino: str) -> ComunicacionCliente:
+    """Ejecuta el POST a la Graph API y deja el resultado auditado en `comm`."""
+    motivo = validar_envio_wa(destino, '')
+    if not motivo:
+        # El emisor se resuelve contra Meta: solo vale la pena si lo demás pasó.
+        motivo = validar_envio_wa(destino, numero_emisor_wa())
+    if motivo:
         comm.estado = 'FALLIDO'
-        comm.error = 'El destinatario coincide con el número emisor (Meta 131021)'
+        comm.error = motivo
         comm.save(update_fields=['estado', 'error'])
-        logger.error(
-            "WhatsApp no enviado: el destino %s es el mismo número emisor; "
-            "WhatsApp no permite enviarse a sí mismo",
-            telefono_seguro(destino),
-        )
+        logger.error("WhatsApp no enviado hacia %s: %s", telefono_seguro(destino), motivo)
         return comm
 
     try:
-        resp = requests.post(
-            f'https://graph.facebook.com/{wa_graph_version()}/{phone_id}/messages',
-            headers={'Authorization': f'Bearer {token}', 'Content-Type': 'application/json'},
-            json={'messaging_product': 'whatsapp', 'to': destino, **payload},
-            timeout=WA_TIMEOUT,
-        )
+        resp = post_mensaje_wa(destino, payload)
         if resp.status_code == 200:
             comm.estado = 'ENVIADO'
             comm.fecha_envio = timezone.now()
@@ -429,22 +434,11 @@ def enviar_whatsapp(
     return _enviar_wa(comm, {'type': 'text', 'text': {'body': mensaje}}, destino)
 
 
-def enviar_whatsapp_template(
-    *,
-    cotizacion=None,
-    pago=None,
-    tipo: str,
-    telefono: str,
-    template_name: str,
-    parametros: Optional[list] = None,
-    language_code: Optional[str] = None,
-    components: Optional[list] = None,
-    trigger: str = 'SIGNAL',
-    clave_idempotencia: Optional[str] = None,
-) -> Optional[ComunicacionCliente]:
+def payload_plantilla_wa(template_name: str, parametros: Optional[list] = None, *,
+                         language_code: Optional[str] = None,
+                         components: Optional[list] = None) -> tuple:
     """
-    Envía una plantilla aprobada en Meta. Es la única vía válida para mensajes
-    iniciados por el negocio fuera de la ventana de 24 h.
+    Arma el payload de una plantilla y el texto que queda en la auditoría.
 
     `parametros` es la forma corta: una lista de valores que se convierten en
     los `{{1}}, {{2}}, …` del cuerpo, aplanados con `texto_plano_wa` porque Meta
@@ -452,7 +446,6 @@ def enviar_whatsapp_template(
     la estructura completa cuando hace falta (cabecera, botones, etc.).
     """
     idioma = language_code or getattr(settings, 'WA_TEMPLATE_LANGUAGE', 'es_MX')
-    destino = normalizar_telefono_wa(telefono)
     valores = [texto_plano_wa(v) for v in (parametros or [])]
 
     if components is None and valores:
@@ -461,7 +454,35 @@ def enviar_whatsapp_template(
             'parameters': [{'type': 'text', 'text': v} for v in valores],
         }]
 
+    plantilla = {'name': template_name, 'language': {'code': idioma}}
+    if components:
+        plantilla['components'] = components
     cuerpo_auditado = f"[{template_name}/{idioma}] " + ' | '.join(valores)
+    return {'type': 'template', 'template': plantilla}, cuerpo_auditado
+
+
+def enviar_whatsapp_template(
+    *,
+    cotizacion=None,
+    pago=None,
+    tipo: str,
+    telefono: str,
+    template_name: str,
+    parametros: Optional[list] = None,
+    language_code: Optional[str] = None,
+    components: Optional[list] = None,
+    trigger: str = 'SIGNAL',
+    clave_idempotencia: Optional[str] = None,
+) -> Optional[ComunicacionCliente]:
+    """
+    Envía una plantilla aprobada en Meta. Es la única vía válida para mensajes
+    iniciados por el negocio fuera de la ventana de 24 h. Los argumentos de la
+    plantilla se interpretan como en `payload_plantilla_wa`.
+    """
+    destino = normalizar_telefono_wa(telefono)
+    payload, cuerpo_auditado = payload_plantilla_wa(
+        template_name, parametros, language_code=language_code, components=components,
+    )
     comm = reservar_comunicacion(
         cotizacion=cotizacion,
         pago=pago,
@@ -483,7 +504,4 @@ def enviar_whatsapp_template(
         comm.save(update_fields=['estado', 'error'])
         return comm
 
-    plantilla = {'name': template_name, 'language': {'code': idioma}}
-    if components:
-        plantilla['components'] = components
-    return _enviar_wa(comm, {'type': 'template', 'template': plantilla}, destino)
+    return _enviar_wa(comm, payload, destino)
@@ -254,6 +254,39 @@ def notificar_pago(pago):
 
 # ──────────────────────────────── Recordatorio ──────────────────────────────
 
+def contenido_recordatorio(parcialidad, *, fecha, saldo, portal, dias_restantes=None) -> dict:
+    """
+    Asunto, contexto, parámetros de plantilla y claves del recordatorio de una
+    parcialidad. Lo comparten `notificar_recordatorio` y el envío masivo de
+    `comunicacion.recordatorios`, para que ambos manden exactamente lo mismo.
+    """
+    cotizacion = parcialidad.plan.cotizacion
+    if dias_restantes is None:
+        dias_restantes = (parcialidad.fecha_limite - fecha).days
+    marca = fecha.isoformat()
+    return {
+        'asunto': f"Recordatorio de pago — {cotizacion.nombre_evento}",
+        'template': 'comunicacion/email/recordatorio.html',
+        'context': {
+            'cotizacion': cotizacion,
+            'parcialidad': parcialidad,
+            'dias_restantes': dias_restantes,
+            'saldo': saldo,
+            'portal_url': portal,
+        },
+        'plantilla_wa': _plantilla('WA_TEMPLATE_RECORDATORIO'),
+        'parametros_wa': [
+            _nombre_pila(cotizacion.cliente),
+            _dinero(parcialidad.monto),
+            _fecha(parcialidad.fecha_limite),
+            _dinero(saldo),
+            portal,
+        ],
+        'clave_email': f"recordatorio:{parcialidad.pk}:{marca}:email",
+        'clave_whatsapp': f"recordatorio:{parcialidad.pk}:{marca}:whatsapp",
+    }
+
+
 def notificar_recordatorio(parcialidad, *, fecha, dias_restantes=None):
     """
     Recordatorio de una parcialidad pendiente.
@@ -261,17 +294,19 @@ def notificar_recordatorio(parcialidad, *, fecha, dias_restantes=None):
     La clave de idempotencia incluye la fecha de ejecución, así que correr el
     comando dos veces el mismo día no duplica, pero el recordatorio de +3 días y
     el de −1 sí son envíos distintos.
+
+    Es el envío suelto, de uno en uno; el cron diario usa
+    `comunicacion.recordatorios.enviar_recordatorios`, que hace lo mismo en lote.
     """
     cotizacion = parcialidad.plan.cotizacion
     cliente = getattr(cotizacion, 'cliente', None)
     if cliente is None:
         return
 
-    portal = url_portal(cotizacion)
-    saldo = cotizacion.saldo_pendiente()
-    if dias_restantes is None:
-        dias_restantes = (parcialidad.fecha_limite - fecha).days
-    marca = fecha.isoformat()
+    contenido = contenido_recordatorio(
+        parcialidad, fecha=fecha, saldo=cotizacion.saldo_pendiente(),
+        portal=url_portal(cotizacion), dias_restantes=dias_restantes,
+    )
 
     if cliente.email:
         _seguro(
@@ -280,17 +315,11 @@ def notificar_recordatorio(parcialidad, *, fecha, dias_restantes=None):
             cotizacion=cotizacion,
             tipo='RECORDATORIO_PAGO',
             destinatario=cliente.email,
-            asunto=f"Recordatorio de pago — {cotizacion.nombre_evento}",
-            template='comunicacion/email/recordatorio.html',
-            context={
-                'cotizacion': cotizacion,
-                'parcialidad': parcialidad,
-                'dias_restantes': dias_restantes,
-                'saldo': saldo,
-                'portal_url': portal,
-            },
+            asunto=contenido['asunto'],
+            template=contenido['template'],
+            context=contenido['context'],
             trigger='CRON',
-            clave_idempotencia=f"recordatorio:{parcialidad.pk}:{marca}:email",
+            clave_idempotencia=contenido['clave_email'],
         )
 
     telefono = _telefono(cliente)
@@ -303,16 +332,10 @@ def notificar_recordatorio(parcialidad, *, fecha, dias_restantes=None):
         cotizacion=cotizacion,
         tipo='RECORDATORIO_PAGO',
         telefono=telefono,
-        template_name=_plantilla('WA_TEMPLATE_RECORDATORIO'),
-        parametros=[
-            _nombre_pila(cliente),
-            _dinero(parcialidad.monto),
-            _fecha(parcialidad.fecha_limite),
-            _dinero(saldo),
-            portal,
-        ],
+        template_name=contenido['plantilla_wa'],
+        parametros=contenido['parametros_wa'],
         trigger='CRON',
-        clave_idempotencia=f"recordatorio:{parcialidad.pk}:{marca}:whatsapp",
+        clave_idempotencia=contenido['clave_whatsapp'],
     )
 
 
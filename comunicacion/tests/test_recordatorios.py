@@ -6,13 +6,27 @@ from unittest.mock import patch
 
 from django.core import mail
 from django.core.management import call_command
-from django.test import TestCase
+from django.test import SimpleTestCase, TestCase
 from django.utils import timezone
 
-from comercial.models import Cliente, Cotizacion, ParcialidadPago, PlanPago
+from comercial.models import Cliente, Cotizacion, Pago, ParcialidadPago, PlanPago
 from comunicacion.models import ComunicacionCliente
+from comunicacion.recordatorios import (
+    LimiteTasa,
+    enviar_recordatorios,
+    histograma,
+    parcialidades_a_recordar,
+)
 
-from .utils import TEL_CLIENTE, TEL_EMISOR, RespuestaFalsa, limpiar_cache_emisor, wa_settings
+from .utils import (
+    TEL_CLIENTE,
+    TEL_EMISOR,
+    ProveedorFalso,
+    RespuestaFalsa,
+    error_meta,
+    limpiar_cache_emisor,
+    wa_settings,
+)
 
 
 @wa_settings()
@@ -121,6 +135,166 @@ class EnviarRecordatoriosTest(TestCase):
         self.assertEqual(len(mail.outbox), 1)
 
 
+@wa_settings(
+    RECORDATORIOS_HILOS=4,
+    RECORDATORIOS_ENVIOS_POR_SEGUNDO={},
+    RECORDATORIOS_REINTENTOS=2,
+    RECORDATORIOS_ESPERA_BASE=0.5,
+)
+class PipelineRecordatoriosTest(TestCase):
+    """El envío en lote, contra proveedores falsos (sin Brevo ni Meta)."""
+
+    def setUp(self):
+        limpiar_cache_emisor()
+        self.hoy = timezone.localdate()
+        self.esperas = []
+
+    def _parcialidades(self, n):
+        for i in range(n):
+            cliente = Cliente.objects.create(
+                nombre=f'Cliente {i}', email=f'c{i}@example.com', telefono=TEL_CLIENTE,
+            )
+            cot = Cotizacion.objects.create(
+                cliente=cliente, nombre_evento=f'Evento {i}',
+                fecha_evento=self.hoy + timedelta(days=90),
+                num_personas=50, precio_final=Decimal('10000.00'),
+            )
+            Cotizacion.objects.filter(pk=cot.pk).update(precio_final=Decimal('10000.00'))
+            plan = PlanPago.objects.create(cotizacion=cot, activo=True)
+            ParcialidadPago.objects.create(
+                plan=plan, numero=1, concepto='Anticipo',
+                monto=Decimal('5000.00'), porcentaje=Decimal('50.00'),
+                fecha_limite=self.hoy + timedelta(days=3),
+            )
+        return parcialidades_a_recordar([self.hoy + timedelta(days=3)])
+
+    def _enviar(self, parcialidades, email=None, whatsapp=None):
+        self.email = email or ProveedorFalso()
+        self.whatsapp = whatsapp or ProveedorFalso()
+        with patch('comunicacion.services.numero_emisor_wa', return_value=TEL_EMISOR):
+            return enviar_recordatorios(
+                parcialidades, fecha=self.hoy,
+                proveedores={'EMAIL': self.email, 'WHATSAPP': self.whatsapp},
+                dormir=self.esperas.append,
+            )
+
+    def test_el_lote_completo_cuesta_cuatro_consultas(self):
+        qs = self._parcialidades(6)
+        # Lectura con todo resuelto, INSERT de las claves, re-lectura de las
+        # claves propias y UPDATE de resultados: no crece con las parcialidades.
+        with self.assertNumQueries(4):
+            self._enviar(qs)
+        self.assertEqual(len(self.email.recibidos), 6)
+        self.assertEqual(len(self.whatsapp.recibidos), 6)
+
+    def test_el_saldo_sale_de_la_anotacion(self):
+        qs = self._parcialidades(1)
+        # bulk_create para no disparar la confirmación de pago de los signals.
+        Pago.objects.bulk_create([Pago(
+            cotizacion=qs.get().plan.cotizacion, monto=Decimal('2500.00'),
+            metodo='TRANSFERENCIA', tipo='INGRESO', concepto='VENTA',
+        )])
+        self._enviar(qs)
+        parametros = self.whatsapp.recibidos[0].payload['template']['components'][0]['parameters']
+        self.assertEqual(parametros[3]['text'], '7,500.00')
+
+    def test_registra_el_resultado_de_cada_envio(self):
+        resumen = self._enviar(self._parcialidades(2))
+        self.assertEqual(resumen.contar('ENVIADO'), 4)
+        self.assertEqual(
+            ComunicacionCliente.objects.filter(estado='ENVIADO', proveedor_id__startswith='falso-').count(),
+            4,
+        )
+
+    def test_las_claves_ya_reservadas_se_omiten_sin_enviar(self):
+        qs = self._parcialidades(2)
+        primera = qs.first()
+        ComunicacionCliente.objects.create(
+            canal='EMAIL', tipo='RECORDATORIO_PAGO', destinatario='x@example.com',
+            clave_idempotencia=f"recordatorio:{primera.pk}:{self.hoy.isoformat()}:email",
+        )
+        resumen = self._enviar(qs)
+        self.assertEqual(resumen.omitidos, 1)
+        self.assertEqual(len(self.email.recibidos), 1)
+        self.assertEqual(len(self.whatsapp.recibidos), 2)
+        self.assertEqual(ComunicacionCliente.objects.count(), 4)
+
+    def test_los_errores_transitorios_se_reintentan_con_espera_exponencial(self):
+        self._enviar(self._parcialidades(1), whatsapp=ProveedorFalso(fallas=2))
+        comm = ComunicacionCliente.objects.get(canal='WHATSAPP')
+        self.assertEqual(comm.estado, 'ENVIADO')
+        self.assertEqual(len(self.esperas), 2)
+        self.assertTrue(0.5 <= self.esperas[0] < 1.0)
+        self.assertTrue(1.0 <= self.esperas[1] < 1.5)
+
+    def test_agotar_los_reintentos_deja_el_envio_fallido(self):
+        self._enviar(self._parcialidades(1), whatsapp=ProveedorFalso(fallas=10))
+        comm = ComunicacionCliente.objects.get(canal='WHATSAPP')
+        self.assertEqual(comm.estado, 'FALLIDO')
+        self.assertIn('tras 3 intentos', comm.error)
+        self.assertEqual(ComunicacionCliente.objects.get(canal='EMAIL').estado, 'ENVIADO')
+
+    def test_el_pool_no_pasa_del_numero_de_hilos(self):
+        self._enviar(self._parcialidades(10), email=ProveedorFalso(demora=0.02))
+        self.assertLessEqual(self.email.max_simultaneos, 4)
+        self.assertEqual(len(self.email.recibidos), 10)
+
+    @wa_settings(WA_TEMPLATE_RECORDATORIO='')
+    def test_sin_plantilla_queda_fallido_sin_llamar_al_proveedor(self):
+        self._enviar(self._parcialidades(1))
+        self.assertEqual(self.whatsapp.recibidos, [])
+        comm = ComunicacionCliente.objects.get(canal='WHATSAPP')
+        self.assertEqual(comm.estado, 'FALLIDO')
+        self.assertEqual(comm.error, 'Plantilla de WhatsApp no configurada')
+
+    def test_meta_429_es_transitorio_y_400_es_definitivo(self):
+        qs = self._parcialidades(1)
+        respuestas = [error_meta(130429, status_code=400), error_meta(132001)]
+        with patch('comunicacion.services.requests.post', side_effect=respuestas), \
+             patch('comunicacion.services.numero_emisor_wa', return_value=TEL_EMISOR):
+            enviar_recordatorios(
+                qs, fecha=self.hoy, proveedores=None, dormir=self.esperas.append,
+            )
+        comm = ComunicacionCliente.objects.get(canal='WHATSAPP')
+        self.assertEqual(comm.estado, 'FALLIDO')
+        self.assertIn('Meta 132001', comm.error)
+        self.assertEqual(len(self.esperas), 1)
+
+    def test_el_comando_imprime_throughput_e_histograma(self):
+        self._parcialidades(2)
+        salida = StringIO()
+        with patch('comunicacion.services.requests.post', return_value=RespuestaFalsa()), \
+             patch('comunicacion.services.numero_emisor_wa', return_value=TEL_EMISOR):
+            call_command('enviar_recordatorios', stdout=salida)
+        texto = salida.getvalue()
+        self.assertIn('mensajes/s', texto)
+        self.assertIn('Latencia EMAIL (2 envíos)', texto)
+        self.assertIn('Latencia WHATSAPP (2 envíos)', texto)
+        self.assertIn('4 enviado(s)', texto)
+
+
+class LimiteTasaTest(SimpleTestCase):
+    def test_espacia_las_llamadas_segun_la_tasa(self):
+        reloj = [100.0]
+        esperas = []
+        limite = LimiteTasa(4, reloj=lambda: reloj[0], dormir=esperas.append)
+        for _ in range(3):
+            limite.esperar()
+        self.assertEqual(esperas, [0.25, 0.5])
+
+    def test_sin_tasa_no_espera(self):
+        esperas = []
+        limite = LimiteTasa(None, dormir=esperas.append)
+        limite.esperar()
+        self.assertEqual(esperas, [])
+
+    def test_histograma_reparte_por_cortes(self):
+        filas = dict(histograma([0.05, 0.3, 0.3, 7.0]))
+        self.assertEqual(filas['< 100 ms'], 1)
+        self.assertEqual(filas['< 500 ms'], 2)
+        self.assertEqual(filas['≥ 5000 ms'], 1)
+
+
 @wa_settings()
 class ShimRecordatoriosPagosTest(TestCase):
     """`comercial.enviar_recordatorios_pagos` debe delegar, no duplicar."""
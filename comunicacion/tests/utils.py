@@ -1,9 +1,12 @@
 """Utilidades compartidas por los tests de comunicacion."""
 import json
+import threading
+import time
 
 from django.test import override_settings
 
 from comunicacion import services
+from comunicacion.recordatorios import ErrorTransitorio
 
 # Números ficticios: el rango 555 está reservado y nunca corresponde a una
 # persona real. Nunca poner aquí un teléfono del negocio ni de un cliente.
@@ -63,3 +66,37 @@ def error_meta(codigo, mensaje='error simulado', status_code=400):
 
 def limpiar_cache_emisor():
     services._EMISOR_CACHE.clear()
+
+
+class ProveedorFalso:
+    """
+    Proveedor local para `comunicacion.recordatorios`: anota lo que recibe y
+    puede fallar con errores transitorios las primeras `fallas` veces.
+    """
+
+    def __init__(self, fallas=0, demora=0.0):
+        self.fallas = fallas
+        self.demora = demora
+        self.recibidos = []
+        self.simultaneos = 0
+        self.max_simultaneos = 0
+        self._lock = threading.Lock()
+
+    def enviar(self, envio):
+        with self._lock:
+            self.simultaneos += 1
+            self.max_simultaneos = max(self.max_simultaneos, self.simultaneos)
+            falla = self.fallas > 0
+            if falla:
+                self.fallas -= 1
+        try:
+            if self.demora:
+                time.sleep(self.demora)
+            if falla:
+                raise ErrorTransitorio('HTTP 429 simulado')
+            with self._lock:
+                self.recibidos.append(envio)
+            return f'falso-{len(self.recibidos)}'
+        finally:
+            with self._lock:
+                self.simultaneos -= 1
@@ -31,8 +31,10 @@ from .models import (
     UnidadNegocio,
 )
 from .services import (
+    aplicar_polizas,
     aplicar_saldo_apertura,
     aprobar_regularizacion_arrastre,
+    cancelar_polizas,
     proponer_regularizacion_arrastre,
 )
 from .services_estados_cuenta import generar_conciliacion_preliminar, procesar_estado_cuenta
@@ -286,30 +288,25 @@ class PolizaAdmin(admin.ModelAdmin):
         "entra a los saldos y reportes del ERP."
     )
     def aplicar_polizas(self, request, queryset):
-        aplicadas = 0
-        errores = []
-        sin_autorizacion = []
-        for poliza in queryset.filter(estado='BORRADOR'):
-            # El mismo candado que la acción de la conciliación: sin esto, la
-            # autorización de Dirección se saltaría aplicando el borrador desde
-            # esta pantalla.
-            if poliza.requiere_autorizacion_direccion and not request.user.is_superuser:
-                sin_autorizacion.append("{}-{}".format(poliza.tipo, poliza.folio))
-            elif poliza.esta_cuadrada:
-                poliza.aplicar(request.user)
-                aplicadas += 1
-            else:
-                errores.append("{}-{}".format(poliza.tipo, poliza.folio))
-
-        if aplicadas:
-            self.message_user(request, "{} póliza(s) aplicada(s)".format(aplicadas))
-        if errores:
-            self.message_user(request, "No cuadran: {}".format(', '.join(errores)), level='ERROR')
-        if sin_autorizacion:
+        # El servicio aplica el mismo candado que la acción de la conciliación:
+        # sin él, la autorización de Dirección se saltaría aplicando el
+        # borrador desde esta pantalla.
+        informe = aplicar_polizas(queryset.filter(estado='BORRADOR'), request.user)
+        por_resultado = {}
+        for fila in informe['resultados']:
+            por_resultado.setdefault(fila['resultado'], []).append(fila['poliza'])
+
+        if informe['aplicadas']:
+            self.message_user(request, "{} póliza(s) aplicada(s)".format(informe['aplicadas']))
+        if por_resultado.get('no_cuadra'):
+            self.message_user(
+                request, "No cuadran: {}".format(', '.join(por_resultado['no_cuadra'])), level='ERROR',
+            )
+        if por_resultado.get('requiere_direccion'):
             self.message_user(
                 request,
                 "Solo Dirección puede aplicar regularizaciones de saldos: {}".format(
-                    ', '.join(sin_autorizacion)
+                    ', '.join(por_resultado['requiere_direccion'])
                 ),
                 level=messages.ERROR,
             )
@@ -320,13 +317,8 @@ class PolizaAdmin(admin.ModelAdmin):
         "pero dejarán de sumar en cualquier saldo o reporte."
     )
     def cancelar_polizas(self, request, queryset):
-        canceladas = queryset.exclude(estado='CANCELADA').update(
-            estado='CANCELADA',
-            cancelada_por=request.user,
-            fecha_cancelacion=timezone.now(),
-            motivo_cancelacion='Cancelación masiva desde admin'
-        )
-        self.message_user(request, "{} póliza(s) cancelada(s)".format(canceladas))
+        informe = cancelar_polizas(queryset, request.user, 'Cancelación masiva desde admin')
+        self.message_user(request, "{} póliza(s) cancelada(s)".format(informe['canceladas']))
 
 
 @admin.register(ConciliacionBancaria)
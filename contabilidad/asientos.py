@@ -0,0 +1,198 @@
+"""
+Escritura de Pólizas Automáticas
+================================
+`AsientoBuilder` junta las líneas de una póliza y la escribe de una vez: el
+folio sale de `FolioSecuencia` y los movimientos se insertan con un solo
+`bulk_create`.
+
+Las cuentas de `ConfiguracionContable`, las unidades de negocio y el usuario
+del sistema se leen de una foto (`Catalogo`) guardada en el cache de Django
+en vez de una consulta por cuenta en cada póliza. El cache es la base de
+datos (ver CACHES en settings), así que la foto es la misma para los dos
+workers de gunicorn y sigue la transacción: si ésta se revierte, la foto
+leída dentro de ella también desaparece. Se descarta al guardar o borrar
+cualquiera de esos modelos.
+"""
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_migrate, post_save
+
+from .models import (
+    ConfiguracionContable,
+    CuentaContable,
+    FolioSecuencia,
+    MovimientoContable,
+    Poliza,
+    UnidadNegocio,
+)
+
+USUARIO_SISTEMA = 'sistema_contable'
+CLAVE_CATALOGO = 'contabilidad:catalogo'
+CERO = Decimal('0.00')
+
+
+class Catalogo:
+    """
+    Foto de la configuración contable: cuentas activas por operación,
+    unidades de negocio por clave y el usuario del sistema.
+    """
+
+    def __init__(self):
+        self.cuentas = {
+            config.operacion: config.cuenta
+            for config in ConfiguracionContable.objects.filter(activa=True).select_related('cuenta')
+        }
+        unidades = list(UnidadNegocio.objects.all())
+        self.unidades = {unidad.clave: unidad for unidad in unidades}
+        self.unidad_respaldo = next((u for u in unidades if u.activa), None)
+        self.usuario_sistema, _ = User.objects.get_or_create(
+            username=USUARIO_SISTEMA,
+            defaults={
+                'first_name': 'Sistema',
+                'last_name': 'Contable',
+                'is_active': False,
+            }
+        )
+
+    def cuenta(self, operacion):
+        """Cuenta activa configurada para `operacion`, o None."""
+        return self.cuentas.get(operacion)
+
+    def unidad(self, clave):
+        """Unidad de negocio por clave; si no existe, la primera activa."""
+        return self.unidades.get(clave) or self.unidad_respaldo
+
+    def usuario(self):
+        """Usuario (inactivo) que firma las pólizas automáticas."""
+        return self.usuario_sistema
+
+
+def catalogo():
+    """Catálogo del cache, o uno recién leído (y guardado) si no hay."""
+    foto = cache.get(CLAVE_CATALOGO)
+    if foto is None:
+        foto = Catalogo()
+        cache.set(CLAVE_CATALOGO, foto, getattr(settings, 'CONTABILIDAD_CATALOGO_SEGUNDOS', 300))
+    return foto
+
+
+def invalidar_catalogo(**kwargs):
+    """Descarta la foto ahora y otra vez al confirmar: otro worker pudo
+    haberla releído entre el cambio y el commit, con los datos anteriores."""
+    cache.delete(CLAVE_CATALOGO)
+    transaction.on_commit(lambda: cache.delete(CLAVE_CATALOGO))
+
+
+for _modelo in (ConfiguracionContable, CuentaContable, UnidadNegocio):
+    post_save.connect(invalidar_catalogo, sender=_modelo, dispatch_uid=f'catalogo_{_modelo.__name__}_save')
+    post_delete.connect(invalidar_catalogo, sender=_modelo, dispatch_uid=f'catalogo_{_modelo.__name__}_delete')
+# `migrate` y `flush` reescriben las tablas sin pasar por save()/delete().
+post_migrate.connect(invalidar_catalogo, dispatch_uid='catalogo_post_migrate')
+
+
+def escribir_movimientos(poliza, lineas, sumar_totales=True):
+    """Inserta las líneas `(cuenta, debe, haber, concepto, referencia)` de
+    `poliza` en una sola consulta y suma sus importes a los totales guardados
+    de la póliza (y de la instancia). `sumar_totales=False` cuando la póliza
+    se acaba de crear ya con esos totales."""
+    MovimientoContable.objects.bulk_create([
+        MovimientoContable(
+            poliza=poliza, cuenta=cuenta, debe=debe, haber=haber,
+            concepto=concepto, referencia=referencia,
+        )
+        for cuenta, debe, haber, concepto, referencia in lineas
+    ], recalcular_totales=False)
+    if not sumar_totales:
+        return
+    debe = sum((linea[1] for linea in lineas), CERO)
+    haber = sum((linea[2] for linea in lineas), CERO)
+    Poliza.objects.filter(pk=poliza.pk).update(
+        total_debe=F('total_debe') + debe, total_haber=F('total_haber') + haber,
+    )
+    poliza.total_debe += debe
+    poliza.total_haber += haber
+
+
+class AsientoBuilder:
+    """
+    Acumula las líneas de una póliza automática y la escribe de una vez.
+
+    Uso:
+        cat = catalogo()
+        asiento = AsientoBuilder('I', pago.fecha_pago, concepto, 'PAGO_CLIENTE', documento=pago)
+        asiento.cargo(cat.cuenta('BANCO_PRINCIPAL'), monto, "Pago Transferencia")
+        asiento.abono(cat.cuenta('ANTICIPO_CLIENTES'), monto, "COT-001")
+        poliza = asiento.guardar(cat.unidad('QUINTA'), cat.usuario())
+    """
+
+    def __init__(self, tipo, fecha, concepto, origen, documento=None, estado='APLICADA'):
+        self.tipo = tipo
+        self.fecha = fecha
+        self.concepto = concepto[:500]
+        self.origen = origen
+        self.documento = documento
+        self.estado = estado
+        self.lineas = []
+
+    def cargo(self, cuenta, importe, concepto='', referencia=''):
+        self.lineas.append((cuenta, importe, CERO, concepto, referencia))
+        return self
+
+    def abono(self, cuenta, importe, concepto='', referencia=''):
+        self.lineas.append((cuenta, CERO, importe, concepto, referencia))
+        return self
+
+    def extender(self, lineas):
+        """Agrega líneas ya armadas como tuplas `(cuenta, debe, haber, concepto, referencia)`."""
+        self.lineas.extend(lineas)
+        return self
+
+    def revertir(self, poliza):
+        """Agrega los movimientos de `poliza` con debe y haber invertidos."""
+        for mov in poliza.movimientos.select_related('cuenta'):
+            self.lineas.append((
+                mov.cuenta, mov.haber, mov.debe,
+                f"Reversión: {mov.concepto}"[:200], mov.referencia,
+            ))
+        return self
+
+    @property
+    def total_debe(self):
+        return sum((linea[1] for linea in self.lineas), CERO)
+
+    @property
+    def total_haber(self):
+        return sum((linea[2] for linea in self.lineas), CERO)
+
+    def guardar(self, unidad, created_by, content_type=None, object_id=None):
+        """Crea la póliza con folio de `FolioSecuencia` y todas sus líneas.
+
+        `content_type`/`object_id` solo hacen falta sin `documento` (p. ej. la
+        reversión, que apunta al mismo documento que la póliza original).
+        """
+        if self.documento is not None:
+            content_type = content_type or ContentType.objects.get_for_model(self.documento)
+            object_id = object_id or self.documento.pk
+        with transaction.atomic(savepoint=False):
+            poliza = Poliza.objects.create(
+                tipo=self.tipo,
+                folio=FolioSecuencia.asignar(self.tipo, self.fecha),
+                fecha=self.fecha,
+                concepto=self.concepto,
+                unidad_negocio=unidad,
+                estado=self.estado,
+                origen=self.origen,
+                content_type=content_type,
+                object_id=object_id,
+                created_by=created_by,
+                total_debe=self.total_debe,
+                total_haber=self.total_haber,
+            )
+            escribir_movimientos(poliza, self.lineas, sumar_totales=False)
+        return poliza
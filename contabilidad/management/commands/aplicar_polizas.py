@@ -0,0 +1,93 @@
+"""
+Aplica en bloque las pólizas BORRADOR de un periodo, para el cierre de mes.
+
+Mismas reglas que "Aplicar pólizas seleccionadas" del admin (ver
+`contabilidad.services.aplicar_polizas`): solo las que cuadran, y las
+regularizaciones de saldos solo si el responsable es de Dirección.
+
+Simula por defecto. Uso:
+    python manage.py aplicar_polizas --desde 2026-08-01 --hasta 2026-08-31
+    python manage.py aplicar_polizas --hasta 2026-08-31 --origen COMPRA --aplicar
+"""
+from datetime import date
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from contabilidad.models import Poliza
+from contabilidad.services import aplicar_polizas
+
+ETIQUETAS = {
+    'aplicada': 'Aplicada',
+    'no_cuadra': 'No cuadra',
+    'requiere_direccion': 'Requiere Dirección',
+    'no_es_borrador': 'No es borrador',
+}
+
+
+class Command(BaseCommand):
+    help = "Aplica las pólizas BORRADOR de un periodo. Simula salvo --aplicar."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--desde', help="Fecha inicial inclusive, YYYY-MM-DD.")
+        parser.add_argument('--hasta', required=True, help="Fecha final inclusive, YYYY-MM-DD.")
+        parser.add_argument('--origen', action='append', choices=[c for c, _ in Poliza.ORIGEN_CHOICES],
+                            help="Solo pólizas de este origen (se puede repetir).")
+        parser.add_argument('--unidad', help="Clave de la unidad de negocio (ej. QUINTA).")
+        parser.add_argument('--aplicar', action='store_true', help="Escribe. Sin esto solo reporta.")
+        parser.add_argument('--usuario',
+                            help="Username que queda como quien aplicó. "
+                                 "Por defecto, el primer superusuario.")
+
+    def handle(self, *args, **opciones):
+        try:
+            hasta = date.fromisoformat(opciones['hasta'])
+            desde = date.fromisoformat(opciones['desde']) if opciones['desde'] else None
+        except ValueError as e:
+            raise CommandError(f"Fecha inválida: {e}")
+
+        polizas = Poliza.objects.filter(estado='BORRADOR', fecha__lte=hasta)
+        if desde:
+            polizas = polizas.filter(fecha__gte=desde)
+        if opciones['origen']:
+            polizas = polizas.filter(origen__in=opciones['origen'])
+        if opciones['unidad']:
+            polizas = polizas.filter(unidad_negocio__clave=opciones['unidad'])
+
+        usuario = self._responsable(opciones.get('usuario'))
+        informe = aplicar_polizas(polizas, usuario, aplicar=opciones['aplicar'])
+        self._reportar(informe)
+
+    def _responsable(self, username):
+        if username:
+            try:
+                return User.objects.get(username=username)
+            except User.DoesNotExist:
+                raise CommandError(f"No existe el usuario '{username}'.")
+        usuario = User.objects.filter(is_superuser=True).order_by('id').first()
+        if not usuario:
+            raise CommandError("No hay ningún superusuario para asentar como responsable. Pasa --usuario.")
+        return usuario
+
+    def _reportar(self, informe):
+        if not informe['resultados']:
+            self.stdout.write(self.style.SUCCESS("No hay pólizas en borrador con esos filtros."))
+            return
+
+        conteo = {}
+        for fila in informe['resultados']:
+            conteo[fila['resultado']] = conteo.get(fila['resultado'], 0) + 1
+            self.stdout.write(
+                f"  {fila['poliza']:<10} {fila['fecha']}  debe ${fila['debe']:>14,.2f}  "
+                f"haber ${fila['haber']:>14,.2f}  {ETIQUETAS[fila['resultado']]}"
+            )
+
+        self.stdout.write('-' * 78)
+        for resultado, cuantas in conteo.items():
+            self.stdout.write(f"  {ETIQUETAS[resultado]:<20} {cuantas:>5}")
+        if informe['aplicado']:
+            self.stdout.write(self.style.SUCCESS(f"  {informe['aplicadas']} póliza(s) aplicada(s)."))
+        elif informe['aplicadas']:
+            self.stdout.write(self.style.WARNING(
+                "  SIMULACIÓN: no se modificó nada. Vuelve a correrlo con --aplicar."
+            ))
@@ -0,0 +1,78 @@
+"""
+Siembra FolioSecuencia con los folios de las pólizas que ya existen.
+
+El consecutivo de folios vive en FolioSecuencia (una fila por tipo y mes).
+Un mes sin fila se siembra solo la primera vez que se le asigna un folio,
+pero ese primer folio todavía cuesta un MAX(folio) sobre el mes y, si dos
+pólizas llegan a la vez, una tiene que reintentar. Este comando deja
+sembrados de una vez todos los meses con pólizas.
+
+También sirve después de una carga masiva o de capturar folios a mano: solo
+sube el consecutivo cuando hay un folio más alto que el registrado, nunca lo
+baja (bajarlo repetiría folios ya emitidos).
+
+Uso:
+    python manage.py sembrar_folios_poliza            # solo reporta
+    python manage.py sembrar_folios_poliza --aplicar  # escribe
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+from django.db.models.functions import ExtractMonth, ExtractYear
+
+from contabilidad.models import FolioSecuencia, Poliza
+
+
+class Command(BaseCommand):
+    help = "Siembra el consecutivo de folios por tipo y mes a partir de las pólizas existentes."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--aplicar', action='store_true',
+            help="Escribe los cambios. Sin esta bandera solo reporta.",
+        )
+
+    def handle(self, *args, **opciones):
+        maximos = (
+            Poliza.objects
+            .annotate(anio=ExtractYear('fecha'), mes=ExtractMonth('fecha'))
+            .values('tipo', 'anio', 'mes')
+            .annotate(maximo=Max('folio'))
+            .order_by('anio', 'mes', 'tipo')
+        )
+        actuales = {
+            (s.tipo, s.anio, s.mes): s.ultimo_folio
+            for s in FolioSecuencia.objects.all()
+        }
+
+        cambios = []
+        for fila in maximos:
+            clave = (fila['tipo'], fila['anio'], fila['mes'])
+            actual = actuales.get(clave)
+            if actual is None or actual < fila['maximo']:
+                cambios.append((clave, actual, fila['maximo']))
+
+        if not cambios:
+            self.stdout.write(self.style.SUCCESS("Los consecutivos ya están al día."))
+            return
+
+        for (tipo, anio, mes), actual, maximo in cambios:
+            antes = 'sin sembrar' if actual is None else actual
+            self.stdout.write(f"  {tipo} {anio}-{mes:02d}: {antes} → {maximo}")
+
+        if not opciones['aplicar']:
+            self.stdout.write(
+                f"{len(cambios)} consecutivo(s) por sembrar. Ejecuta con --aplicar para escribirlos.")
+            return
+
+        for (tipo, anio, mes), _, maximo in cambios:
+            with transaction.atomic():
+                secuencia, creada = FolioSecuencia.objects.select_for_update().get_or_create(
+                    tipo=tipo, anio=anio, mes=mes, defaults={'ultimo_folio': maximo},
+                )
+                # Entre el reporte y este punto pudo asignarse otro folio.
+                if not creada and secuencia.ultimo_folio < maximo:
+                    secuencia.ultimo_folio = maximo
+                    secuencia.save(update_fields=['ultimo_folio'])
+
+        self.stdout.write(self.style.SUCCESS(f"{len(cambios)} consecutivo(s) sembrado(s)."))
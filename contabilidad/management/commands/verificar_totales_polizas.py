@@ -0,0 +1,61 @@
+"""
+Revisa que los totales guardados de cada póliza coincidan con sus movimientos.
+
+`Poliza.total_debe`/`total_haber` se mantienen al escribir movimientos (por
+señal o desde MovimientoContableQuerySet). Un UPDATE hecho a mano en la base
+o un movimiento que se cambió de póliza pueden desviarlos; este comando lo
+detecta comparando contra la suma real en una sola consulta.
+
+Uso:
+    python manage.py verificar_totales_polizas             # solo reporta
+    python manage.py verificar_totales_polizas --corregir  # además los recalcula
+"""
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db.models import F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from contabilidad.models import MovimientoContable, Poliza
+
+
+class Command(BaseCommand):
+    help = "Compara los totales guardados de las pólizas contra la suma de sus movimientos."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--corregir', action='store_true',
+            help="Recalcula los totales desviados. Sin esta bandera solo reporta.",
+        )
+
+    def handle(self, *args, **opciones):
+        movimientos = MovimientoContable.objects.filter(poliza=OuterRef('pk')).order_by().values('poliza')
+
+        def _suma(campo):
+            return Coalesce(Subquery(movimientos.annotate(t=Sum(campo)).values('t')), Value(Decimal('0.00')))
+
+        desviadas = list(
+            Poliza.objects
+            .annotate(suma_debe=_suma('debe'), suma_haber=_suma('haber'))
+            .exclude(total_debe=F('suma_debe'), total_haber=F('suma_haber'))
+            .values_list('pk', 'tipo', 'folio', 'fecha', 'total_debe', 'suma_debe', 'total_haber', 'suma_haber')
+            .order_by('fecha', 'tipo', 'folio')
+        )
+
+        if not desviadas:
+            self.stdout.write(self.style.SUCCESS("Los totales de todas las pólizas coinciden con sus movimientos."))
+            return
+
+        for _, tipo, folio, fecha, debe, suma_debe, haber, suma_haber in desviadas:
+            self.stdout.write(
+                f"  {tipo}-{str(folio).zfill(4)} {fecha}: debe {debe} (real {suma_debe}), "
+                f"haber {haber} (real {suma_haber})"
+            )
+
+        if not opciones['corregir']:
+            self.stdout.write(
+                f"{len(desviadas)} póliza(s) con totales desviados. Ejecuta con --corregir para recalcularlos.")
+            return
+
+        Poliza.recalcular_totales(pk for pk, *_ in desviadas)
+        self.stdout.write(self.style.SUCCESS(f"{len(desviadas)} póliza(s) recalculada(s)."))
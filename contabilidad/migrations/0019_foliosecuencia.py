@@ -0,0 +1,52 @@
+# Generated by Django 6.1 on 2026-10-19 10:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("contabilidad", "0018_poliza_aplicada_por_poliza_fecha_aplicacion"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="FolioSecuencia",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "tipo",
+                    models.CharField(
+                        choices=[("I", "Ingreso"), ("E", "Egreso"), ("D", "Diario")],
+                        max_length=1,
+                        verbose_name="Tipo de póliza",
+                    ),
+                ),
+                ("anio", models.PositiveSmallIntegerField(verbose_name="Año")),
+                ("mes", models.PositiveSmallIntegerField(verbose_name="Mes")),
+                (
+                    "ultimo_folio",
+                    models.PositiveIntegerField(
+                        default=0, verbose_name="Último folio asignado"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Secuencia de folios",
+                "verbose_name_plural": "Secuencias de folios",
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("tipo", "anio", "mes"), name="folio_secuencia_unica"
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 6.1 on 2026-10-19 05:04
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def sumar_totales(apps, schema_editor):
+    """Llena los totales de las pólizas existentes en un solo UPDATE."""
+    Poliza = apps.get_model('contabilidad', 'Poliza')
+    MovimientoContable = apps.get_model('contabilidad', 'MovimientoContable')
+    movimientos = MovimientoContable.objects.filter(poliza=OuterRef('pk')).order_by().values('poliza')
+
+    def _suma(campo):
+        return Coalesce(Subquery(movimientos.annotate(t=Sum(campo)).values('t')), Value(Decimal('0.00')))
+
+    Poliza.objects.update(total_debe=_suma('debe'), total_haber=_suma('haber'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("contabilidad", "0019_foliosecuencia"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="poliza",
+            name="total_debe",
+            field=models.DecimalField(
+                decimal_places=2,
+                default=Decimal("0.00"),
+                editable=False,
+                max_digits=16,
+                verbose_name="Total debe",
+            ),
+        ),
+        migrations.AddField(
+            model_name="poliza",
+            name="total_haber",
+            field=models.DecimalField(
+                decimal_places=2,
+                default=Decimal("0.00"),
+                editable=False,
+                max_digits=16,
+                verbose_name="Total haber",
+            ),
+        ),
+        migrations.RunPython(sumar_totales, migrations.RunPython.noop),
+    ]
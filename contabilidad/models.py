@@ -10,8 +10,9 @@ from decimal import Decimal
 
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
-from django.db import models
+from django.db import IntegrityError, models, transaction
 from django.db.models import Q, Sum
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 
 from core_erp.storages_qkt import storage_privado
@@ -351,6 +352,21 @@ class Poliza(models.Model):
     )
     fecha_aplicacion = models.DateTimeField(null=True, blank=True)
 
+    # Ver requiere_autorizacion_direccion.
+    ORIGENES_AUTORIZACION_DIRECCION = ('APERTURA',)
+
+    # Suma de los movimientos, mantenida al escribirlos (ver
+    # MovimientoContableQuerySet y signals.py); `verificar_totales_polizas`
+    # revisa que no se hayan desviado.
+    total_debe = models.DecimalField(
+        max_digits=16, decimal_places=2, default=Decimal('0.00'), editable=False,
+        verbose_name="Total debe",
+    )
+    total_haber = models.DecimalField(
+        max_digits=16, decimal_places=2, default=Decimal('0.00'), editable=False,
+        verbose_name="Total haber",
+    )
+
     class Meta:
         verbose_name = "Póliza contable"
         verbose_name_plural = "Pólizas"
@@ -364,27 +380,42 @@ class Poliza(models.Model):
     def __str__(self):
         return f"{self.get_tipo_display()}-{self.folio} | {self.fecha} | {self.concepto[:50]}"
 
-    @property
-    def total_debe(self):
-        if not self.pk:
-            # Una póliza sin guardar no puede tener movimientos todavía (el
-            # inline de Movimientos se guarda después, ya con FK a esta
-            # póliza) — acceder a self.movimientos antes de eso lanza
-            # ValueError, no hay nada que sumar.
-            return Decimal('0.00')
-        return self.movimientos.aggregate(t=Sum('debe'))['t'] or Decimal('0.00')
-
-    @property
-    def total_haber(self):
-        if not self.pk:
-            return Decimal('0.00')
-        return self.movimientos.aggregate(t=Sum('haber'))['t'] or Decimal('0.00')
+    def save(self, *args, **kwargs):
+        # Los totales solo los escriben recalcular_totales()/actualizar_totales():
+        # guardar una instancia leída antes de agregar movimientos no los pisa.
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.name not in ('total_debe', 'total_haber')
+            ]
+        super().save(*args, **kwargs)
 
     @property
     def esta_cuadrada(self):
         """Verifica que la póliza cuadre (debe = haber)."""
         return abs(self.total_debe - self.total_haber) < Decimal('0.01')
 
+    @classmethod
+    def recalcular_totales(cls, poliza_ids):
+        """Vuelve a sumar `total_debe`/`total_haber` de esas pólizas en un UPDATE."""
+        poliza_ids = {pk for pk in poliza_ids if pk is not None}
+        if not poliza_ids:
+            return
+        movimientos = MovimientoContable.objects.filter(poliza=models.OuterRef('pk')).order_by().values('poliza')
+        cero = models.Value(Decimal('0.00'))
+
+        def _suma(campo):
+            return Coalesce(models.Subquery(movimientos.annotate(t=Sum(campo)).values('t')), cero)
+
+        cls.objects.filter(pk__in=poliza_ids).update(total_debe=_suma('debe'), total_haber=_suma('haber'))
+
+    def actualizar_totales(self):
+        """Suma los movimientos de esta póliza, guarda los totales y los deja en la instancia."""
+        totales = self.movimientos.aggregate(debe=Sum('debe'), haber=Sum('haber'))
+        self.total_debe = totales['debe'] or Decimal('0.00')
+        self.total_haber = totales['haber'] or Decimal('0.00')
+        Poliza.objects.filter(pk=self.pk).update(total_debe=self.total_debe, total_haber=self.total_haber)
+
     def clean(self):
         if self.estado == 'APLICADA' and not self.esta_cuadrada:
             raise ValidationError(
@@ -397,7 +428,7 @@ class Poliza(models.Model):
         una cuenta de ajuste, sin operación real detrás. No las aplica quien
         concilia: las autoriza Dirección (`is_superuser`, el mismo criterio que
         el resto del ERP — ver `crear_grupos_permisos`)."""
-        return self.origen == 'APERTURA'
+        return self.origen in self.ORIGENES_AUTORIZACION_DIRECCION
 
     def aplicar(self, usuario):
         """Aplica la póliza (la hace definitiva)."""
@@ -422,19 +453,106 @@ class Poliza(models.Model):
 
     @classmethod
     def siguiente_folio(cls, tipo, fecha):
-        """Obtiene el siguiente folio disponible para el tipo y mes."""
-        ultimo = cls.objects.filter(
-            tipo=tipo,
-            fecha__year=fecha.year,
-            fecha__month=fecha.month
-        ).aggregate(max_folio=models.Max('folio'))['max_folio']
-        return (ultimo or 0) + 1
+        """Asigna el siguiente folio del tipo y mes (ver FolioSecuencia).
+
+        El folio queda reservado: hay que crear la póliza en la misma
+        transacción. Si ésta se revierte, el consecutivo vuelve atrás con
+        ella y no quedan huecos.
+        """
+        return FolioSecuencia.asignar(tipo, fecha)
+
+
+class FolioSecuencia(models.Model):
+    """
+    Último folio asignado por tipo de póliza y mes.
+
+    Sustituye al `MAX(folio) + 1` sobre todas las pólizas del mes, que dos
+    pagos simultáneos (el webhook de Openpay y uno capturado en el admin)
+    podían calcular igual. El consecutivo se avanza con un UPDATE atómico
+    (`F('ultimo_folio') + 1`), que deja la fila bloqueada hasta el commit:
+    la segunda transacción espera y lee el número siguiente. El costo ya no
+    crece con el volumen del mes.
+
+    `sembrar_folios_poliza` llena la tabla a partir de las pólizas que ya
+    existen; un mes sin fila se siembra solo la primera vez que se usa.
+    """
+    tipo = models.CharField(max_length=1, choices=Poliza.TIPO_CHOICES, verbose_name="Tipo de póliza")
+    anio = models.PositiveSmallIntegerField(verbose_name="Año")
+    mes = models.PositiveSmallIntegerField(verbose_name="Mes")
+    ultimo_folio = models.PositiveIntegerField(default=0, verbose_name="Último folio asignado")
+
+    class Meta:
+        verbose_name = "Secuencia de folios"
+        verbose_name_plural = "Secuencias de folios"
+        constraints = [
+            models.UniqueConstraint(fields=['tipo', 'anio', 'mes'], name='folio_secuencia_unica'),
+        ]
+
+    def __str__(self):
+        return f"{self.tipo} {self.anio}-{self.mes:02d}: {self.ultimo_folio}"
+
+    @staticmethod
+    def folio_mas_alto(tipo, anio, mes):
+        """Folio más alto ya usado en pólizas del tipo y mes (0 si no hay)."""
+        return Poliza.objects.filter(
+            tipo=tipo, fecha__year=anio, fecha__month=mes
+        ).aggregate(max_folio=models.Max('folio'))['max_folio'] or 0
+
+    @classmethod
+    def asignar(cls, tipo, fecha):
+        """Avanza y devuelve el folio del tipo y mes de `fecha`."""
+        secuencia = cls.objects.filter(tipo=tipo, anio=fecha.year, mes=fecha.month)
+        with transaction.atomic(savepoint=False):
+            if not secuencia.update(ultimo_folio=models.F('ultimo_folio') + 1):
+                try:
+                    with transaction.atomic():
+                        return cls.objects.create(
+                            tipo=tipo, anio=fecha.year, mes=fecha.month,
+                            ultimo_folio=cls.folio_mas_alto(tipo, fecha.year, fecha.month) + 1,
+                        ).ultimo_folio
+                except IntegrityError:
+                    # Otra transacción sembró el mes al mismo tiempo.
+                    secuencia.update(ultimo_folio=models.F('ultimo_folio') + 1)
+            return secuencia.values_list('ultimo_folio', flat=True).get()
 
 
 # ==========================================
 # 5. MOVIMIENTOS CONTABLES (LÍNEAS DE PÓLIZA)
 # ==========================================
 
+class MovimientoContableQuerySet(models.QuerySet):
+    """
+    Las escrituras masivas no disparan post_save/post_delete: aquí recalculan
+    los totales guardados de las pólizas que tocan. (`delete()` sí dispara
+    post_delete por fila, ver signals.py.)
+    """
+
+    def bulk_create(self, objs, *args, recalcular_totales=True, **kwargs):
+        # `recalcular_totales=False`: quien escribe ya lleva las cuentas (ver
+        # asientos.escribir_movimientos).
+        creados = super().bulk_create(objs, *args, **kwargs)
+        if recalcular_totales:
+            Poliza.recalcular_totales({m.poliza_id for m in creados})
+        return creados
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        objs = list(objs)
+        filas = super().bulk_update(objs, fields, *args, **kwargs)
+        if {'debe', 'haber', 'poliza', 'poliza_id'} & set(fields):
+            Poliza.recalcular_totales({m.poliza_id for m in objs})
+        return filas
+
+    def update(self, **kwargs):
+        if not {'debe', 'haber', 'poliza', 'poliza_id'} & set(kwargs):
+            return super().update(**kwargs)
+        poliza_ids = set(self.values_list('poliza_id', flat=True))
+        filas = super().update(**kwargs)
+        nueva = kwargs.get('poliza_id', kwargs.get('poliza'))
+        poliza_ids.add(getattr(nueva, 'pk', nueva))
+        Poliza.recalcular_totales(poliza_ids)
+        return filas
+
+
 class MovimientoContable(models.Model):
     """
     Línea individual de una póliza.
@@ -477,6 +595,8 @@ class MovimientoContable(models.Model):
         help_text="Número de cheque, transferencia, factura, etc."
     )
 
+    objects = MovimientoContableQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Movimiento contable"
         verbose_name_plural = "Movimientos"
@@ -510,3 +510,118 @@ def cerrar_historico_contable(fecha_corte, usuario, aplicar=False):
     for fila in informe['cuentas']:
         fila['saldo_despues'] = fila['cuenta'].saldo_a_fecha(fecha_corte)
     return informe
+
+
+def aplicar_polizas(polizas, usuario, aplicar=True):
+    """
+    Aplica de una vez los BORRADOR de `polizas` (un queryset de Poliza), con
+    las mismas reglas que `Poliza.aplicar()` una por una:
+
+    - Debe cuadrar: las sumas salen de una sola consulta agrupada sobre los
+      movimientos de toda la selección, no de los totales guardados, así
+      que un total desviado tampoco deja pasar una póliza descuadrada.
+    - Las regularizaciones de saldos (`requiere_autorizacion_direccion`)
+      solo las aplica Dirección (`usuario.is_superuser`).
+
+    Las válidas pasan a APLICADA en un solo UPDATE, que además vuelve a
+    guardar sus totales. Ninguna otra parte del ERP escucha el post_save de
+    Poliza, así que saltárselo no deja nada atrás.
+
+    Devuelve un informe con un renglón por póliza seleccionada (`resultado`:
+    'aplicada', 'no_cuadra', 'requiere_direccion' o 'no_es_borrador'); solo
+    escribe si `aplicar=True`.
+    """
+    from django.db.models import DecimalField, Value
+    from django.db.models.functions import Coalesce
+
+    from .models import Poliza
+
+    cero = Value(Decimal('0.00'), output_field=DecimalField())
+    with transaction.atomic():
+        # Bloqueo aparte: PostgreSQL no admite FOR UPDATE con GROUP BY.
+        ids = list(Poliza.objects.select_for_update().filter(
+            pk__in=polizas.values('pk'),
+        ).values_list('pk', flat=True))
+        filas = (
+            Poliza.objects.filter(pk__in=ids)
+            .values('pk', 'tipo', 'folio', 'fecha', 'estado', 'origen')
+            .annotate(
+                debe=Coalesce(Sum('movimientos__debe'), cero),
+                haber=Coalesce(Sum('movimientos__haber'), cero),
+            )
+            .order_by('fecha', 'tipo', 'folio')
+        )
+
+        resultados = []
+        validas = []
+        for fila in filas:
+            if fila['estado'] != 'BORRADOR':
+                resultado = 'no_es_borrador'
+            elif fila['origen'] in Poliza.ORIGENES_AUTORIZACION_DIRECCION and not usuario.is_superuser:
+                resultado = 'requiere_direccion'
+            elif abs(fila['debe'] - fila['haber']) >= Decimal('0.01'):
+                resultado = 'no_cuadra'
+            else:
+                resultado = 'aplicada'
+                validas.append(fila['pk'])
+            resultados.append({
+                'poliza_id': fila['pk'],
+                'poliza': f"{fila['tipo']}-{fila['folio']}",
+                'fecha': fila['fecha'],
+                'debe': fila['debe'],
+                'haber': fila['haber'],
+                'resultado': resultado,
+            })
+
+        informe = {
+            'resultados': resultados,
+            'aplicadas': len(validas),
+            'aplicado': False,
+        }
+        if not aplicar or not validas:
+            return informe
+
+        Poliza.objects.filter(pk__in=validas).update(
+            estado='APLICADA',
+            aplicada_por=usuario,
+            fecha_aplicacion=timezone.now(),
+        )
+        Poliza.recalcular_totales(validas)
+    informe['aplicado'] = True
+    return informe
+
+
+def cancelar_polizas(polizas, usuario, motivo):
+    """
+    Cancela en un solo UPDATE las `polizas` (queryset de Poliza) que no lo
+    estén ya. Igual que `Poliza.cancelar()`, los movimientos se conservan.
+
+    Devuelve un informe con un renglón por póliza (`resultado`: 'cancelada'
+    o 'ya_cancelada').
+    """
+    from .models import Poliza
+
+    with transaction.atomic():
+        filas = list(
+            Poliza.objects.select_for_update()
+            .filter(pk__in=polizas.values('pk'))
+            .values('pk', 'tipo', 'folio', 'fecha', 'estado')
+            .order_by('fecha', 'tipo', 'folio')
+        )
+        vivas = [f['pk'] for f in filas if f['estado'] != 'CANCELADA']
+        if vivas:
+            Poliza.objects.filter(pk__in=vivas).update(
+                estado='CANCELADA',
+                cancelada_por=usuario,
+                fecha_cancelacion=timezone.now(),
+                motivo_cancelacion=motivo,
+            )
+    return {
+        'resultados': [{
+            'poliza_id': f['pk'],
+            'poliza': f"{f['tipo']}-{f['folio']}",
+            'fecha': f['fecha'],
+            'resultado': 'ya_cancelada' if f['estado'] == 'CANCELADA' else 'cancelada',
+        } for f in filas],
+        'canceladas': len(vivas),
+    }
@@ -15,16 +15,16 @@ import logging
 from decimal import ROUND_HALF_UP, Decimal
 
 from django.conf import settings
-from django.contrib.auth.models import User
 from django.contrib.contenttypes.models import ContentType
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 
 from core_erp import impuestos
 
 logger = logging.getLogger(__name__)
 
-from .models import ConfiguracionContable, MovimientoContable, Poliza, UnidadNegocio
+from .asientos import AsientoBuilder, catalogo, escribir_movimientos
+from .models import MovimientoContable, Poliza
 
 
 def signals_enabled():
@@ -34,38 +34,49 @@ def signals_enabled():
 
 def get_usuario_sistema():
     """Obtiene o crea el usuario del sistema para pólizas automáticas."""
-    usuario, _ = User.objects.get_or_create(
-        username='sistema_contable',
-        defaults={
-            'first_name': 'Sistema',
-            'last_name': 'Contable',
-            'is_active': False,
-        }
-    )
-    return usuario
+    return catalogo().usuario()
 
 
 def get_cuenta(operacion):
     """Obtiene la cuenta configurada para una operación."""
-    try:
-        config = ConfiguracionContable.objects.get(operacion=operacion, activa=True)
-        return config.cuenta
-    except ConfiguracionContable.DoesNotExist:
-        return None
+    return catalogo().cuenta(operacion)
 
 
 def get_unidad_negocio(clave):
-    """Obtiene una unidad de negocio por clave."""
-    try:
-        return UnidadNegocio.objects.get(clave=clave)
-    except UnidadNegocio.DoesNotExist:
-        # Fallback: primera unidad activa
-        return UnidadNegocio.objects.filter(activa=True).first()
+    """Obtiene una unidad de negocio por clave (o la primera activa)."""
+    return catalogo().unidad(clave)
 
 
 from comercial.services import calcular_desglose_proporcional  # noqa: F401 — shared fiscal logic
 
 
+# ==========================================
+# TOTALES GUARDADOS DE LA PÓLIZA
+# ==========================================
+# No dependen de CONTABILIDAD_SIGNALS_ENABLED: son parte del dato, no una
+# póliza automática. Las escrituras masivas los mantienen en
+# MovimientoContableQuerySet.
+@receiver(post_save, sender=MovimientoContable, dispatch_uid='totales_poliza_save')
+@receiver(post_delete, sender=MovimientoContable, dispatch_uid='totales_poliza_delete')
+def actualizar_totales_poliza(sender, instance, origin=None, **kwargs):
+    """
+    Vuelve a sumar los totales de la póliza del movimiento. Si el movimiento
+    trae la póliza ya cargada (p. ej. `create(poliza=poliza)`), es esa misma
+    instancia la que queda al día.
+    """
+    if not instance.poliza_id:
+        return
+    # Al borrar la póliza sus movimientos caen en cascada: no hay totales
+    # que mantener en una póliza que va a desaparecer.
+    if isinstance(origin, Poliza):
+        return
+    if MovimientoContable.poliza.is_cached(instance):
+        poliza = instance.poliza
+    else:
+        poliza = Poliza(pk=instance.poliza_id)
+    poliza.actualizar_totales()
+
+
 # ==========================================
 # SIGNAL: PAGO DE CLIENTE (comercial.Pago)
 # ==========================================
@@ -104,26 +115,24 @@ def crear_poliza_pago_cliente(sender, instance, created, **kwargs):
         crear_poliza_ingreso_extra(pago)
         return
 
+    cat = catalogo()
+
     # ─── Determinar cuenta de cargo según método de pago ────────
     if pago.metodo == 'EFECTIVO':
-        cuenta_cargo = get_cuenta('CAJA')
-    elif pago.metodo in ('TRANSFERENCIA', 'DEPOSITO'):
-        cuenta_cargo = get_cuenta('BANCO_PRINCIPAL')
-    elif pago.metodo in ('TARJETA_CREDITO', 'TARJETA_DEBITO'):
-        cuenta_cargo = get_cuenta('BANCO_PRINCIPAL')
+        cuenta_cargo = cat.cuenta('CAJA')
     else:
-        cuenta_cargo = get_cuenta('BANCO_PRINCIPAL')
+        cuenta_cargo = cat.cuenta('BANCO_PRINCIPAL')
 
     # ─── Determinar cuenta de abono principal ───────────────────
     # Anticipo si el evento no se ha ejecutado, Ingreso si ya se ejecutó
     if cotizacion.estado in ('EJECUTADA', 'CERRADA'):
-        cuenta_abono = get_cuenta('INGRESO_EVENTOS')
+        cuenta_abono = cat.cuenta('INGRESO_EVENTOS')
     else:
-        cuenta_abono = get_cuenta('ANTICIPO_CLIENTES')
+        cuenta_abono = cat.cuenta('ANTICIPO_CLIENTES')
 
     # ─── Obtener cuentas de impuestos ───────────────────────────
-    cuenta_iva_trasladado = get_cuenta('IVA_TRASLADADO')
-    cuenta_isr_retenido = get_cuenta('ISR_RETENIDO_CLIENTES')
+    cuenta_iva_trasladado = cat.cuenta('IVA_TRASLADADO')
+    cuenta_isr_retenido = cat.cuenta('ISR_RETENIDO_CLIENTES')
 
     # Validar que existan las cuentas mínimas
     if not cuenta_cargo or not cuenta_abono:
@@ -134,7 +143,7 @@ def crear_poliza_pago_cliente(sender, instance, created, **kwargs):
         return
 
     # ─── Obtener unidad de negocio ──────────────────────────────
-    unidad = get_unidad_negocio('QUINTA')
+    unidad = cat.unidad('QUINTA')
     if not unidad:
         logger.warning("Póliza NO generada para Pago #%s: falta UnidadNegocio 'QUINTA'", pago.pk)
         return
@@ -146,74 +155,32 @@ def crear_poliza_pago_cliente(sender, instance, created, **kwargs):
     retencion_isr = desglose['retencion_isr']
 
     # ─── Crear póliza ───────────────────────────────────────────
-    usuario = get_usuario_sistema()
-    content_type = ContentType.objects.get_for_model(pago)
-
-    poliza = Poliza.objects.create(
-        tipo='I',
-        folio=Poliza.siguiente_folio('I', pago.fecha_pago),
-        fecha=pago.fecha_pago,
-        concepto=f"Pago cliente: {cotizacion.cliente.nombre} - {cotizacion.nombre_evento}",
-        unidad_negocio=unidad,
-        estado='APLICADA',
-        origen='PAGO_CLIENTE',
-        content_type=content_type,
-        object_id=pago.pk,
-        created_by=usuario,
+    asiento = AsientoBuilder(
+        'I', pago.fecha_pago,
+        f"Pago cliente: {cotizacion.cliente.nombre} - {cotizacion.nombre_evento}",
+        'PAGO_CLIENTE', documento=pago,
     )
 
     # ─── DEBE: Bancos/Caja (monto neto recibido) ────────────────
-    MovimientoContable.objects.create(
-        poliza=poliza,
-        cuenta=cuenta_cargo,
-        debe=monto,
-        haber=Decimal('0.00'),
-        concepto=f"Pago {pago.get_metodo_display()}",
-        referencia=pago.referencia or '',
-    )
+    asiento.cargo(cuenta_cargo, monto, f"Pago {pago.get_metodo_display()}", pago.referencia or '')
 
     # ─── DEBE: ISR retenido por cliente (si aplica) ─────────────
     # Cuando cliente MORAL retiene ISR, es un impuesto a FAVOR de QKT
     if cuenta_isr_retenido and retencion_isr > 0:
-        MovimientoContable.objects.create(
-            poliza=poliza,
-            cuenta=cuenta_isr_retenido,
-            debe=retencion_isr,
-            haber=Decimal('0.00'),
-            concepto="ISR retenido por cliente (1.25%)",
-            referencia=f"COT-{cotizacion.pk:03d}",
-        )
+        asiento.cargo(cuenta_isr_retenido, retencion_isr,
+                      "ISR retenido por cliente (1.25%)", f"COT-{cotizacion.pk:03d}")
 
     # ─── HABER: Anticipo/Ingreso (subtotal sin IVA) ─────────────
-    MovimientoContable.objects.create(
-        poliza=poliza,
-        cuenta=cuenta_abono,
-        debe=Decimal('0.00'),
-        haber=subtotal,
-        concepto=f"COT-{cotizacion.pk:03d} (Subtotal)",
-        referencia=pago.referencia or '',
-    )
+    asiento.abono(cuenta_abono, subtotal, f"COT-{cotizacion.pk:03d} (Subtotal)", pago.referencia or '')
 
     # ─── HABER: IVA trasladado ──────────────────────────────────
     if cuenta_iva_trasladado and iva > 0:
-        MovimientoContable.objects.create(
-            poliza=poliza,
-            cuenta=cuenta_iva_trasladado,
-            debe=Decimal('0.00'),
-            haber=iva,
-            concepto="IVA trasladado 16%",
-            referencia=f"COT-{cotizacion.pk:03d}",
-        )
+        asiento.abono(cuenta_iva_trasladado, iva, "IVA trasladado 16%", f"COT-{cotizacion.pk:03d}")
     elif iva > 0:
         # Fallback: si no hay cuenta IVA configurada, incluir en ingreso
-        MovimientoContable.objects.create(
-            poliza=poliza,
-            cuenta=cuenta_abono,
-            debe=Decimal('0.00'),
-            haber=iva,
-            concepto=f"COT-{cotizacion.pk:03d} (IVA incluido)",
-            referencia=pago.referencia or '',
-        )
+        asiento.abono(cuenta_abono, iva, f"COT-{cotizacion.pk:03d} (IVA incluido)", pago.referencia or '')
+
+    asiento.guardar(unidad, cat.usuario())
 
     # ─── Comisión de terminal (TPV), si se capturó ──────────────
     if pago.metodo in ('TARJETA_CREDITO', 'TARJETA_DEBITO') and pago.comision_tpv:
@@ -250,9 +217,10 @@ def crear_poliza_comision_tpv(pago):
     if Poliza.objects.filter(content_type=content_type, object_id=pago.pk, origen='COMISION_TPV').exists():
         return None  # idempotencia
 
-    cuenta_gasto = get_cuenta('GASTO_BANCARIOS')
-    cuenta_iva = get_cuenta('IVA_ACREDITABLE')
-    cuenta_banco = get_cuenta('BANCO_PRINCIPAL')
+    cat = catalogo()
+    cuenta_gasto = cat.cuenta('GASTO_BANCARIOS')
+    cuenta_iva = cat.cuenta('IVA_ACREDITABLE')
+    cuenta_banco = cat.cuenta('BANCO_PRINCIPAL')
     if not cuenta_gasto or not cuenta_banco:
         logger.warning(
             "Comisión TPV no registrada para Pago #%s: falta configuración contable "
@@ -261,7 +229,7 @@ def crear_poliza_comision_tpv(pago):
         )
         return None
 
-    unidad = get_unidad_negocio('QUINTA')
+    unidad = cat.unidad('QUINTA')
     if not unidad:
         logger.warning("Comisión TPV no registrada para Pago #%s: falta UnidadNegocio 'QUINTA'", pago.pk)
         return None
@@ -274,56 +242,20 @@ def crear_poliza_comision_tpv(pago):
         comision_neta = comision_total
         iva = Decimal('0.00')
 
-    poliza = Poliza.objects.create(
-        tipo='E',
-        folio=Poliza.siguiente_folio('E', pago.fecha_pago),
-        fecha=pago.fecha_pago,
-        concepto=f"Comisión terminal BBVA — COT-{pago.cotizacion_id:03d} ({pago.cotizacion.cliente.nombre})",
-        unidad_negocio=unidad,
-        estado='APLICADA',
-        origen='COMISION_TPV',
-        content_type=content_type,
-        object_id=pago.pk,
-        created_by=get_usuario_sistema(),
-    )
-
-    MovimientoContable.objects.create(
-        poliza=poliza,
-        cuenta=cuenta_gasto,
-        debe=comision_neta,
-        haber=Decimal('0.00'),
-        concepto="Comisión terminal TPV",
-        referencia=f"COT-{pago.cotizacion_id:03d}",
+    referencia = f"COT-{pago.cotizacion_id:03d}"
+    asiento = AsientoBuilder(
+        'E', pago.fecha_pago,
+        f"Comisión terminal BBVA — {referencia} ({pago.cotizacion.cliente.nombre})",
+        'COMISION_TPV', documento=pago,
     )
+    asiento.cargo(cuenta_gasto, comision_neta, "Comisión terminal TPV", referencia)
     if cuenta_iva and iva > 0:
-        MovimientoContable.objects.create(
-            poliza=poliza,
-            cuenta=cuenta_iva,
-            debe=iva,
-            haber=Decimal('0.00'),
-            concepto="IVA acreditable comisión TPV",
-            referencia=f"COT-{pago.cotizacion_id:03d}",
-        )
+        asiento.cargo(cuenta_iva, iva, "IVA acreditable comisión TPV", referencia)
     elif iva > 0:
-        MovimientoContable.objects.create(
-            poliza=poliza,
-            cuenta=cuenta_gasto,
-            debe=iva,
-            haber=Decimal('0.00'),
-            concepto="IVA comisión TPV (incluido en gasto)",
-            referencia=f"COT-{pago.cotizacion_id:03d}",
-        )
-
-    MovimientoContable.objects.create(
-        poliza=poliza,
-        cuenta=cuenta_banco,
-        debe=Decimal('0.00'),
-        haber=comision_total,
-        concepto="Comisión TPV descontada del depósito",
-        referencia=f"COT-{pago.cotizacion_id:03d}",
-    )
+        asiento.cargo(cuenta_gasto, iva, "IVA comisión TPV (incluido en gasto)", referencia)
+    asiento.abono(cuenta_banco, comision_total, "Comisión TPV descontada del depósito", referencia)
 
-    return poliza
+    return asiento.guardar(unidad, cat.usuario())
 
 
 # ==========================================
@@ -344,11 +276,12 @@ def crear_poliza_ingreso_extra(pago):
     cotizacion = pago.cotizacion
     monto = Decimal(str(pago.monto))
 
+    cat = catalogo()
     if pago.metodo == 'EFECTIVO':
-        cuenta_cargo = get_cuenta('CAJA')
+        cuenta_cargo = cat.cuenta('CAJA')
     else:
-        cuenta_cargo = get_cuenta('BANCO_PRINCIPAL')
-    cuenta_abono = get_cuenta('OTROS_INGRESOS_CLIENTE')
+        cuenta_cargo = cat.cuenta('BANCO_PRINCIPAL')
+    cuenta_abono = cat.cuenta('OTROS_INGRESOS_CLIENTE')
 
     if not cuenta_cargo or not cuenta_abono:
         logger.warning(
@@ -357,39 +290,19 @@ def crear_poliza_ingreso_extra(pago):
         )
         return
 
-    unidad = get_unidad_negocio('QUINTA')
+    unidad = cat.unidad('QUINTA')
     if not unidad:
         logger.warning("Póliza NO generada para Pago (EXTRA) #%s: falta UnidadNegocio 'QUINTA'", pago.pk)
         return
 
-    usuario = get_usuario_sistema()
-    content_type = ContentType.objects.get_for_model(pago)
-
-    poliza = Poliza.objects.create(
-        tipo='I',
-        folio=Poliza.siguiente_folio('I', pago.fecha_pago),
-        fecha=pago.fecha_pago,
-        concepto=f"Ingreso adicional: {cotizacion.cliente.nombre} - {cotizacion.nombre_evento} (COT-{cotizacion.pk:03d})",
-        unidad_negocio=unidad,
-        estado='APLICADA',
-        origen='PAGO_CLIENTE',
-        content_type=content_type,
-        object_id=pago.pk,
-        created_by=usuario,
-    )
-
-    MovimientoContable.objects.create(
-        poliza=poliza, cuenta=cuenta_cargo,
-        debe=monto, haber=Decimal('0.00'),
-        concepto=f"Ingreso adicional — {pago.get_metodo_display()}",
-        referencia=pago.referencia or '',
-    )
-    MovimientoContable.objects.create(
-        poliza=poliza, cuenta=cuenta_abono,
-        debe=Decimal('0.00'), haber=monto,
-        concepto=f"COT-{cotizacion.pk:03d} — ingreso adicional",
-        referencia=pago.referencia or '',
+    asiento = AsientoBuilder(
+        'I', pago.fecha_pago,
+        f"Ingreso adicional: {cotizacion.cliente.nombre} - {cotizacion.nombre_evento} (COT-{cotizacion.pk:03d})",
+        'PAGO_CLIENTE', documento=pago,
     )
+    asiento.cargo(cuenta_cargo, monto, f"Ingreso adicional — {pago.get_metodo_display()}", pago.referencia or '')
+    asiento.abono(cuenta_abono, monto, f"COT-{cotizacion.pk:03d} — ingreso adicional", pago.referencia or '')
+    asiento.guardar(unidad, cat.usuario())
 
 
 # ==========================================
@@ -429,9 +342,10 @@ def crear_poliza_comision_openpay(transaccion, fee):
     ).exists():
         return None  # ya registrada (idempotencia ante reintentos del webhook)
 
-    cuenta_gasto = get_cuenta('GASTO_BANCARIOS')
-    cuenta_iva = get_cuenta('IVA_ACREDITABLE')
-    cuenta_banco = get_cuenta('BANCO_PRINCIPAL')
+    cat = catalogo()
+    cuenta_gasto = cat.cuenta('GASTO_BANCARIOS')
+    cuenta_iva = cat.cuenta('IVA_ACREDITABLE')
+    cuenta_banco = cat.cuenta('BANCO_PRINCIPAL')
     if not cuenta_gasto or not cuenta_banco:
         logger.warning(
             "Comisión Openpay no registrada para %s: falta configuración contable "
@@ -440,64 +354,28 @@ def crear_poliza_comision_openpay(transaccion, fee):
         )
         return None
 
-    unidad = get_unidad_negocio('QUINTA')
+    unidad = cat.unidad('QUINTA')
     if not unidad:
         logger.warning("Comisión Openpay no registrada para %s: falta UnidadNegocio 'QUINTA'", transaccion.openpay_id)
         return None
 
     fecha = transaccion.pago.fecha_pago if transaccion.pago else transaccion.created_at.date()
 
-    poliza = Poliza.objects.create(
-        tipo='E',
-        folio=Poliza.siguiente_folio('E', fecha),
-        fecha=fecha,
-        concepto=f"Comisión Openpay {transaccion.metodo or ''} — {transaccion.openpay_id}".strip(),
-        unidad_negocio=unidad,
-        estado='APLICADA',
-        origen='COMISION_OPENPAY',
-        content_type=content_type,
-        object_id=transaccion.pk,
-        created_by=get_usuario_sistema(),
-    )
-
-    MovimientoContable.objects.create(
-        poliza=poliza,
-        cuenta=cuenta_gasto,
-        debe=comision,
-        haber=Decimal('0.00'),
-        concepto="Comisión Openpay",
-        referencia=transaccion.openpay_id,
+    referencia = transaccion.openpay_id
+    asiento = AsientoBuilder(
+        'E', fecha,
+        f"Comisión Openpay {transaccion.metodo or ''} — {transaccion.openpay_id}".strip(),
+        'COMISION_OPENPAY', documento=transaccion,
     )
+    asiento.cargo(cuenta_gasto, comision, "Comisión Openpay", referencia)
     if cuenta_iva and iva > 0:
-        MovimientoContable.objects.create(
-            poliza=poliza,
-            cuenta=cuenta_iva,
-            debe=iva,
-            haber=Decimal('0.00'),
-            concepto="IVA acreditable comisión Openpay",
-            referencia=transaccion.openpay_id,
-        )
+        asiento.cargo(cuenta_iva, iva, "IVA acreditable comisión Openpay", referencia)
     elif iva > 0:
         # Sin cuenta de IVA acreditable configurada: se incluye en el gasto
-        MovimientoContable.objects.create(
-            poliza=poliza,
-            cuenta=cuenta_gasto,
-            debe=iva,
-            haber=Decimal('0.00'),
-            concepto="IVA comisión Openpay (incluido en gasto)",
-            referencia=transaccion.openpay_id,
-        )
+        asiento.cargo(cuenta_gasto, iva, "IVA comisión Openpay (incluido en gasto)", referencia)
+    asiento.abono(cuenta_banco, comision + iva, "Comisión Openpay descontada del depósito", referencia)
 
-    MovimientoContable.objects.create(
-        poliza=poliza,
-        cuenta=cuenta_banco,
-        debe=Decimal('0.00'),
-        haber=comision + iva,
-        concepto="Comisión Openpay descontada del depósito",
-        referencia=transaccion.openpay_id,
-    )
-
-    return poliza
+    return asiento.guardar(unidad, cat.usuario())
 
 
 # ==========================================
@@ -516,14 +394,15 @@ def crear_poliza_reembolso_cliente(pago):
     cotizacion = pago.cotizacion
     monto = Decimal(str(pago.monto))
 
+    cat = catalogo()
     if pago.metodo == 'EFECTIVO':
-        cuenta_banco = get_cuenta('CAJA')
+        cuenta_banco = cat.cuenta('CAJA')
     else:
-        cuenta_banco = get_cuenta('BANCO_PRINCIPAL')
+        cuenta_banco = cat.cuenta('BANCO_PRINCIPAL')
 
-    cuenta_anticipo = get_cuenta('ANTICIPO_CLIENTES')
-    cuenta_iva = get_cuenta('IVA_TRASLADADO')
-    cuenta_isr_ret = get_cuenta('ISR_RETENIDO_CLIENTES')
+    cuenta_anticipo = cat.cuenta('ANTICIPO_CLIENTES')
+    cuenta_iva = cat.cuenta('IVA_TRASLADADO')
+    cuenta_isr_ret = cat.cuenta('ISR_RETENIDO_CLIENTES')
 
     if not cuenta_banco or not cuenta_anticipo:
         logger.warning(
@@ -531,7 +410,7 @@ def crear_poliza_reembolso_cliente(pago):
         )
         return
 
-    unidad = get_unidad_negocio('QUINTA')
+    unidad = cat.unidad('QUINTA')
     if not unidad:
         logger.warning("Póliza NO generada para Reembolso #%s: falta UnidadNegocio", pago.pk)
         return
@@ -541,48 +420,18 @@ def crear_poliza_reembolso_cliente(pago):
     iva = desglose['iva']
     retencion_isr = desglose['retencion_isr']
 
-    usuario = get_usuario_sistema()
-    content_type = ContentType.objects.get_for_model(pago)
-
-    poliza = Poliza.objects.create(
-        tipo='E',
-        folio=Poliza.siguiente_folio('E', pago.fecha_pago),
-        fecha=pago.fecha_pago,
-        concepto=f"Reembolso cliente: {cotizacion.cliente.nombre} - {cotizacion.nombre_evento}",
-        unidad_negocio=unidad,
-        estado='APLICADA',
-        origen='PAGO_CLIENTE',
-        content_type=content_type,
-        object_id=pago.pk,
-        created_by=usuario,
-    )
-
-    MovimientoContable.objects.create(
-        poliza=poliza, cuenta=cuenta_anticipo,
-        debe=subtotal, haber=Decimal('0.00'),
-        concepto=f"Reembolso COT-{cotizacion.pk:03d} (Subtotal)",
-        referencia=pago.referencia or '',
+    asiento = AsientoBuilder(
+        'E', pago.fecha_pago,
+        f"Reembolso cliente: {cotizacion.cliente.nombre} - {cotizacion.nombre_evento}",
+        'PAGO_CLIENTE', documento=pago,
     )
+    asiento.cargo(cuenta_anticipo, subtotal, f"Reembolso COT-{cotizacion.pk:03d} (Subtotal)", pago.referencia or '')
     if cuenta_iva and iva > 0:
-        MovimientoContable.objects.create(
-            poliza=poliza, cuenta=cuenta_iva,
-            debe=iva, haber=Decimal('0.00'),
-            concepto="Reverso IVA trasladado 16%",
-            referencia=f"COT-{cotizacion.pk:03d}",
-        )
+        asiento.cargo(cuenta_iva, iva, "Reverso IVA trasladado 16%", f"COT-{cotizacion.pk:03d}")
     if cuenta_isr_ret and retencion_isr > 0:
-        MovimientoContable.objects.create(
-            poliza=poliza, cuenta=cuenta_isr_ret,
-            debe=Decimal('0.00'), haber=retencion_isr,
-            concepto="Reverso ISR retenido por cliente",
-            referencia=f"COT-{cotizacion.pk:03d}",
-        )
-    MovimientoContable.objects.create(
-        poliza=poliza, cuenta=cuenta_banco,
-        debe=Decimal('0.00'), haber=monto,
-        concepto=f"Devolución {pago.get_metodo_display()}",
-        referencia=pago.referencia or '',
-    )
+        asiento.abono(cuenta_isr_ret, retencion_isr, "Reverso ISR retenido por cliente", f"COT-{cotizacion.pk:03d}")
+    asiento.abono(cuenta_banco, monto, f"Devolución {pago.get_metodo_display()}", pago.referencia or '')
+    asiento.guardar(unidad, cat.usuario())
 
 
 # ==========================================
@@ -613,7 +462,7 @@ def crear_polizas_reversion_cancelacion(cotizacion, usuario=None, motivo=''):
         content_type=pago_ct,
         object_id__in=pagos.values_list('pk', flat=True),
         estado='APLICADA',
-    ).prefetch_related('movimientos')
+    )
 
     for original in polizas_originales:
         # Idempotencia: evitar reversiones duplicadas
@@ -626,33 +475,20 @@ def crear_polizas_reversion_cancelacion(cotizacion, usuario=None, motivo=''):
         if ya_revertida:
             continue
 
-        reversion = Poliza.objects.create(
-            tipo='D',
-            folio=Poliza.siguiente_folio('D', cotizacion.fecha_cancelacion.date() if cotizacion.fecha_cancelacion else original.fecha),
-            fecha=cotizacion.fecha_cancelacion.date() if cotizacion.fecha_cancelacion else original.fecha,
-            concepto=f"Reversión cancelación COT-{cotizacion.pk:03d}: {motivo or 'Cancelada'}"[:500],
-            unidad_negocio=original.unidad_negocio,
-            estado='APLICADA',
-            origen='AJUSTE',
-            content_type=pago_ct,
-            object_id=original.object_id,
-            created_by=usuario,
+        asiento = AsientoBuilder(
+            'D', cotizacion.fecha_cancelacion.date() if cotizacion.fecha_cancelacion else original.fecha,
+            f"Reversión cancelación COT-{cotizacion.pk:03d}: {motivo or 'Cancelada'}",
+            'AJUSTE',
         )
-        for mov in original.movimientos.all():
-            MovimientoContable.objects.create(
-                poliza=reversion,
-                cuenta=mov.cuenta,
-                debe=mov.haber,
-                haber=mov.debe,
-                concepto=f"Reversión: {mov.concepto}"[:255],
-                referencia=mov.referencia,
-            )
+        asiento.revertir(original)
+        asiento.guardar(original.unidad_negocio, usuario,
+                        content_type=pago_ct, object_id=original.object_id)
 
 
 # ==========================================
 # SIGNAL: PAGO AIRBNB (airbnb.PagoAirbnb)
 # ==========================================
-def _cuenta_si_hay_importe(operacion, importe, faltantes):
+def _cuenta_si_hay_importe(cat, operacion, importe, faltantes):
     """
     Cuenta configurada para `operacion`, solo si el importe la necesita.
 
@@ -662,13 +498,13 @@ def _cuenta_si_hay_importe(operacion, importe, faltantes):
     """
     if importe <= 0:
         return None
-    cuenta = get_cuenta(operacion)
+    cuenta = cat.cuenta(operacion)
     if cuenta is None:
         faltantes.append(operacion)
     return cuenta
 
 
-def _asiento_pago_airbnb(pago):
+def _asiento_pago_airbnb(pago, cat):
     """
     Líneas del asiento de un pago de Airbnb, como tuplas
     `(cuenta, debe, haber, concepto, referencia)`.
@@ -695,21 +531,21 @@ def _asiento_pago_airbnb(pago):
     """
     faltantes = []
 
-    cuenta_banco = get_cuenta('BANCO_PRINCIPAL')
+    cuenta_banco = cat.cuenta('BANCO_PRINCIPAL')
     if cuenta_banco is None:
         faltantes.append('BANCO_PRINCIPAL')
-    cuenta_ingreso = get_cuenta('INGRESO_AIRBNB')
+    cuenta_ingreso = cat.cuenta('INGRESO_AIRBNB')
     if cuenta_ingreso is None:
         faltantes.append('INGRESO_AIRBNB')
 
     cuenta_ret_isr = _cuenta_si_hay_importe(
-        'RETENCION_ISR_AIRBNB', pago.retencion_isr, faltantes)
+        cat, 'RETENCION_ISR_AIRBNB', pago.retencion_isr, faltantes)
     cuenta_ret_iva = _cuenta_si_hay_importe(
-        'RETENCION_IVA_AIRBNB', pago.retencion_iva, faltantes)
+        cat, 'RETENCION_IVA_AIRBNB', pago.retencion_iva, faltantes)
     cuenta_comision = _cuenta_si_hay_importe(
-        'COMISION_AIRBNB', pago.comision_airbnb, faltantes)
+        cat, 'COMISION_AIRBNB', pago.comision_airbnb, faltantes)
     cuenta_iva_trasladado = _cuenta_si_hay_importe(
-        'IVA_TRASLADADO', pago.iva_trasladado, faltantes)
+        cat, 'IVA_TRASLADADO', pago.iva_trasladado, faltantes)
 
     if faltantes:
         logger.warning(
@@ -766,11 +602,7 @@ def _estado_segun_cuadre(lineas, pago):
 def _escribir_movimientos(poliza, lineas):
     """Reescribe los movimientos de una póliza a partir de `lineas`."""
     poliza.movimientos.all().delete()
-    for cuenta, debe, haber, concepto, referencia in lineas:
-        MovimientoContable.objects.create(
-            poliza=poliza, cuenta=cuenta, debe=debe, haber=haber,
-            concepto=concepto, referencia=referencia,
-        )
+    escribir_movimientos(poliza, lineas)
 
 
 def _movimientos_actuales(poliza):
@@ -810,28 +642,13 @@ def _esta_revertido(pago):
 
 def _poliza_espejo(origen, pago, concepto, fecha):
     """Crea una póliza de diario que invierte los movimientos de `origen`."""
-    espejo = Poliza.objects.create(
-        tipo='D',
-        folio=Poliza.siguiente_folio('D', fecha),
-        fecha=fecha,
-        concepto=concepto[:500],
-        unidad_negocio=origen.unidad_negocio,
-        estado='APLICADA',
-        origen='AJUSTE',
-        content_type=origen.content_type,
+    asiento = AsientoBuilder('D', fecha, concepto, 'AJUSTE')
+    asiento.revertir(origen)
+    return asiento.guardar(
+        origen.unidad_negocio, get_usuario_sistema(),
+        content_type=ContentType.objects.get_for_id(origen.content_type_id),
         object_id=origen.object_id,
-        created_by=get_usuario_sistema(),
     )
-    for mov in origen.movimientos.all():
-        MovimientoContable.objects.create(
-            poliza=espejo,
-            cuenta=mov.cuenta,
-            debe=mov.haber,
-            haber=mov.debe,
-            concepto=f"Reversión: {mov.concepto}"[:255],
-            referencia=mov.referencia,
-        )
-    return espejo
 
 
 @receiver(post_save, sender='airbnb.PagoAirbnb')
@@ -877,7 +694,8 @@ def sincronizar_poliza_pago_airbnb(sender, instance, created, **kwargs):
             )
         return
 
-    lineas = _asiento_pago_airbnb(pago)
+    cat = catalogo()
+    lineas = _asiento_pago_airbnb(pago, cat)
     if lineas is None:
         return
 
@@ -887,26 +705,16 @@ def sincronizar_poliza_pago_airbnb(sender, instance, created, **kwargs):
     estado = _estado_segun_cuadre(lineas, pago)
 
     if poliza is None:
-        unidad = get_unidad_negocio('AIRBNB')
+        unidad = cat.unidad('AIRBNB')
         if not unidad:
             logger.warning(
                 "Póliza NO generada para PagoAirbnb #%s: falta UnidadNegocio "
                 "'AIRBNB'", pago.pk
             )
             return
-        poliza = Poliza.objects.create(
-            tipo='I',
-            folio=Poliza.siguiente_folio('I', fecha_poliza),
-            fecha=fecha_poliza,
-            concepto=concepto[:500],
-            unidad_negocio=unidad,
-            estado=estado,
-            origen='PAGO_AIRBNB',
-            content_type=content_type,
-            object_id=pago.pk,
-            created_by=get_usuario_sistema(),
-        )
-        _escribir_movimientos(poliza, lineas)
+        asiento = AsientoBuilder('I', fecha_poliza, concepto, 'PAGO_AIRBNB',
+                                 documento=pago, estado=estado)
+        asiento.extender(lineas).guardar(unidad, cat.usuario())
         return
 
     # El pago volvió a PAGADO tras una reversión: se compensa antes de
@@ -988,23 +796,25 @@ MAPEO_CATEGORIA_CUENTA = {
 }
 
 
-def get_cuenta_por_categoria(categoria):
+def get_cuenta_por_categoria(categoria, cat=None):
     """
     Obtiene la cuenta contable apropiada según la categoría del gasto.
 
     Args:
         categoria: str - Categoría del gasto (puede ser None)
+        cat: Catalogo ya leído (opcional, para no releerlo)
 
     Returns:
         CuentaContable o None
     """
+    cat = cat or catalogo()
     if not categoria:
-        return get_cuenta('GASTOS_GENERALES')
+        return cat.cuenta('GASTOS_GENERALES')
 
     # Buscar mapeo exacto
     operacion = MAPEO_CATEGORIA_CUENTA.get(categoria.upper())
     if operacion:
-        cuenta = get_cuenta(operacion)
+        cuenta = cat.cuenta(operacion)
         if cuenta:
             return cuenta
 
@@ -1012,12 +822,12 @@ def get_cuenta_por_categoria(categoria):
     categoria_upper = categoria.upper()
     for keyword, op in MAPEO_CATEGORIA_CUENTA.items():
         if keyword in categoria_upper:
-            cuenta = get_cuenta(op)
+            cuenta = cat.cuenta(op)
             if cuenta:
                 return cuenta
 
     # Fallback a gastos generales
-    return get_cuenta('GASTOS_GENERALES')
+    return cat.cuenta('GASTOS_GENERALES')
 
 
 # ==========================================
@@ -1038,9 +848,10 @@ def crear_poliza_compra(sender, instance, created, **kwargs):
     if compra.total <= 0:
         return
 
-    cuenta_iva = get_cuenta('IVA_ACREDITABLE')
+    cat = catalogo()
+    cuenta_iva = cat.cuenta('IVA_ACREDITABLE')
     categoria = getattr(compra, 'categoria', None)
-    cuenta_gasto = get_cuenta_por_categoria(categoria)
+    cuenta_gasto = get_cuenta_por_categoria(categoria, cat)
 
     if not cuenta_gasto:
         logger.warning("Póliza NO generada para Compra #%s: falta cuenta de gasto", compra.pk)
@@ -1066,53 +877,31 @@ def crear_poliza_compra(sender, instance, created, **kwargs):
         # Se necesita una UnidadNegocio para crear la Poliza (campo no-nulo en el modelo).
         # Si falta, se usa temporalmente 'QUINTA' solo para poder guardar el BORRADOR,
         # pero el estado BORRADOR deja claro que debe revisarse y no se cuenta en reportes.
-        unidad = unidad or get_unidad_negocio('QUINTA')
+        unidad = unidad or cat.unidad('QUINTA')
 
-    usuario = get_usuario_sistema()
-    content_type = ContentType.objects.get_for_model(compra)
     fecha_poliza = compra.fecha_emision or compra.uploaded_at.date()
 
     concepto_poliza = f"Compra: {compra.proveedor_display or 'Proveedor'}" + (f" [{categoria}]" if categoria else "")
     if not compra.es_deducible:
         concepto_poliza += " [SIN CFDI - NO DEDUCIBLE]"
 
-    poliza = Poliza.objects.create(
-        tipo='E',
-        folio=Poliza.siguiente_folio('E', fecha_poliza),
-        fecha=fecha_poliza,
-        concepto=concepto_poliza,
-        unidad_negocio=unidad,
-        estado=estado_poliza,
-        origen='COMPRA',
-        content_type=content_type,
-        object_id=compra.pk,
-        created_by=usuario,
-    )
+    asiento = AsientoBuilder('E', fecha_poliza, concepto_poliza, 'COMPRA',
+                             documento=compra, estado=estado_poliza)
 
     # Sin CFDI no hay IVA acreditable ante el SAT: el total completo (incluido
     # lo que hubiera sido IVA) se carga como gasto no deducible, en vez de
     # separar una porción como "acreditable" que en realidad no se puede acreditar.
     monto_gasto = compra.subtotal if (compra.es_deducible and cuenta_iva and compra.iva > 0) else compra.total
 
-    MovimientoContable.objects.create(
-        poliza=poliza, cuenta=cuenta_gasto,
-        debe=monto_gasto, haber=Decimal('0.00'),
-        concepto=compra.proveedor_display[:100] if compra.proveedor_display else "Compra",
-        referencia=compra.uuid[:20] if compra.uuid else '',
-    )
+    referencia = compra.uuid[:20] if compra.uuid else ''
+    asiento.cargo(cuenta_gasto, monto_gasto,
+                  compra.proveedor_display[:100] if compra.proveedor_display else "Compra", referencia)
 
     if compra.es_deducible and cuenta_iva and compra.iva > 0:
-        MovimientoContable.objects.create(
-            poliza=poliza, cuenta=cuenta_iva,
-            debe=compra.iva, haber=Decimal('0.00'),
-            concepto="IVA acreditable",
-        )
+        asiento.cargo(cuenta_iva, compra.iva, "IVA acreditable")
 
     if cuenta_banco:
-        MovimientoContable.objects.create(
-            poliza=poliza, cuenta=cuenta_banco,
-            debe=Decimal('0.00'), haber=compra.total,
-            concepto="Pago a proveedor",
-            referencia=compra.uuid[:20] if compra.uuid else '',
-        )
+        asiento.abono(cuenta_banco, compra.total, "Pago a proveedor", referencia)
+
+    asiento.guardar(unidad, cat.usuario())
 
@@ -7,6 +7,7 @@ exclusión de nómina, saldos de apertura), y la carga de estados de
 cuenta BBVA con su conciliación preliminar.
 """
 import os
+import threading
 import unittest
 from datetime import date, timedelta
 from decimal import Decimal
@@ -16,17 +17,21 @@ from django.contrib import admin
 from django.contrib.auth.models import Permission, User
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.core.management import call_command
-from django.test import TestCase, override_settings
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
 from comercial.models import Cliente, Compra, Cotizacion, ItemCotizacion, Pago
 from contabilidad.admin import MovimientoContableAdmin
+from contabilidad.asientos import catalogo
 from contabilidad.models import (
     ConciliacionBancaria,
     ConfiguracionContable,
     CuentaBancaria,
     CuentaContable,
     EstadoCuentaBancario,
+    FolioSecuencia,
     MovimientoContable,
     MovimientoEstadoCuenta,
     Poliza,
@@ -34,8 +39,10 @@ from contabilidad.models import (
     UnidadNegocio,
 )
 from contabilidad.services import (
+    aplicar_polizas,
     aplicar_saldo_apertura,
     aprobar_regularizacion_arrastre,
+    cancelar_polizas,
     cerrar_historico_contable,
     proponer_regularizacion_arrastre,
 )
@@ -43,6 +50,7 @@ from contabilidad.services_estados_cuenta import (
     _emparejar_automaticamente,
     generar_conciliacion_preliminar,
 )
+from contabilidad.signals import crear_poliza_pago_cliente
 from core_erp.test_utils import login_superuser_con_totp
 from nomina.models import Empleado, ReciboNomina
 from nomina.services import marcar_recibo_como_pagado
@@ -207,6 +215,173 @@ class ReversionCancelacionTest(TestCase):
         self.assertEqual(Poliza.objects.filter(origen='AJUSTE').count(), 1)
 
 
+class AsientoBuilderTest(TestCase):
+    """Pólizas automáticas escritas en lote: catálogo en cache, folio de
+    FolioSecuencia y movimientos con un solo bulk_create."""
+
+    def setUp(self):
+        setup_contabilidad_minima()
+        self.user = User.objects.create_user('u', password='x')
+        self.cliente = Cliente.objects.create(nombre='Cliente', tipo_persona='FISICA')
+        self.cot = _crear_cotizacion(self.cliente, Decimal('11600.00'))
+
+    def _pago_sin_poliza(self, monto):
+        with override_settings(CONTABILIDAD_SIGNALS_ENABLED=False):
+            return Pago.objects.create(
+                cotizacion=self.cot, monto=monto, metodo='TRANSFERENCIA', usuario=self.user,
+            )
+
+    def test_poliza_de_pago_con_catalogo_en_cache_cuesta_cinco_consultas(self):
+        Pago.objects.create(
+            cotizacion=self.cot, monto=Decimal('1160.00'), metodo='TRANSFERENCIA', usuario=self.user,
+        )
+        pago = self._pago_sin_poliza(Decimal('2320.00'))
+
+        # Catálogo, folio (leer y avanzar el consecutivo), póliza y movimientos.
+        with self.assertNumQueries(5):
+            crear_poliza_pago_cliente(Pago, pago, created=True)
+
+        poliza = Poliza.objects.get(object_id=pago.pk, origen='PAGO_CLIENTE')
+        self.assertEqual(poliza.movimientos.count(), 3)
+        self.assertTrue(poliza.esta_cuadrada)
+
+    def test_folios_consecutivos_por_tipo_y_mes(self):
+        for monto in ('1160.00', '2320.00', '580.00'):
+            Pago.objects.create(
+                cotizacion=self.cot, monto=Decimal(monto), metodo='TRANSFERENCIA', usuario=self.user,
+            )
+        folios = list(Poliza.objects.filter(tipo='I').order_by('folio').values_list('folio', flat=True))
+        self.assertEqual(folios, [1, 2, 3])
+        secuencia = FolioSecuencia.objects.get(tipo='I', anio=date.today().year, mes=date.today().month)
+        self.assertEqual(secuencia.ultimo_folio, 3)
+
+    def test_secuencia_nueva_continua_despues_del_folio_mas_alto(self):
+        Poliza.objects.create(
+            tipo='I', folio=41, fecha=date.today(), concepto='Capturada antes de la secuencia',
+            unidad_negocio=UnidadNegocio.objects.get(clave='QUINTA'), created_by=self.user,
+        )
+        Pago.objects.create(
+            cotizacion=self.cot, monto=Decimal('1160.00'), metodo='TRANSFERENCIA', usuario=self.user,
+        )
+        self.assertEqual(Poliza.objects.get(origen='PAGO_CLIENTE').folio, 42)
+
+    def test_cambio_de_configuracion_invalida_el_catalogo(self):
+        config = ConfiguracionContable.objects.get(operacion='CAJA')
+        self.assertEqual(catalogo().cuenta('CAJA'), config.cuenta)
+        with self.assertNumQueries(1):
+            self.assertEqual(catalogo().cuenta('CAJA'), config.cuenta)
+
+        config.cuenta = CuentaContable.objects.create(
+            codigo_sat='101.02', nombre='Caja chica', tipo='ACTIVO', naturaleza='D',
+        )
+        config.save()
+        self.assertEqual(catalogo().cuenta('CAJA'), config.cuenta)
+
+        config.activa = False
+        config.save()
+        self.assertIsNone(catalogo().cuenta('CAJA'))
+
+
+class SembrarFoliosPolizaTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('u', password='x')
+        self.unidad, _ = UnidadNegocio.objects.get_or_create(clave='QUINTA', defaults={'nombre': 'Quinta'})
+
+    def _poliza(self, tipo, folio, fecha):
+        # Folio fijo, sin pasar por la secuencia: como las capturadas antes de
+        # que existiera FolioSecuencia.
+        return Poliza.objects.create(
+            tipo=tipo, folio=folio, fecha=fecha, concepto='Histórica',
+            unidad_negocio=self.unidad, created_by=self.user,
+        )
+
+    def test_siembra_el_folio_mas_alto_de_cada_tipo_y_mes(self):
+        self._poliza('I', 7, date(2026, 3, 2))
+        self._poliza('I', 12, date(2026, 3, 20))
+        self._poliza('E', 3, date(2026, 3, 5))
+        self._poliza('I', 4, date(2026, 4, 1))
+
+        salida = StringIO()
+        call_command('sembrar_folios_poliza', stdout=salida)
+        self.assertFalse(FolioSecuencia.objects.exists())
+        self.assertIn('3 consecutivo(s) por sembrar', salida.getvalue())
+
+        call_command('sembrar_folios_poliza', '--aplicar', stdout=StringIO())
+        self.assertEqual(
+            set(FolioSecuencia.objects.values_list('tipo', 'anio', 'mes', 'ultimo_folio')),
+            {('I', 2026, 3, 12), ('E', 2026, 3, 3), ('I', 2026, 4, 4)},
+        )
+        self.assertEqual(Poliza.siguiente_folio('I', date(2026, 3, 31)), 13)
+
+    def test_no_baja_un_consecutivo_adelantado(self):
+        self._poliza('D', 2, date(2026, 5, 10))
+        FolioSecuencia.objects.create(tipo='D', anio=2026, mes=5, ultimo_folio=9)
+
+        call_command('sembrar_folios_poliza', '--aplicar', stdout=StringIO())
+
+        self.assertEqual(FolioSecuencia.objects.get(tipo='D', anio=2026, mes=5).ultimo_folio, 9)
+
+
+class FolioSecuenciaConcurrenciaTest(TransactionTestCase):
+    """
+    Varios hilos piden folios del mismo tipo y mes a la vez, cada uno en su
+    transacción y con su conexión, incluida la siembra del mes.
+
+    Necesita una base que admita escrituras concurrentes de verdad:
+    PostgreSQL, o SQLite en archivo con WAL. La base de pruebas de SQLite
+    por defecto vive en memoria y ahí el test se omite; CI lo corre en un
+    paso aparte con TEST_DB_NAME (base de pruebas en archivo).
+    """
+    serialized_rollback = True
+    HILOS = 8
+    FOLIOS_POR_HILO = 5
+
+    def setUp(self):
+        if connection.vendor == 'sqlite':
+            if connection.is_in_memory_db():
+                self.skipTest("SQLite en memoria no admite transacciones concurrentes entre hilos")
+            with connection.cursor() as cursor:
+                cursor.execute('PRAGMA journal_mode=WAL')
+        elif connection.vendor != 'postgresql':
+            self.skipTest(f"Sin soporte de concurrencia verificado para {connection.vendor}")
+        self.user = User.objects.create_user('concurrencia', password='x')
+        self.unidad, _ = UnidadNegocio.objects.get_or_create(clave='QUINTA', defaults={'nombre': 'Quinta'})
+
+    def _pedir_folios(self, barrera, folios, errores):
+        try:
+            barrera.wait()
+            for _ in range(self.FOLIOS_POR_HILO):
+                with transaction.atomic():
+                    poliza = Poliza.objects.create(
+                        tipo='I', folio=Poliza.siguiente_folio('I', date(2026, 6, 15)),
+                        fecha=date(2026, 6, 15), concepto='Concurrente',
+                        unidad_negocio=self.unidad, created_by=self.user,
+                    )
+                folios.append(poliza.folio)
+        except Exception as exc:  # se reporta en el hilo principal
+            errores.append(exc)
+        finally:
+            connection.close()
+
+    def test_hilos_simultaneos_no_repiten_folio(self):
+        barrera = threading.Barrier(self.HILOS)
+        folios, errores = [], []
+        hilos = [
+            threading.Thread(target=self._pedir_folios, args=(barrera, folios, errores))
+            for _ in range(self.HILOS)
+        ]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+
+        self.assertEqual(errores, [])
+        total = self.HILOS * self.FOLIOS_POR_HILO
+        self.assertEqual(sorted(folios), list(range(1, total + 1)))
+        self.assertEqual(FolioSecuencia.objects.get(tipo='I', anio=2026, mes=6).ultimo_folio, total)
+
+
 # ==========================================
 # REGULARIZACIÓN CONTABLE
 # ==========================================
@@ -2051,3 +2226,224 @@ class PolizaAdminAccionesConfirmacionTest(TestCase):
 
         self.poliza.refresh_from_db()
         self.assertEqual(self.poliza.estado, 'CANCELADA')
+
+
+class PolizaTotalesTest(TestCase):
+    """`total_debe`/`total_haber` se guardan en la póliza al escribir sus
+    movimientos: la lista del admin y 'Aplicar' ya no suman por póliza."""
+
+    def setUp(self):
+        self.usuario = User.objects.create_superuser('totales', 't@qkt.mx', 'x')
+        self.unidad = UnidadNegocio.objects.get(clave='QUINTA')
+        self.banco = CuentaContable.objects.get(codigo_sat='102.02.01')
+        self.ingreso = CuentaContable.objects.get(codigo_sat='402.02')
+        self.poliza = self._poliza()
+
+    def _poliza(self):
+        return Poliza.objects.create(
+            tipo='D', folio=Poliza.siguiente_folio('D', date(2026, 8, 1)),
+            fecha=date(2026, 8, 1), concepto='Totales', unidad_negocio=self.unidad,
+            origen='MANUAL', created_by=self.usuario,
+        )
+
+    def _totales(self, poliza=None):
+        poliza = Poliza.objects.get(pk=(poliza or self.poliza).pk)
+        return poliza.total_debe, poliza.total_haber
+
+    def test_crear_editar_y_borrar_movimientos(self):
+        cargo = MovimientoContable.objects.create(poliza=self.poliza, cuenta=self.banco, debe=Decimal('150.00'))
+        MovimientoContable.objects.create(poliza=self.poliza, cuenta=self.ingreso, haber=Decimal('150.00'))
+        self.assertEqual(self._totales(), (Decimal('150.00'), Decimal('150.00')))
+        self.assertTrue(self.poliza.esta_cuadrada)
+
+        cargo.debe = Decimal('200.00')
+        cargo.save()
+        self.assertEqual(self._totales(), (Decimal('200.00'), Decimal('150.00')))
+
+        cargo.delete()
+        self.assertEqual(self._totales(), (Decimal('0.00'), Decimal('150.00')))
+
+    def test_escrituras_masivas(self):
+        movimientos = MovimientoContable.objects.bulk_create([
+            MovimientoContable(poliza=self.poliza, cuenta=self.banco, debe=Decimal('80.00')),
+            MovimientoContable(poliza=self.poliza, cuenta=self.ingreso, haber=Decimal('80.00')),
+        ])
+        self.assertEqual(self._totales(), (Decimal('80.00'), Decimal('80.00')))
+
+        MovimientoContable.objects.filter(pk=movimientos[0].pk).update(debe=Decimal('95.50'))
+        self.assertEqual(self._totales(), (Decimal('95.50'), Decimal('80.00')))
+
+        otra = self._poliza()
+        MovimientoContable.objects.filter(pk=movimientos[1].pk).update(poliza=otra)
+        self.assertEqual(self._totales(), (Decimal('95.50'), Decimal('0.00')))
+        self.assertEqual(self._totales(otra), (Decimal('0.00'), Decimal('80.00')))
+
+    def test_borrar_la_poliza_no_recalcula_por_movimiento(self):
+        MovimientoContable.objects.bulk_create([
+            MovimientoContable(poliza=self.poliza, cuenta=self.banco, debe=Decimal('10.00'))
+            for _ in range(5)
+        ])
+        with CaptureQueriesContext(connection) as ctx:
+            self.poliza.delete()
+        self.assertFalse(Poliza.objects.filter(pk=self.poliza.pk).exists())
+        self.assertFalse([
+            q for q in ctx.captured_queries
+            if q['sql'].startswith('UPDATE "contabilidad_poliza"') or 'SUM(' in q['sql']
+        ])
+
+    def test_guardar_una_instancia_vieja_no_pisa_los_totales(self):
+        vieja = Poliza.objects.get(pk=self.poliza.pk)
+        MovimientoContable.objects.create(poliza=self.poliza, cuenta=self.banco, debe=Decimal('60.00'))
+
+        vieja.concepto = 'Renombrada'
+        vieja.save()
+
+        self.assertEqual(self._totales(), (Decimal('60.00'), Decimal('0.00')))
+
+    def test_lista_del_admin_con_consultas_constantes(self):
+        login_superuser_con_totp(self.client, self.usuario)
+
+        def _consultas():
+            with CaptureQueriesContext(connection) as ctx:
+                respuesta = self.client.get('/admin/contabilidad/poliza/')
+            self.assertEqual(respuesta.status_code, 200)
+            return len(ctx.captured_queries)
+
+        MovimientoContable.objects.create(poliza=self.poliza, cuenta=self.banco, debe=Decimal('10.00'))
+        pocas = _consultas()
+        for _ in range(6):
+            poliza = self._poliza()
+            MovimientoContable.objects.create(poliza=poliza, cuenta=self.banco, debe=Decimal('10.00'))
+            MovimientoContable.objects.create(poliza=poliza, cuenta=self.ingreso, haber=Decimal('10.00'))
+        self.assertEqual(_consultas(), pocas)
+
+    def test_verificar_totales_detecta_y_corrige_desviaciones(self):
+        MovimientoContable.objects.create(poliza=self.poliza, cuenta=self.banco, debe=Decimal('40.00'))
+        MovimientoContable.objects.create(poliza=self.poliza, cuenta=self.ingreso, haber=Decimal('40.00'))
+        Poliza.objects.filter(pk=self.poliza.pk).update(total_debe=Decimal('999.00'))
+
+        salida = StringIO()
+        call_command('verificar_totales_polizas', stdout=salida)
+        self.assertIn('1 póliza(s) con totales desviados', salida.getvalue())
+        self.assertEqual(self._totales(), (Decimal('999.00'), Decimal('40.00')))
+
+        call_command('verificar_totales_polizas', '--corregir', stdout=StringIO())
+        self.assertEqual(self._totales(), (Decimal('40.00'), Decimal('40.00')))
+
+        salida = StringIO()
+        call_command('verificar_totales_polizas', stdout=salida)
+        self.assertIn('coinciden', salida.getvalue())
+
+
+class AplicarPolizasEnBloqueTest(TestCase):
+    """Aplicar/cancelar muchas pólizas valida el cuadre de toda la selección
+    en una consulta agrupada y escribe en un solo UPDATE."""
+
+    def setUp(self):
+        self.direccion = User.objects.create_superuser('bloque', 'b@qkt.mx', 'x')
+        self.contador = User.objects.create_user('contador_bloque', password='x', is_staff=True)
+        self.unidad = UnidadNegocio.objects.get(clave='QUINTA')
+        self.banco = CuentaContable.objects.get(codigo_sat='102.02.01')
+        self.ingreso = CuentaContable.objects.get(codigo_sat='402.02')
+
+    def _poliza(self, debe, haber, origen='COMPRA', estado='BORRADOR', fecha=date(2026, 8, 10)):
+        poliza = Poliza.objects.create(
+            tipo='D', folio=Poliza.siguiente_folio('D', fecha), fecha=fecha,
+            concepto='Cierre', unidad_negocio=self.unidad, origen=origen, estado=estado,
+            created_by=self.direccion,
+        )
+        MovimientoContable.objects.bulk_create([
+            MovimientoContable(poliza=poliza, cuenta=self.banco, debe=Decimal(debe)),
+            MovimientoContable(poliza=poliza, cuenta=self.ingreso, haber=Decimal(haber)),
+        ])
+        return poliza
+
+    def _resultados(self, informe):
+        return {fila['poliza_id']: fila['resultado'] for fila in informe['resultados']}
+
+    def test_reporta_cada_poliza_y_aplica_solo_las_validas(self):
+        cuadrada = self._poliza('100.00', '100.00')
+        descuadrada = self._poliza('100.00', '90.00')
+        regularizacion = self._poliza('50.00', '50.00', origen='APERTURA')
+        aplicada = self._poliza('10.00', '10.00', estado='APLICADA')
+
+        informe = aplicar_polizas(Poliza.objects.all(), self.contador)
+
+        self.assertEqual(self._resultados(informe), {
+            cuadrada.pk: 'aplicada',
+            descuadrada.pk: 'no_cuadra',
+            regularizacion.pk: 'requiere_direccion',
+            aplicada.pk: 'no_es_borrador',
+        })
+        self.assertEqual(informe['aplicadas'], 1)
+        cuadrada.refresh_from_db()
+        self.assertEqual(cuadrada.estado, 'APLICADA')
+        self.assertEqual(cuadrada.aplicada_por, self.contador)
+        self.assertIsNotNone(cuadrada.fecha_aplicacion)
+        self.assertEqual(
+            set(Poliza.objects.filter(estado='BORRADOR').values_list('pk', flat=True)),
+            {descuadrada.pk, regularizacion.pk},
+        )
+
+        aplicar_polizas(Poliza.objects.filter(pk=regularizacion.pk), self.direccion)
+        regularizacion.refresh_from_db()
+        self.assertEqual(regularizacion.estado, 'APLICADA')
+
+    def test_el_cuadre_no_depende_de_los_totales_guardados(self):
+        poliza = self._poliza('100.00', '90.00')
+        Poliza.objects.filter(pk=poliza.pk).update(total_haber=Decimal('100.00'))
+
+        informe = aplicar_polizas(Poliza.objects.all(), self.direccion)
+
+        self.assertEqual(self._resultados(informe), {poliza.pk: 'no_cuadra'})
+
+    def test_consultas_constantes_en_el_tamano_de_la_seleccion(self):
+        def _consultas(polizas):
+            with CaptureQueriesContext(connection) as ctx:
+                aplicar_polizas(polizas, self.direccion)
+            return len(ctx.captured_queries)
+
+        pocas = _consultas(Poliza.objects.filter(pk=self._poliza('1.00', '1.00').pk))
+        ids = [self._poliza('1.00', '1.00').pk for _ in range(8)]
+        self.assertEqual(_consultas(Poliza.objects.filter(pk__in=ids)), pocas)
+
+    def test_simulacion_no_escribe(self):
+        poliza = self._poliza('100.00', '100.00')
+
+        informe = aplicar_polizas(Poliza.objects.all(), self.direccion, aplicar=False)
+
+        self.assertEqual(self._resultados(informe), {poliza.pk: 'aplicada'})
+        self.assertFalse(informe['aplicado'])
+        poliza.refresh_from_db()
+        self.assertEqual(poliza.estado, 'BORRADOR')
+
+    def test_comando_de_cierre_de_mes(self):
+        agosto = self._poliza('100.00', '100.00')
+        septiembre = self._poliza('100.00', '100.00', fecha=date(2026, 9, 2))
+
+        call_command('aplicar_polizas', '--desde', '2026-08-01', '--hasta', '2026-08-31', stdout=StringIO())
+        agosto.refresh_from_db()
+        self.assertEqual(agosto.estado, 'BORRADOR')
+
+        salida = StringIO()
+        call_command('aplicar_polizas', '--desde', '2026-08-01', '--hasta', '2026-08-31',
+                     '--aplicar', stdout=salida)
+        self.assertIn('1 póliza(s) aplicada(s)', salida.getvalue())
+        agosto.refresh_from_db()
+        septiembre.refresh_from_db()
+        self.assertEqual(agosto.estado, 'APLICADA')
+        self.assertEqual(agosto.aplicada_por, self.direccion)
+        self.assertEqual(septiembre.estado, 'BORRADOR')
+
+    def test_cancelar_en_bloque(self):
+        viva = self._poliza('100.00', '100.00', estado='APLICADA')
+        cancelada = self._poliza('10.00', '10.00', estado='CANCELADA')
+
+        informe = cancelar_polizas(Poliza.objects.all(), self.direccion, 'Cierre de prueba')
+
+        self.assertEqual(self._resultados(informe), {viva.pk: 'cancelada', cancelada.pk: 'ya_cancelada'})
+        self.assertEqual(informe['canceladas'], 1)
+        viva.refresh_from_db()
+        self.assertEqual(viva.estado, 'CANCELADA')
+        self.assertEqual(viva.motivo_cancelacion, 'Cierre de prueba')
+        self.assertEqual(viva.cancelada_por, self.direccion)
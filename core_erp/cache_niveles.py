@@ -0,0 +1,212 @@
+"""
+Cache en dos niveles
+====================
+El cache compartido es la base de datos (ver CACHES en settings): cada
+lectura es un viaje a la tabla `qkt_cache`. `CacheEnNiveles` es ese mismo
+`DatabaseCache` (nivel 2, compartido entre workers) con un LRU acotado en la
+memoria de cada proceso delante (nivel 1), pero solo para los espacios de
+claves que lo piden en `OPTIONS['L1_ESPACIOS']` (prefijo → segundos de vida
+en L1).
+
+Qué puede ir en L1: claves cuyo valor no cambia mientras la clave exista,
+como las rebanadas del calendario (la clave lleva la generación de su
+fuente). Un `set()` o `delete()` de otro worker no llega a este L1, así que
+una clave mutable se vería vieja hasta que venza su vida en L1.
+
+Qué nunca va en L1 (`OPTIONS['L1_NUNCA']`): lo que necesita atomicidad
+entre workers, como el candado anti-doble-cobro de Openpay
+(`pago_openpay_en_curso:`) y los contadores del rate limiting (`rl:`). La
+lista gana sobre `L1_ESPACIOS`.
+
+L1 guarda el valor serializado y lo deserializa en cada acierto: quien lo
+lea puede modificarlo sin afectar a la siguiente lectura, igual que con el
+cache de base de datos. Tampoco sigue las transacciones: una clave leída o
+escrita dentro de una que luego se revierte sobrevive en L1. Por eso solo
+sirve para claves que, como las de generación, no se vuelven a pedir.
+
+`estadisticas()` da aciertos, fallos y desalojos de cada nivel en este
+proceso; `/admin/cache/estadisticas/` las muestra para el worker que atiende.
+"""
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.cache import cache
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.cache.backends.db import DatabaseCache
+from django.http import JsonResponse
+
+# Django crea una instancia del backend por hilo; el L1 y sus contadores son
+# uno por proceso y configuración, compartidos entre esas instancias.
+_memorias = {}
+_memorias_lock = threading.Lock()
+
+
+def _memoria(clave):
+    with _memorias_lock:
+        if clave not in _memorias:
+            _memorias[clave] = (
+                OrderedDict(),
+                threading.Lock(),
+                dict.fromkeys(
+                    ('l1_aciertos', 'l1_fallos', 'l1_desalojos', 'l1_vencidas',
+                     'l2_aciertos', 'l2_fallos', 'l2_purgas'), 0,
+                ),
+            )
+        return _memorias[clave]
+
+
+class CacheEnNiveles(DatabaseCache):
+
+    def __init__(self, table, params):
+        opciones = dict(params.get('OPTIONS') or {})
+        self._espacios = tuple(opciones.pop('L1_ESPACIOS', {}).items())
+        self._nunca = tuple(opciones.pop('L1_NUNCA', ()))
+        self._l1_max = int(opciones.pop('L1_MAX_ENTRADAS', 500))
+        super().__init__(table, {**params, 'OPTIONS': opciones})
+        self._l1, self._lock, self._stats = _memoria(
+            (table, self._espacios, self._nunca, self._l1_max))
+
+    # ───────────────────────────── Nivel 1 ─────────────────────────────
+
+    def _vida_l1(self, key):
+        """Segundos de vida en L1 para `key` (sin versión), o None si no va."""
+        if key.startswith(self._nunca):
+            return None
+        for prefijo, segundos in self._espacios:
+            if key.startswith(prefijo):
+                return segundos
+        return None
+
+    def _l1_leer(self, clave):
+        with self._lock:
+            entrada = self._l1.get(clave)
+            if entrada is None:
+                self._stats['l1_fallos'] += 1
+                return None
+            vence, datos = entrada
+            if vence <= time.monotonic():
+                del self._l1[clave]
+                self._stats['l1_vencidas'] += 1
+                self._stats['l1_fallos'] += 1
+                return None
+            self._l1.move_to_end(clave)
+            self._stats['l1_aciertos'] += 1
+        return datos
+
+    def _l1_guardar(self, clave, valor, vida, timeout=DEFAULT_TIMEOUT):
+        # No vive en L1 más de lo que viviría en la base.
+        expira = self.get_backend_timeout(timeout)
+        if expira is not None:
+            vida = min(vida, expira - time.time())
+        if vida <= 0:
+            self._l1_borrar(clave)
+            return
+        datos = pickle.dumps(valor, self.pickle_protocol)
+        with self._lock:
+            self._l1[clave] = (time.monotonic() + vida, datos)
+            self._l1.move_to_end(clave)
+            while len(self._l1) > self._l1_max:
+                self._l1.popitem(last=False)
+                self._stats['l1_desalojos'] += 1
+
+    def _l1_borrar(self, *claves):
+        with self._lock:
+            for clave in claves:
+                self._l1.pop(clave, None)
+
+    # ──────────────────────────── API de cache ─────────────────────────
+
+    def get_many(self, keys, version=None):
+        resultado, pendientes = {}, []
+        for key in keys:
+            if self._vida_l1(key) is not None:
+                datos = self._l1_leer(self.make_and_validate_key(key, version=version))
+                if datos is not None:
+                    resultado[key] = pickle.loads(datos)  # noqa: S301 -- lo serializó este mismo proceso
+                    continue
+            pendientes.append(key)
+        if not pendientes:
+            return resultado
+
+        encontrados = super().get_many(pendientes, version=version)
+        with self._lock:
+            self._stats['l2_aciertos'] += len(encontrados)
+            self._stats['l2_fallos'] += len(pendientes) - len(encontrados)
+        for key, valor in encontrados.items():
+            vida = self._vida_l1(key)
+            if vida is not None:
+                # Sin el TTL que le queda en la base: a lo más la vida de L1.
+                self._l1_guardar(self.make_and_validate_key(key, version=version), valor, vida, None)
+        resultado.update(encontrados)
+        return resultado
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        # También cubre set_many(), que en Django es un set() por clave.
+        super().set(key, value, timeout, version)
+        vida = self._vida_l1(key)
+        if vida is not None:
+            self._l1_guardar(self.make_and_validate_key(key, version=version), value, vida, timeout)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        agregado = super().add(key, value, timeout, version)
+        vida = self._vida_l1(key)
+        if agregado and vida is not None:
+            self._l1_guardar(self.make_and_validate_key(key, version=version), value, vida, timeout)
+        return agregado
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        self._l1_borrar(self.make_and_validate_key(key, version=version))
+        return super().touch(key, timeout, version)
+
+    def delete(self, key, version=None):
+        self._l1_borrar(self.make_and_validate_key(key, version=version))
+        return super().delete(key, version)
+
+    def delete_many(self, keys, version=None):
+        self._l1_borrar(*(self.make_and_validate_key(key, version=version) for key in keys))
+        return super().delete_many(keys, version)
+
+    def clear(self):
+        with self._lock:
+            self._l1.clear()
+        return super().clear()
+
+    def _cull(self, db, cursor, now, num):
+        # Django solo purga cuando la tabla pasa de MAX_ENTRIES.
+        with self._lock:
+            self._stats['l2_purgas'] += 1
+        return super()._cull(db, cursor, now, num)
+
+    # ──────────────────────────── Estadísticas ─────────────────────────
+
+    def estadisticas(self):
+        """Contadores de este proceso: {'l1': {...}, 'l2': {...}}."""
+        with self._lock:
+            stats = dict(self._stats)
+            entradas = len(self._l1)
+        return {
+            'l1': {
+                'aciertos': stats['l1_aciertos'],
+                'fallos': stats['l1_fallos'],
+                'desalojos': stats['l1_desalojos'],
+                'vencidas': stats['l1_vencidas'],
+                'entradas': entradas,
+                'max_entradas': self._l1_max,
+            },
+            'l2': {
+                'aciertos': stats['l2_aciertos'],
+                'fallos': stats['l2_fallos'],
+                'purgas': stats['l2_purgas'],
+            },
+        }
+
+
+@staff_member_required
+def estadisticas_cache(request):
+    """Estadísticas del cache del worker que atiende la petición."""
+    estadisticas = cache.estadisticas() if hasattr(cache, 'estadisticas') else {}
+    return JsonResponse({'pid': os.getpid(), **estadisticas})
@@ -1,16 +1,36 @@
 """
-Rate limiting simple basado en cache de Django.
+Rate limiting simple con contadores compartidos entre workers.
 Uso:
     @rate_limit(key='mi_vista', limit=30, window=60)
     def my_view(request): ...
+
+Los contadores viven en un backend intercambiable (RATELIMIT_BACKEND):
+
+- 'tabla' (por defecto): tabla propia `qkt_ratelimit` (clave, contador,
+  expira), creada por la migración comercial 0075. Cada golpe es UN solo
+  `INSERT ... ON CONFLICT DO UPDATE ... RETURNING`, igual en PostgreSQL y en
+  SQLite (>= 3.35), y no compite con el cull de `qkt_cache`.
+- 'cache': el cache de Django, como antes (add/get/set, tres viajes a la
+  base con DatabaseCache).
+
+RATELIMIT_MODO elige el algoritmo de `rate_limit`: 'fijo' (ventana fija, el
+de siempre) o 'gcra' (ventana deslizante: `limit` peticiones de ráfaga y
+después una cada window/limit segundos, sin el doble de ráfaga que permite
+la ventana fija justo en el cambio de ventana). Los contadores de login y del
+portal son de intentos fallidos y siguen siendo de ventana fija.
+
+Las filas vencidas de la tabla se borran con `manage.py limpiar_ratelimit`.
 """
 import hashlib
 import logging
+import math
 import time
 from functools import wraps
 
 from django.conf import settings
 from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
 from django.http import HttpResponse
 
 logger = logging.getLogger(__name__)
@@ -47,30 +67,148 @@ def _bucket(key, ident, window):
     return f'rl:{key}:{ident}:{int(time.time() // window)}'
 
 
-def _contar(bucket, window):
+class ContadorCache:
+    """Contadores en el cache de Django."""
+
+    def contar(self, bucket, window):
+        """
+        Incrementa y devuelve un contador con expiración de respaldo.
+
+        La ventana forma parte de la clave, por lo que no se depende de que el
+        backend conserve el TTL al incrementar. No se usa cache.incr(): su
+        implementación base hace un set() sin timeout explícito, que en
+        DatabaseCache cae al TIMEOUT global de settings.py (3600 s) en vez de
+        respetar los window*2 fijados por el add() inicial. Un bucket que vive
+        30x más de lo previsto es candidato temprano al cull por orden
+        lexicográfico de cache_key — y 'pago_openpay_en_curso:' ordena antes que
+        'rl:', así que el candado anti-doble-cobro de Openpay sería el primero en
+        perderse. Por eso cada escritura fija su propio timeout.
+        """
+        if cache.add(bucket, 1, timeout=window * 2):
+            return 1
+        valor = cache.get(bucket)
+        if valor is None:
+            # La clave expiró entre el add() y este get().
+            cache.set(bucket, 1, timeout=window * 2)
+            return 1
+        valor += 1
+        cache.set(bucket, valor, timeout=window * 2)
+        return valor
+
+    def leer(self, bucket):
+        return cache.get(bucket, 0)
+
+    def borrar(self, bucket):
+        cache.delete(bucket)
+
+    def gcra(self, clave, limit, window):
+        """Segundos que faltan para admitir la petición; 0 si se admite.
+
+        No es atómico (get y set por separado): dos peticiones simultáneas
+        pueden pasar las dos. Para eso está el backend 'tabla'."""
+        ahora = time.time()
+        intervalo = window / limit
+        llegada = max(cache.get(clave) or ahora, ahora) + intervalo
+        if llegada - ahora > window:
+            return llegada - ahora - window
+        cache.set(clave, llegada, timeout=window * 2)
+        return 0
+
+
+class ContadorTabla:
     """
-    Incrementa y devuelve un contador con expiración de respaldo.
-
-    La ventana forma parte de la clave, por lo que no se depende de que el
-    backend conserve el TTL al incrementar. No se usa cache.incr(): su
-    implementación base hace un set() sin timeout explícito, que en
-    DatabaseCache cae al TIMEOUT global de settings.py (3600 s) en vez de
-    respetar los window*2 fijados por el add() inicial. Un bucket que vive
-    30x más de lo previsto es candidato temprano al cull por orden
-    lexicográfico de cache_key — y 'pago_openpay_en_curso:' ordena antes que
-    'rl:', así que el candado anti-doble-cobro de Openpay sería el primero en
-    perderse. Por eso cada escritura fija su propio timeout.
+    Contadores en la tabla `qkt_ratelimit`, una fila por clave.
+
+    `expira` es un epoch en segundos. En ventana fija es el fin de vida del
+    contador (window*2 después del primer golpe, como el timeout del cache);
+    en GCRA es el "tiempo teórico de llegada" de la siguiente petición. En los
+    dos casos una fila con `expira` en el pasado equivale a que no exista, así
+    que `limpiar_expirados` la puede borrar sin cambiar ningún resultado.
     """
-    if cache.add(bucket, 1, timeout=window * 2):
-        return 1
-    valor = cache.get(bucket)
-    if valor is None:
-        # La clave expiró entre el add() y este get().
-        cache.set(bucket, 1, timeout=window * 2)
-        return 1
-    valor += 1
-    cache.set(bucket, valor, timeout=window * 2)
-    return valor
+    TABLA = 'qkt_ratelimit'
+
+    def _sql(self, sql, **nombres):
+        return sql.format(tabla=connection.ops.quote_name(self.TABLA), **nombres)
+
+    def _ejecutar(self, sql, parametros, **nombres):
+        """Primera fila de un SELECT o de un ... RETURNING. Solo para esas:
+        tras una sentencia sin filas (un DELETE) psycopg2 lanza
+        ProgrammingError en fetchone(); SQLite regresa None."""
+        with connection.cursor() as cursor:
+            cursor.execute(self._sql(sql, **nombres), parametros)
+            return cursor.fetchone()
+
+    def contar(self, bucket, window):
+        ahora = time.time()
+        # Dentro del UPDATE, `{tabla}.columna` es el valor anterior de la fila.
+        return self._ejecutar(
+            'INSERT INTO {tabla} (clave, contador, expira) VALUES (%s, 1, %s) '
+            'ON CONFLICT (clave) DO UPDATE SET '
+            'contador = CASE WHEN {tabla}.expira <= %s THEN 1 ELSE {tabla}.contador + 1 END, '
+            'expira = CASE WHEN {tabla}.expira <= %s THEN excluded.expira ELSE {tabla}.expira END '
+            'RETURNING contador',
+            [bucket, ahora + window * 2, ahora, ahora],
+        )[0]
+
+    def leer(self, bucket):
+        fila = self._ejecutar(
+            'SELECT contador FROM {tabla} WHERE clave = %s AND expira > %s',
+            [bucket, time.time()],
+        )
+        return fila[0] if fila else 0
+
+    def borrar(self, bucket):
+        with connection.cursor() as cursor:
+            cursor.execute(self._sql('DELETE FROM {tabla} WHERE clave = %s'), [bucket])
+
+    def gcra(self, clave, limit, window):
+        """Segundos que faltan para admitir la petición; 0 si se admite.
+
+        El UPDATE solo se aplica si la petición cabe (WHERE del upsert): si no
+        cabe, no devuelve fila y la llegada guardada no avanza."""
+        ahora = time.time()
+        intervalo = window / limit
+        fila = self._ejecutar(
+            'INSERT INTO {tabla} (clave, contador, expira) VALUES (%s, 1, %s) '
+            'ON CONFLICT (clave) DO UPDATE SET '
+            'contador = {tabla}.contador + 1, '
+            'expira = {maximo}({tabla}.expira, %s) + %s '
+            'WHERE {maximo}({tabla}.expira, %s) + %s - %s <= %s '
+            'RETURNING expira',
+            [clave, ahora + intervalo, ahora, intervalo, ahora, intervalo, ahora, window],
+            maximo='GREATEST' if connection.vendor == 'postgresql' else 'MAX',
+        )
+        if fila:
+            return 0
+        fila = self._ejecutar('SELECT expira FROM {tabla} WHERE clave = %s', [clave])
+        return max(0.0, max(fila[0], ahora) + intervalo - ahora - window) if fila else 0
+
+    def limpiar_expirados(self):
+        """Borra las filas vencidas y devuelve cuántas eran."""
+        with connection.cursor() as cursor:
+            cursor.execute(self._sql('DELETE FROM {tabla} WHERE expira <= %s'), [time.time()])
+            return cursor.rowcount
+
+
+BACKENDS = {
+    'cache': ContadorCache(),
+    'tabla': ContadorTabla(),
+}
+
+
+def _backend():
+    nombre = getattr(settings, 'RATELIMIT_BACKEND', 'tabla')
+    try:
+        return BACKENDS[nombre]
+    except KeyError:
+        raise ImproperlyConfigured(
+            f"RATELIMIT_BACKEND={nombre!r}; opciones: {', '.join(BACKENDS)}."
+        ) from None
+
+
+def _contar(bucket, window):
+    """Incrementa y devuelve el contador del bucket en el backend configurado."""
+    return _backend().contar(bucket, window)
 
 
 def rate_limit(key, limit=60, window=60):
@@ -78,7 +216,7 @@ def rate_limit(key, limit=60, window=60):
     Decorador que limita peticiones por IP.
 
     Args:
-        key: prefijo del bucket en cache
+        key: prefijo del bucket
         limit: máximo de requests permitidos
         window: ventana de tiempo en segundos
     """
@@ -86,12 +224,16 @@ def rate_limit(key, limit=60, window=60):
         @wraps(view_func)
         def wrapper(request, *args, **kwargs):
             ip = _client_ip(request)
-            bucket = _bucket(key, ip, window)
-            if _contar(bucket, window) > limit:
+            if getattr(settings, 'RATELIMIT_MODO', 'fijo') == 'gcra':
+                espera = _backend().gcra(f'rl:{key}:{ip}', limit, window)
+                reintentar = math.ceil(espera) if espera else None
+            else:
+                reintentar = window if _contar(_bucket(key, ip, window), window) > limit else None
+            if reintentar is not None:
                 return HttpResponse(
                     'Rate limit exceeded',
                     status=429,
-                    headers={'Retry-After': str(window)},
+                    headers={'Retry-After': str(reintentar)},
                 )
             return view_func(request, *args, **kwargs)
         return wrapper
@@ -99,12 +241,13 @@ def rate_limit(key, limit=60, window=60):
 
 
 def reset_rate_limit(key, ident, window=60):
-    """Borra el contador de rate limit de la ventana fija actual."""
-    cache.delete(_bucket(key, ident, window))
+    """Borra el contador de rate limit de la ventana fija actual y el de GCRA."""
+    _backend().borrar(_bucket(key, ident, window))
+    _backend().borrar(f'rl:{key}:{ident}')
 
 
 def _clave_usuario(username):
-    """Hashea el usuario para no guardar nombres en claro en la tabla cache."""
+    """Hashea el usuario para no guardar nombres en claro en la tabla de contadores."""
     normalizado = (username or '').strip().lower()
     return hashlib.sha256(normalizado.encode()).hexdigest()[:32]
 
@@ -124,9 +267,9 @@ def _buckets_login(request, username):
 def login_bloqueado(request, username=None):
     """Indica si la IP o el usuario agotaron los intentos fallidos permitidos."""
     bucket_ip, bucket_usuario = _buckets_login(request, username)
-    if bucket_ip and cache.get(bucket_ip, 0) >= settings.ADMIN_LOGIN_MAX_INTENTOS_IP:
+    if bucket_ip and _backend().leer(bucket_ip) >= settings.ADMIN_LOGIN_MAX_INTENTOS_IP:
         return True
-    if bucket_usuario and cache.get(bucket_usuario, 0) >= settings.ADMIN_LOGIN_MAX_INTENTOS_USUARIO:
+    if bucket_usuario and _backend().leer(bucket_usuario) >= settings.ADMIN_LOGIN_MAX_INTENTOS_USUARIO:
         return True
     return False
 
@@ -160,7 +303,7 @@ def limpiar_intentos_login(request, username):
     """
     _, bucket_usuario = _buckets_login(request, username)
     if bucket_usuario:
-        cache.delete(bucket_usuario)
+        _backend().borrar(bucket_usuario)
 
 
 def _clave_cotizacion(cotizacion_id):
@@ -182,7 +325,7 @@ def portal_acceso_bloqueado(cotizacion_id):
     objetivo sin importar desde dónde se prueben.
     """
     bucket = _bucket_portal(cotizacion_id)
-    return cache.get(bucket, 0) >= settings.PORTAL_ACCESO_MAX_INTENTOS
+    return _backend().leer(bucket) >= settings.PORTAL_ACCESO_MAX_INTENTOS
 
 
 def registrar_portal_acceso_fallido(cotizacion_id):
@@ -191,4 +334,4 @@ def registrar_portal_acceso_fallido(cotizacion_id):
 
 def limpiar_portal_acceso(cotizacion_id):
     """Borra el contador tras un acceso correcto al portal."""
-    cache.delete(_bucket_portal(cotizacion_id))
+    _backend().borrar(_bucket_portal(cotizacion_id))
@@ -193,6 +193,13 @@ DATABASES = {
 }
 db_from_env = dj_database_url.config(conn_max_age=500)
 DATABASES['default'].update(db_from_env)
+# Con TEST_DB_NAME la base de pruebas de SQLite se crea en ese archivo en vez
+# de en memoria. Es lo que necesitan las pruebas de concurrencia entre hilos
+# (contabilidad FolioSecuenciaConcurrenciaTest), que en memoria se omiten;
+# CI las corre así en un paso aparte.
+TEST_DB_NAME = config('TEST_DB_NAME', default='')
+if TEST_DB_NAME:
+    DATABASES['default']['TEST'] = {'NAME': TEST_DB_NAME}
 
 # --- CACHE COMPARTIDO ENTRE WORKERS ---
 # El default de Django (LocMemCache) vive dentro de cada proceso y gunicorn
@@ -204,15 +211,28 @@ DATABASES['default'].update(db_from_env)
 # `redis` a requirements.txt y reintroducir aquí un backend condicional —
 # mientras no esté provisionado, no se declara esa rama: definir una
 # REDIS_URL sin la dependencia instalada tumbaría el arranque.
+#
+# Delante de la base va un LRU por worker (core_erp/cache_niveles.py), solo
+# para los prefijos de L1_ESPACIOS: claves cuyo valor no cambia mientras
+# existan. L1_NUNCA lista lo que necesita atomicidad entre workers.
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'BACKEND': 'core_erp.cache_niveles.CacheEnNiveles',
         'LOCATION': 'qkt_cache',
         'TIMEOUT': 3600,
         # MAX_ENTRIES por defecto son 300: con el HTML de los documentos
         # legales más los buckets del rate limiting, el cull podría borrar
         # contadores vivos y regalar intentos al atacante.
-        'OPTIONS': {'MAX_ENTRIES': 10000, 'CULL_FREQUENCY': 4},
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+            'CULL_FREQUENCY': 4,
+            'L1_MAX_ENTRADAS': config('CACHE_L1_MAX_ENTRADAS', default=500, cast=int),
+            'L1_ESPACIOS': {
+                # La clave lleva la generación de su fuente (airbnb/calendario.py).
+                'airbnb:calendario:rebanada:': 600,
+            },
+            'L1_NUNCA': ('pago_openpay_en_curso:', 'rl:'),
+        },
     }
 }
 
@@ -233,6 +253,12 @@ ADMIN_LOGIN_MAX_INTENTOS_USUARIO = config('ADMIN_LOGIN_MAX_INTENTOS_USUARIO', de
 PORTAL_ACCESO_VENTANA = config('PORTAL_ACCESO_VENTANA', default=900, cast=int)
 PORTAL_ACCESO_MAX_INTENTOS = config('PORTAL_ACCESO_MAX_INTENTOS', default=10, cast=int)
 
+# Dónde viven los contadores del rate limiting: 'tabla' (qkt_ratelimit, un
+# upsert por golpe) o 'cache' (qkt_cache, add/get/set). Y el algoritmo de
+# @rate_limit: 'fijo' (ventana fija) o 'gcra' (deslizante). Ver core_erp/ratelimit.py.
+RATELIMIT_BACKEND = config('RATELIMIT_BACKEND', default='tabla')
+RATELIMIT_MODO = config('RATELIMIT_MODO', default='fijo')
+
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},
     {'NAME': 'django.contrib.auth.password_validation.MinimumLengthValidator'},
@@ -294,6 +320,15 @@ WA_TEMPLATE_RECORDATORIO = config('WA_TEMPLATE_RECORDATORIO', default='')
 # solo funciona mientras la ventana de 24 h con ese número esté abierta.
 WA_TEMPLATE_ALERTA_INTERNA = config('WA_TEMPLATE_ALERTA_INTERNA', default='')
 
+# --- RECORDATORIOS DE PAGO (envío en lote) ---
+# El cron manda los recordatorios del día por un pool de hilos. Cada proveedor
+# tiene su propio tope de mensajes por segundo; los 429/5xx se reintentan con
+# espera exponencial a partir de RECORDATORIOS_ESPERA_BASE segundos.
+RECORDATORIOS_HILOS = 8
+RECORDATORIOS_ENVIOS_POR_SEGUNDO = {'EMAIL': 10, 'WHATSAPP': 20}
+RECORDATORIOS_REINTENTOS = 3
+RECORDATORIOS_ESPERA_BASE = 1.0
+
 # --- STORAGES (Cloudflare R2, S3-compatible) ---
 STORAGES = {
     "default": {
@@ -368,6 +403,30 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 JIBBLE_CLIENT_ID = config('JIBBLE_CLIENT_ID', default='')
 JIBBLE_CLIENT_SECRET = config('JIBBLE_CLIENT_SECRET', default='')
 NOMINA_CRON_TOKEN = config('NOMINA_CRON_TOKEN', default='')
+# Sincronización de timesheets: las peticiones a /v1/Timesheets pasan por una
+# cubeta de tokens (ráfaga de JIBBLE_TIMESHEETS_RAFAGA y después
+# JIBBLE_TIMESHEETS_POR_SEGUNDO). Un 429 espera lo que diga Retry-After o, si
+# no viene, JIBBLE_ESPERA_BASE segundos con espera exponencial. Un día ya
+# descargado se da por cerrado —y se lee del cache local— cuando se descargó
+# más de JIBBLE_DIAS_EDICION días después de terminar.
+JIBBLE_TIMESHEETS_POR_SEGUNDO = 0.5
+JIBBLE_TIMESHEETS_RAFAGA = 5
+JIBBLE_REINTENTOS = 3
+JIBBLE_ESPERA_BASE = 2.0
+JIBBLE_DIAS_EDICION = 3
+# Lotes de recibos (nomina/lotes.py): los PDF se generan fuera de la petición,
+# en un pool de NOMINA_PROCESOS_PDF procesos, y se guardan en tandas de
+# NOMINA_LOTE_TANDA recibos (cada tanda avanza el progreso del lote).
+NOMINA_PROCESOS_PDF = 2
+NOMINA_LOTE_TANDA = 10
+# Un lote PROCESANDO cuya última tanda tiene más de esto se da por
+# abandonado (el worker murió) y `procesar_lotes_nomina` lo retoma.
+NOMINA_LOTE_ABANDONO_MINUTOS = 30
+# Con True la vista procesa el lote en un hilo del worker web. Apagarlo en
+# cuanto `procesar_lotes_nomina --continuo` corra como servicio aparte en
+# Railway; mientras tanto, un cron del mismo comando recoge lo que un
+# reciclaje de gunicorn deje a medias.
+NOMINA_LOTES_EN_HILO = config('NOMINA_LOTES_EN_HILO', default=True, cast=bool)
 
 # --- OPENPAY (checkout propio: tarjeta/efectivo/SPEI + webhook) ---
 # OPENPAY_MODE controla el ambiente (sandbox/production) y con eso la URL
@@ -382,6 +441,19 @@ OPENPAY_PRIVATE_KEY = config('OPENPAY_PRIVATE_KEY', default='')
 OPENPAY_PUBLIC_KEY = config('OPENPAY_PUBLIC_KEY', default='')
 OPENPAY_WEBHOOK_USER = config('OPENPAY_WEBHOOK_USER', default='')
 OPENPAY_WEBHOOK_PASSWORD = config('OPENPAY_WEBHOOK_PASSWORD', default='')
+# False (por defecto): el Pago, la póliza y los avisos se crean dentro de la
+# petición del webhook. True: el webhook solo encola la notificación y el
+# worker `python manage.py procesar_webhooks_openpay --continuo` la procesa.
+# Activarlo SOLO después de levantar ese worker como servicio aparte en
+# Railway: sin él, las confirmaciones SPEI/Paynet se quedan en la cola y
+# nunca se vuelven Pago.
+OPENPAY_WEBHOOK_ENCOLAR = config('OPENPAY_WEBHOOK_ENCOLAR', default=False, cast=bool)
+# Una notificación que falla en el worker se reintenta con espera creciente
+# (OPENPAY_WEBHOOK_REINTENTO_SEGUNDOS × 2^intentos). Tras
+# OPENPAY_WEBHOOK_MAX_INTENTOS sale de la cola con su error_detalle; la
+# acción "Reencolar webhook" del admin la vuelve a meter.
+OPENPAY_WEBHOOK_MAX_INTENTOS = 8
+OPENPAY_WEBHOOK_REINTENTO_SEGUNDOS = 30
 
 # ==============================================================
 # SECCIÓN JAZZMIN
@@ -599,3 +671,7 @@ LOGIN_REDIRECT_URL = '/admin/'
 LOGOUT_REDIRECT_URL = '/admin/login/'
 
 CONTABILIDAD_SIGNALS_ENABLED = True
+# Vigencia en cache de la foto de ConfiguracionContable que usan las pólizas
+# automáticas (ver contabilidad/asientos.py). Guardar la configuración la
+# descarta al momento; el plazo solo acota una relectura concurrente.
+CONTABILIDAD_CATALOGO_SEGUNDOS = 300
@@ -0,0 +1,91 @@
+"""Pruebas del cache en dos niveles (L1 por worker delante de qkt_cache)."""
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+
+from core_erp.cache_niveles import CacheEnNiveles
+
+REBANADA = 'airbnb:calendario:rebanada:cotizaciones:abc123:2026-07'
+
+
+class CacheEnNivelesTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def test_espacio_con_l1_no_vuelve_a_la_base(self):
+        cache.set(REBANADA, {'version': 'v1', 'filas': []}, 600)
+        with self.assertNumQueries(0):
+            self.assertEqual(cache.get(REBANADA), {'version': 'v1', 'filas': []})
+            self.assertEqual(cache.get_many([REBANADA]), {REBANADA: {'version': 'v1', 'filas': []}})
+
+    def test_lectura_desde_la_base_llena_l1(self):
+        # Otro worker la escribió: aquí solo está en la base.
+        cache.set(REBANADA, 'valor', 600)
+        cache._l1.clear()
+
+        with self.assertNumQueries(1):
+            cache.get(REBANADA)
+        with self.assertNumQueries(0):
+            self.assertEqual(cache.get(REBANADA), 'valor')
+
+    def test_claves_fuera_de_los_espacios_siempre_van_a_la_base(self):
+        cache.set('contabilidad:catalogo', 'foto', 60)
+        with self.assertNumQueries(1):
+            cache.get('contabilidad:catalogo')
+
+    def test_candado_y_rate_limit_nunca_pasan_por_l1(self):
+        nivel = CacheEnNiveles('qkt_cache', {'OPTIONS': {
+            'L1_ESPACIOS': {'': 600},
+            'L1_NUNCA': ('pago_openpay_en_curso:', 'rl:'),
+        }})
+        for clave in ('pago_openpay_en_curso:7', 'rl:api:192.0.2.1:1'):
+            with self.subTest(clave=clave):
+                self.assertTrue(nivel.add(clave, '1', 60))
+                self.assertFalse(nivel.add(clave, '1', 60))
+                with self.assertNumQueries(1):
+                    nivel.get(clave)
+        # Con el prefijo vacío, cualquier otra clave sí entra a L1.
+        nivel.set('otra', 1, 60)
+        with self.assertNumQueries(0):
+            nivel.get('otra')
+
+    def test_borrar_saca_la_clave_de_l1(self):
+        cache.set(REBANADA, 'valor', 600)
+        cache.delete(REBANADA)
+        self.assertIsNone(cache.get(REBANADA))
+
+    def test_el_valor_leido_es_una_copia(self):
+        cache.set(REBANADA, {'filas': [1]}, 600)
+        cache.get(REBANADA)['filas'].append(2)
+        self.assertEqual(cache.get(REBANADA), {'filas': [1]})
+
+    def test_lru_acotado_y_estadisticas(self):
+        nivel = CacheEnNiveles('qkt_cache', {'OPTIONS': {
+            'L1_ESPACIOS': {'doc:': 600}, 'L1_MAX_ENTRADAS': 2,
+        }})
+        for n in range(3):
+            nivel.set(f'doc:{n}', n, 600)
+        nivel.get('doc:2')   # L1
+        nivel.get('doc:0')   # desalojada: a la base, y vuelve a L1
+        nivel.get('doc:9')   # no existe
+
+        stats = nivel.estadisticas()
+        self.assertEqual(stats['l1']['entradas'], 2)
+        self.assertEqual(stats['l1']['desalojos'], 2)
+        self.assertEqual(stats['l1']['aciertos'], 1)
+        self.assertEqual(stats['l1']['fallos'], 2)
+        self.assertEqual((stats['l2']['aciertos'], stats['l2']['fallos']), (1, 1))
+
+    def test_vista_de_estadisticas_solo_para_staff(self):
+        url = reverse('estadisticas_cache')
+        self.assertEqual(self.client.get(url).status_code, 302)
+
+        staff = get_user_model().objects.create_user('staff_cache', password='x', is_staff=True)
+        self.client.force_login(staff)
+        datos = self.client.get(url).json()
+        self.assertIn('pid', datos)
+        self.assertLessEqual({'aciertos', 'fallos', 'desalojos'}, set(datos['l1']))
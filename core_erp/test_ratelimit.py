@@ -5,13 +5,20 @@ from unittest.mock import patch
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.core.cache import cache
-from django.db import connection
+from django.core.cache import cache, caches
+from django.core.cache.backends.db import DatabaseCache
+from django.db import ProgrammingError, connection
 from django.http import HttpResponse
 from django.test import RequestFactory, TestCase, override_settings
 from django.urls import reverse
 
-from core_erp.ratelimit import limpiar_intentos_login, rate_limit, registrar_login_fallido
+from core_erp.ratelimit import (
+    BACKENDS,
+    _contar,
+    limpiar_intentos_login,
+    rate_limit,
+    registrar_login_fallido,
+)
 
 
 class CacheCompartidoTest(TestCase):
@@ -19,8 +26,10 @@ class CacheCompartidoTest(TestCase):
         cache.clear()
 
     def test_backend_no_es_memoria_local(self):
+        # El L1 por worker va delante, pero el nivel compartido es la base.
         backend = settings.CACHES['default']['BACKEND']
-        self.assertEqual(backend, 'django.core.cache.backends.db.DatabaseCache')
+        self.assertEqual(backend, 'core_erp.cache_niveles.CacheEnNiveles')
+        self.assertIsInstance(caches['default'], DatabaseCache)
         self.assertNotIn('LocMemCache', backend)
 
     def test_valor_del_cache_se_guarda_en_base_de_datos(self):
@@ -53,13 +62,18 @@ class CacheCompartidoTest(TestCase):
         with patch('core_erp.ratelimit.time.time', return_value=inicio_ventana + 60):
             self.assertEqual(vista(request).status_code, 200)
 
+    def test_los_dos_backends_cuentan_igual(self):
+        for backend in ('cache', 'tabla'):
+            with self.subTest(backend=backend), override_settings(RATELIMIT_BACKEND=backend):
+                cuentas = [_contar(f'rl:paridad:{backend}:0', 60) for _ in range(3)]
+                self.assertEqual(cuentas, [1, 2, 3])
+
+    @override_settings(RATELIMIT_BACKEND='cache')
     def test_contar_no_extiende_el_ttl_al_incrementar(self):
         # Antes del fix, el incremento usaba cache.incr(), cuyo set() interno
         # sin timeout caía al TIMEOUT global (3600s) en vez de respetar
         # window*2 — el mismo defecto que dejaba el candado anti-doble-cobro
         # de Openpay como primer candidato al cull.
-        from core_erp.ratelimit import _contar
-
         bucket = 'rl:test-ttl:0'
         _contar(bucket, window=1)
         _contar(bucket, window=1)
@@ -69,6 +83,101 @@ class CacheCompartidoTest(TestCase):
         self.assertIsNone(cache.get(bucket))
 
 
+class _CursorComoPsycopg2:
+    """Cursor real que, como psycopg2, lanza ProgrammingError si se pide
+    fetchone() tras una sentencia que no devuelve filas (SQLite regresa None)."""
+
+    def __init__(self, cursor):
+        self._cursor, self._sql = cursor, ''
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._cursor.close()
+
+    def execute(self, sql, parametros=None):
+        self._sql = sql.lstrip().upper()
+        return self._cursor.execute(sql, parametros)
+
+    def fetchone(self):
+        if not (self._sql.startswith('SELECT') or 'RETURNING' in self._sql):
+            raise ProgrammingError('no results to fetch')
+        return self._cursor.fetchone()
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+
+class ContadorTablaTest(TestCase):
+    """Backend 'tabla': un upsert por golpe sobre qkt_ratelimit."""
+
+    def setUp(self):
+        self.tabla = BACKENDS['tabla']
+        self.reloj = patch('core_erp.ratelimit.time.time', return_value=1_000_000.0)
+        self.ahora = self.reloj.start()
+        self.addCleanup(self.reloj.stop)
+
+    def test_un_golpe_es_una_sola_consulta(self):
+        self.tabla.contar('rl:prueba:ip:1', 60)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.tabla.contar('rl:prueba:ip:1', 60), 2)
+
+    def test_contador_vencido_vuelve_a_empezar(self):
+        self.tabla.contar('rl:prueba:ip:1', 10)
+        self.tabla.contar('rl:prueba:ip:1', 10)
+        self.assertEqual(self.tabla.leer('rl:prueba:ip:1'), 2)
+
+        self.ahora.return_value += 20
+        self.assertEqual(self.tabla.leer('rl:prueba:ip:1'), 0)
+        self.assertEqual(self.tabla.contar('rl:prueba:ip:1', 10), 1)
+
+    def test_limpiar_expirados_borra_solo_lo_vencido(self):
+        self.tabla.contar('rl:prueba:vieja:1', 10)
+        self.ahora.return_value += 15
+        self.tabla.contar('rl:prueba:nueva:1', 10)
+        self.ahora.return_value += 10
+
+        self.assertEqual(self.tabla.limpiar_expirados(), 1)
+        self.assertEqual(self.tabla.leer('rl:prueba:nueva:1'), 1)
+
+    def test_ninguna_operacion_pide_filas_a_un_delete(self):
+        cursor_real = connection.cursor
+        with patch.object(connection, 'cursor', lambda: _CursorComoPsycopg2(cursor_real())):
+            self.assertEqual(self.tabla.contar('rl:admin_login_user:ana:1', 60), 1)
+            self.assertEqual(self.tabla.gcra('rl:gcra:ip', 3, 60), 0)
+            self.tabla.borrar('rl:admin_login_user:ana:1')
+            self.assertEqual(self.tabla.leer('rl:admin_login_user:ana:1'), 0)
+            self.ahora.return_value += 200
+            self.assertEqual(self.tabla.limpiar_expirados(), 1)
+
+    def test_gcra_admite_la_rafaga_y_luego_una_por_intervalo(self):
+        admitidas = [self.tabla.gcra('rl:gcra:ip', 3, 60) == 0 for _ in range(4)]
+        self.assertEqual(admitidas, [True, True, True, False])
+        self.assertAlmostEqual(self.tabla.gcra('rl:gcra:ip', 3, 60), 20.0)
+
+        # Una petición cada 20 s (60/3) vuelve a caber, sin esperar al
+        # cambio de ventana.
+        self.ahora.return_value += 20
+        self.assertEqual(self.tabla.gcra('rl:gcra:ip', 3, 60), 0)
+        self.assertGreater(self.tabla.gcra('rl:gcra:ip', 3, 60), 0)
+
+    @override_settings(RATELIMIT_MODO='gcra')
+    def test_rate_limit_en_modo_gcra(self):
+        request = RequestFactory().get('/prueba-rate-limit/')
+
+        @rate_limit(key='prueba_gcra', limit=2, window=60)
+        def vista(_request):
+            return HttpResponse('ok')
+
+        self.assertEqual(vista(request).status_code, 200)
+        self.assertEqual(vista(request).status_code, 200)
+        rechazo = vista(request)
+        self.assertEqual(rechazo.status_code, 429)
+        self.assertEqual(rechazo.headers['Retry-After'], '30')
+
+
 @override_settings(
     ADMIN_LOGIN_VENTANA=900,
     ADMIN_LOGIN_MAX_INTENTOS_IP=3,
@@ -217,4 +326,7 @@ class AdminLoginRateLimitTest(TestCase):
         with connection.cursor() as cursor:
             cursor.execute(f'SELECT cache_key FROM {tabla}')  # noqa: S608 -- tabla viene de settings.CACHES, no de entrada externa
             claves = [fila[0] for fila in cursor.fetchall()]
-        self.assertFalse(any(self.username in clave_cache for clave_cache in claves))
+            cursor.execute('SELECT clave FROM qkt_ratelimit')
+            contadores = [fila[0] for fila in cursor.fetchall()]
+        self.assertTrue(contadores)
+        self.assertFalse(any(self.username in clave for clave in claves + contadores))
@@ -29,6 +29,7 @@ from comercial.views_cotizador import (
     cotizador_gracias,
     cotizador_publico,
 )
+from comercial.views_inventario import api_movimientos_inventario, api_stock_inventario
 from comercial.views_openpay import (
     openpay_webhook_view,
     portal_ficha_paynet,
@@ -43,6 +44,7 @@ from comercial.views_portal import (
     portal_descargar_plan,
     portal_evento,
 )
+from core_erp.cache_niveles import estadisticas_cache
 from core_erp.descargas import descargar_archivo_privado
 from core_erp.ratelimit import _client_ip, login_bloqueado
 from core_erp.views_totp import totp_activar_view, totp_verificar_view
@@ -126,6 +128,8 @@ urlpatterns = [
     path('admin/2fa/activar/', totp_activar_view, name='totp_activar'),
     path('admin/2fa/verificar/', totp_verificar_view, name='totp_verificar'),
 
+    path('admin/cache/estadisticas/', estadisticas_cache, name='estadisticas_cache'),
+
     path('airbnb/', include('airbnb.urls')),
 
     # --- 2. EL DASHBOARD (Tu página principal del admin) ---
@@ -145,6 +149,8 @@ urlpatterns = [
     path('admin/exportar-cotizaciones/', exportar_reporte_cotizaciones, name='exportar_reporte_cotizaciones'),
     path('admin/reporte-pagos/', exportar_reporte_pagos, name='reporte_pagos'),
     path('admin/lista-compras/', generar_lista_compras, name='generar_lista_compras'),
+    path('admin/inventario/stock/', api_stock_inventario, name='api_stock_inventario'),
+    path('admin/inventario/movimientos/', api_movimientos_inventario, name='api_movimientos_inventario'),
     path('admin/exportar-cierre/', exportar_cierre_excel, name='exportar_cierre_excel'),
 
     # --- 4. MÓDULOS EXTRA ---
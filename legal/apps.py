@@ -5,3 +5,6 @@ class LegalConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'legal'
     verbose_name = 'Legal'
+
+    def ready(self):
+        from . import services  # noqa: F401
@@ -0,0 +1,34 @@
+# Generated by Django 6.1 on 2026-10-19 04:19
+
+from django.db import migrations, models
+
+
+def renderizar_vigentes(apps, schema_editor):
+    # El modelo histórico no trae render_html(); se usa el del código actual,
+    # que es justo el que servirá la página a partir de este despliegue.
+    from legal.models import DocumentoLegal as DocumentoActual
+
+    DocumentoLegal = apps.get_model("legal", "DocumentoLegal")
+    for doc in DocumentoLegal.objects.filter(vigente=True, html_renderizado=""):
+        html = DocumentoActual(contenido_md=doc.contenido_md).render_html()
+        DocumentoLegal.objects.filter(pk=doc.pk).update(html_renderizado=html)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("legal", "0004_alter_solicitudarco_identificacion"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="documentolegal",
+            name="html_renderizado",
+            field=models.TextField(
+                blank=True,
+                editable=False,
+                help_text="Cuerpo ya sanitizado (render_html), generado al publicar.",
+            ),
+        ),
+        migrations.RunPython(renderizar_vigentes, migrations.RunPython.noop),
+    ]
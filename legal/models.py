@@ -50,6 +50,9 @@ class DocumentoLegal(models.Model):
     contenido_md = models.TextField(
         help_text="Contenido en Markdown. Inmutable una vez guardado.")
     hash_contenido = models.CharField(max_length=64, editable=False, db_index=True)
+    html_renderizado = models.TextField(
+        blank=True, editable=False,
+        help_text="Cuerpo ya sanitizado (render_html), generado al publicar.")
     vigente_desde = models.DateField()
     vigente = models.BooleanField(default=False, db_index=True)
 
@@ -123,6 +126,11 @@ class DocumentoLegal(models.Model):
         )
         return nh3.clean(html)
 
+    def cuerpo_html(self) -> str:
+        """HTML del cuerpo: el guardado al publicar, o renderizado al vuelo
+        si la versión se marcó vigente sin pasar por `save()`."""
+        return self.html_renderizado or self.render_html()
+
     def marcadores_pendientes(self) -> list:
         """Marcadores [CONFIRMAR:] / [PENDIENTE:] que quedan en el contenido."""
         return MARCADORES_SIN_RESOLVER.findall(self.contenido_md or '')
@@ -149,6 +157,10 @@ class DocumentoLegal(models.Model):
                 "No se puede publicar un documento con marcadores sin resolver."
             )
         if self.vigente:
+            # El contenido es inmutable, así que basta renderizarlo una vez:
+            # la página pública y el ETag salen de este HTML y del hash.
+            if not self.html_renderizado:
+                self.html_renderizado = self.render_html()
             DocumentoLegal.objects.filter(tipo=self.tipo, vigente=True) \
                                   .exclude(pk=self.pk).update(vigente=False)
         super().save(*args, **kwargs)
@@ -1,8 +1,12 @@
 """Capa de servicio del módulo legal. Las vistas no tocan los modelos directamente."""
 
 import logging
+import threading
+import uuid
 
+from django.core.cache import cache
 from django.db import transaction
+from django.db.models.signals import post_save
 
 from .models import (
     AceptacionLegal,
@@ -20,16 +24,66 @@ DOCUMENTOS_OBLIGATORIOS = (
     TipoDocumento.POLITICA_CANCELACION,
 )
 
+# `documentos_vigentes` corre en cada aceptación. Las versiones vigentes solo
+# cambian al publicar, así que cada proceso las guarda en memoria junto con la
+# generación del cache con la que las leyó. Publicar cambia la generación (ver
+# `invalidar_documentos_vigentes`) y los demás procesos la ven en su siguiente
+# lectura: una consulta al cache en vez de traer los documentos completos.
+CLAVE_GENERACION = 'legal:vigentes:gen'
+_vigentes = {}
+_vigentes_lock = threading.Lock()
+
+
+def _generacion():
+    generacion = cache.get(CLAVE_GENERACION)
+    if generacion is None:
+        cache.add(CLAVE_GENERACION, uuid.uuid4().hex[:8], None)
+        generacion = cache.get(CLAVE_GENERACION)
+    return generacion
+
+
+def invalidar_documentos_vigentes():
+    """Cambia la generación ahora y otra vez al confirmar: una aceptación
+    entre el cambio y el commit habría memorizado las versiones de antes.
+
+    `save()` de DocumentoLegal la llama sola; quien cambie `vigente` con
+    `QuerySet.update()` tiene que llamarla a mano."""
+    def _nueva_generacion():
+        with _vigentes_lock:
+            _vigentes.clear()
+        cache.set(CLAVE_GENERACION, uuid.uuid4().hex[:8], None)
+    _nueva_generacion()
+    transaction.on_commit(_nueva_generacion)
+
 
 class LegalService:
 
     @staticmethod
     def documento_vigente(tipo: str):
-        return DocumentoLegal.objects.filter(tipo=tipo, vigente=True).first()
+        # Sin memo: la página pública tiene que dejar de servir una versión
+        # despublicada aunque se haya hecho con `update()`.
+        return (
+            DocumentoLegal.objects.filter(tipo=tipo, vigente=True)
+            .defer('contenido_md').first()
+        )
 
     @staticmethod
     def documentos_vigentes(tipos=DOCUMENTOS_OBLIGATORIOS):
-        return list(DocumentoLegal.objects.filter(tipo__in=tipos, vigente=True))
+        """Versiones vigentes de `tipos`, sin el contenido (solo tipo, versión
+        y hash, que es lo que se congela en la aceptación)."""
+        clave = (_generacion(), tuple(tipos))
+        documentos = _vigentes.get(clave)
+        if documentos is None:
+            documentos = list(
+                DocumentoLegal.objects.filter(tipo__in=tipos, vigente=True)
+                .defer('contenido_md', 'html_renderizado')
+            )
+            with _vigentes_lock:
+                # Lo de generaciones anteriores ya no se va a pedir.
+                for vieja in [k for k in _vigentes if k[0] != clave[0]]:
+                    del _vigentes[vieja]
+                _vigentes[clave] = documentos
+        return list(documentos)
 
     @staticmethod
     def obtener_ip(request):
@@ -103,3 +157,10 @@ class LegalService:
             .first()
         )
         return clave_finalidad in (ultima or [])
+
+
+def _documento_guardado(sender, **kwargs):
+    invalidar_documentos_vigentes()
+
+
+post_save.connect(_documento_guardado, sender=DocumentoLegal, dispatch_uid='legal_vigentes_save')
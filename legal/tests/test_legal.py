@@ -373,6 +373,56 @@ class VistasPublicasTest(TestCase):
             self.client.get(reverse('legal:terminos'), secure=True).status_code, 404)
 
 
+class HtmlPrecalculadoTest(TestCase):
+    """El cuerpo se renderiza al publicar y la página se sirve con ETag."""
+
+    def test_publicar_guarda_el_html_sanitizado(self):
+        borrador = _doc(TipoDocumento.TERMINOS, contenido='## Uno\n\n<script>x</script>',
+                        vigente=False)
+        self.assertEqual(borrador.html_renderizado, '')
+
+        borrador.vigente = True
+        borrador.save()
+        borrador.refresh_from_db()
+        self.assertEqual(borrador.html_renderizado, borrador.render_html())
+        self.assertNotIn('<script', borrador.html_renderizado)
+
+    def test_etag_del_contenido_y_304(self):
+        _doc(TipoDocumento.TERMINOS, version='1.0', contenido='Texto uno')
+        r1 = self.client.get(reverse('legal:terminos'), secure=True)
+        self.assertEqual(r1['Cache-Control'], 'public, no-cache')
+
+        r2 = self.client.get(reverse('legal:terminos'), secure=True,
+                             HTTP_IF_NONE_MATCH=r1['ETag'])
+        self.assertEqual(r2.status_code, 304)
+        self.assertEqual(r2.content, b'')
+
+        _doc(TipoDocumento.TERMINOS, version='2.0', contenido='Texto dos')
+        r3 = self.client.get(reverse('legal:terminos'), secure=True,
+                             HTTP_IF_NONE_MATCH=r1['ETag'])
+        self.assertEqual(r3.status_code, 200)
+        self.assertNotEqual(r3['ETag'], r1['ETag'])
+        self.assertContains(r3, 'Texto dos')
+
+    def test_vigente_sin_html_guardado_se_renderiza_al_vuelo(self):
+        doc = _doc(TipoDocumento.TERMINOS, contenido='## Sección legada', vigente=False)
+        DocumentoLegal.objects.filter(pk=doc.pk).update(vigente=True)
+        r = self.client.get(reverse('legal:terminos'), secure=True)
+        self.assertContains(r, '<h2>Sección legada</h2>')
+
+    def test_documentos_vigentes_se_memorizan_hasta_publicar(self):
+        _documentos_obligatorios()
+        LegalService.documentos_vigentes()
+        # Solo la lectura de la generación en el cache.
+        with self.assertNumQueries(1):
+            documentos = LegalService.documentos_vigentes()
+        self.assertEqual(len(documentos), 3)
+
+        nuevo = _doc(TipoDocumento.TERMINOS, version='2.0', contenido='Terminos v2')
+        versiones = {d.tipo: d.pk for d in LegalService.documentos_vigentes()}
+        self.assertEqual(versiones[TipoDocumento.TERMINOS], nuevo.pk)
+
+
 class SeedTest(TestCase):
     """El seed corre en cada arranque del contenedor: debe ser idempotente y
     no puede degradar una versión publicada desde el admin."""
@@ -1,16 +1,22 @@
+import hashlib
 import mimetypes
+import threading
 from pathlib import Path
 
 from django.contrib.auth.decorators import login_required, permission_required
-from django.core.cache import cache
 from django.http import FileResponse, Http404, HttpResponse
 from django.shortcuts import get_object_or_404
 from django.template.loader import render_to_string
+from django.utils.cache import get_conditional_response
 
 from .models import AccesoIdentificacionARCO, SolicitudARCO, TipoDocumento
 from .services import LegalService
 
-CACHE_SEGUNDOS = 60 * 60
+# Página completa en la memoria del proceso, por todo lo que la portada y el
+# cuerpo muestran. Hay a lo más una versión vigente por tipo: al guardar una
+# página se descartan las demás del mismo tipo.
+_paginas = {}
+_paginas_lock = threading.Lock()
 
 
 @login_required
@@ -40,19 +46,44 @@ def descargar_identificacion_arco(request, solicitud_id):
     return response
 
 
+def _pagina(documento):
+    """{'contenido', 'etag'} de la página pública de `documento`."""
+    clave = (
+        documento.tipo, documento.pk, documento.hash_contenido,
+        documento.version, documento.titulo, documento.vigente_desde,
+    )
+    pagina = _paginas.get(clave)
+    if pagina is None:
+        contenido = render_to_string(
+            'legal/documento.html',
+            {'documento': documento, 'cuerpo': documento.cuerpo_html()},
+        )
+        pagina = {
+            'contenido': contenido,
+            'etag': '"%s"' % hashlib.sha256(contenido.encode()).hexdigest()[:32],
+        }
+        with _paginas_lock:
+            for vieja in [k for k in _paginas if k[0] == documento.tipo]:
+                del _paginas[vieja]
+            _paginas[clave] = pagina
+    return pagina
+
+
 def documento_publico(request, tipo):
     """
     Renderiza siempre la versión vigente. Público, sin autenticación.
 
-    La clave de cache incluye el SHA-256 del contenido, no solo la URL como
-    haría `cache_page`: al publicar una versión nueva cambia el hash y por
-    tanto la clave, así que la corrección entra en vigor de inmediato en vez
-    de quedar tapada por la versión anterior hasta que expire el cache.
-    Tratándose de documentos legales, servir contenido obsoleto es justo lo
-    que no puede pasar.
+    El cuerpo ya viene sanitizado desde la publicación (`html_renderizado`)
+    y la página se arma una vez por proceso. La clave incluye el SHA-256 del
+    contenido, no solo la URL como haría `cache_page`: al publicar una
+    versión nueva cambia el hash y por tanto la clave, así que la corrección
+    entra en vigor de inmediato. Tratándose de documentos legales, servir
+    contenido obsoleto es justo lo que no puede pasar.
 
-    Tampoco se invalida con `cache.clear()`: este mismo cache guarda los
-    buckets del rate limiting y el candado de pagos de Openpay.
+    Por lo mismo la respuesta no lleva `max-age`: la URL es fija y un
+    navegador o proxy seguiría mostrando la versión anterior. Lleva un ETag
+    del contenido y `no-cache`, así que la revalidación cuesta una consulta
+    y un 304 sin cuerpo.
     """
     if tipo not in TipoDocumento.values:
         raise Http404
@@ -61,13 +92,8 @@ def documento_publico(request, tipo):
     if not documento:
         raise Http404
 
-    clave = f'legal:doc:{tipo}:{documento.hash_contenido}'
-    html = cache.get(clave)
-    if html is None:
-        html = render_to_string(
-            'legal/documento.html',
-            {'documento': documento, 'cuerpo': documento.render_html()},
-            request=request,
-        )
-        cache.set(clave, html, CACHE_SEGUNDOS)
-    return HttpResponse(html)
+    pagina = _pagina(documento)
+    response = HttpResponse(pagina['contenido'])
+    response['ETag'] = pagina['etag']
+    response['Cache-Control'] = 'public, no-cache'
+    return get_conditional_response(request, etag=pagina['etag'], response=response)
@@ -7,7 +7,7 @@ from django.utils.timezone import now
 
 from core_erp.descargas import url_descarga
 
-from .models import Empleado, ReciboNomina
+from .models import Empleado, LoteNomina, ReciboNomina
 
 try:
     from .views import cargar_nomina, sync_jibble_view
@@ -44,7 +44,7 @@ class ReciboNominaAdmin(admin.ModelAdmin):
     marcar_como_pagado.short_description = "Marcar como pagado en efectivo (solo administrativo)"
 
     def folio_custom(self, obj):
-        return f"NOM-{obj.id:03d}"
+        return f"NOM-{obj.folio or obj.id:03d}"
     folio_custom.short_description = "Folio"
 
     def ver_pdf(self, obj):
@@ -75,3 +75,36 @@ class ReciboNominaAdmin(admin.ModelAdmin):
             extra_context['jibble_fecha_fin'] = domingo_pasado.strftime('%Y-%m-%d')
 
         return super().changelist_view(request, extra_context=extra_context)
+
+
+@admin.register(LoteNomina)
+class LoteNominaAdmin(admin.ModelAdmin):
+    list_display = ('__str__', 'origen', 'estado_badge', 'avance', 'creado_por', 'creado_en', 'terminado_en')
+    list_filter = ('estado', 'origen')
+    readonly_fields = ('origen', 'estado', 'periodo', 'total', 'procesados', 'error', 'primer_folio',
+                       'creado_por', 'creado_en', 'latido_en', 'terminado_en')
+    exclude = ('datos',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    @admin.display(description="Estado", ordering="estado")
+    def estado_badge(self, obj):
+        colores = {
+            'PENDIENTE': '#95a5a6',
+            'PROCESANDO': '#1565C0',
+            'TERMINADO': '#2E7D32',
+            'ERROR': '#e74c3c',
+        }
+        return format_html(
+            '<span style="background:{}; color:#fff; padding:3px 8px; '
+            'border-radius:12px; font-size:10px; font-weight:600;">{}</span>',
+            colores.get(obj.estado, '#95a5a6'), obj.get_estado_display()
+        )
+
+    @admin.display(description="Avance")
+    def avance(self, obj):
+        return f"{obj.procesados}/{obj.total}"
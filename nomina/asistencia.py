@@ -0,0 +1,170 @@
+"""
+Lectura vectorizada del reporte de asistencia (Excel/CSV exportado de Jibble)
+============================================================================
+`cargar_nomina` recorría la hoja celda por celda: un `pd.to_datetime` por
+celda para encontrar la fila de fechas y `parsear_horas_complejas` /
+`parsear_hms` por cada celda de horas. Aquí lo mismo se hace por columnas:
+
+1. La fila de fechas se busca convirtiendo cada una de las primeras 20 filas
+   con `to_datetime(errors='coerce', format='mixed')` (cada valor se
+   interpreta por separado, igual que el `to_datetime` por celda).
+2. Las filas PAYROLL/HORAS salen de una máscara booleana sobre las primeras
+   5 columnas.
+3. Las celdas de horas de esas filas se aplanan a una tabla (fila, columna,
+   valor) y se interpretan con operaciones de texto vectorizadas.
+
+El resultado es exactamente el mismo `datos_empleados` que producía el
+recorrido anterior (ver `parsear_horas_complejas`, `parsear_hms`,
+`redondear_horas_90` y `calcular_hora_salida` en views.py, que siguen siendo
+la referencia de cada regla). Solo el redondeo a 4 decimales y el armado de
+cada registro se hacen en Python, para conservar el `round()` de siempre.
+"""
+from datetime import time
+
+import numpy as np
+import pandas as pd
+
+FILAS_BUSQUEDA_FECHAS = 20
+COLUMNAS_ETIQUETA = 5
+_ENTERO = r'^\s*[+-]?\d+\s*$'
+
+
+def _texto(serie):
+    """`str(x)` de cada valor, con 'nan' para los vacíos como hace str(float('nan'))."""
+    return serie.astype(object).where(serie.notna(), 'nan').astype(str)
+
+
+def fila_de_fechas(df):
+    """(índice de la fila de fechas, {columna: Timestamp}); (-1, {}) si no hay.
+
+    Es la primera de las primeras 20 filas con más de 3 fechas posteriores
+    al año 2000.
+    """
+    for r in range(min(FILAS_BUSQUEDA_FECHAS, len(df))):
+        fechas = pd.to_datetime(df.iloc[r].astype(object), errors='coerce', format='mixed')
+        validas = (fechas.notna() & (fechas.dt.year > 2000)).to_numpy()
+        if validas.sum() > 3:
+            return r, dict(zip(np.flatnonzero(validas).tolist(), fechas[validas].tolist()))
+    return -1, {}
+
+
+def _horas_decimales(texto, vacia):
+    """Horas en decimal de cada celda (0 si no se entiende), sin redondear."""
+    con_dos_puntos = texto.str.contains(':', regex=False) & ~vacia
+    partes = texto.where(con_dos_puntos).str.split(':', expand=True).reindex(columns=range(3))
+    h, m, sec = (pd.to_numeric(partes[i], errors='coerce') for i in range(3))
+    validas = h.notna() & m.notna() & (partes[2].isna() | sec.notna())
+    horas_hms = (h + (m / 60.0) + (sec.fillna(0.0) / 3600.0)).where(con_dos_puntos & validas, 0.0)
+
+    numero = pd.to_numeric(texto.where(~con_dos_puntos & ~vacia), errors='coerce')
+    return horas_hms.where(con_dos_puntos, numero.fillna(0.0)).astype(float)
+
+
+def _horas_minutos_segundos(texto):
+    """(h, m, s) enteros de cada celda, con (0, 0, 0) si no se entiende."""
+    con_dos_puntos = texto.str.contains(':', regex=False)
+    partes = texto.where(con_dos_puntos).str.split(':', expand=True).reindex(columns=range(3))
+    enteros = [partes[i].str.match(_ENTERO).eq(True) for i in range(3)]
+    validas_hms = con_dos_puntos & enteros[0] & enteros[1] & (partes[2].isna() | enteros[2])
+    hms = [pd.to_numeric(partes[i].where(enteros[i]), errors='coerce').fillna(0) for i in range(3)]
+
+    valor = pd.to_numeric(texto.where(~con_dos_puntos), errors='coerce').to_numpy(dtype=float)
+    validas_num = ~con_dos_puntos.to_numpy() & np.isfinite(valor)
+    valor = np.where(validas_num, valor, 0.0)
+    horas = np.trunc(valor)
+    resto_min = (valor - horas) * 60
+    minutos = np.trunc(resto_min)
+    segundos = np.trunc((resto_min - minutos) * 60)
+
+    resultado = []
+    for desde_texto, desde_numero in zip(hms, (horas, minutos, segundos)):
+        columna = np.where(validas_hms.to_numpy(), desde_texto.to_numpy(dtype=float), 0.0)
+        resultado.append(np.where(validas_num, desde_numero, columna).astype(np.int64))
+    return resultado
+
+
+def leer_asistencia(df, horarios_semana):
+    """
+    (datos_empleados, fecha_emision_por_empleado) de la hoja `df` leída con
+    `header=None`; None si la hoja no tiene fila de fechas.
+
+    `horarios_semana`: {weekday: time} con la hora de entrada programada
+    (ver `parsear_horario_trabajo`), de la que sale la hora de salida.
+    """
+    row_fechas_idx, mapa_columnas_fechas = fila_de_fechas(df)
+    if not mapa_columnas_fechas:
+        return None
+
+    # Filas PAYROLL/HORAS después de la fila de fechas
+    resto = df.iloc[row_fechas_idx + 1:]
+    etiquetas = resto.iloc[:, :COLUMNAS_ETIQUETA].apply(lambda c: _texto(c).str.upper().str.strip())
+    es_payroll = etiquetas.apply(
+        lambda c: c.str.contains('PAYROLL', regex=False) | c.str.contains('HORAS', regex=False)
+    ).any(axis=1)
+    nombres = etiquetas.iloc[:, 0]
+    filas = es_payroll & ~nombres.isin(['NAN', '', '-'])
+    nombres = nombres[filas].tolist()
+
+    datos_empleados = {nombre: [] for nombre in nombres}
+    fecha_emision_por_empleado = {}
+    if not nombres:
+        return datos_empleados, fecha_emision_por_empleado
+
+    # Tabla (fila, columna, valor) en el mismo orden del recorrido anterior
+    columnas = list(mapa_columnas_fechas)
+    valores = resto[filas].iloc[:, columnas].to_numpy(dtype=object)
+    celdas = pd.Series(valores.ravel(), dtype=object)
+    fila_de = np.repeat(np.arange(len(nombres)), len(columnas))
+    columna_de = np.tile(np.arange(len(columnas)), len(nombres))
+
+    texto = _texto(celdas).str.strip()
+    vacia = celdas.isna() | texto.isin(['-', ''])
+    horas = _horas_decimales(texto, vacia)
+
+    # round() de Python (no el de NumPy) para que horas_raw sea idéntico
+    candidatas = np.flatnonzero((horas > 0).to_numpy())
+    redondeadas = [round(x, 4) for x in horas.iloc[candidatas].tolist()]
+    con_horas = [(i, x) for i, x in zip(candidatas.tolist(), redondeadas) if x > 0]
+    if not con_horas:
+        return datos_empleados, fecha_emision_por_empleado
+    indices = np.array([i for i, _ in con_horas])
+    horas_raw = np.array([x for _, x in con_horas])
+
+    h, m, s = _horas_minutos_segundos(texto.iloc[indices].reset_index(drop=True))
+
+    # Regla 90% y hora de salida (entrada programada + duración)
+    parte_entera = np.trunc(horas_raw)
+    horas_a_pagar = np.where(horas_raw - parte_entera >= 0.9, parte_entera + 1, parte_entera)
+    fechas = [mapa_columnas_fechas[columnas[c]] for c in range(len(columnas))]
+    entradas = [horarios_semana.get(f.weekday(), time(8, 0)) for f in fechas]
+    segundos_entrada = np.array([e.hour * 3600 + e.minute * 60 for e in entradas], dtype=np.int64)
+    total = segundos_entrada[columna_de[indices]] + h * 3600 + m * 60 + s
+    salida_h, salida_m = (total // 3600) % 24, (total % 3600) // 60
+
+    fecha_txt = [f.strftime('%Y-%m-%d') for f in fechas]
+    dia_txt = [f.strftime('%A')[:3] for f in fechas]
+    entrada_txt = [e.strftime('%H:%M') for e in entradas]
+
+    for fila, col, raw, pagar, hh, mm, ss, sh, sm in zip(
+        fila_de[indices].tolist(), columna_de[indices].tolist(), horas_raw.tolist(),
+        horas_a_pagar.tolist(), h.tolist(), m.tolist(), s.tolist(), salida_h.tolist(), salida_m.tolist(),
+    ):
+        nombre = nombres[fila]
+        hora_salida = f"{sh:02d}:{sm:02d}"
+        datos_empleados[nombre].append({
+            'fecha': fecha_txt[col],
+            'dia': dia_txt[col],
+            'entrada': entrada_txt[col],
+            'salida': hora_salida,
+            'horas_fmt': f"{hh}:{mm:02d}:{ss:02d}",
+            'horas_raw': raw,
+            'horas_a_pagar': pagar,
+            'horas_a_pagar_fmt': f"{pagar:.0f}:00",
+            'fue_recortado': pagar < raw,
+        })
+        # Ultima salida para fecha de emision
+        salida_dt = f"{fecha_txt[col]} {hora_salida}"
+        if nombre not in fecha_emision_por_empleado or salida_dt > fecha_emision_por_empleado[nombre]:
+            fecha_emision_por_empleado[nombre] = salida_dt
+
+    return datos_empleados, fecha_emision_por_empleado
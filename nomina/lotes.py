@@ -0,0 +1,260 @@
+"""
+Lotes de recibos de nómina
+==========================
+La carga de Excel y la sincronización con Jibble generaban un PDF de
+WeasyPrint por empleado dentro de la petición HTTP, con un
+`get_or_create` y un `COUNT(*)` (para el folio) por empleado. Con toda la
+plantilla eso dejaba un worker de gunicorn ocupado por minutos.
+
+Ahora la vista solo crea un LoteNomina con los registros ya calculados y lo
+encola. Lo procesa el worker `procesar_lotes_nomina --continuo` o, mientras
+ese servicio no exista (NOMINA_LOTES_EN_HILO), un hilo del mismo worker web:
+
+1. Resuelve todos los empleados en una consulta y da de alta los nuevos con
+   un `bulk_create`.
+2. Reserva de una vez los folios del lote en FolioNomina y guarda el
+   primero en el lote.
+3. Arma el HTML de cada recibo en el hilo (plantillas de Django) y lo
+   convierte a PDF en un pool de procesos (NOMINA_PROCESOS_PDF).
+4. Sube los PDF y guarda los recibos con `bulk_create` en tandas de
+   NOMINA_LOTE_TANDA; cada tanda avanza `procesados` y el `latido_en` del
+   lote en la misma transacción.
+
+Si el proceso muere a medias (gunicorn recicla el worker con
+--max-requests, un deploy), el lote se queda en PROCESANDO con su latido
+detenido. Pasados NOMINA_LOTE_ABANDONO_MINUTOS, `procesar_lotes_nomina` lo
+retoma, igual que a los PENDIENTE y, con --reintentar, a los de ERROR: los
+empleados que ya tienen recibo en el lote se saltan y los demás conservan
+el folio que les tocaba del bloque reservado.
+"""
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from .models import Empleado, FolioNomina, LoteNomina, ReciboNomina
+from .pdf import escribir_pdf
+
+logger = logging.getLogger(__name__)
+
+
+def crear_lote(datos_empleados, fecha_emision_por_empleado=None, *, origen, periodo='', usuario=None):
+    """LoteNomina PENDIENTE con los empleados que tienen registros."""
+    empleados = {nombre: registros for nombre, registros in datos_empleados.items() if registros}
+    return LoteNomina.objects.create(
+        origen=origen,
+        periodo=periodo,
+        datos={'empleados': empleados, 'fechas_emision': fecha_emision_por_empleado or {}},
+        total=len(empleados),
+        creado_por=usuario,
+    )
+
+
+def encolar_lote(lote):
+    """
+    Con NOMINA_LOTES_EN_HILO procesa el lote en un hilo aparte en cuanto se
+    confirme la transacción; si no, lo deja PENDIENTE para el worker.
+    """
+    if not getattr(settings, 'NOMINA_LOTES_EN_HILO', True):
+        return
+
+    def _arrancar():
+        threading.Thread(
+            target=_procesar_en_hilo, args=(lote.pk,),
+            name=f'lote-nomina-{lote.pk}', daemon=True,
+        ).start()
+    transaction.on_commit(_arrancar)
+
+
+def _procesar_en_hilo(lote_id):
+    try:
+        procesar_lote(lote_id)
+    finally:
+        connection.close()
+
+
+def lotes_por_tomar(reintentar=False):
+    """
+    Q de los lotes que `procesar_lote` puede tomar: PENDIENTE, PROCESANDO
+    con el latido vencido (el proceso que lo generaba murió) y, con
+    `reintentar`, ERROR.
+    """
+    minutos = getattr(settings, 'NOMINA_LOTE_ABANDONO_MINUTOS', 30)
+    abandonado = timezone.now() - timedelta(minutes=minutos)
+    tomables = Q(estado='PENDIENTE') | Q(
+        Q(latido_en__lt=abandonado) | Q(latido_en__isnull=True), estado='PROCESANDO',
+    )
+    if reintentar:
+        tomables |= Q(estado='ERROR')
+    return tomables
+
+
+def resolver_empleados(nombres):
+    """{nombre: Empleado}; los que no existen se dan de alta en un solo INSERT."""
+    empleados = {}
+    for empleado in Empleado.objects.filter(nombre__in=nombres).order_by('pk'):
+        # Con nombres repetidos gana el más antiguo, como hacía get_or_create.
+        empleados.setdefault(empleado.nombre, empleado)
+    nuevos = [Empleado(nombre=nombre) for nombre in nombres if nombre not in empleados]
+    if nuevos:
+        Empleado.objects.bulk_create(nuevos)
+        for empleado in Empleado.objects.filter(nombre__in=[e.nombre for e in nuevos]).order_by('pk'):
+            empleados.setdefault(empleado.nombre, empleado)
+    return empleados
+
+
+def _logo_url():
+    ruta_logo = os.path.join(settings.BASE_DIR, 'static', 'img', 'logo.png')
+    return f"file:///{ruta_logo.replace(os.sep, '/')}" if os.name == 'nt' else f"file://{ruta_logo}"
+
+
+def _fecha_emision(valor):
+    """'YYYY-MM-DD HH:MM' (última salida de la semana) → 'DD/MM/YYYY HH:MM'; si no, ahora."""
+    try:
+        return datetime.strptime(valor, '%Y-%m-%d %H:%M').strftime('%d/%m/%Y %H:%M')
+    except (TypeError, ValueError):
+        return timezone.now().strftime('%d/%m/%Y %H:%M')
+
+
+def preparar_recibo(empleado, registros, *, folio, periodo, fecha_emision, logo_url):
+    """(ReciboNomina sin guardar, HTML del PDF) con la regla del 90% ya aplicada."""
+    total_horas_reales = round(sum(r['horas_raw'] for r in registros), 2)
+    total_horas_a_pagar = sum(r['horas_a_pagar'] for r in registros)
+    ahorro_horas = round(total_horas_reales - total_horas_a_pagar, 2)
+    if not periodo:
+        fechas = sorted(r['fecha'] for r in registros)
+        periodo = f"{fechas[0]} al {fechas[-1]}"
+    tarifa = float(empleado.tarifa_base)
+    total_pagado = round(total_horas_a_pagar * tarifa, 2)
+    total_sin_redondeo = round(total_horas_reales * tarifa, 2)
+    ahorro_dinero = round(total_sin_redondeo - total_pagado, 2)
+
+    context = {
+        'empleado': empleado,
+        'periodo': periodo,
+        'lista_asistencia': registros,
+        'total_horas_reales': f"{total_horas_reales:.2f}",
+        'total_horas_a_pagar': f"{total_horas_a_pagar:.0f}",
+        'ahorro_horas': f"{ahorro_horas:.2f}",
+        'total_pagado': f"{total_pagado:,.2f}",
+        'total_sin_redondeo': f"{total_sin_redondeo:,.2f}",
+        'ahorro_dinero': f"{ahorro_dinero:,.2f}",
+        'folio': f"NOM-{folio:03d}",
+        'logo_url': logo_url,
+        'fecha_emision': fecha_emision,
+    }
+    recibo = ReciboNomina(
+        empleado=empleado, folio=folio, periodo=periodo,
+        horas_trabajadas=Decimal(str(total_horas_a_pagar)),
+        tarifa_aplicada=empleado.tarifa_base,
+        total_pagado=Decimal(str(total_pagado)),
+    )
+    return recibo, render_to_string('nomina/recibo_nomina.html', context)
+
+
+def renderizar_pdfs(htmls, procesos):
+    """PDF de cada HTML, en orden. Con un proceso o menos se hace aquí mismo."""
+    if procesos <= 1 or len(htmls) <= 1:
+        yield from map(escribir_pdf, htmls)
+        return
+    contexto = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=min(procesos, len(htmls)), mp_context=contexto) as pool:
+        yield from pool.map(escribir_pdf, htmls)
+
+
+def _nombre_archivo(nombre):
+    safe_name = "".join([c for c in nombre if c.isalnum() or c == ' ']).strip().replace(' ', '_')
+    return f"Nomina_{safe_name}.pdf"
+
+
+def _guardar_tanda(lote, tanda):
+    campo = ReciboNomina._meta.get_field('archivo_pdf')
+    for recibo, nombre, pdf in tanda:
+        recibo.archivo_pdf.name = campo.storage.save(
+            campo.generate_filename(recibo, _nombre_archivo(nombre)),
+            ContentFile(pdf), max_length=campo.max_length,
+        )
+    with transaction.atomic():
+        ReciboNomina.objects.bulk_create([recibo for recibo, _, _ in tanda])
+        LoteNomina.objects.filter(pk=lote.pk).update(
+            procesados=F('procesados') + len(tanda), latido_en=timezone.now())
+
+
+def procesar_lote(lote_id, progreso=None, reintentar=False):
+    """
+    Genera los recibos del lote y lo devuelve en TERMINADO o en ERROR. Solo
+    toma los lotes de `lotes_por_tomar(reintentar)` (None si no), así que
+    dos llamadas con el mismo lote no duplican recibos; uno retomado solo
+    genera los que le faltan. `progreso(hechos, total)` se llama después de
+    cada tanda.
+    """
+    tomado = LoteNomina.objects.filter(lotes_por_tomar(reintentar), pk=lote_id).update(
+        estado='PROCESANDO', latido_en=timezone.now(), error='', terminado_en=None)
+    if not tomado:
+        return None
+    lote = LoteNomina.objects.get(pk=lote_id)
+    empleados_datos = lote.datos.get('empleados', {})
+    fechas_emision = lote.datos.get('fechas_emision', {})
+    tamanio_tanda = max(1, getattr(settings, 'NOMINA_LOTE_TANDA', 10))
+
+    try:
+        nombres = list(empleados_datos)
+        empleados = resolver_empleados(nombres)
+        if lote.primer_folio is None and nombres:
+            with transaction.atomic():
+                lote.primer_folio = FolioNomina.reservar(len(nombres))
+                LoteNomina.objects.filter(pk=lote.pk).update(primer_folio=lote.primer_folio)
+        # El folio sale de la posición en el lote, así que un empleado
+        # pendiente conserva el suyo aunque otros ya se hayan generado.
+        con_recibo = set(lote.recibos.values_list('empleado_id', flat=True))
+        pendientes = [
+            (lote.primer_folio + i, nombre) for i, nombre in enumerate(nombres)
+            if empleados[nombre].pk not in con_recibo
+        ]
+        hechos = len(nombres) - len(pendientes)
+        LoteNomina.objects.filter(pk=lote.pk).update(procesados=hechos)
+        logo_url = _logo_url()
+
+        preparados = [
+            preparar_recibo(
+                empleados[nombre], empleados_datos[nombre],
+                folio=folio, periodo=lote.periodo,
+                fecha_emision=_fecha_emision(fechas_emision.get(nombre)), logo_url=logo_url,
+            )
+            for folio, nombre in pendientes
+        ]
+        for recibo, _ in preparados:
+            recibo.lote = lote
+
+        pdfs = renderizar_pdfs(
+            [html for _, html in preparados], getattr(settings, 'NOMINA_PROCESOS_PDF', 2))
+        tanda = []
+        for i, ((recibo, _), (_, nombre), pdf) in enumerate(zip(preparados, pendientes, pdfs), start=1):
+            tanda.append((recibo, nombre, pdf))
+            if len(tanda) == tamanio_tanda or i == len(pendientes):
+                _guardar_tanda(lote, tanda)
+                hechos += len(tanda)
+                tanda = []
+                if progreso:
+                    progreso(hechos, lote.total)
+    except Exception as e:
+        # Lo que ya se guardó se queda: son recibos completos con su PDF.
+        logger.exception("Error procesando el lote de nómina #%s.", lote_id)
+        LoteNomina.objects.filter(pk=lote_id).update(
+            estado='ERROR', error=str(e)[:2000], terminado_en=timezone.now())
+        lote.refresh_from_db()
+        return lote
+
+    LoteNomina.objects.filter(pk=lote_id).update(estado='TERMINADO', terminado_en=timezone.now())
+    lote.refresh_from_db()
+    return lote
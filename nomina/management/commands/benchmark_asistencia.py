@@ -0,0 +1,91 @@
+"""
+Mide `leer_asistencia` con una hoja sintética del tamaño de una nómina real.
+
+La hoja imita el export de Jibble: título, fila de fechas, dos filas por
+empleado (Tracked Hours y Payroll Hours) con horas en los formatos que
+aparecen en la práctica (texto H:MM:SS, decimales, objetos time, '-' y
+vacíos) y el bloque Work Schedule al final.
+
+Uso:
+    python manage.py benchmark_asistencia                       # 200 × 31
+    python manage.py benchmark_asistencia --empleados 500 --dias 14 --repeticiones 10
+"""
+import random
+import time as reloj
+from datetime import date, time, timedelta
+
+import pandas as pd
+from django.core.management.base import BaseCommand
+
+from nomina.asistencia import leer_asistencia
+from nomina.views import parsear_horario_trabajo
+
+
+def hoja_sintetica(empleados=200, dias=31, semilla=0, inicio=date(2026, 3, 1)):
+    """DataFrame como el que da `read_excel(header=None)` para el export de Jibble."""
+    azar = random.Random(semilla)  # noqa: S311 — datos de prueba, no criptografía
+    fechas = [inicio + timedelta(days=d) for d in range(dias)]
+
+    def horas():
+        tipo = azar.random()
+        if tipo < 0.15:
+            return '-'
+        if tipo < 0.25:
+            return None
+        segundos = azar.randint(600, 11 * 3600)
+        h, resto = divmod(segundos, 3600)
+        if tipo < 0.65:
+            return f"{h}:{resto // 60:02d}:{resto % 60:02d}"
+        if tipo < 0.85:
+            return round(segundos / 3600, 2)
+        return time(h, resto // 60, resto % 60)
+
+    filas = [
+        ['Timesheets Report'] + [None] * (dias + 1),
+        [None] * (dias + 2),
+        ['Name', 'Type'] + [f.strftime('%Y-%m-%d') for f in fechas],
+    ]
+    for i in range(empleados):
+        nombre = f"Empleado {i:04d}"
+        filas.append([nombre, 'Tracked Hours'] + [horas() for _ in fechas])
+        filas.append([nombre, 'Payroll Hours'] + [horas() for _ in fechas])
+    filas.append([None] * (dias + 2))
+    filas.append(['Work Schedule'] + [None] * (dias + 1))
+    filas.append(['Day', 'Start'] + [None] * dias)
+    for dia, entrada in zip(
+        ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday'],
+        ['08:00', '08:00', '08:00', '08:00', '09:00', '10:00', 'Rest'],
+    ):
+        filas.append([dia, entrada] + [None] * dias)
+    return pd.DataFrame(filas)
+
+
+class Command(BaseCommand):
+    help = "Mide el parser de asistencia con una hoja sintética."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--empleados', type=int, default=200)
+        parser.add_argument('--dias', type=int, default=31)
+        parser.add_argument('--repeticiones', type=int, default=5)
+
+    def handle(self, *args, **opciones):
+        df = hoja_sintetica(opciones['empleados'], opciones['dias'])
+        horarios = parsear_horario_trabajo(df)
+
+        tiempos = []
+        for _ in range(max(1, opciones['repeticiones'])):
+            inicio = reloj.perf_counter()
+            datos_empleados, _ = leer_asistencia(df, horarios)
+            tiempos.append(reloj.perf_counter() - inicio)
+
+        celdas = opciones['empleados'] * 2 * opciones['dias']
+        registros = sum(len(r) for r in datos_empleados.values())
+        mejor = min(tiempos)
+        self.stdout.write(
+            f"{opciones['empleados']} empleados × {opciones['dias']} días ({celdas} celdas, "
+            f"{registros} registros)"
+        )
+        self.stdout.write(
+            f"  mejor {mejor * 1000:.1f} ms · promedio {sum(tiempos) / len(tiempos) * 1000:.1f} ms · "
+            f"{celdas / mejor:,.0f} celdas/s"
+        )
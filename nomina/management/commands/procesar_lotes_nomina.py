@@ -0,0 +1,64 @@
+"""
+Procesa los lotes de recibos de nómina pendientes o que se quedaron a medias.
+
+Toma los lotes en PENDIENTE y los PROCESANDO cuyo latido tiene más de
+NOMINA_LOTE_ABANDONO_MINUTOS (el worker que los generaba murió); con
+--reintentar también los de ERROR. Un lote retomado solo genera los recibos
+que le faltan, con los folios que ya tenía reservados.
+
+Uso:
+    python manage.py procesar_lotes_nomina                  # drena y termina (cron)
+    python manage.py procesar_lotes_nomina --reintentar     # incluye los de ERROR
+    python manage.py procesar_lotes_nomina --continuo       # worker permanente
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from nomina.lotes import lotes_por_tomar, procesar_lote
+from nomina.models import LoteNomina
+
+
+class Command(BaseCommand):
+    help = "Genera los recibos de los lotes de nómina pendientes o abandonados."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--reintentar', action='store_true',
+            help='Retoma también los lotes en ERROR, sin repetir los recibos que ya generaron.',
+        )
+        parser.add_argument(
+            '--continuo', action='store_true',
+            help='No termina al vaciar la cola: vuelve a revisarla cada --intervalo segundos.',
+        )
+        parser.add_argument(
+            '--intervalo', type=float, default=5.0,
+            help='Segundos entre revisiones en modo --continuo (default 5).',
+        )
+
+    def handle(self, *args, **opciones):
+        total, reintentar = 0, opciones['reintentar']
+        while True:
+            lotes = list(
+                LoteNomina.objects.filter(lotes_por_tomar(reintentar))
+                .order_by('creado_en').values_list('pk', flat=True)
+            )
+            for lote_id in lotes:
+                lote = procesar_lote(lote_id, reintentar=reintentar)
+                if lote is None:
+                    # Otro proceso lo tomó entre la consulta y este punto.
+                    continue
+                total += 1
+                if lote.estado == 'TERMINADO':
+                    self.stdout.write(self.style.SUCCESS(f"  Lote #{lote.pk}: {lote.procesados} recibo(s)."))
+                else:
+                    self.stdout.write(self.style.ERROR(f"  Lote #{lote.pk}: {lote.error}"))
+            if not opciones['continuo']:
+                break
+            # Los de ERROR solo en la primera pasada: uno que vuelve a fallar
+            # no se reintenta cada --intervalo.
+            reintentar = False
+            time.sleep(opciones['intervalo'])
+
+        if not total:
+            self.stdout.write(self.style.SUCCESS("No hay lotes pendientes."))
@@ -6,25 +6,26 @@ Sincroniza timesheets de Jibble y genera recibos de nómina.
 Uso manual:
     python manage.py sync_jibble                          # Semana anterior
     python manage.py sync_jibble --inicio 2026-03-16 --fin 2026-03-22
+    python manage.py sync_jibble --inicio 2026-01-01      # Hasta ayer
+    python manage.py sync_jibble --inicio 2026-01-01 --solo-sincronizar
     python manage.py sync_jibble --diagnostico            # Solo verificar conexión
 
+Los timesheets crudos quedan en TimesheetJibble: volver a correr un rango
+solo pide a Jibble los días abiertos o que nunca se descargaron
+(--refrescar los pide todos).
+
 Railway Cron (cada lunes a las 7am):
     python manage.py sync_jibble
 """
 
-import os
 from datetime import date, datetime, timedelta
-from decimal import Decimal
 
-from django.conf import settings
-from django.core.files.base import ContentFile
 from django.core.management.base import BaseCommand, CommandError
-from django.template.loader import render_to_string
-from weasyprint import HTML
 
-from nomina.models import Empleado, ReciboNomina
+from nomina.lotes import crear_lote, procesar_lote
+from nomina.models import Empleado
 from nomina.services import JibbleAPIError, JibbleService
-from nomina.views import redondear_horas_90
+from nomina.views import _transformar_datos_jibble
 
 
 class Command(BaseCommand):
@@ -39,7 +40,17 @@ class Command(BaseCommand):
         parser.add_argument(
             '--fin',
             type=str,
-            help='Fecha fin (YYYY-MM-DD). Default: domingo de la semana anterior.',
+            help='Fecha fin (YYYY-MM-DD). Default: domingo de la semana anterior, o ayer si se da --inicio.',
+        )
+        parser.add_argument(
+            '--refrescar',
+            action='store_true',
+            help='Vuelve a pedir a Jibble todos los días del rango, aunque estén cerrados en el cache.',
+        )
+        parser.add_argument(
+            '--solo-sincronizar',
+            action='store_true',
+            help='Solo descarga los timesheets al cache local, sin generar recibos.',
         )
         parser.add_argument(
             '--diagnostico',
@@ -79,14 +90,24 @@ class Command(BaseCommand):
         # =====================
         # DETERMINAR RANGO DE FECHAS
         # =====================
-        if options['inicio'] and options['fin']:
+        if options['fin'] and not options['inicio']:
+            raise CommandError('--fin requiere --inicio.')
+        if options['inicio']:
             fecha_inicio = options['inicio']
-            fecha_fin = options['fin']
+            fecha_fin = options['fin'] or (date.today() - timedelta(days=1)).strftime('%Y-%m-%d')
+            try:
+                inicio_dt = datetime.strptime(fecha_inicio, '%Y-%m-%d').date()
+                fin_dt = datetime.strptime(fecha_fin, '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError('Las fechas deben tener formato YYYY-MM-DD.')
+            if inicio_dt > fin_dt:
+                raise CommandError('--inicio no puede ser posterior a --fin.')
         else:
             # Default: semana anterior (lunes a domingo)
             hoy = date.today()
             lunes_pasado = hoy - timedelta(days=hoy.weekday() + 7)
             domingo_pasado = lunes_pasado + timedelta(days=6)
+            inicio_dt, fin_dt = lunes_pasado, domingo_pasado
             fecha_inicio = lunes_pasado.strftime('%Y-%m-%d')
             fecha_fin = domingo_pasado.strftime('%Y-%m-%d')
 
@@ -103,9 +124,23 @@ class Command(BaseCommand):
         except JibbleAPIError as e:
             raise CommandError(f'Error de autenticación: {e}')
 
+        if options['solo_sincronizar']:
+            payloads, descargados = svc.sincronizar_timesheets(
+                inicio_dt, fin_dt, refrescar=options['refrescar'])
+            self.stdout.write(self.style.SUCCESS(
+                f"  {len(payloads)} día(s) en cache: {descargados} pedidos a Jibble, "
+                f"{len(payloads) - descargados} ya cerrados."
+            ))
+            return
+
         try:
-            resultado = svc.obtener_timesheets_semana(fecha_inicio, fecha_fin)
+            resultado = svc.obtener_timesheets_semana(
+                fecha_inicio, fecha_fin, refrescar=options['refrescar'])
             self.stdout.write(f"  Fuente: {resultado['fuente']}")
+            self.stdout.write(
+                f"  Días pedidos a Jibble: {resultado['dias_descargados']} "
+                f"(del cache: {resultado['dias_en_cache']})"
+            )
             self.stdout.write(f"  Empleados encontrados: {len(resultado['personas'])}")
         except JibbleAPIError as e:
             raise CommandError(f'Error al obtener timesheets: {e}')
@@ -117,98 +152,38 @@ class Command(BaseCommand):
         # =====================
         # PROCESAR Y GENERAR RECIBOS
         # =====================
-        ruta_logo = os.path.join(settings.BASE_DIR, 'static', 'img', 'logo.png')
-        logo_url = f"file:///{ruta_logo.replace(os.sep, '/')}" if os.name == 'nt' else f"file://{ruta_logo}"
-
-        count = 0
-        dry_run = options['dry_run']
-
-        for nombre, info in resultado['personas'].items():
-            if not info['dias']:
-                continue
-
-            empleado_obj, created = Empleado.objects.get_or_create(nombre=nombre)
-            if created:
-                self.stdout.write(f"  Empleado NUEVO creado: {nombre}")
-
-            tarifa = float(empleado_obj.tarifa_base)
-            registros = []
-            total_horas_reales = 0.0
-            total_horas_a_pagar = 0.0
-
-            for dia in info['dias']:
-                seg = dia['duracion_segundos']
-                horas_decimal = seg / 3600.0
-                h = seg // 3600
-                m = (seg % 3600) // 60
-                s = seg % 60
-
-                horas_pagar = redondear_horas_90(horas_decimal)
-                total_horas_reales += horas_decimal
-                total_horas_a_pagar += horas_pagar
-
-                registros.append({
-                    'fecha': dia['fecha'],
-                    'dia': datetime.strptime(dia['fecha'], '%Y-%m-%d').strftime('%A')[:3],
-                    'entrada': dia.get('entrada', '-'),
-                    'salida': dia.get('salida', '-'),
-                    'horas_fmt': f"{h}:{m:02d}:{s:02d}",
-                    'horas_raw': horas_decimal,
-                    'horas_a_pagar': horas_pagar,
-                    'horas_a_pagar_fmt': f"{horas_pagar:.0f}:00",
-                    'fue_recortado': horas_pagar < horas_decimal,
-                })
-
-            total_horas_reales = round(total_horas_reales, 2)
-            ahorro_horas = round(total_horas_reales - total_horas_a_pagar, 2)
+        datos_empleados, fecha_emision_map = _transformar_datos_jibble(resultado['personas'])
+        tarifas = dict(
+            Empleado.objects.filter(nombre__in=list(datos_empleados)).values_list('nombre', 'tarifa_base'))
+        tarifa_default = Empleado._meta.get_field('tarifa_base').default
+
+        for nombre, registros in datos_empleados.items():
+            tarifa = float(tarifas.get(nombre, tarifa_default))
+            total_horas_reales = round(sum(r['horas_raw'] for r in registros), 2)
+            total_horas_a_pagar = sum(r['horas_a_pagar'] for r in registros)
             total_pagado = round(total_horas_a_pagar * tarifa, 2)
-            total_sin_redondeo = round(total_horas_reales * tarifa, 2)
-            ahorro_dinero = round(total_sin_redondeo - total_pagado, 2)
-
+            ahorro_dinero = round(round(total_horas_reales * tarifa, 2) - total_pagado, 2)
+            nuevo = '' if nombre in tarifas else ' [empleado nuevo]'
             self.stdout.write(
                 f"  {nombre}: {total_horas_reales}h reales → {total_horas_a_pagar:.0f}h a pagar "
-                f"(${total_pagado:,.2f}, ahorro ${ahorro_dinero:,.2f})"
+                f"(${total_pagado:,.2f}, ahorro ${ahorro_dinero:,.2f}){nuevo}"
             )
 
-            if dry_run:
-                continue
-
-            periodo = f"{fecha_inicio} al {fecha_fin}"
-
-            context = {
-                'empleado': empleado_obj,
-                'periodo': periodo,
-                'lista_asistencia': registros,
-                'total_horas_reales': f"{total_horas_reales:.2f}",
-                'total_horas_a_pagar': f"{total_horas_a_pagar:.0f}",
-                'ahorro_horas': f"{ahorro_horas:.2f}",
-                'total_pagado': f"{total_pagado:,.2f}",
-                'total_sin_redondeo': f"{total_sin_redondeo:,.2f}",
-                'ahorro_dinero': f"{ahorro_dinero:,.2f}",
-                'folio': f"NOM-{ReciboNomina.objects.count()+1:03d}",
-                'logo_url': logo_url,
-            }
-
-            html = render_to_string('nomina/recibo_nomina.html', context)
-            pdf = HTML(string=html).write_pdf()
-
-            recibo = ReciboNomina.objects.create(
-                empleado=empleado_obj,
-                periodo=periodo,
-                horas_trabajadas=Decimal(str(total_horas_a_pagar)),
-                tarifa_aplicada=empleado_obj.tarifa_base,
-                total_pagado=Decimal(str(total_pagado)),
-            )
+        if options['dry_run']:
+            self.stdout.write(self.style.NOTICE(f'  DRY RUN: {len(datos_empleados)} empleados procesados (sin guardar).'))
+            return
+        if not datos_empleados:
+            self.stdout.write(self.style.WARNING('  No se generaron recibos.'))
+            return
 
-            safe_name = "".join(
-                [c for c in nombre if c.isalnum() or c == ' ']
-            ).strip().replace(' ', '_')
-            recibo.archivo_pdf.save(f"Nomina_{safe_name}.pdf", ContentFile(pdf))
-            count += 1
+        # El comando ya corre fuera de una petición: el lote se procesa aquí
+        # mismo, con el mismo motor (y pool de PDF) que usan las vistas.
+        lote = crear_lote(
+            datos_empleados, fecha_emision_map, origen='JIBBLE', periodo=f"{fecha_inicio} al {fecha_fin}")
+        lote = procesar_lote(
+            lote.pk, progreso=lambda hechos, total: self.stdout.write(f"  {hechos}/{total} recibos"))
 
-        if dry_run:
-            self.stdout.write(self.style.NOTICE(f'  DRY RUN: {len(resultado["personas"])} empleados procesados (sin guardar).'))
-        elif count > 0:
-            self.stdout.write(self.style.SUCCESS(f'  {count} recibos generados exitosamente.'))
+        if lote.estado == 'TERMINADO':
+            self.stdout.write(self.style.SUCCESS(f'  Lote #{lote.pk}: {lote.procesados} recibos generados exitosamente.'))
         else:
-            self.stdout.write(self.style.WARNING('  No se generaron recibos.'))
+            raise CommandError(f'Lote #{lote.pk} terminó con error tras {lote.procesados} recibos: {lote.error}')
@@ -0,0 +1,49 @@
+# Generated by Django 6.1 on 2026-10-19 10:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("nomina", "0004_alter_recibonomina_archivo_pdf"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TimesheetJibble",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("fecha", models.DateField()),
+                ("obtenido_en", models.DateTimeField()),
+                (
+                    "hash",
+                    models.CharField(help_text="SHA-256 del payload", max_length=64),
+                ),
+                ("payload", models.JSONField()),
+            ],
+            options={
+                "verbose_name": "Timesheet de Jibble",
+                "verbose_name_plural": "Timesheets de Jibble",
+                "indexes": [
+                    models.Index(
+                        fields=["fecha", "-obtenido_en"], name="timesheet_jibble_fecha"
+                    )
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("fecha", "obtenido_en", "hash"),
+                        name="timesheet_jibble_unico",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,137 @@
+# Generated by Django 6.1 on 2026-10-19 11:40
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+# Los recibos que ya existen se quedan con el folio que el admin les mostraba
+# (NOM-{id}); FolioNomina se siembra sola a partir del más alto.
+
+
+def folio_desde_id(apps, schema_editor):
+    ReciboNomina = apps.get_model("nomina", "ReciboNomina")
+    ReciboNomina.objects.update(folio=models.F("id"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("nomina", "0005_timesheetjibble"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="FolioNomina",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("ultimo_folio", models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                "verbose_name": "Secuencia de folios de nómina",
+                "verbose_name_plural": "Secuencias de folios de nómina",
+            },
+        ),
+        migrations.AddField(
+            model_name="recibonomina",
+            name="folio",
+            field=models.PositiveIntegerField(
+                blank=True,
+                help_text="Consecutivo NOM-xxx; lo asigna FolioNomina.",
+                null=True,
+                unique=True,
+            ),
+        ),
+        migrations.CreateModel(
+            name="LoteNomina",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "origen",
+                    models.CharField(
+                        choices=[("EXCEL", "Carga de Excel"), ("JIBBLE", "Jibble")],
+                        max_length=10,
+                    ),
+                ),
+                (
+                    "estado",
+                    models.CharField(
+                        choices=[
+                            ("PENDIENTE", "Pendiente"),
+                            ("PROCESANDO", "Procesando"),
+                            ("TERMINADO", "Terminado"),
+                            ("ERROR", "Error"),
+                        ],
+                        default="PENDIENTE",
+                        max_length=12,
+                    ),
+                ),
+                (
+                    "periodo",
+                    models.CharField(
+                        blank=True,
+                        help_text="Vacío: cada recibo usa del primer al último día trabajado.",
+                        max_length=100,
+                    ),
+                ),
+                (
+                    "datos",
+                    models.JSONField(
+                        help_text="{'empleados': {nombre: [registros]}, 'fechas_emision': {nombre: 'YYYY-MM-DD HH:MM'}}"
+                    ),
+                ),
+                (
+                    "total",
+                    models.PositiveIntegerField(default=0, verbose_name="Empleados"),
+                ),
+                ("procesados", models.PositiveIntegerField(default=0)),
+                ("error", models.TextField(blank=True)),
+                ("creado_en", models.DateTimeField(auto_now_add=True)),
+                ("terminado_en", models.DateTimeField(blank=True, null=True)),
+                (
+                    "creado_por",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="lotes_nomina",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Lote de recibos",
+                "verbose_name_plural": "Lotes de recibos",
+                "ordering": ["-creado_en"],
+            },
+        ),
+        migrations.AddField(
+            model_name="recibonomina",
+            name="lote",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="recibos",
+                to="nomina.lotenomina",
+                verbose_name="Lote",
+            ),
+        ),
+        migrations.RunPython(folio_desde_id, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 6.1 on 2026-10-19 18:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("nomina", "0006_lotes_y_folios"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="lotenomina",
+            name="latido_en",
+            field=models.DateTimeField(
+                blank=True,
+                help_text="Última tanda guardada. Un lote PROCESANDO sin latido reciente se da por abandonado.",
+                null=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name="lotenomina",
+            name="primer_folio",
+            field=models.PositiveIntegerField(
+                blank=True,
+                help_text="Primero del bloque de folios reservado; al reanudar el lote se reutiliza.",
+                null=True,
+            ),
+        ),
+    ]
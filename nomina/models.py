@@ -1,5 +1,5 @@
 from django.contrib.auth.models import User
-from django.db import models
+from django.db import IntegrityError, models, transaction
 
 from core_erp.storages_qkt import storage_privado
 
@@ -32,6 +32,14 @@ class ReciboNomina(models.Model):
     ]
 
     empleado = models.ForeignKey(Empleado, on_delete=models.CASCADE)
+    folio = models.PositiveIntegerField(
+        null=True, blank=True, unique=True,
+        help_text="Consecutivo NOM-xxx; lo asigna FolioNomina.",
+    )
+    lote = models.ForeignKey(
+        'LoteNomina', on_delete=models.SET_NULL, null=True, blank=True,
+        related_name='recibos', verbose_name="Lote",
+    )
     fecha_generacion = models.DateTimeField(auto_now_add=True)
 
     # Datos leídos del Excel
@@ -62,3 +70,121 @@ class ReciboNomina(models.Model):
 
     def __str__(self):
         return f"Pago {self.empleado} - ${self.total_pagado} [{self.estado}]"
+
+
+class FolioNomina(models.Model):
+    """
+    Último folio de recibo de nómina asignado (una sola fila).
+
+    Sustituye al `ReciboNomina.objects.count() + 1`, que costaba un COUNT por
+    empleado y repetía folio si dos cargas corrían a la vez o si se había
+    borrado un recibo. Igual que FolioSecuencia en contabilidad, el
+    consecutivo avanza con un UPDATE atómico; un lote reserva de una vez
+    todos los folios que necesita.
+    """
+    ultimo_folio = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name = "Secuencia de folios de nómina"
+        verbose_name_plural = "Secuencias de folios de nómina"
+
+    def __str__(self):
+        return f"NOM: {self.ultimo_folio}"
+
+    @classmethod
+    def reservar(cls, cantidad=1):
+        """Avanza el consecutivo `cantidad` lugares y devuelve el primero reservado."""
+        secuencia = cls.objects.filter(pk=1)
+        with transaction.atomic(savepoint=False):
+            if not secuencia.update(ultimo_folio=models.F('ultimo_folio') + cantidad):
+                try:
+                    with transaction.atomic():
+                        mas_alto = ReciboNomina.objects.aggregate(m=models.Max('folio'))['m'] or 0
+                        return cls.objects.create(pk=1, ultimo_folio=mas_alto + cantidad).ultimo_folio - cantidad + 1
+                except IntegrityError:
+                    # Otra carga sembró la secuencia al mismo tiempo.
+                    secuencia.update(ultimo_folio=models.F('ultimo_folio') + cantidad)
+            return secuencia.values_list('ultimo_folio', flat=True).get() - cantidad + 1
+
+
+class LoteNomina(models.Model):
+    """
+    Recibos de nómina por generar en segundo plano (ver nomina/lotes.py).
+
+    La carga de Excel y la sincronización con Jibble solo dejan aquí los
+    registros de asistencia ya calculados; los PDF se generan fuera de la
+    petición y `procesados` lleva el avance. Un lote que se quedó a medias
+    (PROCESANDO sin latido o ERROR) se retoma sin duplicar recibos.
+    """
+    ESTADO_CHOICES = [
+        ('PENDIENTE', 'Pendiente'),
+        ('PROCESANDO', 'Procesando'),
+        ('TERMINADO', 'Terminado'),
+        ('ERROR', 'Error'),
+    ]
+    ORIGEN_CHOICES = [
+        ('EXCEL', 'Carga de Excel'),
+        ('JIBBLE', 'Jibble'),
+    ]
+
+    origen = models.CharField(max_length=10, choices=ORIGEN_CHOICES)
+    estado = models.CharField(max_length=12, choices=ESTADO_CHOICES, default='PENDIENTE')
+    periodo = models.CharField(
+        max_length=100, blank=True,
+        help_text="Vacío: cada recibo usa del primer al último día trabajado.",
+    )
+    datos = models.JSONField(help_text="{'empleados': {nombre: [registros]}, 'fechas_emision': {nombre: 'YYYY-MM-DD HH:MM'}}")
+    total = models.PositiveIntegerField(default=0, verbose_name="Empleados")
+    procesados = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    primer_folio = models.PositiveIntegerField(
+        null=True, blank=True,
+        help_text="Primero del bloque de folios reservado; al reanudar el lote se reutiliza.",
+    )
+    latido_en = models.DateTimeField(
+        null=True, blank=True,
+        help_text="Última tanda guardada. Un lote PROCESANDO sin latido reciente se da por abandonado.",
+    )
+    creado_por = models.ForeignKey(
+        User, on_delete=models.SET_NULL, null=True, blank=True, related_name='lotes_nomina',
+    )
+    creado_en = models.DateTimeField(auto_now_add=True)
+    terminado_en = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Lote de recibos"
+        verbose_name_plural = "Lotes de recibos"
+        ordering = ['-creado_en']
+
+    def __str__(self):
+        return f"Lote #{self.pk} ({self.get_origen_display()}) {self.procesados}/{self.total}"
+
+
+class TimesheetJibble(models.Model):
+    """
+    Respuesta cruda de /v1/Timesheets para un día, tal como la mandó Jibble.
+
+    Es el cache de la sincronización: un día ya descargado y cerrado (pasó el
+    margen de edición de JIBBLE_DIAS_EDICION) se lee de aquí en vez de volver
+    a pedirlo. Un día abierto se vuelve a pedir y solo se guarda una fila
+    nueva si el contenido cambió; si no, se actualiza `obtenido_en`.
+    """
+    fecha = models.DateField()
+    obtenido_en = models.DateTimeField()
+    hash = models.CharField(max_length=64, help_text="SHA-256 del payload")
+    payload = models.JSONField()
+
+    class Meta:
+        verbose_name = "Timesheet de Jibble"
+        verbose_name_plural = "Timesheets de Jibble"
+        constraints = [
+            models.UniqueConstraint(
+                fields=['fecha', 'obtenido_en', 'hash'], name='timesheet_jibble_unico',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['fecha', '-obtenido_en'], name='timesheet_jibble_fecha'),
+        ]
+
+    def __str__(self):
+        return f"Timesheets {self.fecha} ({self.obtenido_en:%Y-%m-%d %H:%M})"
@@ -0,0 +1,13 @@
+"""
+Render de recibos a PDF para el pool de procesos de nomina/lotes.py.
+
+Vive aparte y sin imports de Django a propósito: el pool arranca sus
+procesos con `spawn` (el proceso padre tiene hilos y `fork` con hilos puede
+dejar candados tomados en el hijo), así que cada proceso importa solo este
+módulo y WeasyPrint.
+"""
+
+
+def escribir_pdf(html):
+    from weasyprint import HTML
+    return HTML(string=html).write_pdf()
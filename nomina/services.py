@@ -6,18 +6,26 @@ Endpoints verificados:
 - People:     GET  https://workspace.prod.jibble.io/v1/People
 - Timesheets: GET  https://time-attendance.prod.jibble.io/v1/Timesheets?date=YYYY-MM-DD
 
+Cada día de Timesheets se guarda crudo en TimesheetJibble; volver a
+sincronizar un rango solo pide a Jibble los días abiertos o nuevos.
+
 Variables de entorno: JIBBLE_CLIENT_ID, JIBBLE_CLIENT_SECRET
 """
 
+import hashlib
+import json
 import logging
 import re
 import time
 from datetime import datetime, timedelta
+from email.utils import parsedate_to_datetime
 
 import requests
 from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.db import transaction
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
 
 logger = logging.getLogger(__name__)
 
@@ -30,6 +38,51 @@ class JibbleAPIError(Exception):
     pass
 
 
+class CubetaTokens:
+    """
+    Cubeta de tokens para las peticiones a Jibble: deja pasar una ráfaga de
+    `capacidad` y después `por_segundo`. `pausar` la detiene el tiempo que
+    pida un Retry-After; al terminar sale una sola petición y vuelve el ritmo.
+    """
+
+    def __init__(self, por_segundo, capacidad, *, reloj=time.monotonic, dormir=time.sleep):
+        self.por_segundo = por_segundo
+        self.capacidad = capacidad
+        self.reloj = reloj
+        self.dormir = dormir
+        self.tokens = float(capacidad)
+        self._ultimo = reloj()
+
+    def tomar(self):
+        ahora = self.reloj()
+        if ahora > self._ultimo:
+            self.tokens = min(self.capacidad, self.tokens + (ahora - self._ultimo) * self.por_segundo)
+            self._ultimo = ahora
+        # Con tokens negativos la cubeta "debe" tiempo: la siguiente espera más.
+        espera = (self._ultimo - ahora) + max(0.0, (1 - self.tokens) / self.por_segundo)
+        self.tokens -= 1
+        if espera > 0:
+            self.dormir(espera)
+
+    def pausar(self, segundos):
+        # Lo que se debía o se había juntado ya no cuenta: manda Retry-After.
+        self._ultimo = max(self._ultimo, self.reloj() + segundos)
+        self.tokens = 1.0
+
+
+def _segundos_retry_after(response):
+    """Retry-After en segundos (número o fecha HTTP); None si no viene o no se entiende."""
+    valor = (response.headers.get('Retry-After') or '').strip()
+    if not valor:
+        return None
+    if valor.isdigit():
+        return float(valor)
+    try:
+        return max(0.0, (parsedate_to_datetime(valor) - timezone.now()).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
 class JibbleService:
 
     def __init__(self):
@@ -40,6 +93,10 @@ class JibbleService:
         self._session.headers.update({
             'Content-Type': 'application/json; charset=UTF-8',
         })
+        self.cubeta = CubetaTokens(
+            getattr(settings, 'JIBBLE_TIMESHEETS_POR_SEGUNDO', 0.5),
+            getattr(settings, 'JIBBLE_TIMESHEETS_RAFAGA', 5),
+        )
 
     def esta_configurado(self):
         return bool(self.client_id and self.client_secret)
@@ -106,10 +163,12 @@ class JibbleService:
     # ==========================================
     # TIMESHEETS — con entrada/salida real
     # ==========================================
-    def obtener_timesheets_semana(self, fecha_inicio, fecha_fin, person_ids=None):
+    def obtener_timesheets_semana(self, fecha_inicio, fecha_fin, person_ids=None, refrescar=False):
         """
         Obtiene horas por dia por empleado usando el endpoint Timesheets.
-        Incluye pausa entre requests para evitar rate limit (429).
+        Acepta cualquier rango; los días se sincronizan con
+        `sincronizar_timesheets` (solo se piden a Jibble los abiertos o
+        nunca descargados).
 
         Returns:
             dict {
@@ -120,7 +179,9 @@ class JibbleService:
                         'ultima_salida': '2026-03-21 14:39'  # Última salida de la semana
                     }
                 },
-                'fuente': 'Timesheets'
+                'fuente': 'Timesheets',
+                'dias_descargados': 2,  # pedidos a Jibble en esta corrida
+                'dias_en_cache': 5,     # leídos de TimesheetJibble
             }
         """
         self._verificar_token()
@@ -135,120 +196,168 @@ class JibbleService:
 
         logger.info(f"Jibble: {len(mapa_personas)} empleados encontrados.")
 
-        # 2. Iterar dia por dia con pausa para evitar rate limit
-        personas = {}
+        # 2. Payload crudo de cada día, del cache local o de Jibble
         dt_inicio = datetime.strptime(fecha_inicio, '%Y-%m-%d').date()
         dt_fin = datetime.strptime(fecha_fin, '%Y-%m-%d').date()
-        current = dt_inicio
-        es_primer_dia = True
-
-        while current <= dt_fin:
-            fecha_str = current.strftime('%Y-%m-%d')
+        payloads, descargados = self.sincronizar_timesheets(dt_inicio, dt_fin, refrescar=refrescar)
 
+        personas = {}
+        for fecha, data in sorted(payloads.items()):
             try:
-                # Pausa entre requests para evitar rate limit (429)
-                if not es_primer_dia:
-                    time.sleep(2)
-                es_primer_dia = False
+                self._acumular_dia(data, fecha.strftime('%Y-%m-%d'), mapa_personas, personas)
+            except Exception as e:
+                logger.warning(f"Error procesando Timesheets {fecha}: {e}")
+
+        # Ordenar dias de cada persona
+        for nombre in personas:
+            personas[nombre]['dias'].sort(key=lambda d: d['fecha'])
+
+        return {
+            'personas': personas,
+            'fuente': 'Timesheets',
+            'dias_descargados': descargados,
+            'dias_en_cache': len(payloads) - descargados,
+        }
 
+    def sincronizar_timesheets(self, fecha_inicio, fecha_fin, refrescar=False):
+        """
+        Deja en TimesheetJibble el payload de cada día de [fecha_inicio,
+        fecha_fin] y devuelve ({fecha: payload}, días pedidos a Jibble).
+
+        Solo se piden los días que nunca se descargaron o que siguen abiertos;
+        `refrescar` los pide todos. Si Jibble falla con un día que ya estaba
+        en el cache, se usa la última copia.
+        """
+        from .models import TimesheetJibble
+
+        self._verificar_token()
+        dias_edicion = timedelta(days=getattr(settings, 'JIBBLE_DIAS_EDICION', 3))
+
+        ultimas = TimesheetJibble.objects.filter(
+            fecha__range=(fecha_inicio, fecha_fin),
+            pk=Subquery(
+                TimesheetJibble.objects.filter(fecha=OuterRef('fecha'))
+                .order_by('-obtenido_en').values('pk')[:1]
+            ),
+        )
+        cache_local = {t.fecha: t for t in ultimas}
+
+        payloads, descargados = {}, 0
+        fecha = fecha_inicio
+        while fecha <= fecha_fin:
+            guardado = cache_local.get(fecha)
+            cerrado = guardado and timezone.localtime(guardado.obtenido_en).date() > fecha + dias_edicion
+            if guardado and cerrado and not refrescar:
+                payloads[fecha] = guardado.payload
+                fecha += timedelta(days=1)
+                continue
+
+            data = self._pedir_timesheets(fecha.strftime('%Y-%m-%d'))
+            if data is None:
+                if guardado:
+                    payloads[fecha] = guardado.payload
+                fecha += timedelta(days=1)
+                continue
+
+            descargados += 1
+            payloads[fecha] = data
+            huella = hashlib.sha256(
+                json.dumps(data, sort_keys=True, ensure_ascii=False).encode()
+            ).hexdigest()
+            ahora = timezone.now()
+            if guardado and guardado.hash == huella:
+                TimesheetJibble.objects.filter(pk=guardado.pk).update(obtenido_en=ahora)
+            else:
+                TimesheetJibble.objects.create(fecha=fecha, obtenido_en=ahora, hash=huella, payload=data)
+            fecha += timedelta(days=1)
+
+        return payloads, descargados
+
+    def _pedir_timesheets(self, fecha_str):
+        """GET /v1/Timesheets de un día. None si Jibble no lo entregó."""
+        reintentos = getattr(settings, 'JIBBLE_REINTENTOS', 3)
+        espera_base = getattr(settings, 'JIBBLE_ESPERA_BASE', 2.0)
+        try:
+            for intento in range(reintentos + 1):
+                self.cubeta.tomar()
                 response = self._session.get(
                     JIBBLE_TIMESHEETS_URL,
                     params={'date': fecha_str},
                     timeout=20,
                 )
+                if response.status_code != 429:
+                    break
+                espera = _segundos_retry_after(response)
+                if espera is None:
+                    espera = espera_base * 2 ** intento
+                logger.warning(f"Timesheets {fecha_str}: rate limit, esperando {espera:.0f}s...")
+                self.cubeta.pausar(espera)
 
-                # Retry si hay rate limit
-                if response.status_code == 429:
-                    logger.warning(f"Timesheets {fecha_str}: rate limit, esperando 6s...")
-                    time.sleep(6)
-                    response = self._session.get(
-                        JIBBLE_TIMESHEETS_URL,
-                        params={'date': fecha_str},
-                        timeout=20,
-                    )
-
-                # Segundo retry si sigue 429
-                if response.status_code == 429:
-                    logger.warning(f"Timesheets {fecha_str}: segundo rate limit, esperando 10s...")
-                    time.sleep(10)
-                    response = self._session.get(
-                        JIBBLE_TIMESHEETS_URL,
-                        params={'date': fecha_str},
-                        timeout=20,
-                    )
-
-                if response.status_code != 200:
-                    logger.warning(f"Timesheets {fecha_str}: HTTP {response.status_code}")
-                    current += timedelta(days=1)
-                    continue
-
-                data = response.json()
-                items = data.get('value', [])
-
-                for item in items:
-                    pid = item.get('personId', '')
-                    if pid not in mapa_personas:
-                        continue
-
-                    nombre = mapa_personas[pid]
-                    if nombre not in personas:
-                        personas[nombre] = {'person_id': pid, 'dias': [], 'ultima_salida': ''}
-
-                    daily_list = item.get('daily', [])
-                    for day in daily_list:
-                        day_date = day.get('date', '')
-                        if isinstance(day_date, str) and len(day_date) >= 10:
-                            day_date = day_date[:10]
-
-                        # Duracion: payroll -> tracked -> worked
-                        payroll_hours = day.get('payrollHours', {})
-                        tracked_hours = day.get('trackedHours', {})
-
-                        duracion_seg = self._parsear_iso_duration(payroll_hours.get('total', ''))
-                        if duracion_seg == 0:
-                            duracion_seg = self._parsear_iso_duration(tracked_hours.get('total', ''))
-                        if duracion_seg == 0:
-                            duracion_seg = self._parsear_iso_duration(tracked_hours.get('worked', ''))
-                        if duracion_seg == 0:
-                            duracion_seg = self._parsear_iso_duration(item.get('totalPayroll', ''))
-                        if duracion_seg == 0:
-                            duracion_seg = self._parsear_iso_duration(item.get('totalTracked', ''))
-
-                        # Entrada y salida reales
-                        first_in = day.get('firstIn') or day.get('firstInTimestamp') or ''
-                        last_out = day.get('lastOut') or day.get('lastOutTimestamp') or ''
-
-                        entrada = self._formatear_hora(first_in)
-                        salida = self._formatear_hora(last_out)
-
-                        # Solo agregar si hay tiempo real trabajado (> 1 minuto)
-                        if duracion_seg > 60:
-                            personas[nombre]['dias'].append({
-                                'fecha': day_date or fecha_str,
-                                'duracion_segundos': duracion_seg,
-                                'entrada': entrada,
-                                'salida': salida,
-                            })
-
-                            # Rastrear la última salida de la semana para fecha de emisión
-                            ultima_actual = personas[nombre].get('ultima_salida', '')
-
-                            # Construir datetime de salida: fecha + hora
-                            if salida != '-':
-                                salida_dt_str = f"{day_date or fecha_str} {salida}"
-                                if not ultima_actual or salida_dt_str > ultima_actual:
-                                    personas[nombre]['ultima_salida'] = salida_dt_str
-
-            except Exception as e:
-                logger.warning(f"Error procesando Timesheets {fecha_str}: {e}")
-
-            current += timedelta(days=1)
-
-        # Ordenar dias de cada persona
-        for nombre in personas:
-            personas[nombre]['dias'].sort(key=lambda d: d['fecha'])
-
-        return {'personas': personas, 'fuente': 'Timesheets'}
+            if response.status_code != 200:
+                logger.warning(f"Timesheets {fecha_str}: HTTP {response.status_code}")
+                return None
+            return response.json()
+        except Exception as e:
+            logger.warning(f"Error procesando Timesheets {fecha_str}: {e}")
+            return None
+
+    def _acumular_dia(self, data, fecha_str, mapa_personas, personas):
+        """Suma a `personas` los días trabajados del payload de `fecha_str`."""
+        items = data.get('value', [])
+
+        for item in items:
+            pid = item.get('personId', '')
+            if pid not in mapa_personas:
+                continue
+
+            nombre = mapa_personas[pid]
+            if nombre not in personas:
+                personas[nombre] = {'person_id': pid, 'dias': [], 'ultima_salida': ''}
+
+            daily_list = item.get('daily', [])
+            for day in daily_list:
+                day_date = day.get('date', '')
+                if isinstance(day_date, str) and len(day_date) >= 10:
+                    day_date = day_date[:10]
+
+                # Duracion: payroll -> tracked -> worked
+                payroll_hours = day.get('payrollHours', {})
+                tracked_hours = day.get('trackedHours', {})
+
+                duracion_seg = self._parsear_iso_duration(payroll_hours.get('total', ''))
+                if duracion_seg == 0:
+                    duracion_seg = self._parsear_iso_duration(tracked_hours.get('total', ''))
+                if duracion_seg == 0:
+                    duracion_seg = self._parsear_iso_duration(tracked_hours.get('worked', ''))
+                if duracion_seg == 0:
+                    duracion_seg = self._parsear_iso_duration(item.get('totalPayroll', ''))
+                if duracion_seg == 0:
+                    duracion_seg = self._parsear_iso_duration(item.get('totalTracked', ''))
+
+                # Entrada y salida reales
+                first_in = day.get('firstIn') or day.get('firstInTimestamp') or ''
+                last_out = day.get('lastOut') or day.get('lastOutTimestamp') or ''
+
+                entrada = self._formatear_hora(first_in)
+                salida = self._formatear_hora(last_out)
+
+                # Solo agregar si hay tiempo real trabajado (> 1 minuto)
+                if duracion_seg > 60:
+                    personas[nombre]['dias'].append({
+                        'fecha': day_date or fecha_str,
+                        'duracion_segundos': duracion_seg,
+                        'entrada': entrada,
+                        'salida': salida,
+                    })
+
+                    # Rastrear la última salida de la semana para fecha de emisión
+                    ultima_actual = personas[nombre].get('ultima_salida', '')
+
+                    # Construir datetime de salida: fecha + hora
+                    if salida != '-':
+                        salida_dt_str = f"{day_date or fecha_str} {salida}"
+                        if not ultima_actual or salida_dt_str > ultima_actual:
+                            personas[nombre]['ultima_salida'] = salida_dt_str
 
     # ==========================================
     # PARSERS
@@ -1,9 +1,30 @@
 import time
+from datetime import date, datetime, timedelta
+from datetime import time as hora
+from datetime import timezone as dt_timezone
+from io import StringIO
 from unittest.mock import patch
 
 from django.core.cache import cache
-from django.test import TestCase, override_settings
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
+
+from nomina.asistencia import leer_asistencia
+from nomina.lotes import crear_lote, encolar_lote, procesar_lote
+from nomina.management.commands.benchmark_asistencia import hoja_sintetica
+from nomina.models import Empleado, FolioNomina, LoteNomina, ReciboNomina, TimesheetJibble
+from nomina.services import CubetaTokens, JibbleService
+from nomina.views import (
+    calcular_hora_salida,
+    parsear_hms,
+    parsear_horario_trabajo,
+    parsear_horas_complejas,
+    redondear_horas_90,
+)
 
 
 class WebhookSyncJibbleRateLimitTest(TestCase):
@@ -60,3 +81,359 @@ class WebhookSyncJibbleErrorGenericoTest(TestCase):
         self.assertNotIn(mensaje_interno, str(cuerpo))
         self.assertEqual(cuerpo['error'], 'Error inesperado al sincronizar con Jibble.')
         self.assertIn(mensaje_interno, '\n'.join(logs.output))
+
+
+class _Respuesta:
+    def __init__(self, status_code=200, data=None, headers=None):
+        self.status_code = status_code
+        self._data = data or {}
+        self.headers = headers or {}
+
+    def json(self):
+        return self._data
+
+
+class _SesionFalsa:
+    """Responde /v1/Timesheets con lo que haya en `respuestas[fecha]` (una
+    lista que se consume en orden) y anota cada día pedido."""
+
+    def __init__(self, respuestas):
+        self.respuestas = respuestas
+        self.pedidos = []
+
+    def get(self, url, params=None, timeout=None):
+        self.pedidos.append(params['date'])
+        return self.respuestas[params['date']].pop(0)
+
+
+def _payload(segundos):
+    return {'value': [{'personId': 'p1', 'daily': [{'payrollHours': {'total': f'PT{segundos}S'}}]}]}
+
+
+class SincronizacionTimesheetsTest(TestCase):
+
+    def setUp(self):
+        self.dormidas = []
+        self.svc = JibbleService()
+        self.svc.access_token = 'token'
+        self.svc.cubeta = CubetaTokens(1, 10, reloj=lambda: 0.0, dormir=self.dormidas.append)
+
+    def _sesion(self, respuestas):
+        self.svc._session = _SesionFalsa(respuestas)
+        return self.svc._session
+
+    def _guardado(self, fecha, obtenido_en, payload):
+        return TimesheetJibble.objects.create(
+            fecha=fecha, obtenido_en=obtenido_en, hash='x' * 64, payload=payload)
+
+    def test_solo_pide_los_dias_abiertos_o_nuevos(self):
+        # El 2 se descargó el 10 (cerrado); el 3 se descargó el mismo día (abierto).
+        self._guardado(date(2026, 3, 2), datetime(2026, 3, 10, 12, tzinfo=dt_timezone.utc), _payload(3600))
+        self._guardado(date(2026, 3, 3), datetime(2026, 3, 3, 20, tzinfo=dt_timezone.utc), _payload(60))
+        sesion = self._sesion({
+            '2026-03-03': [_Respuesta(data=_payload(7200))],
+            '2026-03-04': [_Respuesta(data=_payload(1800))],
+        })
+
+        payloads, descargados = self.svc.sincronizar_timesheets(date(2026, 3, 2), date(2026, 3, 4))
+
+        self.assertEqual(sesion.pedidos, ['2026-03-03', '2026-03-04'])
+        self.assertEqual(descargados, 2)
+        self.assertEqual(payloads[date(2026, 3, 2)], _payload(3600))
+        self.assertEqual(payloads[date(2026, 3, 3)], _payload(7200))
+        # El 3 cambió: queda su historial; el 4 es nuevo.
+        self.assertEqual(TimesheetJibble.objects.filter(fecha=date(2026, 3, 3)).count(), 2)
+        self.assertEqual(TimesheetJibble.objects.filter(fecha=date(2026, 3, 4)).count(), 1)
+
+    def test_payload_sin_cambios_no_agrega_fila(self):
+        self._sesion({'2026-03-05': [_Respuesta(data=_payload(3600)), _Respuesta(data=_payload(3600))]})
+        self.svc.sincronizar_timesheets(date(2026, 3, 5), date(2026, 3, 5))
+        self.svc.sincronizar_timesheets(date(2026, 3, 5), date(2026, 3, 5))
+        self.assertEqual(TimesheetJibble.objects.filter(fecha=date(2026, 3, 5)).count(), 1)
+
+    @override_settings(JIBBLE_REINTENTOS=2)
+    def test_rate_limit_espera_lo_que_pide_retry_after(self):
+        reloj = [0.0]
+        self.svc.cubeta = CubetaTokens(
+            1, 10, reloj=lambda: reloj[0],
+            dormir=lambda s: (self.dormidas.append(s), reloj.__setitem__(0, reloj[0] + s)),
+        )
+        self._sesion({'2026-03-06': [
+            _Respuesta(429, headers={'Retry-After': '7'}),
+            _Respuesta(data=_payload(3600)),
+        ]})
+
+        payloads, _ = self.svc.sincronizar_timesheets(date(2026, 3, 6), date(2026, 3, 6))
+
+        self.assertEqual(self.dormidas, [7.0])
+        self.assertEqual(payloads[date(2026, 3, 6)], _payload(3600))
+
+    def test_falla_de_jibble_usa_la_ultima_copia(self):
+        self._guardado(date(2026, 3, 7), datetime(2026, 3, 7, 20, tzinfo=dt_timezone.utc), _payload(3600))
+        self._sesion({'2026-03-07': [_Respuesta(500)]})
+
+        payloads, descargados = self.svc.sincronizar_timesheets(date(2026, 3, 7), date(2026, 3, 7))
+
+        self.assertEqual(descargados, 0)
+        self.assertEqual(payloads[date(2026, 3, 7)], _payload(3600))
+
+    def test_timesheets_semana_arma_los_dias_desde_el_cache(self):
+        self._guardado(date(2026, 3, 2), datetime(2026, 3, 10, tzinfo=dt_timezone.utc), _payload(3600))
+        self._sesion({})
+
+        with patch.object(JibbleService, 'obtener_personas', return_value={'p1': 'ANA'}):
+            resultado = self.svc.obtener_timesheets_semana('2026-03-02', '2026-03-02')
+
+        self.assertEqual(resultado['dias_descargados'], 0)
+        self.assertEqual(resultado['dias_en_cache'], 1)
+        self.assertEqual(resultado['personas']['ANA']['dias'][0]['duracion_segundos'], 3600)
+
+
+class CubetaTokensTest(SimpleTestCase):
+
+    def test_rafaga_y_despues_ritmo(self):
+        reloj, dormidas = [0.0], []
+
+        def dormir(segundos):
+            dormidas.append(segundos)
+            reloj[0] += segundos
+
+        cubeta = CubetaTokens(0.5, 3, reloj=lambda: reloj[0], dormir=dormir)
+        for _ in range(5):
+            cubeta.tomar()
+        self.assertEqual(dormidas, [2.0, 2.0])
+
+        cubeta.pausar(10)
+        cubeta.tomar()
+        self.assertEqual(dormidas[-1], 10.0)
+
+
+def _registro(fecha, horas):
+    return {
+        'fecha': fecha, 'dia': 'Mon', 'entrada': '08:00', 'salida': '16:00',
+        'horas_fmt': f'{horas}:00:00', 'horas_raw': float(horas),
+        'horas_a_pagar': horas, 'horas_a_pagar_fmt': f'{horas}:00', 'fue_recortado': False,
+    }
+
+
+@override_settings(
+    STORAGES={
+        'default': {'BACKEND': 'django.core.files.storage.InMemoryStorage'},
+        'privado': {'BACKEND': 'django.core.files.storage.InMemoryStorage'},
+    },
+    NOMINA_PROCESOS_PDF=1, NOMINA_LOTE_TANDA=2,
+)
+class LoteNominaTest(TestCase):
+
+    def _datos(self, *nombres):
+        return {nombre: [_registro('2026-03-02', 8), _registro('2026-03-03', 6)] for nombre in nombres}
+
+    def test_genera_los_recibos_del_lote_con_folios_consecutivos(self):
+        Empleado.objects.create(nombre='ANA', tarifa_base=60)
+        existente = ReciboNomina.objects.create(
+            empleado=Empleado.objects.get(nombre='ANA'), folio=7, periodo='x',
+            horas_trabajadas=1, tarifa_aplicada=60, total_pagado=60)
+        lote = crear_lote(self._datos('ANA', 'BETO', 'CARLA'), {'ANA': '2026-03-03 16:00'}, origen='EXCEL')
+        avance = []
+
+        lote = procesar_lote(lote.pk, progreso=lambda hechos, total: avance.append((hechos, total)))
+
+        self.assertEqual(lote.estado, 'TERMINADO')
+        self.assertEqual(avance, [(2, 3), (3, 3)])
+        recibos = ReciboNomina.objects.filter(lote=lote).order_by('folio')
+        self.assertEqual([r.folio for r in recibos], [8, 9, 10])
+        self.assertEqual([r.empleado.nombre for r in recibos], ['ANA', 'BETO', 'CARLA'])
+        self.assertEqual(recibos[0].total_pagado, 14 * 60)
+        self.assertEqual(recibos[0].periodo, '2026-03-02 al 2026-03-03')
+        self.assertTrue(all(r.archivo_pdf.name.startswith('nominas_pdf/Nomina_') for r in recibos))
+        # Los nuevos se dieron de alta; ANA no se duplicó.
+        self.assertEqual(Empleado.objects.count(), 3)
+        self.assertEqual(ReciboNomina.objects.exclude(pk=existente.pk).count(), 3)
+
+    def test_las_consultas_no_crecen_con_los_empleados(self):
+        def consultas(nombres):
+            lote = crear_lote(self._datos(*nombres), origen='EXCEL')
+            with CaptureQueriesContext(connection) as ctx:
+                procesar_lote(lote.pk)
+            return len(ctx)
+
+        FolioNomina.reservar()  # Secuencia ya sembrada en las dos corridas.
+        with self.settings(NOMINA_LOTE_TANDA=50):
+            self.assertEqual(consultas(['A1', 'A2']), consultas([f'B{i}' for i in range(12)]))
+
+    def test_un_lote_no_se_procesa_dos_veces(self):
+        lote = crear_lote(self._datos('ANA'), origen='EXCEL')
+        procesar_lote(lote.pk)
+        self.assertIsNone(procesar_lote(lote.pk))
+        self.assertEqual(ReciboNomina.objects.count(), 1)
+
+    def _cortar_tras_la_primera_tanda(self, lote, excepcion):
+        def progreso(hechos, total):
+            raise excepcion
+        try:
+            return procesar_lote(lote.pk, progreso=progreso)
+        except SystemExit:
+            return None
+
+    def test_un_lote_abandonado_se_retoma_sin_duplicar_recibos_ni_folios(self):
+        lote = crear_lote(self._datos('ANA', 'BETO', 'CARLA'), origen='EXCEL')
+        # El worker muere (SystemExit no lo atrapa procesar_lote) tras la primera tanda.
+        self._cortar_tras_la_primera_tanda(lote, SystemExit())
+        lote.refresh_from_db()
+        self.assertEqual((lote.estado, lote.procesados), ('PROCESANDO', 2))
+
+        # Con el latido reciente nadie lo toma.
+        self.assertIsNone(procesar_lote(lote.pk))
+        LoteNomina.objects.filter(pk=lote.pk).update(latido_en=timezone.now() - timedelta(hours=1))
+        call_command('procesar_lotes_nomina', stdout=StringIO())
+
+        lote.refresh_from_db()
+        self.assertEqual((lote.estado, lote.procesados), ('TERMINADO', 3))
+        recibos = ReciboNomina.objects.filter(lote=lote).order_by('folio')
+        self.assertEqual([(r.folio, r.empleado.nombre) for r in recibos], [(1, 'ANA'), (2, 'BETO'), (3, 'CARLA')])
+        self.assertEqual(FolioNomina.objects.get().ultimo_folio, 3)
+
+    def test_un_lote_en_error_solo_se_reintenta_con_reintentar(self):
+        lote = crear_lote(self._datos('ANA', 'BETO', 'CARLA'), origen='EXCEL')
+        lote = self._cortar_tras_la_primera_tanda(lote, RuntimeError('S3 no responde'))
+        self.assertEqual((lote.estado, lote.procesados), ('ERROR', 2))
+
+        self.assertIsNone(procesar_lote(lote.pk))
+        lote = procesar_lote(lote.pk, reintentar=True)
+
+        self.assertEqual((lote.estado, lote.procesados, lote.error), ('TERMINADO', 3, ''))
+        self.assertEqual(sorted(ReciboNomina.objects.values_list('folio', flat=True)), [1, 2, 3])
+        self.assertEqual(FolioNomina.objects.get().ultimo_folio, 3)
+
+    def test_sin_hilo_el_lote_queda_para_el_worker(self):
+        lote = crear_lote(self._datos('ANA'), origen='EXCEL')
+        with self.settings(NOMINA_LOTES_EN_HILO=False), self.captureOnCommitCallbacks() as callbacks:
+            encolar_lote(lote)
+        self.assertEqual(callbacks, [])
+
+    def test_folios_se_reservan_por_bloque(self):
+        self.assertEqual(FolioNomina.reservar(3), 1)
+        self.assertEqual(FolioNomina.reservar(), 4)
+        self.assertEqual(FolioNomina.objects.get().ultimo_folio, 4)
+
+
+@override_settings(NOMINA_CRON_TOKEN='token-de-prueba')
+class WebhookSyncJibbleLoteTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_encola_el_lote_y_responde_sin_esperar_los_pdf(self):
+        personas = {'ANA': {'person_id': 'p1', 'ultima_salida': '', 'dias': [
+            {'fecha': '2026-03-02', 'duracion_segundos': 8 * 3600, 'entrada': '08:00', 'salida': '16:00'},
+        ]}}
+        with patch('nomina.services.JibbleService.esta_configurado', return_value=True), \
+             patch('nomina.services.JibbleService.autenticar'), \
+             patch('nomina.services.JibbleService.obtener_timesheets_semana',
+                   return_value={'personas': personas, 'fuente': 'Timesheets'}), \
+             self.captureOnCommitCallbacks() as callbacks:
+            respuesta = self.client.post(
+                reverse('webhook_sync_jibble'), data='{}', content_type='application/json',
+                HTTP_AUTHORIZATION='Bearer token-de-prueba',
+            )
+
+        self.assertEqual(respuesta.status_code, 200)
+        lote = LoteNomina.objects.get()
+        self.assertEqual(respuesta.json()['recibos_generados'], 0)
+        self.assertEqual((respuesta.json()['lote'], respuesta.json()['recibos_en_proceso']), (lote.pk, 1))
+        self.assertEqual((lote.estado, lote.total), ('PENDIENTE', 1))
+        self.assertEqual(ReciboNomina.objects.count(), 0)
+        self.assertEqual(len(callbacks), 1)
+
+
+def _leer_asistencia_celda_por_celda(df, horarios_semana):
+    """Recorrido que hacía cargar_nomina antes del parser vectorizado."""
+    import pandas as pd
+
+    row_fechas_idx, mapa_columnas_fechas = -1, {}
+    for r in range(min(20, len(df))):
+        temp_map = {}
+        for c, val in enumerate(df.iloc[r].values):
+            if pd.isna(val):
+                continue
+            try:
+                fecha_dt = pd.to_datetime(val)
+                if not pd.isna(fecha_dt) and fecha_dt.year > 2000:
+                    temp_map[c] = fecha_dt
+            except Exception:  # noqa: S112 — así era el original
+                continue
+        if len(temp_map) > 3:
+            row_fechas_idx, mapa_columnas_fechas = r, temp_map
+            break
+    if not mapa_columnas_fechas:
+        return None
+
+    datos_empleados, fecha_emision_por_empleado = {}, {}
+    for r in range(row_fechas_idx + 1, len(df)):
+        fila = df.iloc[r]
+        fila_txt = [str(x).upper().strip() for x in fila.values]
+        nombre = ''
+        for i in range(min(5, len(fila_txt))):
+            if "PAYROLL" in fila_txt[i] or "HORAS" in fila_txt[i]:
+                nombre = fila_txt[0]
+                break
+        if not nombre or nombre in ["NAN", "", "-"]:
+            continue
+        datos_empleados.setdefault(nombre, [])
+        for col_idx, fecha_obj in mapa_columnas_fechas.items():
+            horas_raw = parsear_horas_complejas(fila[col_idx])
+            h, m, s = parsear_hms(fila[col_idx])
+            if horas_raw > 0:
+                entrada = horarios_semana.get(fecha_obj.weekday(), hora(8, 0))
+                hora_salida = calcular_hora_salida(entrada, h, m, s)
+                horas_a_pagar = redondear_horas_90(horas_raw)
+                datos_empleados[nombre].append({
+                    'fecha': fecha_obj.strftime('%Y-%m-%d'),
+                    'dia': fecha_obj.strftime('%A')[:3],
+                    'entrada': entrada.strftime('%H:%M'),
+                    'salida': hora_salida,
+                    'horas_fmt': f"{h}:{m:02d}:{s:02d}",
+                    'horas_raw': horas_raw,
+                    'horas_a_pagar': horas_a_pagar,
+                    'horas_a_pagar_fmt': f"{horas_a_pagar:.0f}:00",
+                    'fue_recortado': horas_a_pagar < horas_raw,
+                })
+                salida_dt = f"{fecha_obj.strftime('%Y-%m-%d')} {hora_salida}"
+                if nombre not in fecha_emision_por_empleado or salida_dt > fecha_emision_por_empleado[nombre]:
+                    fecha_emision_por_empleado[nombre] = salida_dt
+    return datos_empleados, fecha_emision_por_empleado
+
+
+class LeerAsistenciaTest(SimpleTestCase):
+
+    def _comparar(self, df):
+        horarios = parsear_horario_trabajo(df)
+        self.assertEqual(leer_asistencia(df, horarios), _leer_asistencia_celda_por_celda(df, horarios))
+
+    def test_igual_al_recorrido_celda_por_celda(self):
+        df = hoja_sintetica(empleados=40, dias=31, semilla=7)
+        horarios = parsear_horario_trabajo(df)
+        self.assertEqual(horarios[4], hora(9, 0))
+        datos, fechas = leer_asistencia(df, horarios)
+        self.assertEqual(len(datos), 40)
+        self.assertEqual((datos, fechas), _leer_asistencia_celda_por_celda(df, horarios))
+
+    def test_celdas_raras(self):
+        import pandas as pd
+
+        fechas = ['2026-03-02', '2026-03-03', '2026-03-04', '2026-03-05', '2026-03-06']
+        valores = [
+            '8:30', ' 7:45:10 ', '8:x:00', '8.5:30', '9:', 0.00004, -3, '2,5', 'nan', '1e1',
+            '8:-15', '25:00:00', 7, hora(6, 59, 59), '  -  ',
+        ]
+        filas = [['Nombre', 'Tipo'] + fechas]
+        for i in range(0, len(valores), 5):
+            filas.append([f'ana {i}', 'Horas Payroll'] + valores[i:i + 5])
+        filas.append(['-', 'PAYROLL'] + ['8:00'] * 5)
+        filas.append(['BETO', 'Tracked'] + ['8:00'] * 5)
+        self._comparar(pd.DataFrame(filas))
+
+    def test_sin_fila_de_fechas(self):
+        import pandas as pd
+
+        self.assertIsNone(leer_asistencia(pd.DataFrame([['a', 'b'], ['c', 'd']]), {}))
@@ -1,27 +1,22 @@
 import io
 import logging
 import math
-import os
 from datetime import date, datetime, time, timedelta
-from decimal import ROUND_HALF_UP, Decimal
+from decimal import ROUND_HALF_UP
 
 import pandas as pd
 from django.conf import settings
 from django.contrib import messages
 from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import permission_required
-from django.core.files.base import ContentFile
 from django.http import JsonResponse
 from django.shortcuts import redirect, render
-from django.template.loader import render_to_string
-from django.utils import timezone
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
-from weasyprint import HTML
 
 from core_erp.ratelimit import rate_limit
 
-from .models import Empleado, ReciboNomina
+from .asistencia import leer_asistencia
 
 logger = logging.getLogger(__name__)
 
@@ -125,70 +120,19 @@ def parsear_horario_trabajo(df):
 # GENERADOR DE RECIBOS (reutilizable)
 # ==========================================
 
-def _generar_recibos_desde_datos(datos_empleados, fecha_emision_por_empleado=None):
+def _encolar_recibos(datos_empleados, fecha_emision_por_empleado=None, *, origen, usuario=None):
     """
-    Genera recibos PDF.
+    Deja los recibos en un LoteNomina que se procesa en segundo plano (ver
+    nomina/lotes.py). None si no hay empleados con registros.
     fecha_emision_por_empleado: {nombre: 'YYYY-MM-DD HH:MM'} -> ultima salida semanal.
     """
-    count = 0
-    ruta_logo = os.path.join(settings.BASE_DIR, 'static', 'img', 'logo.png')
-    logo_url = f"file:///{ruta_logo.replace(os.sep, '/')}" if os.name == 'nt' else f"file://{ruta_logo}"
-    fecha_emision_por_empleado = fecha_emision_por_empleado or {}
+    from .lotes import crear_lote, encolar_lote
 
-    for nombre, registros in datos_empleados.items():
-        if not registros:
-            continue
-
-        total_horas_reales = round(sum(r['horas_raw'] for r in registros), 2)
-        total_horas_a_pagar = sum(r['horas_a_pagar'] for r in registros)
-        ahorro_horas = round(total_horas_reales - total_horas_a_pagar, 2)
-        empleado_obj, _ = Empleado.objects.get_or_create(nombre=nombre)
-        fechas_dt = [pd.to_datetime(r['fecha']) for r in registros]
-        periodo = f"{min(fechas_dt).strftime('%Y-%m-%d')} al {max(fechas_dt).strftime('%Y-%m-%d')}"
-        tarifa = float(empleado_obj.tarifa_base)
-        total_pagado = round(total_horas_a_pagar * tarifa, 2)
-        total_sin_redondeo = round(total_horas_reales * tarifa, 2)
-        ahorro_dinero = round(total_sin_redondeo - total_pagado, 2)
-
-        # Fecha de emision: ultima salida de la semana o ahora
-        fecha_emision = fecha_emision_por_empleado.get(nombre, '')
-        if not fecha_emision:
-            fecha_emision = timezone.now().strftime('%d/%m/%Y %H:%M')
-        else:
-            try:
-                dt = datetime.strptime(fecha_emision, '%Y-%m-%d %H:%M')
-                fecha_emision = dt.strftime('%d/%m/%Y %H:%M')
-            except ValueError:
-                fecha_emision = timezone.now().strftime('%d/%m/%Y %H:%M')
-
-        context = {
-            'empleado': empleado_obj,
-            'periodo': periodo,
-            'lista_asistencia': registros,
-            'total_horas_reales': f"{total_horas_reales:.2f}",
-            'total_horas_a_pagar': f"{total_horas_a_pagar:.0f}",
-            'ahorro_horas': f"{ahorro_horas:.2f}",
-            'total_pagado': f"{total_pagado:,.2f}",
-            'total_sin_redondeo': f"{total_sin_redondeo:,.2f}",
-            'ahorro_dinero': f"{ahorro_dinero:,.2f}",
-            'folio': f"NOM-{ReciboNomina.objects.count()+1:03d}",
-            'logo_url': logo_url,
-            'fecha_emision': fecha_emision,
-        }
-
-        html = render_to_string('nomina/recibo_nomina.html', context)
-        pdf = HTML(string=html).write_pdf()
-        recibo = ReciboNomina.objects.create(
-            empleado=empleado_obj, periodo=periodo,
-            horas_trabajadas=Decimal(str(total_horas_a_pagar)),
-            tarifa_aplicada=empleado_obj.tarifa_base,
-            total_pagado=Decimal(str(total_pagado)),
-        )
-        safe_name = "".join([c for c in nombre if c.isalnum() or c == ' ']).strip().replace(' ', '_')
-        recibo.archivo_pdf.save(f"Nomina_{safe_name}.pdf", ContentFile(pdf))
-        count += 1
-
-    return count
+    if not any(datos_empleados.values()):
+        return None
+    lote = crear_lote(datos_empleados, fecha_emision_por_empleado, origen=origen, usuario=usuario)
+    encolar_lote(lote)
+    return lote
 
 
 # ==========================================
@@ -207,75 +151,17 @@ def cargar_nomina(request):
                 df = pd.read_excel(archivo, header=None)
 
             horarios_semana = parsear_horario_trabajo(df)
-            row_fechas_idx = -1
-            mapa_columnas_fechas = {}
-            for r in range(min(20, len(df))):
-                fila = df.iloc[r].values
-                temp_map = {}
-                fechas_encontradas = 0
-                for c, val in enumerate(fila):
-                    if pd.isna(val):
-                        continue
-                    try:
-                        fecha_dt = pd.to_datetime(val)
-                        if not pd.isna(fecha_dt) and fecha_dt.year > 2000:
-                            temp_map[c] = fecha_dt
-                            fechas_encontradas += 1
-                    except Exception:
-                        pass
-                if fechas_encontradas > 3:
-                    row_fechas_idx = r
-                    mapa_columnas_fechas = temp_map
-                    break
-
-            if not mapa_columnas_fechas:
+            leido = leer_asistencia(df, horarios_semana)
+            if leido is None:
                 messages.error(request, "No encontre la fila de fechas en el archivo.")
                 return redirect('admin:nomina_recibonomina_changelist')
+            datos_empleados, fecha_emision_por_empleado = leido
 
-            datos_empleados = {}
-            fecha_emision_por_empleado = {}
-
-            for r in range(row_fechas_idx + 1, len(df)):
-                fila = df.iloc[r]
-                fila_txt = [str(x).upper().strip() for x in fila.values]
-                es_fila_payroll = False
-                nombre = ""
-                for i in range(min(5, len(fila_txt))):
-                    if "PAYROLL" in fila_txt[i] or "HORAS" in fila_txt[i]:
-                        es_fila_payroll = True
-                        nombre = fila_txt[0]
-                        break
-                if es_fila_payroll and nombre and nombre not in ["NAN", "", "-"]:
-                    if nombre not in datos_empleados:
-                        datos_empleados[nombre] = []
-                    for col_idx, fecha_obj in mapa_columnas_fechas.items():
-                        if col_idx < len(fila):
-                            horas_raw = parsear_horas_complejas(fila[col_idx])
-                            h, m, s = parsear_hms(fila[col_idx])
-                            if horas_raw > 0:
-                                dia_semana = fecha_obj.weekday()
-                                hora_entrada_prog = horarios_semana.get(dia_semana, time(8, 0))
-                                hora_salida = calcular_hora_salida(hora_entrada_prog, h, m, s)
-                                horas_a_pagar = redondear_horas_90(horas_raw)
-                                datos_empleados[nombre].append({
-                                    'fecha': fecha_obj.strftime('%Y-%m-%d'),
-                                    'dia': fecha_obj.strftime('%A')[:3],
-                                    'entrada': hora_entrada_prog.strftime('%H:%M'),
-                                    'salida': hora_salida,
-                                    'horas_fmt': f"{h}:{m:02d}:{s:02d}",
-                                    'horas_raw': horas_raw,
-                                    'horas_a_pagar': horas_a_pagar,
-                                    'horas_a_pagar_fmt': f"{horas_a_pagar:.0f}:00",
-                                    'fue_recortado': horas_a_pagar < horas_raw,
-                                })
-                                # Ultima salida para fecha de emision
-                                salida_dt = f"{fecha_obj.strftime('%Y-%m-%d')} {hora_salida}"
-                                if nombre not in fecha_emision_por_empleado or salida_dt > fecha_emision_por_empleado[nombre]:
-                                    fecha_emision_por_empleado[nombre] = salida_dt
-
-            count = _generar_recibos_desde_datos(datos_empleados, fecha_emision_por_empleado)
-            if count > 0:
-                messages.success(request, f"Exito: {count} recibos generados con regla de redondeo 90%.")
+            lote = _encolar_recibos(datos_empleados, fecha_emision_por_empleado,
+                                    origen='EXCEL', usuario=request.user)
+            if lote:
+                messages.success(request, f"Lote #{lote.pk}: {lote.total} recibos en proceso con regla de redondeo 90%. "
+                                          "El avance se ve en Lotes de recibos.")
             else:
                 messages.warning(request, "No se encontraron datos procesables.")
             return redirect('admin:nomina_recibonomina_changelist')
@@ -315,9 +201,10 @@ def sync_jibble_view(request):
                 messages.warning(request, f"Jibble ({fuente}): No se encontraron datos para el periodo.")
                 return redirect('admin:nomina_recibonomina_changelist')
             datos_empleados, fecha_emision_map = _transformar_datos_jibble(personas)
-            count = _generar_recibos_desde_datos(datos_empleados, fecha_emision_map)
-            if count > 0:
-                messages.success(request, f"Jibble ({fuente}): {count} recibos generados con regla 90%.")
+            lote = _encolar_recibos(datos_empleados, fecha_emision_map, origen='JIBBLE', usuario=request.user)
+            if lote:
+                messages.success(request, f"Jibble ({fuente}): lote #{lote.pk} con {lote.total} recibos en proceso "
+                                          "(regla 90%). El avance se ve en Lotes de recibos.")
             else:
                 messages.warning(request, "No se generaron recibos.")
         except JibbleAPIError as e:
@@ -373,11 +260,16 @@ def webhook_sync_jibble(request):
         if not personas:
             return JsonResponse({'status': 'ok', 'recibos_generados': 0, 'fuente': fuente})
         datos_empleados, fecha_emision_map = _transformar_datos_jibble(personas)
-        count = _generar_recibos_desde_datos(datos_empleados, fecha_emision_map)
+        lote = _encolar_recibos(datos_empleados, fecha_emision_map, origen='JIBBLE')
+        # Mismo contrato que cuando los PDF se generaban aquí: 200 con
+        # `recibos_generados`, que ahora es 0 porque se generan después de
+        # responder. `lote` y `recibos_en_proceso` dicen cuáles vienen.
         return JsonResponse({
             'status': 'ok', 'periodo': f'{fecha_inicio} al {fecha_fin}',
             'fuente': fuente, 'empleados_procesados': len(personas),
-            'recibos_generados': count,
+            'recibos_generados': 0,
+            'lote': lote.pk if lote else None,
+            'recibos_en_proceso': lote.total if lote else 0,
         })
     except JibbleAPIError as e:
         return JsonResponse({'error': f'Jibble API: {e}'}, status=502)
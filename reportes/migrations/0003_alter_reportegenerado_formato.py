@@ -0,0 +1,26 @@
+# Generated by Django 6.1 on 2026-10-19 04:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("reportes", "0002_alter_reportegenerado_options"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="reportegenerado",
+            name="formato",
+            field=models.CharField(
+                choices=[
+                    ("PDF", "PDF"),
+                    ("XLSX", "Excel"),
+                    ("HTML", "Vista en Pantalla"),
+                ],
+                default="PDF",
+                max_length=10,
+            ),
+        ),
+    ]
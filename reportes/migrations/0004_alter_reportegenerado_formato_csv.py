@@ -0,0 +1,27 @@
+# Generated by Django 6.1 on 2026-10-19 05:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("reportes", "0003_alter_reportegenerado_formato"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="reportegenerado",
+            name="formato",
+            field=models.CharField(
+                choices=[
+                    ("PDF", "PDF"),
+                    ("XLSX", "Excel"),
+                    ("CSV", "CSV"),
+                    ("HTML", "Vista en Pantalla"),
+                ],
+                default="PDF",
+                max_length=10,
+            ),
+        ),
+    ]
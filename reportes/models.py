@@ -31,6 +31,8 @@ class ReporteGenerado(models.Model):
     ]
     FORMATO_CHOICES = [
         ('PDF', 'PDF'),
+        ('XLSX', 'Excel'),
+        ('CSV', 'CSV'),
         ('HTML', 'Vista en Pantalla'),
     ]
 
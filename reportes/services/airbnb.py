@@ -5,6 +5,7 @@ Ocupación por listing/mes y comparativo mensual.
 
 ERP Quinta Ko'ox Tanil
 """
+from bisect import bisect_right
 from calendar import monthrange
 from datetime import date, timedelta
 from decimal import Decimal
@@ -14,10 +15,42 @@ from django.db.models import Count, Q, Sum
 from django.db.models.functions import TruncMonth
 
 
+def _repartir_noches(desde: date, hasta: date, cortes: List[date]):
+    """
+    Reparte las noches de [desde, hasta) entre las ventanas consecutivas
+    [cortes[i], cortes[i+1]). Produce (i, noches) solo para las ventanas que
+    toca, recortando lo que cae fuera del primer y el último corte.
+    """
+    desde = max(desde, cortes[0])
+    hasta = min(hasta, cortes[-1])
+    i = bisect_right(cortes, desde) - 1
+    while desde < hasta:
+        corte = min(hasta, cortes[i + 1])
+        yield i, (corte - desde).days
+        desde = corte
+        i += 1
+
+
+def _tasa(parte, total) -> Decimal:
+    return (Decimal(parte) / Decimal(total) * 100).quantize(Decimal('0.1')) if total > 0 else Decimal('0.0')
+
+
+def _promedio(ingreso: Decimal, noches) -> Decimal:
+    return (ingreso / noches).quantize(Decimal('0.01')) if noches > 0 else Decimal('0.00')
+
+
 class OcupacionService:
     """
     Calcula tasa de ocupación por listing y mes.
     Ocupación = noches reservadas / noches disponibles del mes.
+
+    ADR (tarifa promedio por noche vendida) y RevPAR (ingreso por noche
+    disponible) salen del monto bruto de los PagoAirbnb PAGADO, repartido
+    entre los meses en proporción a las noches de cada estancia.
+
+    Todo el rango se resuelve con una consulta de reservas y otra de pagos:
+    cada estancia se reparte entre los meses con un barrido sobre los cortes
+    de mes, en vez de consultar cada (listing × mes) por separado.
     """
 
     @classmethod
@@ -27,73 +60,96 @@ class OcupacionService:
         fecha_fin: date,
         anuncio_id: int = None,
     ) -> Dict:
-        from airbnb.models import AnuncioAirbnb, ReservaAirbnb
+        from airbnb.models import AnuncioAirbnb, PagoAirbnb, ReservaAirbnb
 
         anuncios = AnuncioAirbnb.objects.filter(activo=True)
         if anuncio_id:
             anuncios = anuncios.filter(pk=anuncio_id)
+        anuncios = list(anuncios)
 
         # Generar lista de meses en el rango
         meses = cls._generar_meses(fecha_inicio, fecha_fin)
+        # Ventana i = [cortes[i], cortes[i+1]); la última termina el día
+        # siguiente a `fecha_fin` porque esa noche todavía cuenta.
+        cortes = [m['inicio'] for m in meses] + [fecha_fin + timedelta(days=1)]
+        disponibles = [(m['fin'] - m['inicio']).days + 1 for m in meses]
+
+        ids = [a.pk for a in anuncios]
+        noches = {pk: [0] * len(meses) for pk in ids}
+        ingresos = {pk: [Decimal('0')] * len(meses) for pk in ids}
+
+        # Reservas que se solapan con el rango (excluir bloqueadas por host y canceladas)
+        reservas = ReservaAirbnb.objects.filter(
+            anuncio_id__in=ids,
+            fecha_inicio__lte=fecha_fin,
+            fecha_fin__gte=fecha_inicio,
+        ).exclude(estado__in=['CANCELADA', 'BLOQUEADA']).values_list(
+            'anuncio_id', 'fecha_inicio', 'fecha_fin',
+        )
+        for pk, check_in, check_out in reservas:
+            for i, n in _repartir_noches(check_in, check_out, cortes):
+                noches[pk][i] += n
+
+        # El monto de cada pago se prorratea por noche: una estancia del 30
+        # de junio al 2 de julio lleva un tercio a junio y dos a julio.
+        pagos = PagoAirbnb.objects.filter(
+            anuncio_id__in=ids,
+            estado='PAGADO',
+            fecha_checkin__lte=fecha_fin,
+            fecha_checkout__gt=fecha_inicio,
+        ).values_list('anuncio_id', 'fecha_checkin', 'fecha_checkout', 'monto_bruto')
+        for pk, check_in, check_out, monto in pagos:
+            estancia = (check_out - check_in).days
+            if estancia <= 0:
+                continue
+            por_noche = monto / estancia
+            for i, n in _repartir_noches(check_in, check_out, cortes):
+                ingresos[pk][i] += por_noche * n
 
         data_por_listing = []
-        totales_por_mes = {m['key']: {'noches': 0, 'disponibles': 0} for m in meses}
+        totales_noches = [0] * len(meses)
+        totales_ingresos = [Decimal('0')] * len(meses)
 
         for anuncio in anuncios:
             fila = {
                 'anuncio': anuncio.nombre,
                 'tipo': anuncio.get_tipo_display(),
                 'meses': [],
-                'total_noches': 0,
-                'total_disponibles': 0,
+                'total_noches': sum(noches[anuncio.pk]),
+                'total_disponibles': sum(disponibles),
+                'total_ingreso': sum(ingresos[anuncio.pk]).quantize(Decimal('0.01')),
             }
 
-            for mes in meses:
-                inicio_mes = mes['inicio']
-                fin_mes = mes['fin']
-                dias_mes = (fin_mes - inicio_mes).days + 1
-
-                # Reservas que se solapan con el mes (excluir bloqueadas por host y canceladas)
-                reservas = ReservaAirbnb.objects.filter(
-                    anuncio=anuncio,
-                    fecha_inicio__lte=fin_mes,
-                    fecha_fin__gte=inicio_mes,
-                ).exclude(estado__in=['CANCELADA', 'BLOQUEADA'])
-
-                noches = 0
-                for r in reservas:
-                    check_in = max(r.fecha_inicio, inicio_mes)
-                    check_out = min(r.fecha_fin, fin_mes + timedelta(days=1))
-                    noches += max(0, (check_out - check_in).days)
-
-                tasa = (Decimal(noches) / Decimal(dias_mes) * 100).quantize(Decimal('0.1')) if dias_mes > 0 else Decimal('0.0')
-
+            for i in range(len(meses)):
+                n, dias_mes, ingreso = noches[anuncio.pk][i], disponibles[i], ingresos[anuncio.pk][i]
                 fila['meses'].append({
-                    'noches': noches,
+                    'noches': n,
                     'disponibles': dias_mes,
-                    'tasa': tasa,
+                    'tasa': _tasa(n, dias_mes),
+                    'ingreso': ingreso.quantize(Decimal('0.01')),
+                    'adr': _promedio(ingreso, n),
+                    'revpar': _promedio(ingreso, dias_mes),
                 })
-                fila['total_noches'] += noches
-                fila['total_disponibles'] += dias_mes
-
-                totales_por_mes[mes['key']]['noches'] += noches
-                totales_por_mes[mes['key']]['disponibles'] += dias_mes
+                totales_noches[i] += n
+                totales_ingresos[i] += ingreso
 
-            fila['tasa_global'] = (
-                (Decimal(fila['total_noches']) / Decimal(fila['total_disponibles']) * 100).quantize(Decimal('0.1'))
-                if fila['total_disponibles'] > 0 else Decimal('0.0')
-            )
+            fila['tasa_global'] = _tasa(fila['total_noches'], fila['total_disponibles'])
+            fila['adr'] = _promedio(fila['total_ingreso'], fila['total_noches'])
+            fila['revpar'] = _promedio(fila['total_ingreso'], fila['total_disponibles'])
             data_por_listing.append(fila)
 
         # Totales generales por mes
         totales_meses = []
-        for mes in meses:
-            t = totales_por_mes[mes['key']]
-            tasa = (Decimal(t['noches']) / Decimal(t['disponibles']) * 100).quantize(Decimal('0.1')) if t['disponibles'] > 0 else Decimal('0.0')
+        for i in range(len(meses)):
+            n, ingreso = totales_noches[i], totales_ingresos[i]
+            dias = disponibles[i] * len(anuncios)
             totales_meses.append({
-                'noches': t['noches'],
-                'disponibles': t['disponibles'],
-                'tasa': tasa,
+                'noches': n,
+                'disponibles': dias,
+                'tasa': _tasa(n, dias),
+                'ingreso': ingreso.quantize(Decimal('0.01')),
+                'adr': _promedio(ingreso, n),
+                'revpar': _promedio(ingreso, dias),
             })
 
         return {
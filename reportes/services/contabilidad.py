@@ -8,9 +8,10 @@ ERP Quinta Ko'ox Tanil
 """
 from datetime import date
 from decimal import Decimal
-from typing import Dict, List, Optional
+from itertools import islice
+from typing import Dict, Iterator, List, Optional
 
-from django.db.models import Q, Sum
+from django.db.models import Count, Q, Sum
 
 
 class EstadoResultadosService:
@@ -124,6 +125,132 @@ class EstadoResultadosService:
         }
 
 
+class ArbolSaldos:
+    """
+    Saldos de todo el catálogo en una sola consulta agrupada por cuenta,
+    acumulados en memoria hacia arriba por `padre`: el saldo de una cuenta
+    de acumulación (`permite_movimientos=False`) es el de sus subcuentas.
+
+    `periodos` nombra las columnas a sumar ({nombre: Q sobre
+    MovimientoContable}); cada una se acumula por separado, así el Balance
+    General saca del mismo árbol los saldos al corte y el resultado del
+    ejercicio. Se acumulan debe y haber, no saldos: cada cuenta aplica su
+    propia naturaleza, y una complementaria (p.ej. depreciación acumulada,
+    acreedora dentro del activo) resta en su padre.
+
+    El árbol incluye las cuentas inactivas: sus movimientos siguen contando
+    en el padre y en los totales, aunque `lineas()` no las muestre.
+    """
+
+    # Naturaleza de cada tipo: con ella se firma el total del tipo.
+    NATURALEZA_TIPO = {
+        'ACTIVO': 'D', 'PASIVO': 'A', 'CAPITAL': 'A',
+        'INGRESO': 'A', 'COSTO': 'D', 'GASTO': 'D', 'ORDEN': 'D',
+    }
+
+    def __init__(self, cuentas, sumas: Dict[int, Dict[str, tuple]], periodos):
+        self.cuentas = sorted(cuentas, key=lambda c: c.codigo_sat)
+        self.periodos = tuple(periodos)
+        por_id = {c.pk: c for c in self.cuentas}
+        cero = (Decimal('0.00'), Decimal('0.00'))
+        self.acumulado = {
+            c.pk: {p: sumas.get(c.pk, {}).get(p, cero) for p in self.periodos}
+            for c in self.cuentas
+        }
+
+        # Hijos antes que padres: más profundos primero. Con la profundidad
+        # calculada por `padre` (no por el campo `nivel`, que es captura).
+        profundidad = {}
+
+        def _profundidad(cuenta):
+            if cuenta.pk not in profundidad:
+                padre = por_id.get(cuenta.padre_id)
+                profundidad[cuenta.pk] = 0 if padre is None else _profundidad(padre) + 1
+            return profundidad[cuenta.pk]
+
+        for cuenta in sorted(self.cuentas, key=_profundidad, reverse=True):
+            if cuenta.padre_id in por_id:
+                del_hijo = self.acumulado[cuenta.pk]
+                del_padre = self.acumulado[cuenta.padre_id]
+                for p in self.periodos:
+                    del_padre[p] = (del_padre[p][0] + del_hijo[p][0], del_padre[p][1] + del_hijo[p][1])
+
+        # Raíces de cada tipo: las que no tienen padre del mismo tipo.
+        self.raices = {}
+        for cuenta in self.cuentas:
+            padre = por_id.get(cuenta.padre_id)
+            if padre is None or padre.tipo != cuenta.tipo:
+                self.raices.setdefault(cuenta.tipo, []).append(cuenta)
+
+    @classmethod
+    def cargar(cls, filtros: Q, periodos: Optional[Dict[str, Q]] = None) -> 'ArbolSaldos':
+        """
+        Dos consultas: el catálogo y los movimientos que pasan `filtros`
+        sumados por cuenta (una pareja debe/haber por periodo). Sin
+        `periodos`, una sola columna 'saldo' con todo lo filtrado.
+        """
+        from contabilidad.models import CuentaContable, MovimientoContable
+
+        periodos = periodos or {'saldo': Q()}
+        columnas = {}
+        for nombre, condicion in periodos.items():
+            columnas[f'{nombre}__debe'] = Sum('debe', filter=condicion)
+            columnas[f'{nombre}__haber'] = Sum('haber', filter=condicion)
+
+        sumas = {}
+        filas = MovimientoContable.objects.filter(filtros).values('cuenta_id').annotate(**columnas).order_by()
+        for fila in filas:
+            sumas[fila['cuenta_id']] = {
+                nombre: (
+                    fila[f'{nombre}__debe'] or Decimal('0.00'),
+                    fila[f'{nombre}__haber'] or Decimal('0.00'),
+                )
+                for nombre in periodos
+            }
+
+        cuentas = CuentaContable.objects.only(
+            'codigo_sat', 'nombre', 'tipo', 'naturaleza', 'nivel', 'padre_id', 'activa',
+        )
+        return cls(cuentas, sumas, periodos)
+
+    @staticmethod
+    def _firmar(naturaleza, debe, haber):
+        return debe - haber if naturaleza == 'D' else haber - debe
+
+    def debe_haber(self, cuenta, periodo='saldo'):
+        """(debe, haber) de la cuenta con sus subcuentas."""
+        return self.acumulado[cuenta.pk][periodo]
+
+    def saldo(self, cuenta, periodo='saldo'):
+        """Saldo de la cuenta con sus subcuentas, según su naturaleza."""
+        return self._firmar(cuenta.naturaleza, *self.acumulado[cuenta.pk][periodo])
+
+    def total(self, tipo: str, periodo='saldo'):
+        """Saldo de todo el tipo con la naturaleza del tipo."""
+        debe = haber = Decimal('0.00')
+        for cuenta in self.raices.get(tipo, []):
+            d, h = self.acumulado[cuenta.pk][periodo]
+            debe += d
+            haber += h
+        return self._firmar(self.NATURALEZA_TIPO[tipo], debe, haber)
+
+    def lineas(self, tipo: str, periodo='saldo', nivel_detalle: int = 3) -> List[Dict]:
+        """Cuentas activas del tipo hasta `nivel_detalle` con saldo, por código."""
+        lineas = []
+        for cuenta in self.cuentas:
+            if cuenta.tipo != tipo or not cuenta.activa or cuenta.nivel > nivel_detalle:
+                continue
+            saldo = self.saldo(cuenta, periodo)
+            if saldo != 0:
+                lineas.append({
+                    'codigo': cuenta.codigo_sat,
+                    'nombre': cuenta.nombre,
+                    'nivel': cuenta.nivel,
+                    'saldo': saldo,
+                })
+        return lineas
+
+
 class BalanceGeneralService:
     """
     Genera el Balance General (Estado de Situación Financiera).
@@ -132,6 +259,10 @@ class BalanceGeneralService:
         PASIVO (200)
         CAPITAL (300) + Resultado del ejercicio
         Validación: Activo = Pasivo + Capital
+
+    Saldos y resultado del ejercicio salen del mismo ArbolSaldos: cada cuenta
+    de acumulación muestra el subtotal de sus subcuentas y los totales suman
+    todo el tipo, aunque haya subcuentas más allá de `nivel_detalle`.
     """
 
     @classmethod
@@ -141,50 +272,27 @@ class BalanceGeneralService:
         unidad_negocio=None,
         nivel_detalle: int = 3,
     ) -> Dict:
-        from contabilidad.models import CuentaContable, MovimientoContable
-
         filtros = Q(poliza__estado='APLICADA', poliza__fecha__lte=fecha_corte)
         if unidad_negocio:
             filtros &= Q(poliza__unidad_negocio=unidad_negocio)
 
-        def _saldos_tipo(tipo: str) -> List[Dict]:
-            cuentas = CuentaContable.objects.filter(
-                tipo=tipo, activa=True, nivel__lte=nivel_detalle
-            ).order_by('codigo_sat')
-
-            lineas = []
-            for cuenta in cuentas:
-                datos = MovimientoContable.objects.filter(
-                    filtros, cuenta=cuenta
-                ).aggregate(debe=Sum('debe'), haber=Sum('haber'))
-
-                debe = datos['debe'] or Decimal('0.00')
-                haber = datos['haber'] or Decimal('0.00')
-
-                if cuenta.naturaleza == 'D':
-                    saldo = debe - haber
-                else:
-                    saldo = haber - debe
-
-                if saldo != 0:
-                    lineas.append({
-                        'codigo': cuenta.codigo_sat,
-                        'nombre': cuenta.nombre,
-                        'nivel': cuenta.nivel,
-                        'saldo': saldo,
-                    })
-            return lineas
+        # Inicio del ejercicio fiscal (1 de enero del año de corte)
+        inicio_ejercicio = date(fecha_corte.year, 1, 1)
+        arbol = ArbolSaldos.cargar(filtros, {
+            'corte': Q(),
+            'ejercicio': Q(poliza__fecha__gte=inicio_ejercicio),
+        })
 
-        activos = _saldos_tipo('ACTIVO')
-        pasivos = _saldos_tipo('PASIVO')
-        capital = _saldos_tipo('CAPITAL')
+        activos = arbol.lineas('ACTIVO', 'corte', nivel_detalle)
+        pasivos = arbol.lineas('PASIVO', 'corte', nivel_detalle)
+        capital = arbol.lineas('CAPITAL', 'corte', nivel_detalle)
 
-        total_activo = sum(l['saldo'] for l in activos)
-        total_pasivo = sum(l['saldo'] for l in pasivos)
-        total_capital = sum(l['saldo'] for l in capital)
+        total_activo = arbol.total('ACTIVO', 'corte')
+        total_pasivo = arbol.total('PASIVO', 'corte')
+        total_capital = arbol.total('CAPITAL', 'corte')
 
         # Resultado del ejercicio (ingresos - costos - gastos acumulados)
-        resultado_ejercicio = cls._calcular_resultado_ejercicio(fecha_corte, filtros)
+        resultado_ejercicio = cls._calcular_resultado_ejercicio(arbol)
 
         total_capital_mas_resultado = total_capital + resultado_ejercicio
         total_pasivo_capital = total_pasivo + total_capital_mas_resultado
@@ -209,107 +317,210 @@ class BalanceGeneralService:
         }
 
     @classmethod
-    def _calcular_resultado_ejercicio(cls, fecha_corte, filtros_base):
+    def _calcular_resultado_ejercicio(cls, arbol: ArbolSaldos, periodo: str = 'ejercicio'):
         """Calcula resultado del ejercicio: Ingresos - Costos - Gastos."""
-        from contabilidad.models import CuentaContable, MovimientoContable
-
-        # Inicio del ejercicio fiscal (1 de enero del año de corte)
-        inicio_ejercicio = date(fecha_corte.year, 1, 1)
-        filtros = filtros_base & Q(poliza__fecha__gte=inicio_ejercicio)
-
-        resultado = Decimal('0.00')
-        for tipo, signo in [('INGRESO', 1), ('COSTO', -1), ('GASTO', -1)]:
-            cuentas = CuentaContable.objects.filter(tipo=tipo, activa=True)
-            for cuenta in cuentas:
-                datos = MovimientoContable.objects.filter(
-                    filtros, cuenta=cuenta
-                ).aggregate(debe=Sum('debe'), haber=Sum('haber'))
-                debe = datos['debe'] or Decimal('0.00')
-                haber = datos['haber'] or Decimal('0.00')
-                saldo = (haber - debe) if cuenta.naturaleza == 'A' else (debe - haber)
-                resultado += saldo * signo
-
-        return resultado
+        return (
+            arbol.total('INGRESO', periodo)
+            - arbol.total('COSTO', periodo)
+            - arbol.total('GASTO', periodo)
+        )
 
 
 class LibroMayorService:
     """
     Genera el Libro Mayor: movimientos de una cuenta contable en un período.
     Muestra saldo inicial, cada movimiento con saldo acumulado, y saldo final.
+
+    Para cuentas con decenas de miles de movimientos (bancos, IVA) los
+    movimientos no se cargan todos: `movimientos()` los lee por lotes con
+    paginación por llave (fecha, folio, id) y va llevando el saldo. El
+    encabezado (`resumen()`) sale de dos agregados, así que se conoce antes
+    de leer el primer movimiento. `pagina()` arranca en cualquier fecha o
+    después de cualquier movimiento: el saldo hasta ahí lo suma la base en
+    un agregado, sin recorrer las páginas anteriores.
     """
 
+    TAM_LOTE = 1000
+
+    # Orden del libro: también es la llave de la paginación.
+    ORDEN = ('poliza__fecha', 'poliza__folio', 'id')
+
     @classmethod
-    def generar(
+    def resumen(
         cls,
         cuenta_id: int,
         fecha_inicio: date,
         fecha_fin: date,
         unidad_negocio=None,
     ) -> Dict:
+        """Cuenta, saldo inicial, totales del período y saldo final."""
         from contabilidad.models import CuentaContable, MovimientoContable
 
         cuenta = CuentaContable.objects.get(pk=cuenta_id)
 
-        filtros_base = Q(poliza__estado='APLICADA')
+        filtros_base = Q(poliza__estado='APLICADA', cuenta=cuenta)
         if unidad_negocio:
             filtros_base &= Q(poliza__unidad_negocio=unidad_negocio)
 
         # Saldo inicial (antes del período)
-        datos_ini = MovimientoContable.objects.filter(
-            filtros_base, cuenta=cuenta, poliza__fecha__lt=fecha_inicio
-        ).aggregate(debe=Sum('debe'), haber=Sum('haber'))
-
-        debe_ini = datos_ini['debe'] or Decimal('0.00')
-        haber_ini = datos_ini['haber'] or Decimal('0.00')
-        saldo_inicial = (debe_ini - haber_ini) if cuenta.naturaleza == 'D' else (haber_ini - debe_ini)
-
-        # Movimientos del período
-        movimientos = MovimientoContable.objects.filter(
-            filtros_base, cuenta=cuenta,
-            poliza__fecha__gte=fecha_inicio, poliza__fecha__lte=fecha_fin
-        ).select_related('poliza').order_by('poliza__fecha', 'poliza__folio', 'id')
-
-        lineas = []
-        saldo_acum = saldo_inicial
-        total_debe = Decimal('0.00')
-        total_haber = Decimal('0.00')
-
-        for mov in movimientos:
-            if cuenta.naturaleza == 'D':
-                saldo_acum = saldo_acum + mov.debe - mov.haber
-            else:
-                saldo_acum = saldo_acum - mov.debe + mov.haber
-
-            total_debe += mov.debe
-            total_haber += mov.haber
-
-            lineas.append({
-                'fecha': mov.poliza.fecha,
-                'tipo_poliza': mov.poliza.get_tipo_display(),
-                'folio': mov.poliza.folio,
-                'concepto': mov.concepto or mov.poliza.concepto,
-                'referencia': mov.referencia,
-                'debe': mov.debe,
-                'haber': mov.haber,
-                'saldo': saldo_acum,
-            })
+        saldo_inicial = cls._saldo(cuenta, filtros_base & Q(poliza__fecha__lt=fecha_inicio))
+
+        datos = MovimientoContable.objects.filter(
+            filtros_base, poliza__fecha__gte=fecha_inicio, poliza__fecha__lte=fecha_fin
+        ).aggregate(debe=Sum('debe'), haber=Sum('haber'), movimientos=Count('id'))
+        total_debe = datos['debe'] or Decimal('0.00')
+        total_haber = datos['haber'] or Decimal('0.00')
+        if cuenta.naturaleza == 'D':
+            saldo_final = saldo_inicial + total_debe - total_haber
+        else:
+            saldo_final = saldo_inicial - total_debe + total_haber
 
         return {
             'cuenta': cuenta,
             'fecha_inicio': fecha_inicio,
             'fecha_fin': fecha_fin,
+            'filtros': filtros_base,
             'saldo_inicial': saldo_inicial,
-            'movimientos': lineas,
+            'num_movimientos': datos['movimientos'],
             'total_debe': total_debe,
             'total_haber': total_haber,
-            'saldo_final': saldo_acum,
+            'saldo_final': saldo_final,
         }
 
+    @staticmethod
+    def _saldo(cuenta, filtros):
+        from contabilidad.models import MovimientoContable
+
+        datos = MovimientoContable.objects.filter(filtros).aggregate(debe=Sum('debe'), haber=Sum('haber'))
+        debe = datos['debe'] or Decimal('0.00')
+        haber = datos['haber'] or Decimal('0.00')
+        return (debe - haber) if cuenta.naturaleza == 'D' else (haber - debe)
+
+    @staticmethod
+    def _despues_de(clave):
+        """Q de los movimientos posteriores a `clave` = (fecha, folio, id)."""
+        fecha, folio, pk = clave
+        return (
+            Q(poliza__fecha__gt=fecha)
+            | Q(poliza__fecha=fecha, poliza__folio__gt=folio)
+            | Q(poliza__fecha=fecha, poliza__folio=folio, id__gt=pk)
+        )
+
+    @classmethod
+    def saldo_hasta(cls, resumen: Dict, clave: tuple):
+        """Saldo acumulado inmediatamente después del movimiento `clave`."""
+        return cls._saldo(resumen['cuenta'], resumen['filtros'] & ~cls._despues_de(clave))
+
+    @classmethod
+    def saldo_antes_de(cls, resumen: Dict, fecha: date):
+        """Saldo acumulado al empezar el día `fecha`."""
+        return cls._saldo(resumen['cuenta'], resumen['filtros'] & Q(poliza__fecha__lt=fecha))
+
+    @classmethod
+    def movimientos(
+        cls,
+        resumen: Dict,
+        desde: Optional[date] = None,
+        despues: Optional[tuple] = None,
+        saldo: Optional[Decimal] = None,
+        tam_lote: Optional[int] = None,
+    ) -> Iterator[Dict]:
+        """
+        Movimientos del período en orden, con saldo acumulado. Lee de a
+        `tam_lote` filas. `desde` (fecha) o `despues` (clave de un
+        movimiento) recortan el inicio; `saldo` es el acumulado hasta ese
+        punto (por omisión, el saldo inicial del período).
+        """
+        from contabilidad.models import MovimientoContable, Poliza
+
+        tipos = dict(Poliza.TIPO_CHOICES)
+        deudora = resumen['cuenta'].naturaleza == 'D'
+        saldo_acum = resumen['saldo_inicial'] if saldo is None else saldo
+        tam_lote = tam_lote or cls.TAM_LOTE
+
+        base = MovimientoContable.objects.filter(
+            resumen['filtros'],
+            poliza__fecha__gte=max(desde or resumen['fecha_inicio'], resumen['fecha_inicio']),
+            poliza__fecha__lte=resumen['fecha_fin'],
+        ).order_by(*cls.ORDEN).values_list(
+            'poliza__fecha', 'poliza__folio', 'id', 'poliza__tipo',
+            'concepto', 'poliza__concepto', 'referencia', 'debe', 'haber',
+        )
+
+        while True:
+            lote = base.filter(cls._despues_de(despues)) if despues else base
+            filas = list(lote[:tam_lote])
+            for fecha, folio, pk, tipo, concepto, concepto_poliza, referencia, debe, haber in filas:
+                if deudora:
+                    saldo_acum = saldo_acum + debe - haber
+                else:
+                    saldo_acum = saldo_acum - debe + haber
+                yield {
+                    'fecha': fecha,
+                    'tipo_poliza': tipos.get(tipo, tipo),
+                    'folio': folio,
+                    'concepto': concepto or concepto_poliza,
+                    'referencia': referencia,
+                    'debe': debe,
+                    'haber': haber,
+                    'saldo': saldo_acum,
+                    'clave': (fecha, folio, pk),
+                }
+            if len(filas) < tam_lote:
+                return
+            despues = filas[-1][:3]
+
+    @classmethod
+    def pagina(
+        cls,
+        resumen: Dict,
+        desde: Optional[date] = None,
+        despues: Optional[tuple] = None,
+        tam: int = 100,
+    ) -> Dict:
+        """
+        Una página del libro para verla en pantalla: empieza en el día `desde`
+        o después del movimiento `despues`, con el saldo acumulado hasta ahí.
+        `siguiente` es la clave para pedir la página que sigue (o None).
+        """
+        if despues:
+            saldo_anterior = cls.saldo_hasta(resumen, despues)
+        elif desde and desde > resumen['fecha_inicio']:
+            saldo_anterior = cls.saldo_antes_de(resumen, desde)
+        else:
+            saldo_anterior = resumen['saldo_inicial']
+
+        lineas = list(islice(cls.movimientos(resumen, desde, despues, saldo_anterior, tam_lote=tam + 1), tam + 1))
+        hay_mas = len(lineas) > tam
+        lineas = lineas[:tam]
+        return {
+            'saldo_anterior': saldo_anterior,
+            'movimientos': lineas,
+            'siguiente': lineas[-1]['clave'] if hay_mas else None,
+        }
+
+    @classmethod
+    def generar(
+        cls,
+        cuenta_id: int,
+        fecha_inicio: date,
+        fecha_fin: date,
+        unidad_negocio=None,
+    ) -> Dict:
+        """Libro completo en memoria; para cuentas grandes, `resumen()` + `movimientos()`."""
+        datos = cls.resumen(cuenta_id, fecha_inicio, fecha_fin, unidad_negocio)
+        datos['movimientos'] = list(cls.movimientos(datos))
+        return datos
+
 
 class AuxiliarCuentasService:
     """
     Genera el Auxiliar de Cuentas: resumen de saldos de todas las subcuentas
     de una cuenta padre, útil para desglosar rubros.
+
+    Saldo inicial, cargos, abonos y número de movimientos de todas las
+    subcuentas salen de una sola consulta (agregados condicionales sobre
+    sus movimientos), sin importar cuántas subcuentas tenga el padre.
     """
 
     @classmethod
@@ -320,51 +531,49 @@ class AuxiliarCuentasService:
         fecha_fin: date,
         unidad_negocio=None,
     ) -> Dict:
-        from contabilidad.models import CuentaContable, MovimientoContable
+        from contabilidad.models import CuentaContable
 
         padre = CuentaContable.objects.get(pk=cuenta_padre_id)
+
+        aplicados = Q(movimientos__poliza__estado='APLICADA')
+        if unidad_negocio:
+            aplicados &= Q(movimientos__poliza__unidad_negocio=unidad_negocio)
+        anteriores = aplicados & Q(movimientos__poliza__fecha__lt=fecha_inicio)
+        del_periodo = aplicados & Q(
+            movimientos__poliza__fecha__gte=fecha_inicio,
+            movimientos__poliza__fecha__lte=fecha_fin,
+        )
+
         subcuentas = CuentaContable.objects.filter(
             codigo_sat__startswith=padre.codigo_sat,
             activa=True,
             permite_movimientos=True,
+        ).annotate(
+            debe_inicial=Sum('movimientos__debe', filter=anteriores),
+            haber_inicial=Sum('movimientos__haber', filter=anteriores),
+            cargos=Sum('movimientos__debe', filter=del_periodo),
+            abonos=Sum('movimientos__haber', filter=del_periodo),
+            num_movimientos=Count('movimientos', filter=del_periodo),
         ).order_by('codigo_sat')
 
-        filtros_base = Q(poliza__estado='APLICADA')
-        if unidad_negocio:
-            filtros_base &= Q(poliza__unidad_negocio=unidad_negocio)
-
         lineas = []
         total_debe = Decimal('0.00')
         total_haber = Decimal('0.00')
         total_saldo = Decimal('0.00')
 
         for cuenta in subcuentas:
-            # Saldo inicial
-            ini = MovimientoContable.objects.filter(
-                filtros_base, cuenta=cuenta, poliza__fecha__lt=fecha_inicio
-            ).aggregate(debe=Sum('debe'), haber=Sum('haber'))
-            d_ini = ini['debe'] or Decimal('0.00')
-            h_ini = ini['haber'] or Decimal('0.00')
+            d_ini = cuenta.debe_inicial or Decimal('0.00')
+            h_ini = cuenta.haber_inicial or Decimal('0.00')
             saldo_ini = (d_ini - h_ini) if cuenta.naturaleza == 'D' else (h_ini - d_ini)
 
-            # Movimientos del período
-            per = MovimientoContable.objects.filter(
-                filtros_base, cuenta=cuenta,
-                poliza__fecha__gte=fecha_inicio, poliza__fecha__lte=fecha_fin
-            ).aggregate(debe=Sum('debe'), haber=Sum('haber'))
-            cargos = per['debe'] or Decimal('0.00')
-            abonos = per['haber'] or Decimal('0.00')
+            cargos = cuenta.cargos or Decimal('0.00')
+            abonos = cuenta.abonos or Decimal('0.00')
 
             if cuenta.naturaleza == 'D':
                 saldo_final = saldo_ini + cargos - abonos
             else:
                 saldo_final = saldo_ini - cargos + abonos
 
-            num_movs = MovimientoContable.objects.filter(
-                filtros_base, cuenta=cuenta,
-                poliza__fecha__gte=fecha_inicio, poliza__fecha__lte=fecha_fin
-            ).count()
-
             if saldo_ini != 0 or cargos != 0 or abonos != 0:
                 lineas.append({
                     'codigo': cuenta.codigo_sat,
@@ -373,7 +582,7 @@ class AuxiliarCuentasService:
                     'cargos': cargos,
                     'abonos': abonos,
                     'saldo_final': saldo_final,
-                    'num_movimientos': num_movs,
+                    'num_movimientos': cuenta.num_movimientos,
                 })
                 total_debe += cargos
                 total_haber += abonos
@@ -0,0 +1,370 @@
+"""
+Tests del módulo de Reportes
+============================
+"""
+from datetime import date, timedelta
+from decimal import Decimal
+from io import BytesIO
+from unittest import mock
+
+from django.contrib.auth.models import Permission, User
+from django.db.models import Sum
+from django.test import TestCase
+from django.urls import reverse
+
+from airbnb.models import AnuncioAirbnb, PagoAirbnb, ReservaAirbnb
+from contabilidad.models import CuentaContable, MovimientoContable, Poliza, UnidadNegocio
+from reportes.models import ReporteGenerado
+from reportes.services.airbnb import OcupacionService
+from reportes.services.contabilidad import AuxiliarCuentasService, BalanceGeneralService, LibroMayorService
+
+
+def _noches_por_mes_referencia(anuncio, mes):
+    """Recorte por mes como lo hacía el reporte antes: una consulta por celda."""
+    reservas = ReservaAirbnb.objects.filter(
+        anuncio=anuncio,
+        fecha_inicio__lte=mes['fin'],
+        fecha_fin__gte=mes['inicio'],
+    ).exclude(estado__in=['CANCELADA', 'BLOQUEADA'])
+    noches = 0
+    for r in reservas:
+        check_in = max(r.fecha_inicio, mes['inicio'])
+        check_out = min(r.fecha_fin, mes['fin'] + timedelta(days=1))
+        noches += max(0, (check_out - check_in).days)
+    return noches
+
+
+class OcupacionServiceTest(TestCase):
+
+    def setUp(self):
+        self.casa = AnuncioAirbnb.objects.create(
+            nombre='Casa Miel', tipo='CASA', url_ical='https://airbnb.mx/calendar/ical/1.ics')
+        self.cuarto = AnuncioAirbnb.objects.create(
+            nombre='Kaan Room', tipo='HABITACION', url_ical='https://airbnb.mx/calendar/ical/2.ics')
+
+    def _reserva(self, anuncio, ini, fin, estado='CONFIRMADA'):
+        return ReservaAirbnb.objects.create(
+            anuncio=anuncio, uid_ical=f'uid-{anuncio.pk}-{ini}-{fin}-{estado}',
+            fecha_inicio=ini, fecha_fin=fin, estado=estado,
+        )
+
+    def _pago(self, anuncio, ini, fin, bruto, estado='PAGADO'):
+        return PagoAirbnb.objects.create(
+            anuncio=anuncio, huesped='X', fecha_checkin=ini, fecha_checkout=fin,
+            monto_bruto=Decimal(bruto), monto_neto=Decimal(bruto), estado=estado,
+        )
+
+    def test_noches_iguales_al_recorte_por_mes(self):
+        # Cruces de mes, de año, bordes del rango, traslapes y estados excluidos.
+        self._reserva(self.casa, date(2025, 12, 28), date(2026, 1, 3))
+        self._reserva(self.casa, date(2026, 1, 31), date(2026, 2, 1))
+        self._reserva(self.casa, date(2026, 2, 27), date(2026, 3, 2))
+        self._reserva(self.casa, date(2026, 2, 28), date(2026, 3, 1))
+        self._reserva(self.casa, date(2026, 3, 10), date(2026, 3, 10))
+        self._reserva(self.casa, date(2026, 4, 1), date(2026, 4, 5), estado='CANCELADA')
+        self._reserva(self.cuarto, date(2026, 1, 10), date(2026, 4, 20))
+        self._reserva(self.cuarto, date(2026, 4, 14), date(2026, 4, 16), estado='BLOQUEADA')
+        self._reserva(self.cuarto, date(2026, 4, 15), date(2026, 5, 2), estado='PENDIENTE')
+
+        inicio, fin = date(2026, 1, 2), date(2026, 4, 15)
+        datos = OcupacionService.generar(inicio, fin)
+
+        for fila, anuncio in zip(datos['data'], [self.casa, self.cuarto]):
+            esperadas = [_noches_por_mes_referencia(anuncio, m) for m in datos['meses']]
+            self.assertEqual([m['noches'] for m in fila['meses']], esperadas)
+            self.assertEqual(fila['total_noches'], sum(esperadas))
+        # Casa: ene 1 + 1, feb 2 + 1, mar 1; Cuarto: 22, 28, 31 y 15 + 1 de la pendiente.
+        self.assertEqual([m['noches'] for m in datos['data'][0]['meses']], [2, 3, 1, 0])
+        self.assertEqual([m['noches'] for m in datos['data'][1]['meses']], [22, 28, 31, 16])
+        self.assertEqual([m['disponibles'] for m in datos['totales_meses']], [60, 56, 62, 30])
+
+    def test_adr_y_revpar_prorratean_el_pago_por_noche(self):
+        self._reserva(self.casa, date(2026, 1, 30), date(2026, 2, 2))
+        self._pago(self.casa, date(2026, 1, 30), date(2026, 2, 2), '3000.00')
+        self._pago(self.casa, date(2026, 2, 10), date(2026, 2, 12), '999.00', estado='PENDIENTE')
+
+        datos = OcupacionService.generar(date(2026, 1, 1), date(2026, 2, 28), anuncio_id=self.casa.pk)
+
+        enero, febrero = datos['data'][0]['meses']
+        self.assertEqual((enero['noches'], enero['ingreso']), (2, Decimal('2000.00')))
+        self.assertEqual((febrero['noches'], febrero['ingreso']), (1, Decimal('1000.00')))
+        self.assertEqual(enero['adr'], Decimal('1000.00'))
+        self.assertEqual(enero['revpar'], Decimal('64.52'))
+        self.assertEqual(datos['data'][0]['adr'], Decimal('1000.00'))
+        self.assertEqual(datos['data'][0]['revpar'], Decimal('50.85'))
+
+    def test_consultas_no_crecen_con_meses_ni_listings(self):
+        for anuncio in (self.casa, self.cuarto):
+            self._reserva(anuncio, date(2025, 3, 1), date(2025, 3, 9))
+            self._pago(anuncio, date(2025, 3, 1), date(2025, 3, 9), '800.00')
+
+        # Anuncios, reservas y pagos, sin importar que sean 24 meses.
+        with self.assertNumQueries(3):
+            datos = OcupacionService.generar(date(2025, 1, 1), date(2026, 12, 31))
+        self.assertEqual(len(datos['meses']), 24)
+
+
+def _saldo_cuenta_referencia(cuenta, fecha_corte):
+    """Saldo de una sola cuenta como lo calculaba el balance: una consulta por cuenta."""
+    datos = MovimientoContable.objects.filter(
+        cuenta=cuenta, poliza__estado='APLICADA', poliza__fecha__lte=fecha_corte,
+    ).aggregate(debe=Sum('debe'), haber=Sum('haber'))
+    debe = datos['debe'] or Decimal('0.00')
+    haber = datos['haber'] or Decimal('0.00')
+    return debe - haber if cuenta.naturaleza == 'D' else haber - debe
+
+
+class PolizasMixin:
+    """Pólizas sobre el catálogo SAT que carga la migración 0002 de contabilidad."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('contador', password='x')
+        self.unidad = UnidadNegocio.objects.get(clave='QUINTA')
+        self.folio = 0
+
+    def _poliza(self, fecha, *partidas, estado='APLICADA'):
+        self.folio += 1
+        poliza = Poliza.objects.create(
+            tipo='D', folio=self.folio, fecha=fecha, concepto='Prueba',
+            unidad_negocio=self.unidad, estado=estado, created_by=self.user,
+        )
+        for codigo, debe, haber in partidas:
+            MovimientoContable.objects.create(
+                poliza=poliza, cuenta=CuentaContable.objects.get(codigo_sat=codigo),
+                debe=Decimal(debe), haber=Decimal(haber),
+            )
+        return poliza
+
+    def _movimientos(self):
+        self._poliza(date(2025, 12, 1), ('102.01', '1000', '0'), ('301.01', '0', '1000'))
+        self._poliza(date(2025, 12, 15), ('102.02.01', '300', '0'), ('401.01', '0', '300'))
+        self._poliza(date(2026, 1, 10), ('102.02.01', '5000', '0'), ('401.01', '0', '5000'))
+        self._poliza(date(2026, 2, 1), ('601.01.01', '1200', '0'), ('102.02.01', '0', '1200'))
+        self._poliza(date(2026, 2, 3), ('105.01', '800', '0'), ('205.01', '0', '800'))
+        self._poliza(date(2026, 2, 4), ('102.01', '50', '0'), ('401.01', '0', '50'), estado='BORRADOR')
+        self._poliza(date(2026, 4, 1), ('102.01', '70', '0'), ('401.01', '0', '70'))
+
+
+class BalanceGeneralServiceTest(PolizasMixin, TestCase):
+
+    def test_hojas_iguales_y_padres_con_subtotal(self):
+        self._movimientos()
+        corte = date(2026, 3, 31)
+
+        datos = BalanceGeneralService.generar(corte)
+
+        activos = {l['codigo']: l['saldo'] for l in datos['activos']}
+        for codigo in ('102.01', '105.01'):
+            cuenta = CuentaContable.objects.get(codigo_sat=codigo)
+            self.assertEqual(activos[codigo], _saldo_cuenta_referencia(cuenta, corte))
+        # Bancos nacionales (acumulación) con la subcuenta de nivel 4 que no se muestra.
+        self.assertEqual(activos['102.02'], Decimal('4100.00'))
+        self.assertEqual(activos['102'], Decimal('5100.00'))
+        self.assertEqual(activos['100'], Decimal('5900.00'))
+        self.assertNotIn('102.02.01', activos)
+        self.assertEqual(datos['total_activo'], Decimal('5900.00'))
+
+        self.assertEqual(datos['total_pasivo'], Decimal('800.00'))
+        self.assertEqual(datos['total_capital'], Decimal('1000.00'))
+        # Solo el ejercicio 2026: 5,000 de ingreso menos 1,200 de sueldos.
+        self.assertEqual(datos['resultado_ejercicio'], Decimal('3800.00'))
+        # El ingreso de 2025 no se cerró a utilidades acumuladas: no cuadra por eso.
+        self.assertFalse(datos['cuadra'])
+        self.assertEqual(datos['diferencia'], Decimal('300.00'))
+
+    def test_consultas_no_crecen_con_el_catalogo(self):
+        self._movimientos()
+        for i in range(20):
+            CuentaContable.objects.create(
+                codigo_sat=f'102.02.{i + 10}', nombre=f'Banco {i}', tipo='ACTIVO', naturaleza='D',
+                nivel=4, padre=CuentaContable.objects.get(codigo_sat='102.02'),
+            )
+
+        # Catálogo y movimientos agrupados, sin importar cuántas cuentas haya.
+        with self.assertNumQueries(2):
+            BalanceGeneralService.generar(date(2026, 3, 31))
+
+
+class AuxiliarCuentasServiceTest(PolizasMixin, TestCase):
+    """Mismos movimientos que el balance; el auxiliar de 102 y de 601."""
+
+    def _referencia(self, cuenta, inicio, fin):
+        """Las tres cifras por subcuenta como se sacaban antes: tres consultas por cuenta."""
+        base = MovimientoContable.objects.filter(cuenta=cuenta, poliza__estado='APLICADA')
+        ini = base.filter(poliza__fecha__lt=inicio).aggregate(debe=Sum('debe'), haber=Sum('haber'))
+        per = base.filter(poliza__fecha__gte=inicio, poliza__fecha__lte=fin)
+        sumas = per.aggregate(debe=Sum('debe'), haber=Sum('haber'))
+        d_ini, h_ini = ini['debe'] or Decimal('0.00'), ini['haber'] or Decimal('0.00')
+        return (
+            d_ini - h_ini if cuenta.naturaleza == 'D' else h_ini - d_ini,
+            sumas['debe'] or Decimal('0.00'),
+            sumas['haber'] or Decimal('0.00'),
+            per.count(),
+        )
+
+    def test_mismas_cifras_que_por_cuenta(self):
+        self._movimientos()
+        self._poliza(date(2026, 2, 20), ('102.02.01', '10', '0'), ('102.02.01', '0', '10'))
+        inicio, fin = date(2026, 1, 1), date(2026, 3, 31)
+
+        for codigo in ('102', '601'):
+            padre = CuentaContable.objects.get(codigo_sat=codigo)
+            with self.subTest(codigo=codigo), self.assertNumQueries(2):
+                datos = AuxiliarCuentasService.generar(padre.pk, inicio, fin)
+            for linea in datos['lineas']:
+                cuenta = CuentaContable.objects.get(codigo_sat=linea['codigo'])
+                self.assertEqual(
+                    (linea['saldo_inicial'], linea['cargos'], linea['abonos'], linea['num_movimientos']),
+                    self._referencia(cuenta, inicio, fin),
+                )
+
+        datos = AuxiliarCuentasService.generar(CuentaContable.objects.get(codigo_sat='102').pk, inicio, fin)
+        bbva = next(l for l in datos['lineas'] if l['codigo'] == '102.02.01')
+        self.assertEqual(bbva['saldo_inicial'], Decimal('300.00'))
+        self.assertEqual(bbva['saldo_final'], Decimal('4100.00'))
+        self.assertEqual(bbva['num_movimientos'], 4)
+
+    def test_exporta_xlsx(self):
+        import openpyxl
+
+        self._movimientos()
+        self.user.is_staff = True
+        self.user.save()
+        self.user.user_permissions.add(Permission.objects.get(codename='view_movimientocontable'))
+        self.client.force_login(self.user)
+
+        padre = CuentaContable.objects.get(codigo_sat='102')
+        respuesta = self.client.get(reverse('reportes:auxiliar'), {
+            'cuenta_padre_id': padre.pk, 'fecha_inicio': '2026-01-01', 'fecha_fin': '2026-03-31',
+            'formato': 'xlsx',
+        })
+
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertIn('Auxiliar_102_20260101_20260331.xlsx', respuesta['Content-Disposition'])
+        filas = list(openpyxl.load_workbook(BytesIO(respuesta.content)).active.values)
+        self.assertEqual(filas[0][0], 'Código')
+        self.assertEqual(filas[1][:2], ('102.01', 'Caja'))
+        self.assertEqual(filas[2][0], '102.02.01')
+        self.assertEqual(filas[2][5], 4100)
+        self.assertEqual(filas[-1][1], 'Totales')
+        self.assertEqual(ReporteGenerado.objects.get().formato, 'XLSX')
+
+
+class LibroMayorServiceTest(PolizasMixin, TestCase):
+    """Libro mayor de BBVA: movimientos el mismo día con distinto folio."""
+
+    def setUp(self):
+        super().setUp()
+        self._movimientos()
+        for dia in (5, 5, 5, 12, 12, 28):
+            self._poliza(date(2026, 2, dia), ('102.02.01', '0', '10'), ('601.01.01', '10', '0'))
+        self.cuenta = CuentaContable.objects.get(codigo_sat='102.02.01')
+        self.inicio, self.fin = date(2026, 1, 1), date(2026, 3, 31)
+
+    def _referencia(self):
+        """(fecha, folio, saldo) de cada movimiento como se armaba antes: todo en una lista."""
+        saldo = _saldo_cuenta_referencia(self.cuenta, self.inicio - timedelta(days=1))
+        filas = []
+        for mov in MovimientoContable.objects.filter(
+            cuenta=self.cuenta, poliza__estado='APLICADA',
+            poliza__fecha__gte=self.inicio, poliza__fecha__lte=self.fin,
+        ).select_related('poliza').order_by('poliza__fecha', 'poliza__folio', 'id'):
+            saldo = saldo + mov.debe - mov.haber
+            filas.append((mov.poliza.fecha, mov.poliza.folio, saldo))
+        return filas
+
+    def _permiso(self):
+        self.user.is_staff = True
+        self.user.save()
+        self.user.user_permissions.add(Permission.objects.get(codename='view_movimientocontable'))
+        self.client.force_login(self.user)
+
+    def _get(self, **params):
+        return self.client.get(reverse('reportes:libro_mayor'), {
+            'cuenta_id': self.cuenta.pk, 'fecha_inicio': '2026-01-01', 'fecha_fin': '2026-03-31', **params,
+        })
+
+    def test_por_lotes_igual_que_todo_junto(self):
+        resumen = LibroMayorService.resumen(self.cuenta.pk, self.inicio, self.fin)
+        self.assertEqual(resumen['saldo_inicial'], Decimal('300.00'))
+        self.assertEqual(resumen['num_movimientos'], 8)
+        self.assertEqual(resumen['saldo_final'], Decimal('4040.00'))
+
+        for tam_lote in (1, 2, 3, 1000):
+            with self.subTest(tam_lote=tam_lote):
+                lineas = list(LibroMayorService.movimientos(resumen, tam_lote=tam_lote))
+                self.assertEqual([(l['fecha'], l['folio'], l['saldo']) for l in lineas], self._referencia())
+
+        datos = LibroMayorService.generar(self.cuenta.pk, self.inicio, self.fin)
+        self.assertEqual(datos['movimientos'][-1]['saldo'], datos['saldo_final'])
+
+    def test_pagina_arranca_en_cualquier_punto_con_su_saldo(self):
+        resumen = LibroMayorService.resumen(self.cuenta.pk, self.inicio, self.fin)
+        referencia = self._referencia()
+
+        primera = LibroMayorService.pagina(resumen, tam=3)
+        segunda = LibroMayorService.pagina(resumen, despues=primera['siguiente'], tam=3)
+        self.assertEqual(segunda['saldo_anterior'], referencia[2][2])
+        self.assertEqual([l['saldo'] for l in segunda['movimientos']], [r[2] for r in referencia[3:6]])
+
+        # Saltar a una fecha: el saldo anterior es el del día previo, sin leer las páginas de antes.
+        with self.assertNumQueries(2):
+            salto = LibroMayorService.pagina(resumen, desde=date(2026, 2, 12), tam=3)
+        self.assertEqual(salto['movimientos'][0]['fecha'], date(2026, 2, 12))
+        self.assertEqual(salto['saldo_anterior'], Decimal('4070.00'))
+        self.assertIsNone(salto['siguiente'])
+
+    def test_csv_y_xlsx(self):
+        import openpyxl
+
+        self._permiso()
+        respuesta = self._get(formato='csv')
+        self.assertTrue(respuesta.streaming)
+        filas = b''.join(respuesta.streaming_content).decode().splitlines()
+        self.assertEqual(filas[0], 'Fecha,Tipo,Folio,Concepto,Referencia,Debe,Haber,Saldo')
+        self.assertEqual(len(filas), 9)
+        self.assertTrue(filas[-1].endswith(',4040.00'))
+
+        respuesta = self._get(formato='xlsx')
+        filas = list(openpyxl.load_workbook(BytesIO(respuesta.content)).active.values)
+        self.assertEqual(len(filas), 10)
+        self.assertEqual(filas[-1][3:], ('Totales', None, 5000, 1260, 4040))
+        self.assertEqual(
+            list(ReporteGenerado.objects.order_by('pk').values_list('formato', flat=True)), ['CSV', 'XLSX'],
+        )
+
+    def test_pantalla_por_paginas(self):
+        self._permiso()
+        with mock.patch('reportes.views.MOVIMIENTOS_POR_PAGINA', 5):
+            respuesta = self._get(formato='html')
+            self.assertEqual(len(respuesta.context['movimientos']), 5)
+            siguiente = respuesta.context['siguiente']
+            self.assertIn('despues=', siguiente)
+            respuesta = self.client.get(f"{reverse('reportes:libro_mayor')}?{siguiente}")
+        self.assertEqual(len(respuesta.context['movimientos']), 3)
+        self.assertEqual(respuesta.context['saldo_anterior'], Decimal('4070.00'))
+        self.assertIsNone(respuesta.context['siguiente'])
+        self.assertContains(respuesta, 'Saldo anterior')
+        # Solo la primera página queda en el historial.
+        self.assertEqual(ReporteGenerado.objects.count(), 1)
+
+    def test_pdf_por_tramos(self):
+        self._permiso()
+        documentos = []
+
+        def _html(string):
+            documentos.append(string)
+            documento = mock.Mock()
+            documento.pages = [string]
+            return mock.Mock(render=mock.Mock(return_value=documento))
+
+        with mock.patch('reportes.views.MOVIMIENTOS_POR_TRAMO_PDF', 3), \
+                mock.patch('reportes.views.HTML', side_effect=_html):
+            respuesta = self._get()
+
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(len(documentos), 3)
+        self.assertIn('Saldo Inicial', documentos[0])
+        self.assertNotIn('Saldo Inicial', documentos[1])
+        self.assertNotIn('TOTALES', documentos[1])
+        self.assertIn('TOTALES', documentos[2])
@@ -5,14 +5,16 @@ Selector centralizado + generación de cada reporte en HTML y PDF.
 
 ERP Quinta Ko'ox Tanil
 """
+import csv
 import os
 from datetime import date, timedelta
 from decimal import Decimal
+from itertools import chain, islice
 
 from django.conf import settings
 from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import permission_required
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, render
 from django.template.loader import render_to_string
 from django.utils import timezone
@@ -64,6 +66,95 @@ def _render_pdf(request, template, context, filename):
     return response
 
 
+def _render_pdf_por_tramos(request, template, context, movimientos, por_tramo, filename):
+    """
+    Como `_render_pdf`, pero con `movimientos` (iterable) repartidos en
+    documentos de `por_tramo` filas que se unen al final: WeasyPrint no arma
+    de una vez el layout de decenas de miles de filas. El template recibe
+    `continuacion` (no es el primer tramo) y `hay_mas` (no es el último).
+    Con un solo tramo es exactamente `_render_pdf`.
+    """
+    context['logo_url'] = _logo_url()
+    context['fecha_impresion'] = timezone.now()
+    movimientos = iter(movimientos)
+    tramo = list(islice(movimientos, por_tramo))
+    siguiente = list(islice(movimientos, por_tramo))
+
+    response = HttpResponse(content_type='application/pdf')
+    response['Content-Disposition'] = f'inline; filename="{filename}"'
+    if not siguiente:
+        html_string = render_to_string(template, {**context, 'movimientos': tramo})
+        HTML(string=html_string).write_pdf(response)
+        return response
+
+    documentos = []
+    continuacion = False
+    while tramo:
+        html_string = render_to_string(template, {
+            **context, 'movimientos': tramo, 'continuacion': continuacion,
+            'hay_mas': bool(siguiente), 'por_tramos': True,
+        })
+        documentos.append(HTML(string=html_string).render())
+        tramo, siguiente = siguiente, list(islice(movimientos, por_tramo))
+        continuacion = True
+    paginas = [pagina for documento in documentos for pagina in documento.pages]
+    documentos[0].copy(paginas).write_pdf(response)
+    return response
+
+
+class _Eco:
+    """Buffer de `csv.writer` que devuelve lo escrito en vez de guardarlo."""
+
+    def write(self, valor):
+        return valor
+
+
+def _stream_csv(filename, encabezados, filas):
+    """Descarga CSV que se escribe fila por fila mientras se lee `filas`."""
+    escritor = csv.writer(_Eco())
+    respuesta = StreamingHttpResponse(
+        chain([escritor.writerow(encabezados)], (escritor.writerow(fila) for fila in filas)),
+        content_type='text/csv; charset=utf-8',
+    )
+    respuesta['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return respuesta
+
+
+def _render_xlsx(filename, titulo, encabezados, filas, totales=None):
+    """
+    Escribe `filas` (iterable de listas) en un libro de una hoja y lo
+    devuelve como descarga. El libro es de solo escritura: openpyxl no
+    guarda las celdas en memoria, las va pasando al archivo.
+    """
+    import openpyxl
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font
+
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet(title=titulo[:31])
+
+    def _negritas(valores):
+        celdas = []
+        for valor in valores:
+            celda = WriteOnlyCell(ws, value=valor)
+            celda.font = Font(bold=True)
+            celdas.append(celda)
+        return celdas
+
+    ws.append(_negritas(encabezados))
+    for fila in filas:
+        ws.append(fila)
+    if totales:
+        ws.append(_negritas(totales))
+
+    response = HttpResponse(
+        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    )
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    wb.save(response)
+    return response
+
+
 # ==========================================
 # SELECTOR PRINCIPAL
 # ==========================================
@@ -231,10 +322,29 @@ def reporte_balance_general(request):
 # 4. LIBRO MAYOR
 # ==========================================
 
+ENCABEZADOS_LIBRO_MAYOR = ['Fecha', 'Tipo', 'Folio', 'Concepto', 'Referencia', 'Debe', 'Haber', 'Saldo']
+
+# Movimientos por documento de WeasyPrint al armar el PDF del libro mayor.
+MOVIMIENTOS_POR_TRAMO_PDF = 1500
+
+MOVIMIENTOS_POR_PAGINA = 100
+
+
+def _filas_libro_mayor(movimientos):
+    for m in movimientos:
+        yield [m['fecha'], m['tipo_poliza'], m['folio'], m['concepto'], m['referencia'],
+               m['debe'], m['haber'], m['saldo']]
+
+
 @staff_member_required
 @permission_required('contabilidad.view_movimientocontable', raise_exception=True)
 def reporte_libro_mayor(request):
-    """Genera Libro Mayor de una cuenta en PDF."""
+    """
+    Genera Libro Mayor de una cuenta en PDF; con `formato=csv` o `formato=xlsx`
+    lo descarga, y con `formato=html` lo muestra en pantalla por páginas.
+    Los movimientos se leen por lotes (ver LibroMayorService), nunca todos a
+    la vez.
+    """
     from contabilidad.models import UnidadNegocio
 
     from .services.contabilidad import LibroMayorService
@@ -246,12 +356,13 @@ def reporte_libro_mayor(request):
     fecha_inicio = _parse_fecha(request, 'fecha_inicio', date(timezone.now().year, 1, 1))
     fecha_fin = _parse_fecha(request, 'fecha_fin', timezone.now().date())
     unidad_id = request.GET.get('unidad_negocio')
+    formato = request.GET.get('formato', 'pdf').lower()
 
     unidad = None
     if unidad_id:
         unidad = get_object_or_404(UnidadNegocio, pk=unidad_id)
 
-    datos = LibroMayorService.generar(
+    datos = LibroMayorService.resumen(
         cuenta_id=int(cuenta_id),
         fecha_inicio=fecha_inicio,
         fecha_fin=fecha_fin,
@@ -260,13 +371,70 @@ def reporte_libro_mayor(request):
     datos['unidad'] = unidad
     datos['titulo'] = f"Libro Mayor — {datos['cuenta'].codigo_sat} {datos['cuenta'].nombre}"
 
-    _registrar_reporte(request, 'LIBRO_MAYOR', fecha_inicio, fecha_fin, parametros={
+    if formato == 'html':
+        return _libro_mayor_en_pantalla(request, datos)
+
+    _registrar_reporte(request, 'LIBRO_MAYOR', fecha_inicio, fecha_fin, formato=formato.upper() if formato in ('csv', 'xlsx') else 'PDF', parametros={
         'cuenta': str(datos['cuenta']),
         'unidad': str(unidad) if unidad else None,
     })
 
-    filename = f"LibroMayor_{datos['cuenta'].codigo_sat}_{fecha_inicio.strftime('%Y%m%d')}_{fecha_fin.strftime('%Y%m%d')}.pdf"
-    return _render_pdf(request, 'reportes/pdf_libro_mayor.html', datos, filename)
+    filename = f"LibroMayor_{datos['cuenta'].codigo_sat}_{fecha_inicio.strftime('%Y%m%d')}_{fecha_fin.strftime('%Y%m%d')}"
+    movimientos = LibroMayorService.movimientos(datos)
+    if formato == 'csv':
+        return _stream_csv(f'{filename}.csv', ENCABEZADOS_LIBRO_MAYOR, _filas_libro_mayor(movimientos))
+    if formato == 'xlsx':
+        return _render_xlsx(
+            f'{filename}.xlsx', 'Libro mayor', ENCABEZADOS_LIBRO_MAYOR, _filas_libro_mayor(movimientos),
+            ['', '', '', 'Totales', '', datos['total_debe'], datos['total_haber'], datos['saldo_final']],
+        )
+    return _render_pdf_por_tramos(
+        request, 'reportes/pdf_libro_mayor.html', datos, movimientos, MOVIMIENTOS_POR_TRAMO_PDF, f'{filename}.pdf',
+    )
+
+
+def _libro_mayor_en_pantalla(request, datos):
+    """Una página del libro: `ir_a` salta a una fecha, `despues` sigue desde un movimiento."""
+    from django.contrib import admin
+
+    from .services.contabilidad import LibroMayorService
+
+    ir_a = _parse_fecha(request, 'ir_a')
+    despues = None
+    try:
+        fecha, folio, pk = request.GET.get('despues', '').split(',')
+        despues = (date.fromisoformat(fecha), int(folio), int(pk))
+    except ValueError:
+        pass
+
+    if not ir_a and not despues:
+        _registrar_reporte(request, 'LIBRO_MAYOR', datos['fecha_inicio'], datos['fecha_fin'], formato='HTML', parametros={
+            'cuenta': str(datos['cuenta']),
+            'unidad': str(datos['unidad']) if datos['unidad'] else None,
+        })
+
+    pagina = LibroMayorService.pagina(datos, desde=ir_a, despues=despues, tam=MOVIMIENTOS_POR_PAGINA)
+    parametros = request.GET.copy()
+    for campo in ('ir_a', 'despues'):
+        parametros.pop(campo, None)
+    siguiente = None
+    if pagina['siguiente']:
+        fecha, folio, pk = pagina['siguiente']
+        parametros['despues'] = f'{fecha.isoformat()},{folio},{pk}'
+        siguiente = parametros.urlencode()
+        del parametros['despues']
+
+    context = {
+        **admin.site.each_context(request),
+        **datos,
+        **pagina,
+        'title': datos['titulo'],
+        'ir_a': ir_a,
+        'parametros': parametros,
+        'siguiente': siguiente,
+        'es_inicio': not ir_a and not despues,
+    }
+    return render(request, 'reportes/libro_mayor.html', context)
 
 
 # ==========================================
@@ -276,7 +444,7 @@ def reporte_libro_mayor(request):
 @staff_member_required
 @permission_required('contabilidad.view_movimientocontable', raise_exception=True)
 def reporte_auxiliar(request):
-    """Genera Auxiliar de Cuentas (subcuentas de un padre) en PDF."""
+    """Genera Auxiliar de Cuentas (subcuentas de un padre) en PDF, o en XLSX con `formato=xlsx`."""
     from contabilidad.models import UnidadNegocio
 
     from .services.contabilidad import AuxiliarCuentasService
@@ -301,14 +469,26 @@ def reporte_auxiliar(request):
     )
     datos['unidad'] = unidad
     datos['titulo'] = f"Auxiliar de Cuentas — {datos['cuenta_padre'].codigo_sat} {datos['cuenta_padre'].nombre}"
+    en_excel = request.GET.get('formato') == 'xlsx'
 
-    _registrar_reporte(request, 'AUXILIAR', fecha_inicio, fecha_fin, parametros={
+    _registrar_reporte(request, 'AUXILIAR', fecha_inicio, fecha_fin, formato='XLSX' if en_excel else 'PDF', parametros={
         'cuenta_padre': str(datos['cuenta_padre']),
         'unidad': str(unidad) if unidad else None,
     })
 
-    filename = f"Auxiliar_{datos['cuenta_padre'].codigo_sat}_{fecha_inicio.strftime('%Y%m%d')}_{fecha_fin.strftime('%Y%m%d')}.pdf"
-    return _render_pdf(request, 'reportes/pdf_auxiliar.html', datos, filename)
+    filename = f"Auxiliar_{datos['cuenta_padre'].codigo_sat}_{fecha_inicio.strftime('%Y%m%d')}_{fecha_fin.strftime('%Y%m%d')}"
+    if en_excel:
+        return _render_xlsx(
+            f'{filename}.xlsx', 'Auxiliar',
+            ['Código', 'Cuenta', 'Saldo inicial', 'Cargos', 'Abonos', 'Saldo final', 'Movimientos'],
+            (
+                [l['codigo'], l['nombre'], l['saldo_inicial'], l['cargos'], l['abonos'],
+                 l['saldo_final'], l['num_movimientos']]
+                for l in datos['lineas']
+            ),
+            ['', 'Totales', None, datos['total_debe'], datos['total_haber'], datos['total_saldo'], None],
+        )
+    return _render_pdf(request, 'reportes/pdf_auxiliar.html', datos, f'{filename}.pdf')
 
 
 # ==========================================